@@ -0,0 +1,851 @@
+#!/opt/local/bin/python
+#
+# aprsis_emulator.py
+# Local APRS-IS stand-in server for end-to-end load testing
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Accepts APRS-IS client logins (e.g. from secure_aprs_bastion_bot.py),
+# honours the clients' g/ (group message) filters, injects a scripted
+# message stream at a configurable rate and collects the acks and responses
+# that the clients send back. Once the injection has finished and the
+# connection has been idle for a while, the program prints a JSON report
+# with the sustained packet rates and the message -> ack / message ->
+# first response latencies.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import logging
+import aprslib
+import argparse
+import fnmatch
+import json
+import pyotp
+import random
+import re
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(module)s -%(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Our server name, as shown in the banner, the logresp and the q construct
+EMULATOR_SERVER_NAME = "EMULATOR"
+
+# Interval for the server's keepalive comment lines (in seconds)
+KEEPALIVE_INTERVAL = 20
+
+# Outgoing APRS messages: SOURCE>DEST[,PATH]::ADDRESSEE:text[{msgno]
+regex_aprs_message = re.compile(
+    r"^([A-Z0-9-]{1,9})>[^:]*::([A-Z0-9- ]{9}):(.*?)(?:\{([A-Za-z0-9]{1,5})\}?)?$",
+    re.IGNORECASE,
+)
+
+# Script placeholder for the current TOTP code: {totp:SECRET} or {totp:SECRET:TTL}
+regex_totp_placeholder = re.compile(r"\{totp:([A-Z2-7=]+)(?::(\d+))?\}", re.IGNORECASE)
+
+
+def parse_group_filter(filter_string: str):
+    """
+    Extracts the callsign patterns from all g/ (group message)
+    terms of an APRS-IS filter string. All other filter types
+    are ignored.
+
+    Parameters
+    ==========
+    filter_string: str
+        APRS-IS filter string, e.g. "g/DF1JSL-1/DF1JSL*"
+
+    Returns
+    =======
+    patterns: list
+        Upper case callsign patterns ('*' = wildcard)
+    """
+    patterns = []
+    for term in filter_string.split():
+        if term.lower().startswith("g/"):
+            patterns.extend(p.upper() for p in term[2:].split("/") if p)
+        else:
+            logger.debug(msg=f"Ignoring unsupported filter term '{term}'")
+    return patterns
+
+
+def matches_group_filter(patterns: list, addressee: str):
+    """
+    Checks whether a message's addressee matches one of the g/ patterns
+
+    Parameters
+    ==========
+    patterns: list
+        Callsign patterns, see parse_group_filter
+    addressee: str
+        Message addressee (without padding)
+
+    Returns
+    =======
+    success: bool
+        True if the message passes the filter
+    """
+    addressee = addressee.upper()
+    return any(fnmatch.fnmatchcase(addressee, pattern) for pattern in patterns)
+
+
+def percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def latency_summary(values: list):
+    """
+    Summarizes a list of latencies (in seconds) in milliseconds
+
+    Parameters
+    ==========
+    values: list
+        Latency values in seconds
+
+    Returns
+    =======
+    summary: dict
+        count, p50, p99, mean and max values
+    """
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_msec": round(percentile(values, 0.50) * 1000, 3),
+        "p99_msec": round(percentile(values, 0.99) * 1000, 3),
+        "mean_msec": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "max_msec": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+class InjectedMessage:
+    __slots__ = ("sender", "msgno", "injected", "acked", "answered")
+
+    def __init__(self, sender: str, msgno: str, injected: float):
+        self.sender = sender
+        self.msgno = msgno
+        self.injected = injected
+        self.acked = None
+        self.answered = None
+
+
+class Statistics:
+    def __init__(self):
+        """
+        Collects injected and received packets and correlates the clients'
+        acks and responses with the injected messages. Acks are matched by
+        sender callsign and message number. Responses are assigned to the
+        oldest already acknowledged message of the respective sender which
+        has not been answered yet; any further response lines (e.g. multi-line
+        responses) are counted as additional responses. Messages without
+        message number do not get acknowledged and are thus eligible for
+        a response right away.
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        """
+        self._lock = threading.Lock()
+        self._pending_acks = {}
+        self._pending_responses = {}
+        self.messages = []
+        self.filtered = 0
+        self.received = {"ack": 0, "rej": 0, "response": 0, "additional": 0, "other": 0}
+        self.unmatched_acks = 0
+        self.auto_answers = {"ack": 0, "rej": 0, "dropped": 0}
+        self.first_injected = None
+        self.last_injected = None
+        self.last_received = None
+
+    def record_injection(self, sender: str, msgno: str, delivered: bool):
+        now = time.monotonic()
+        with self._lock:
+            if not delivered:
+                self.filtered += 1
+                return
+            message = InjectedMessage(sender=sender, msgno=msgno, injected=now)
+            self.messages.append(message)
+            if msgno:
+                self._pending_acks[(sender, msgno)] = message
+            self._pending_responses.setdefault(sender, deque()).append(message)
+            if self.first_injected is None:
+                self.first_injected = now
+            self.last_injected = now
+
+    def record_auto_answer(self, kind: str):
+        with self._lock:
+            self.auto_answers[kind] += 1
+
+    def record_received(self, line: str):
+        now = time.monotonic()
+        matches = regex_aprs_message.match(line)
+        with self._lock:
+            self.last_received = now
+            if not matches:
+                self.received["other"] += 1
+                return
+            addressee = matches[2].strip().upper()
+            text = matches[3]
+            if addressee.startswith("BLN"):
+                self.received["other"] += 1
+                return
+            if text.startswith("ack") or text.startswith("rej"):
+                kind = text[:3]
+                self.received[kind] += 1
+                # reply-ack format: ackNN}AA
+                msgno = text[3:].split("}")[0]
+                message = self._pending_acks.pop((addressee, msgno), None)
+                if message:
+                    message.acked = now
+                else:
+                    self.unmatched_acks += 1
+                return
+            pending = self._pending_responses.get(addressee)
+            if pending and (pending[0].acked is not None or not pending[0].msgno):
+                message = pending.popleft()
+                message.answered = now
+                self.received["response"] += 1
+            else:
+                self.received["additional"] += 1
+
+    def report(self):
+        """
+        Creates the final report
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        report: dict
+            Packet counts, sustained rates and latencies
+        """
+        with self._lock:
+            injected = len(self.messages)
+            end = max(filter(None, (self.last_injected, self.last_received)), default=0)
+            duration = end - self.first_injected if self.first_injected else 0.0
+            injection_duration = (
+                self.last_injected - self.first_injected if self.first_injected else 0.0
+            )
+            acked = [m.acked - m.injected for m in self.messages if m.acked]
+            answered = [m.answered - m.injected for m in self.messages if m.answered]
+            return {
+                "injected": injected,
+                "filtered": self.filtered,
+                "received": dict(self.received),
+                "unmatched_acks": self.unmatched_acks,
+                "auto_answers": dict(self.auto_answers),
+                "unacknowledged": sum(1 for m in self.messages if m.msgno and not m.acked),
+                "unanswered": injected - len(answered),
+                "duration_seconds": round(duration, 3),
+                "injected_per_sec": (
+                    round(injected / injection_duration, 1) if injection_duration else 0.0
+                ),
+                "acked_per_sec": round(len(acked) / duration, 1) if duration else 0.0,
+                "answered_per_sec": round(len(answered) / duration, 1) if duration else 0.0,
+                "ack_latency": latency_summary(acked),
+                "response_latency": latency_summary(answered),
+            }
+
+
+class EmulatorClientHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.callsign = None
+        self.patterns = []
+        self.verified = False
+        self.send_lock = threading.Lock()
+
+    def send_line(self, line: str):
+        with self.send_lock:
+            self.wfile.write(f"{line}\r\n".encode("latin-1", errors="replace"))
+            self.wfile.flush()
+
+    def login(self):
+        """
+        Handles the client's login line
+        "user CALL pass PASSCODE [vers NAME VERSION] [filter FILTER]"
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        success: bool
+            True if a login line was received
+        """
+        line = self.rfile.readline().decode("latin-1").strip()
+        fields = line.split()
+        if len(fields) < 4 or fields[0].lower() != "user" or fields[2].lower() != "pass":
+            logger.warning(msg=f"Invalid login line '{line}'")
+            return False
+        self.callsign = fields[1].upper()
+        passcode = fields[3]
+        if "filter" in fields:
+            filter_string = " ".join(fields[fields.index("filter") + 1 :])
+            self.patterns = parse_group_filter(filter_string=filter_string)
+        self.verified = passcode.isdigit() and int(passcode) == aprslib.passcode(
+            self.callsign
+        )
+        status = "verified" if self.verified else "unverified"
+        if self.server.emulator.login_delay > 0:
+            time.sleep(self.server.emulator.login_delay)
+        self.send_line(f"# logresp {self.callsign} {status}, server {EMULATOR_SERVER_NAME}")
+        logger.info(
+            msg=f"Client '{self.callsign}' logged in ({status}), g/ filter={self.patterns}"
+        )
+        return True
+
+    def handle(self):
+        self.send_line(f"# aprsis-emulator 1.0 {EMULATOR_SERVER_NAME}")
+        if not self.login():
+            return
+        self.server.emulator.register_client(self)
+        try:
+            for raw_line in self.rfile:
+                line = raw_line.decode("latin-1").strip()
+                if not line or line.startswith("#"):
+                    continue
+                logger.debug(msg=f"Received from '{self.callsign}': {line}")
+                self.server.emulator.statistics.record_received(line=line)
+                self.server.emulator.answer_message(client=self, line=line)
+                if self.server.emulator.received_log:
+                    self.server.emulator.received_log.write(f"{line}\n")
+        except OSError as ex:
+            logger.debug(msg=f"Connection to '{self.callsign}' lost: {ex}")
+        finally:
+            self.server.emulator.unregister_client(self)
+            logger.info(msg=f"Client '{self.callsign}' disconnected")
+
+
+class EmulatorServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class AprsIsEmulator:
+    def __init__(
+        self,
+        address: str = "127.0.0.1",
+        port: int = 14580,
+        received_log=None,
+        auto_ack: bool = False,
+        ack_loss: float = 0.0,
+        ack_delay: float = 0.0,
+        reject_patterns: list = None,
+        login_delay: float = 0.0,
+    ):
+        """
+        Class initialization
+
+        Parameters
+        ==========
+        address: str
+            Address that the server binds to
+        port: int
+            TCP port (0 = pick a free port)
+        received_log: file | None
+            Optional file object; all packets received from clients get
+            written to this file
+        auto_ack: bool
+            Answer the clients' messages with message number on behalf of
+            their addressees (ack or rej), see answer_message
+        ack_loss: float
+            Fraction (0..1) of the auto-answers that get lost
+        ack_delay: float
+            Delay (in seconds) of the auto-answers
+        reject_patterns: list
+            Addressee patterns ('*' = wildcard) which answer with rej
+        login_delay: float
+            Delay (in seconds) of the server's login response
+
+        Returns
+        =======
+        """
+        self.statistics = Statistics()
+        self.received_log = received_log
+        self.auto_ack = auto_ack
+        self.ack_loss = ack_loss
+        self.ack_delay = ack_delay
+        self.reject_patterns = reject_patterns or []
+        self.login_delay = login_delay
+        self._clients = []
+        self._clients_lock = threading.Lock()
+        self.login_event = threading.Event()
+        self.server = EmulatorServer((address, port), EmulatorClientHandler)
+        self.server.emulator = self
+        self.address, self.port = self.server.server_address[:2]
+
+    def start(self):
+        threading.Thread(
+            target=self.server.serve_forever, name="aprsis-emulator", daemon=True
+        ).start()
+        threading.Thread(
+            target=self._keepalive, name="aprsis-emulator-keepalive", daemon=True
+        ).start()
+        logger.info(msg=f"APRS-IS emulator listening on {self.address}:{self.port}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def register_client(self, client: EmulatorClientHandler):
+        with self._clients_lock:
+            self._clients.append(client)
+        if client.verified:
+            self.login_event.set()
+
+    def unregister_client(self, client: EmulatorClientHandler):
+        with self._clients_lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def get_client_callsigns(self):
+        with self._clients_lock:
+            return [client.callsign for client in self._clients if client.verified]
+
+    def _keepalive(self):
+        while True:
+            time.sleep(KEEPALIVE_INTERVAL)
+            timestamp = time.strftime("%d %b %Y %H:%M:%S GMT", time.gmtime())
+            self.broadcast_comment(f"# {EMULATOR_SERVER_NAME} {timestamp}")
+
+    def broadcast_comment(self, line: str):
+        with self._clients_lock:
+            clients = list(self._clients)
+        for client in clients:
+            try:
+                client.send_line(line)
+            except OSError:
+                pass
+
+    def answer_message(self, client: EmulatorClientHandler, line: str):
+        """
+        Acts as the addressee of a client's APRS message: messages with a
+        message number get an ack (or a rej, if the addressee matches one
+        of the reject patterns). Does nothing unless auto-ack is enabled
+
+        Parameters
+        ==========
+        client: EmulatorClientHandler
+            The client which has sent the message
+        line: str
+            The received packet
+
+        Returns
+        =======
+        """
+        if not self.auto_ack:
+            return
+        matches = regex_aprs_message.match(line)
+        if not matches or not matches[4]:
+            return
+        if matches[3].startswith("ack") or matches[3].startswith("rej"):
+            return
+        addressee = matches[2].strip().upper()
+        kind = "rej" if matches_group_filter(self.reject_patterns, addressee) else "ack"
+        if self.ack_loss and random.random() < self.ack_loss:
+            self.statistics.record_auto_answer(kind="dropped")
+            logger.debug(msg=f"Dropping {kind} for '{client.callsign}' {matches[4]}")
+            return
+        self.statistics.record_auto_answer(kind=kind)
+        packet = (
+            f"{addressee}>APRS,TCPIP*,qAC,{EMULATOR_SERVER_NAME}::"
+            f"{client.callsign:9}:{kind}{matches[4]}"
+        )
+
+        def send_answer():
+            try:
+                client.send_line(packet)
+            except OSError as ex:
+                logger.debug(msg=f"Unable to send to '{client.callsign}': {ex}")
+
+        if self.ack_delay > 0:
+            timer = threading.Timer(self.ack_delay, send_answer)
+            timer.daemon = True
+            timer.start()
+        else:
+            send_answer()
+
+    def inject_message(self, sender: str, addressee: str, text: str, msgno: str):
+        """
+        Sends an APRS message to all clients whose g/ filter
+        matches the message's addressee
+
+        Parameters
+        ==========
+        sender: str
+            Message sender's callsign
+        addressee: str
+            Message addressee's callsign
+        text: str
+            Message text
+        msgno: str
+            Message number; empty string = message without message number
+
+        Returns
+        =======
+        delivered: bool
+            True if at least one client has received the message
+        """
+        packet = f"{sender}>APRS,TCPIP*,qAC,{EMULATOR_SERVER_NAME}::{addressee:9}:{text}"
+        if msgno:
+            packet += f"{{{msgno}"
+        with self._clients_lock:
+            clients = [
+                c for c in self._clients if matches_group_filter(c.patterns, addressee)
+            ]
+        # Register the message prior to sending it, as the
+        # client's ack may arrive before send_line returns
+        self.statistics.record_injection(
+            sender=sender, msgno=msgno, delivered=bool(clients)
+        )
+        for client in clients:
+            try:
+                client.send_line(packet)
+            except OSError as ex:
+                logger.debug(msg=f"Unable to send to '{client.callsign}': {ex}")
+        return bool(clients)
+
+
+def read_script(filename: str):
+    """
+    Reads the injection script. Each non-empty line that does not start with
+    '#' contains a sender callsign and the message text, separated by
+    whitespace. The text may contain the placeholders {n} (running message
+    counter) and {totp:SECRET} / {totp:SECRET:TTL} (TOTP code which is
+    valid at the time of injection)
+
+    Parameters
+    ==========
+    filename: str
+        Name of the script file
+
+    Returns
+    =======
+    entries: list
+        List of (sender, text) tuples
+    """
+    entries = []
+    with open(filename, "r", encoding="utf-8") as script_file:
+        for line in script_file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            sender, _, text = line.partition(" ")
+            entries.append((sender.upper(), text.strip()))
+    return entries
+
+
+def render_text(text: str, counter: int):
+    """
+    Replaces the script placeholders in a message text
+
+    Parameters
+    ==========
+    text: str
+        Message text from the script
+    counter: int
+        Running message counter
+
+    Returns
+    =======
+    text: str
+        The message text
+    """
+    text = regex_totp_placeholder.sub(
+        lambda m: pyotp.TOTP(m[1].upper(), interval=int(m[2] or 30)).now(), text
+    )
+    return text.replace("{n}", str(counter))
+
+
+def run_injection(
+    emulator: AprsIsEmulator,
+    entries: list,
+    addressee: str | None,
+    rate: float,
+    repeat: int,
+    with_msgno: bool,
+):
+    """
+    Injects the script entries at the given rate
+
+    Parameters
+    ==========
+    emulator: AprsIsEmulator
+        Our emulator
+    entries: list
+        Script entries, see read_script
+    addressee: str | None
+        Message addressee; None = first logged-in client's callsign
+    rate: float
+        Messages per second; 0 = as fast as possible
+    repeat: int
+        Number of script iterations
+    with_msgno: bool
+        Add message numbers (and thus request acks)
+
+    Returns
+    =======
+    """
+    if not addressee:
+        addressee = emulator.get_client_callsigns()[0]
+    interval = 1.0 / rate if rate > 0 else 0.0
+    counter = 0
+    start = time.monotonic()
+    for _ in range(repeat):
+        for sender, text in entries:
+            counter += 1
+            if interval:
+                delay = start + (counter - 1) * interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            emulator.inject_message(
+                sender=sender,
+                addressee=addressee,
+                text=render_text(text=text, counter=counter),
+                # APRS message numbers have up to 5 characters
+                msgno=str((counter - 1) % 99999 + 1) if with_msgno else "",
+            )
+    logger.info(msg=f"Injected {counter} messages to '{addressee}'")
+
+
+def get_command_line_params():
+    """
+    Gets and returns the command line arguments
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    args: argparse.Namespace
+        The command line arguments
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--address",
+        dest="address",
+        type=str,
+        default="127.0.0.1",
+        help="Address that the emulator binds to (default: 127.0.0.1)",
+    )
+
+    parser.add_argument(
+        "--port",
+        dest="port",
+        type=int,
+        default=14580,
+        help="TCP port (default: 14580)",
+    )
+
+    parser.add_argument(
+        "--script",
+        dest="script",
+        type=str,
+        required=True,
+        help="Injection script; one '<sender callsign> <message text>' entry per line",
+    )
+
+    parser.add_argument(
+        "--addressee",
+        dest="addressee",
+        type=str,
+        default="",
+        help="Message addressee (default: callsign of the first logged-in client)",
+    )
+
+    parser.add_argument(
+        "--rate",
+        dest="rate",
+        type=float,
+        default=1.0,
+        help="Injected messages per second; 0 = as fast as possible (default: 1)",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        dest="repeat",
+        type=int,
+        default=1,
+        help="Number of script iterations (default: 1)",
+    )
+
+    parser.add_argument(
+        "--no-msgno",
+        dest="no_msgno",
+        action="store_true",
+        default=False,
+        help="Inject messages without message numbers (no acks will be requested)",
+    )
+
+    parser.add_argument(
+        "--start-delay",
+        dest="start_delay",
+        type=float,
+        default=2.0,
+        help="Delay between the client's login and the injection start (default: 2)",
+    )
+
+    parser.add_argument(
+        "--login-timeout",
+        dest="login_timeout",
+        type=float,
+        default=120.0,
+        help="Max time to wait for a verified client login (default: 120)",
+    )
+
+    parser.add_argument(
+        "--drain-seconds",
+        dest="drain_seconds",
+        type=float,
+        default=10.0,
+        help="Finish after the clients have been idle for n seconds (default: 10)",
+    )
+
+    parser.add_argument(
+        "--login-delay",
+        dest="login_delay",
+        type=float,
+        default=0.0,
+        help="Delay of the server's login response in seconds, e.g. for simulating a slow server (default: 0)",
+    )
+
+    parser.add_argument(
+        "--auto-ack",
+        dest="auto_ack",
+        action="store_true",
+        default=False,
+        help="Answer the clients' messages with message number with an ack on behalf of their addressees",
+    )
+
+    parser.add_argument(
+        "--ack-loss",
+        dest="ack_loss",
+        type=float,
+        default=0.0,
+        help="Fraction (0..1) of the auto-acks that get lost (default: 0)",
+    )
+
+    parser.add_argument(
+        "--ack-delay",
+        dest="ack_delay",
+        type=float,
+        default=0.0,
+        help="Delay of the auto-acks in seconds (default: 0)",
+    )
+
+    parser.add_argument(
+        "--reject-callsign",
+        dest="reject_callsigns",
+        action="append",
+        default=[],
+        help="With --auto-ack: addressee pattern ('*' = wildcard) which answers with rej; can be repeated",
+    )
+
+    parser.add_argument(
+        "--received-log",
+        dest="received_log",
+        type=str,
+        default="",
+        help="Write all packets received from clients to this file",
+    )
+
+    parser.add_argument(
+        "--output",
+        dest="output",
+        type=str,
+        default="",
+        help="Write the JSON report to this file (default: stdout)",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_command_line_params()
+
+    script_entries = read_script(filename=args.script)
+    # With auto-ack, the emulator may serve as the clients' counterpart only
+    if not script_entries and not args.auto_ack:
+        logger.error(msg="Injection script is empty")
+        sys.exit(1)
+
+    received_log = open(args.received_log, "w") if args.received_log else None
+    emulator = AprsIsEmulator(
+        address=args.address,
+        port=args.port,
+        received_log=received_log,
+        auto_ack=args.auto_ack,
+        ack_loss=args.ack_loss,
+        ack_delay=args.ack_delay,
+        reject_patterns=[pattern.upper() for pattern in args.reject_callsigns],
+        login_delay=args.login_delay,
+    )
+    emulator.start()
+
+    logger.info(msg="Waiting for a verified client login")
+    if not emulator.login_event.wait(timeout=args.login_timeout):
+        logger.error(msg="No client has logged in; exiting")
+        sys.exit(1)
+    time.sleep(args.start_delay)
+
+    run_injection(
+        emulator=emulator,
+        entries=script_entries,
+        addressee=args.addressee.upper() or None,
+        rate=args.rate,
+        repeat=args.repeat,
+        with_msgno=not args.no_msgno,
+    )
+    injection_end = time.monotonic()
+
+    # wait until the clients have stopped sending data
+    while True:
+        last_activity = max(
+            filter(
+                None,
+                (
+                    injection_end,
+                    emulator.statistics.last_injected,
+                    emulator.statistics.last_received,
+                ),
+            )
+        )
+        idle = time.monotonic() - last_activity
+        if idle >= args.drain_seconds:
+            break
+        time.sleep(args.drain_seconds - idle)
+
+    emulator.stop()
+    if received_log:
+        received_log.close()
+
+    report = emulator.statistics.report()
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
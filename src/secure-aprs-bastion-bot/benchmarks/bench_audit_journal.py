@@ -0,0 +1,182 @@
+#!/opt/local/bin/python
+#
+# secure-aprs-bastion-bot: audit journal write and query cost
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Measures the cost of submitting an execution record to the audit
+# journal (which is the only part that runs on the message processing
+# path), the number of records per write/fsync (group commit) and the
+# query tool's throughput for a journal with a given number of records.
+# Prior to the measurement, all records are read back and compared to
+# the submitted ones, including the rotated journal files.
+#
+# Usage: python benchmarks/bench_audit_journal.py [--records N]
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sabb_audit import AuditJournal, AUDIT_FIELDS, get_journal_files, unescape_field
+from sabb_audit_query import RecordFilter, query_journal
+
+
+def make_record(index: int, start_time: float):
+    """
+    Creates a synthetic execution record
+
+    Parameters
+    ==========
+    index: int
+        Record number
+    start_time: float
+        Timestamp of the first record (epoch seconds)
+
+    Returns
+    =======
+    record: dict
+        The execution record
+    """
+    return {
+        "timestamp": f"{start_time + index:.3f}",
+        "mode": "sync",
+        "from_callsign": f"N{index % 500}TST",
+        "target_callsign": f"N{index % 500}TST-{index % 16}",
+        "command_code": f"cmd{index % 20}",
+        # Escaped characters must survive the round trip
+        "command_string": f"/usr/local/bin/job{index % 20}.sh\t--run {index}\\",
+        "pid": 10000 + index,
+        "exit_code": 1 if index % 97 == 0 else 0,
+        "duration_ms": f"{index % 1000 / 10:.1f}",
+        "watchdog": 0,
+        "correlation_id": f"{index * 7919:012x}",
+    }
+
+
+def run_benchmark(records: int, commit_interval: float):
+    """
+    Writes, verifies and queries a synthetic journal
+
+    Parameters
+    ==========
+    records: int
+        Number of journal records
+    commit_interval: float
+        Group commit interval in seconds
+
+    Returns
+    =======
+    results: dict
+        The measurement results
+    """
+    start_time = time.time() - records
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "sabb_audit_journal.tsv")
+        journal = AuditJournal(
+            filename=filename,
+            max_bytes=16 * 1024 * 1024,
+            backup_count=1000,
+            commit_interval=commit_interval,
+        )
+        begin = time.perf_counter()
+        for index in range(records):
+            journal.append(make_record(index=index, start_time=start_time))
+        submit_time = time.perf_counter() - begin
+        journal.close()
+        write_time = time.perf_counter() - begin
+        filenames = get_journal_files(filename=filename)
+        results["write"] = {
+            "records": records,
+            "submit_usec_per_record": round(submit_time / records * 1e6, 2),
+            "records_per_sec_on_disk": round(records / write_time),
+            "commits": journal.commits,
+            "records_per_commit": round(records / max(journal.commits, 1), 1),
+            "files": len(filenames),
+            "bytes": sum(os.path.getsize(name) for name in filenames),
+        }
+
+        # Read everything back (oldest file first)
+        mismatches = 0
+        index = 0
+        for name in filenames:
+            with open(name, "r", encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    if line.startswith("#"):
+                        continue
+                    fields = [
+                        unescape_field(field) for field in line.rstrip("\n").split("\t")
+                    ]
+                    expected = make_record(index=index, start_time=start_time)
+                    if fields != [str(expected[field]) for field in AUDIT_FIELDS]:
+                        mismatches += 1
+                    index += 1
+        results["mismatches"] = mismatches + abs(records - index)
+
+        queries = {
+            "all": RecordFilter(),
+            "callsign": RecordFilter(callsign="N42TST"),
+            "callsign_wildcard": RecordFilter(callsign="N42TST-*"),
+            "command_code": RecordFilter(command_code="cmd7"),
+            "failed": RecordFilter(failed=True),
+            "correlation_id": RecordFilter(
+                correlation_id=f"{records // 2 * 7919:012x}"
+            ),
+            "last_10_percent": RecordFilter(since=start_time + records * 0.9),
+        }
+        results["query"] = {}
+        for name, record_filter in queries.items():
+            begin = time.perf_counter()
+            _, count = query_journal(
+                filenames=filenames, record_filter=record_filter, limit=1
+            )
+            elapsed = time.perf_counter() - begin
+            results["query"][name] = {
+                "matches": count,
+                "seconds": round(elapsed, 3),
+                "records_per_sec": round(records / elapsed),
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--records",
+        dest="records",
+        type=int,
+        default=1000000,
+        help="Number of journal records (default: 1000000)",
+    )
+    parser.add_argument(
+        "--commit-interval-ms",
+        dest="commit_interval_ms",
+        type=int,
+        default=50,
+        help="Group commit interval in msec (default: 50)",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        records=args.records, commit_interval=args.commit_interval_ms / 1000
+    )
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if results["mismatches"] else 0)
@@ -0,0 +1,202 @@
+#!/opt/local/bin/python
+#
+# secure-aprs-bastion-bot: verification cost per authentication scheme
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Measures the cost of a single code verification for each of the bot's
+# authentication schemes (plus the pyotp-based verification that the bot
+# used to perform) and the callsign identification's cost for matches on
+# the SSID entry, on the SSID-less base entry and for non-matching codes.
+# The results are printed in JSON format. Prior to the measurement, the
+# precomputed OTP keys are checked against pyotp for a range of counter
+# values.
+#
+# Usage: python benchmarks/bench_authenticators.py [--iterations N]
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pyotp
+import sabb_shared
+from sabb_utils import (
+    get_authenticator,
+    get_otp_key,
+    clear_otp_key_cache,
+    build_user_index,
+    identify_target_callsign_and_command_string,
+)
+
+SECRET = "GJYWOPM5YW22OD4REQDP75APVEGMNX4N"
+SECOND_FACTOR_SECRET = "7QWJ4S2ZQGXH6MJ2B3CUDL5KXNYZ6TQA"
+
+
+def check_otp_keys(secret: str, counters: int = 10000):
+    """
+    Differential check: our precomputed OTP keys must generate
+    the very same codes as pyotp
+
+    Parameters
+    ==========
+    secret: str
+        base32-encoded OTP secret
+    counters: int
+        Number of counter values to check
+
+    Returns
+    =======
+    mismatches: int
+        Number of counter values with differing codes
+    """
+    hotp = pyotp.HOTP(secret)
+    otp_key = get_otp_key(secret=secret)
+    return sum(
+        1 for counter in range(counters) if hotp.at(counter) != otp_key.generate(counter)
+    )
+
+
+def measure(function, iterations: int):
+    """
+    Runs the function n times and returns the per-call cost
+
+    Parameters
+    ==========
+    function: callable
+        Function without parameters
+    iterations: int
+        Number of iterations
+
+    Returns
+    =======
+    result: dict
+        Mean per-call cost in microseconds plus calls per second
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    elapsed = time.perf_counter() - start
+    return {
+        "iterations": iterations,
+        "usec_per_verify": round(elapsed / iterations * 1e6, 3),
+        "verifies_per_sec": round(iterations / elapsed, 1),
+    }
+
+
+def run_benchmark(iterations: int):
+    """
+    Measures the verification cost per authentication scheme (using a
+    non-matching code) and the callsign identification cost for
+    matching and non-matching codes.
+
+    Parameters
+    ==========
+    iterations: int
+        Number of iterations per measurement
+
+    Returns
+    =======
+    results: dict
+        Benchmark results
+    """
+    clear_otp_key_cache()
+    totp = get_authenticator(scheme="totp")
+    hotp = get_authenticator(scheme="hotp")
+    user_entry = {"callsign": "DF1JSL-1", "secret": SECRET, "ttl": 30}
+    second_factor_entry = {
+        "callsign": "DF1JSL-1/reboot",
+        "secret": SECOND_FACTOR_SECRET,
+        "ttl": 30,
+    }
+    code = "000000"
+
+    results = {
+        "mismatches_vs_pyotp": check_otp_keys(secret=SECRET),
+        "schemes": {
+            # The bot's former implementation: new pyotp object per verification
+            "pyotp_totp_w0": measure(
+                lambda: pyotp.TOTP(SECRET, interval=30).verify(code), iterations
+            ),
+            "totp_w0": measure(
+                lambda: totp.verify(user_entry=user_entry, code=code), iterations
+            ),
+            "totp_w1": measure(
+                lambda: totp.verify(user_entry=user_entry, code=code, valid_window=1),
+                iterations,
+            ),
+            f"hotp_look_ahead_{sabb_shared.hotp_look_ahead}": measure(
+                lambda: hotp.verify(user_entry=user_entry, code=code), iterations
+            ),
+            "totp_w0_plus_second_factor": measure(
+                lambda: (
+                    totp.verify(user_entry=user_entry, code=code),
+                    totp.verify(user_entry=second_factor_entry, code=code),
+                ),
+                iterations,
+            ),
+        },
+    }
+
+    # Callsign identification with entries for both DF1JSL-1 and DF1JSL.
+    # All candidate entries get verified, so the cost should not depend on
+    # which entry (if any) matches
+    base_secret = pyotp.random_base32()
+    data = {
+        "users": [
+            {"callsign": "DF1JSL", "secret": base_secret, "ttl": 30, "commands": {}},
+            {"callsign": "DF1JSL-1", "secret": SECRET, "ttl": 30, "commands": {}},
+        ]
+    }
+    user_index = build_user_index(data=data)
+    codes = {
+        "ssid_entry_match": pyotp.TOTP(SECRET).now(),
+        "base_entry_match": pyotp.TOTP(base_secret).now(),
+        "no_match": code,
+    }
+    results["identify"] = {
+        name: measure(
+            lambda totp_code=totp_code: identify_target_callsign_and_command_string(
+                data=data,
+                callsign="DF1JSL-1",
+                totp_code=totp_code,
+                command_code=None,
+                user_index=user_index,
+            ),
+            iterations,
+        )
+        for name, totp_code in codes.items()
+    }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--iterations",
+        dest="iterations",
+        type=int,
+        default=20000,
+        help="Number of iterations per measurement (default: 20000)",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmark(iterations=args.iterations)
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if results["mismatches_vs_pyotp"] else 0)
@@ -0,0 +1,457 @@
+#!/opt/local/bin/python
+#
+# secure-aprs-bastion-bot: message handling benchmark suite
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Generates synthetic user/command configuration files (default: 10, 1k,
+# 10k and 100k users with a varying number of commands per user) and drives
+# the bot's input parser (plus the output generator for accepted messages)
+# with different traffic mixes: valid, invalid, replayed and unknown-callsign
+# messages. All command executions are simulated. A simulated clock moves
+# forward between valid messages, thus providing fresh TOTP time steps
+# for every valid message. The results (throughput, p50/p99 latency and
+# outcomes per config size and traffic mix) are printed in JSON format.
+#
+# All data is derived from --seed; runs with identical parameters process
+# identical message streams.
+#
+# Usage: python benchmarks/bench_message_handling.py [--sizes 10 1000]
+#        [--mixes valid mixed] [--messages 2000] [--seed 4711] [--output results.json]
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml
+import sabb_shared
+from sabb_logger import logger
+from sabb_offline_client import (
+    OfflineAprsClient,
+    initialize_offline_bot,
+    process_offline_message,
+)
+from sabb_utils import OtpKey, read_config_file_from_disk
+
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+
+# Share of each message type per traffic mix
+TRAFFIC_MIXES = {
+    "valid": {"valid": 1.0},
+    "invalid": {"invalid": 1.0},
+    "replayed": {"replayed": 1.0},
+    "unknown": {"unknown": 1.0},
+    "mixed": {"valid": 0.4, "invalid": 0.2, "replayed": 0.2, "unknown": 0.2},
+}
+
+BASE32_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+TTL = 30
+
+
+class SimulatedClock:
+    def __init__(self, start: float):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+def generate_user_config(num_users: int, rng: random.Random, max_commands: int):
+    """
+    Generates a synthetic user/command configuration. Every 5th user
+    entry comes with an SSID; every 10th SSID-less user also gets an
+    additional entry with SSID, thus resulting in two candidate entries
+    for that callsign
+
+    Parameters
+    ==========
+    num_users: int
+        Number of user entries
+    rng: random.Random
+        Seeded random number generator
+    max_commands: int
+        Max number of commands per user
+
+    Returns
+    =======
+    data: dict
+        The configuration data
+    """
+    users = []
+    for i in range(num_users):
+        base_callsign = f"X{i:07d}"
+        callsigns = [base_callsign if i % 5 else f"{base_callsign}-{1 + i % 15}"]
+        if i % 10 == 1:
+            callsigns.append(f"{base_callsign}-9")
+        for callsign in callsigns:
+            commands = {}
+            for j in range(rng.randint(1, max_commands)):
+                commands[f"cmd{j}"] = {
+                    "command_string": f"echo {callsign} cmd{j} @0 @1",
+                    "detached_launch": False,
+                    "watchdog_timespan": 0.0,
+                }
+            users.append(
+                {
+                    "callsign": callsign,
+                    "secret": "".join(rng.choice(BASE32_ALPHABET) for _ in range(32)),
+                    "ttl": TTL,
+                    "scheme": "totp",
+                    "commands": commands,
+                }
+            )
+    return {"users": users}
+
+
+def generate_traffic(
+    data: dict, mix: dict, messages: int, rng: random.Random, start_time: float
+):
+    """
+    Generates the message stream for a traffic mix
+
+    Parameters
+    ==========
+    data: dict
+        The configuration data
+    mix: dict
+        Share of each message type
+    messages: int
+        Number of messages
+    rng: random.Random
+        Seeded random number generator
+    start_time: float
+        Simulated start time
+
+    Returns
+    =======
+    warmup: list
+        Untimed valid messages which provide replay candidates
+    traffic: list
+        List of (timestamp, kind, from_callsign, message) tuples
+    """
+    users = data["users"]
+    otp_keys = {}
+    now = start_time
+
+    def valid_message():
+        nonlocal now
+        # Move forward by one TTL so that every valid message has a fresh time step
+        now += TTL
+        user = rng.choice(users)
+        otp_key = otp_keys.setdefault(user["secret"], OtpKey(secret=user["secret"]))
+        command = rng.choice(list(user["commands"]))
+        code = otp_key.generate(int(now // user["ttl"]))
+        return now, "valid", user["callsign"], f"{code}{command} p1"
+
+    warmup = [valid_message() for _ in range(min(messages, 500))] if (
+        "replayed" in mix
+    ) else []
+    sent_valid = list(warmup)
+
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=messages)
+    traffic = []
+    for kind in kinds:
+        if kind == "valid" or (kind == "replayed" and not sent_valid):
+            entry = valid_message()
+            sent_valid.append(entry)
+        elif kind == "replayed":
+            _, _, callsign, message = rng.choice(sent_valid)
+            entry = (now, "replayed", callsign, message)
+        elif kind == "invalid":
+            user = rng.choice(users)
+            otp_key = otp_keys.setdefault(
+                user["secret"], OtpKey(secret=user["secret"])
+            )
+            code = (int(otp_key.generate(int(now // user["ttl"]))) + 1) % 1000000
+            entry = (now, "invalid", user["callsign"], f"{code:06d}cmd0 p1")
+        else:
+            entry = (
+                now,
+                "unknown",
+                f"Z{rng.randint(0, 9999999):07d}",
+                f"{rng.randint(0, 999999):06d}cmd0 p1",
+            )
+        traffic.append(entry)
+    return warmup, traffic
+
+
+def percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_mix(
+    client: OfflineAprsClient,
+    config_filename: str,
+    data: dict,
+    mix_name: str,
+    messages: int,
+    rng: random.Random,
+):
+    """
+    Runs a single traffic mix against a freshly initialized bot
+
+    Parameters
+    ==========
+    client: OfflineAprsClient
+        Our offline client
+    config_filename: str
+        Name of the user/command configuration file
+    data: dict
+        The configuration data
+    mix_name: str
+        Name of the traffic mix, see TRAFFIC_MIXES
+    messages: int
+        Number of timed messages
+    rng: random.Random
+        Seeded random number generator
+
+    Returns
+    =======
+    result: dict
+        Throughput, latency and outcome data
+    """
+    start_time = 1_800_000_000.0
+    warmup, traffic = generate_traffic(
+        data=data,
+        mix=TRAFFIC_MIXES[mix_name],
+        messages=messages,
+        rng=rng,
+        start_time=start_time,
+    )
+
+    initialize_offline_bot(
+        client=client, command_config_filename=config_filename, data=data
+    )
+    clock = SimulatedClock(start=start_time)
+    sabb_shared.clock = clock
+
+    for timestamp, _, from_callsign, message in warmup:
+        clock.now = timestamp
+        process_offline_message(
+            client=client, from_callsign=from_callsign, message=message
+        )
+
+    latencies = []
+    outcomes = {}
+    total_start = time.perf_counter()
+    for timestamp, kind, from_callsign, message in traffic:
+        clock.now = timestamp
+        start = time.perf_counter()
+        _, response = process_offline_message(
+            client=client, from_callsign=from_callsign, message=message
+        )
+        latencies.append(time.perf_counter() - start)
+        key = f"{kind}:{response}"
+        outcomes[key] = outcomes.get(key, 0) + 1
+    total_elapsed = time.perf_counter() - total_start
+
+    latencies.sort()
+    return {
+        "mix": mix_name,
+        "messages": len(traffic),
+        "throughput_msgs_per_sec": round(len(traffic) / total_elapsed, 1),
+        "latency_usec": {
+            "p50": round(percentile(latencies, 0.50) * 1e6, 1),
+            "p99": round(percentile(latencies, 0.99) * 1e6, 1),
+            "mean": round(sum(latencies) / len(latencies) * 1e6, 1),
+            "max": round(latencies[-1] * 1e6, 1),
+        },
+        "outcomes": dict(sorted(outcomes.items())),
+    }
+
+
+def run_benchmark(
+    sizes: list,
+    mixes: list,
+    messages: int,
+    seed: int,
+    max_commands: int,
+    lockout_threshold: int,
+    work_dir: str,
+):
+    """
+    Runs all traffic mixes for all configuration sizes
+
+    Parameters
+    ==========
+    sizes: list
+        Number of users per configuration
+    mixes: list
+        Names of the traffic mixes
+    messages: int
+        Number of timed messages per traffic mix
+    seed: int
+        Random seed
+    max_commands: int
+        Max number of commands per user
+    lockout_threshold: int
+        sabb_lockout_threshold setting (0 = disabled)
+    work_dir: str
+        Directory for the generated configuration files
+
+    Returns
+    =======
+    results: dict
+        Benchmark results
+    """
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "messages_per_mix": messages,
+        "lockout_threshold": lockout_threshold,
+        "results": [],
+    }
+    client = OfflineAprsClient(
+        sabb_config={
+            "sabb_totp_cache_max_len": max(messages * 2, 1000),
+            "sabb_totp_cache_max_age_seconds": 300,
+            "sabb_lockout_threshold": lockout_threshold,
+        }
+    )
+    original_clock = sabb_shared.clock
+    try:
+        for size in sizes:
+            rng = random.Random(f"{seed}-{size}")
+            data = generate_user_config(
+                num_users=size, rng=rng, max_commands=max_commands
+            )
+            config_filename = os.path.join(work_dir, f"sabb_command_config_{size}.yml")
+            with open(config_filename, "w") as config_file:
+                yaml.dump(
+                    data,
+                    config_file,
+                    Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+                )
+
+            # Measure the time it takes to read the configuration file; the bot
+            # does this at startup and whenever the file has been changed
+            load_start = time.perf_counter()
+            _, data = read_config_file_from_disk(filename=config_filename)
+            config_load_seconds = time.perf_counter() - load_start
+
+            size_results = {
+                "users": size,
+                "user_entries": len(data["users"]),
+                "config_load_seconds": round(config_load_seconds, 3),
+                "mixes": [],
+            }
+            for mix_name in mixes:
+                size_results["mixes"].append(
+                    run_mix(
+                        client=client,
+                        config_filename=config_filename,
+                        data=data,
+                        mix_name=mix_name,
+                        messages=messages,
+                        rng=random.Random(f"{seed}-{size}-{mix_name}"),
+                    )
+                )
+            results["results"].append(size_results)
+    finally:
+        sabb_shared.clock = original_clock
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        dest="sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Number of users per synthetic configuration (default: 10 1000 10000 100000)",
+    )
+    parser.add_argument(
+        "--mixes",
+        dest="mixes",
+        nargs="+",
+        choices=list(TRAFFIC_MIXES),
+        default=list(TRAFFIC_MIXES),
+        help="Traffic mixes (default: all)",
+    )
+    parser.add_argument(
+        "--messages",
+        dest="messages",
+        type=int,
+        default=2000,
+        help="Number of timed messages per traffic mix (default: 2000)",
+    )
+    parser.add_argument(
+        "--seed", dest="seed", type=int, default=4711, help="Random seed (default: 4711)"
+    )
+    parser.add_argument(
+        "--max-commands",
+        dest="max_commands",
+        type=int,
+        default=20,
+        help="Max number of commands per user (default: 20)",
+    )
+    parser.add_argument(
+        "--lockout-threshold",
+        dest="lockout_threshold",
+        type=int,
+        default=0,
+        help="sabb_lockout_threshold setting (default: 0 = disabled)",
+    )
+    parser.add_argument(
+        "--work-dir",
+        dest="work_dir",
+        type=str,
+        default="",
+        help="Directory for the generated configuration files (default: temporary directory)",
+    )
+    parser.add_argument(
+        "--output",
+        dest="output",
+        type=str,
+        default="",
+        help="Write the JSON results to this file (default: stdout)",
+    )
+    args = parser.parse_args()
+
+    # Keep the bot's log output out of our measurements
+    logger.setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = run_benchmark(
+            sizes=args.sizes,
+            mixes=args.mixes,
+            messages=args.messages,
+            seed=args.seed,
+            max_commands=args.max_commands,
+            lockout_threshold=args.lockout_threshold,
+            work_dir=args.work_dir or temp_dir,
+        )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
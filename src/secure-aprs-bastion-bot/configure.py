@@ -35,11 +35,16 @@ import platform
 import threading
 from sabb_utils import (
     verify_totp_code,
+    match_hotp_code,
     execute_program,
     identify_target_callsign_and_command_string,
+    get_command_second_factor,
+    read_hotp_counters_from_disk,
+    resolve_hotp_counter_filename,
 )
 import sabb_shared
 import sabb_http_codes
+from sabb_lockout import LockoutTable
 
 # Platform-specific content for 'wait_or_keypress' function
 if platform.system() == "Windows":
@@ -52,6 +57,15 @@ else:
 # Default name of the to-be-generated output configuration file
 CONFIG_FILE_NAME = "sabb_command_config.yml"
 
+# Default name of the bot's lockout table file (see 'sabb_lockout_file'
+# in the bot's configuration file)
+LOCKOUT_FILE_NAME = "sabb_lockouts.json"
+
+# Default name of the bot's HOTP counter file (see 'sabb_hotp_counter_file'
+# in the bot's configuration file). Relative file names are resolved
+# against the configuration file's directory, just like the bot does
+HOTP_COUNTER_FILE_NAME = "sabb_hotp_counters.json"
+
 # Timespan for --execute-command-code; allowing the user to abort
 # the pending execution of the retrieved command within x seconds
 EXECUTE_COMMAND_CODE_ABORT_TIMESPAN = 10
@@ -196,6 +210,38 @@ def get_command_line_params_config():
         help="Validates the provided TOTP code against the user's secret",
     )
 
+    parser.add_argument(
+        "--list-lockouts",
+        dest="list_lockouts",
+        action="store_true",
+        default=False,
+        help="Lists all callsigns from the bot's lockout table",
+    )
+
+    parser.add_argument(
+        "--clear-lockouts",
+        dest="clear_lockouts",
+        action="store_true",
+        default=False,
+        help="Removes the --callsign (or all callsigns if no callsign was given) from the bot's lockout table",
+    )
+
+    parser.add_argument(
+        "--lockout-file",
+        default=LOCKOUT_FILE_NAME,
+        dest="lockout_file",
+        type=str,
+        help="The bot's lockout table file name (default: sabb_lockouts.json)",
+    )
+
+    parser.add_argument(
+        "--hotp-counter-file",
+        default=HOTP_COUNTER_FILE_NAME,
+        dest="hotp_counter_file",
+        type=str,
+        help="The bot's HOTP counter file name, relative to the configuration file's directory (default: sabb_hotp_counters.json)",
+    )
+
     parser.add_argument(
         "--dry-run",
         dest="dry_run",
@@ -268,6 +314,23 @@ def get_command_line_params_config():
         help="TTL value in seconds (default: 30; range: 30-300)",
     )
 
+    parser.add_argument(
+        "--scheme",
+        dest="scheme",
+        type=str.lower,
+        choices=["totp", "hotp"],
+        default="totp",
+        help="Authentication scheme for --add-user: time-based (totp) or counter-based (hotp) one-time passwords (default: totp)",
+    )
+
+    parser.add_argument(
+        "--second-factor",
+        dest="second_factor",
+        action="store_true",
+        default=False,
+        help="In combination with --add-command: protect the command with its own TOTP secret (second factor)",
+    )
+
     parser.add_argument(
         "--watchdog-timespan",
         dest="watchdog_timespan",
@@ -303,8 +366,16 @@ def get_command_line_params_config():
     __test_totp_code = args.test_totp_code
     __dry_run = args.dry_run
     __execute_command_code = args.execute_command_code
-    __show_secret = args.show_secret if add_user else False
+    __show_secret = args.show_secret if args.add_user or args.add_command else False
     __aprs_test_arguments = args.aprs_test_arguments or []
+    __list_lockouts = args.list_lockouts
+    __clear_lockouts = args.clear_lockouts
+    __lockout_file = args.lockout_file
+    __hotp_counter_file = resolve_hotp_counter_filename(
+        filename=args.hotp_counter_file, config_filename=__configfile
+    )
+    __scheme = args.scheme
+    __second_factor = args.second_factor
 
     # Run some basic plausibility checks
 
@@ -379,6 +450,20 @@ def get_command_line_params_config():
             logger.error("TOTP code is required")
             sys.exit(0)
 
+    if __list_lockouts or __clear_lockouts:
+        if (
+            __add_user
+            or __del_user
+            or __add_command
+            or __del_command
+            or __test_totp_code
+            or __execute_command_code
+        ):
+            logger.error(
+                msg="--list-lockouts / --clear-lockouts and other commands cannot be run at the same time"
+            )
+            sys.exit(0)
+
     if (
         not __test_totp_code
         and not __execute_command_code
@@ -386,6 +471,8 @@ def get_command_line_params_config():
         and not __del_command
         and not __add_user
         and not __del_user
+        and not __list_lockouts
+        and not __clear_lockouts
     ):
         logger.error(msg="No command parameters specified; nothing to do")
         parser.print_help()
@@ -396,6 +483,10 @@ def get_command_line_params_config():
             logger.error(msg="Invalid command code; must not contain spaces")
             sys.exit(0)
 
+    if __second_factor and not __add_command:
+        logger.error(msg="--second-factor can only be used with --add-command")
+        sys.exit(0)
+
     if __watchdog_timespan > 0.0 and __detached_launch:
         logger.error(
             msg="'Watchdog timespan' cannot be set for 'detached launch' configuration"
@@ -419,6 +510,12 @@ def get_command_line_params_config():
         __execute_command_code,
         __aprs_test_arguments,
         __watchdog_timespan,
+        __list_lockouts,
+        __clear_lockouts,
+        __lockout_file,
+        __hotp_counter_file,
+        __scheme,
+        __second_factor,
     )
 
 
@@ -460,7 +557,12 @@ def does_file_exist(file_name: str):
 
 
 def add_user_to_yaml_config(
-    configfile: str, callsign: str, secret: str, ttl_interval: int
+    configfile: str,
+    callsign: str,
+    secret: str,
+    ttl_interval: int,
+    scheme: str = "totp",
+    counter: int = 0,
 ):
     """
     Writes a new user to the config file.
@@ -475,6 +577,10 @@ def add_user_to_yaml_config(
         user's TOTP secret
     ttl_interval: int
         TOTP's TTL interval
+    scheme: str
+        Authentication scheme, 'totp' or 'hotp'
+    counter: int
+        HOTP only: next counter value that we expect from the user
 
     Returns
     =======
@@ -500,20 +606,26 @@ def add_user_to_yaml_config(
         if user["callsign"] == callsign:
             user["secret"] = secret
             user["ttl"] = ttl_interval
+            user["scheme"] = scheme
+            user.pop("counter", None)
+            if scheme == "hotp":
+                user["counter"] = counter
             data_updated = True
             break
 
     # We were unable to update the user as it didn't exist
     # So let's create a new entry instead
     if not data_updated:
-        data["users"].append(
-            {
-                "callsign": callsign,
-                "secret": secret,
-                "ttl": ttl_interval,
-                "commands": {},
-            }
-        )
+        user = {
+            "callsign": callsign,
+            "secret": secret,
+            "ttl": ttl_interval,
+            "scheme": scheme,
+        }
+        if scheme == "hotp":
+            user["counter"] = counter
+        user["commands"] = {}
+        data["users"].append(user)
 
     # Write the config file back to disk
     __success = write_config_file_to_disk(filename=configfile, data=data)
@@ -739,6 +851,8 @@ def add_cmd_to_yaml_config(
     command_string: str,
     detached_launch=False,
     watchdog_timespan=0.0,
+    second_factor_secret: str | None = None,
+    second_factor_ttl: int = 30,
 ):
     """
     Writes a new command for an existing user to the config file.
@@ -758,6 +872,10 @@ def add_cmd_to_yaml_config(
     watchdog_timespan: float
         Watchdog timespan for 'detached_launch'='False' configuration
         settings. A value of 0.0 disables the watchdog
+    second_factor_secret: str | None
+        Optional TOTP secret for the command's second factor
+    second_factor_ttl: int
+        TTL interval for the command's second factor
 
     Returns
     =======
@@ -779,11 +897,15 @@ def add_cmd_to_yaml_config(
         if user["callsign"] == callsign:
             # We have found our user
             # now let's create/update our command entry
-            user.setdefault("commands", {})[command_code] = {
+            command = {
                 "command_string": command_string,
                 "detached_launch": detached_launch,
                 "watchdog_timespan": watchdog_timespan,
             }
+            if second_factor_secret:
+                command["second_factor_secret"] = second_factor_secret
+                command["second_factor_ttl"] = second_factor_ttl
+            user.setdefault("commands", {})[command_code] = command
             found_data = True
             break
 
@@ -844,48 +966,46 @@ def del_cmd_from_yaml_config(configfile: str, callsign: str, command_code: str):
     return __success
 
 
-def add_user(configfile: str, callsign: str, ttl_interval: int, show_secret: bool):
+def provision_otp_secret(
+    label: str, ttl_interval: int, show_secret: bool, scheme: str = "totp"
+):
     """
-    Adds a user to the config file.
+    Generates a new OTP secret, shows its QR code and validates
+    the secret against a code from the user's authenticator app.
 
     Parameters
     ==========
-    configfile: str
-        Name of the external YAML config file
-    callsign: str
-        User's callsign
+    label: str
+        Account label which is shown in the user's authenticator app
     ttl_interval: int
-        desired time-to-live time span for the user callsign's secret
+        TOTP only: desired time-to-live time span for the secret
     show_secret: bool
         whether to show the secret or not (debug purposes only)
+    scheme: str
+        Authentication scheme, 'totp' or 'hotp'
 
     Returns
     =======
-    success: bool
-        True / False, depending on whether the entry was created/updated
+    secret: str | None
+        The new secret or 'None' if the user has aborted the process
+    counter: int
+        HOTP only: next counter value that we expect from the user
     """
-    __success = False
-
-    # Do not fail if the config file does not exist
-    if not does_file_exist(configfile):
-        logger.info(f"Creating new configuration file {configfile}")
-    logger.info("Adding new user account")
-
-    logger.info(
-        f"Generating TOTP credentials for user '{callsign}' with TTL '{ttl_interval}'"
-    )
-
-    # generate the TOTP secret
+    # generate the OTP secret
     secret = pyotp.random_base32()
 
-    # generate the TOTP object
-    totp = pyotp.TOTP(secret, interval=ttl_interval)
-
     # Provision the URI for the QR code
-    uri = totp.provisioning_uri(
-        name="https://github.com/joergschultzelutter",
-        issuer_name="secure-aprs-bastion-bot",
-    )
+    if scheme == "hotp":
+        uri = pyotp.HOTP(secret).provisioning_uri(
+            name=label,
+            initial_count=0,
+            issuer_name="secure-aprs-bastion-bot",
+        )
+    else:
+        uri = pyotp.TOTP(secret, interval=ttl_interval).provisioning_uri(
+            name=label,
+            issuer_name="secure-aprs-bastion-bot",
+        )
 
     # generate the qr code
     qr = qrcode.QRCode(
@@ -902,7 +1022,7 @@ def add_user(configfile: str, callsign: str, ttl_interval: int, show_secret: boo
 
     # show the secret if the user has asked for it
     if show_secret:
-        print(f"User's TOTP secret: {secret}\n")
+        print(f"{scheme.upper()} secret: {secret}\n")
 
     # here comes the interactive part
     print("Scan this QR code with your authenticator app. When done,")
@@ -914,45 +1034,97 @@ def add_user(configfile: str, callsign: str, ttl_interval: int, show_secret: boo
     while content not in ["CONTINUE", "QUIT"]:
         content = input("Enter CONTINUE or QUIT: ")
         if content == "QUIT":
-            logger.debug(f"{add_user.__name__}: aborting")
-            return __success
+            logger.debug(f"{provision_otp_secret.__name__}: aborting")
+            return None, 0
 
-    # User has entered CONTINUE. Validate secret against TOTP code from user
-    content = ""
-    while content not in ["QUIT"] or len(content) != 6 and not content.isdigit():
-        content = input("Enter the 6-digit TOTP code or enter QUIT to exit:")
+    # User has entered CONTINUE. Validate secret against the code from user
+    while True:
+        content = input(
+            f"Enter the 6-digit {scheme.upper()} code or enter QUIT to exit:"
+        )
         if content == "QUIT":
-            logger.debug(f"{add_user.__name__}: aborting")
-            __success = False
-            return __success
-        else:
-            if not verify_totp_code(
-                totp_secret=secret, totp_code=content, ttl_interval=ttl_interval
-            ):
-                print("This TOTP code is invalid")
-                content = ""
-                continue
-            else:
-                # write to YAML file
-                __success = add_user_to_yaml_config(
-                    configfile=configfile,
-                    callsign=callsign,
-                    secret=secret,
-                    ttl_interval=ttl_interval,
-                )
-                print("")
-                if __success:
-                    logger.info(
-                        msg=f"User '{callsign}' was successfully added to config YAML file"
-                    )
-                    logger.info(
-                        msg="Now use --add-command and add some command codes for that user"
-                    )
-                else:
-                    logger.info(
-                        msg=f"Unable to write entry for '{callsign}' to config YAML file"
-                    )
-                break
+            logger.debug(f"{provision_otp_secret.__name__}: aborting")
+            return None, 0
+        if scheme == "hotp":
+            counter = match_hotp_code(
+                hotp_secret=secret, hotp_code=content, next_counter=0
+            )
+            if counter is not None:
+                # The user has consumed this counter value; expect the next one
+                return secret, counter + 1
+        elif verify_totp_code(
+            totp_secret=secret, totp_code=content, ttl_interval=ttl_interval
+        ):
+            return secret, 0
+        print(f"This {scheme.upper()} code is invalid")
+
+
+def add_user(
+    configfile: str,
+    callsign: str,
+    ttl_interval: int,
+    show_secret: bool,
+    scheme: str = "totp",
+):
+    """
+    Adds a user to the config file.
+
+    Parameters
+    ==========
+    configfile: str
+        Name of the external YAML config file
+    callsign: str
+        User's callsign
+    ttl_interval: int
+        desired time-to-live time span for the user callsign's secret
+    show_secret: bool
+        whether to show the secret or not (debug purposes only)
+    scheme: str
+        Authentication scheme, 'totp' or 'hotp'
+
+    Returns
+    =======
+    success: bool
+        True / False, depending on whether the entry was created/updated
+    """
+    __success = False
+
+    # Do not fail if the config file does not exist
+    if not does_file_exist(configfile):
+        logger.info(f"Creating new configuration file {configfile}")
+    logger.info("Adding new user account")
+
+    if scheme == "hotp":
+        logger.info(f"Generating HOTP credentials for user '{callsign}'")
+    else:
+        logger.info(
+            f"Generating TOTP credentials for user '{callsign}' with TTL '{ttl_interval}'"
+        )
+
+    secret, counter = provision_otp_secret(
+        label="https://github.com/joergschultzelutter",
+        ttl_interval=ttl_interval,
+        show_secret=show_secret,
+        scheme=scheme,
+    )
+    if not secret:
+        return __success
+
+    # write to YAML file
+    __success = add_user_to_yaml_config(
+        configfile=configfile,
+        callsign=callsign,
+        secret=secret,
+        ttl_interval=ttl_interval,
+        scheme=scheme,
+        counter=counter,
+    )
+    print("")
+    if __success:
+        logger.info(msg=f"User '{callsign}' was successfully added to config YAML file")
+        logger.info(msg="Now use --add-command and add some command codes for that user")
+    else:
+        logger.info(msg=f"Unable to write entry for '{callsign}' to config YAML file")
     return __success
 
 
@@ -997,6 +1169,9 @@ def add_cmd(
     command_string: str,
     detached_launch: bool,
     watchdog_timespan: float,
+    second_factor: bool = False,
+    ttl_interval: int = 30,
+    show_secret: bool = False,
 ):
     """
     Adds a command-code/command-string entry for a user to the config file.
@@ -1015,6 +1190,12 @@ def add_cmd(
         Determines whether to launch as a detached subprocess
     watchdog_timespan: float
         Watchdog timespan value
+    second_factor: bool
+        Protect the command with its own TOTP secret (second factor)
+    ttl_interval: int
+        TTL interval for the second factor's TOTP secret
+    show_secret: bool
+        whether to show the second factor's secret or not (debug purposes only)
 
     Returns
     =======
@@ -1028,6 +1209,18 @@ def add_cmd(
         logger.info(
             f"Adding new command-code '{command_code}' config for user '{callsign}'"
         )
+        second_factor_secret = None
+        if second_factor:
+            logger.info(
+                f"Generating second factor TOTP credentials for command-code '{command_code}' with TTL '{ttl_interval}'"
+            )
+            second_factor_secret, _ = provision_otp_secret(
+                label=f"{callsign}/{command_code}",
+                ttl_interval=ttl_interval,
+                show_secret=show_secret,
+            )
+            if not second_factor_secret:
+                return __success
         __success = add_cmd_to_yaml_config(
             configfile=configfile,
             callsign=callsign,
@@ -1035,6 +1228,8 @@ def add_cmd(
             command_string=command_string,
             detached_launch=detached_launch,
             watchdog_timespan=watchdog_timespan,
+            second_factor_secret=second_factor_secret,
+            second_factor_ttl=ttl_interval,
         )
         if __success:
             logger.info(
@@ -1083,6 +1278,74 @@ def del_cmd(configfile: str, callsign: str, command_code: str):
     return __success
 
 
+def list_lockouts(lockout_file: str):
+    """
+    Lists the content of the bot's lockout table
+
+    Parameters
+    ==========
+    lockout_file: str
+        Name of the bot's lockout table file
+
+    Returns
+    =======
+    success: bool
+        True / False, depending on whether the file was read
+    """
+    if not does_file_exist(lockout_file):
+        logger.info(f"Lockout file '{lockout_file}' does not exist; nothing to do")
+        return False
+
+    # Load the whole table; rewriting the file must not evict any entries
+    lockout_table = LockoutTable(filename=lockout_file, max_entries=None)
+    entries = lockout_table.get_entries()
+    if not entries:
+        logger.info(f"Lockout file '{lockout_file}' does not contain any entries")
+        return True
+
+    now = time.time()
+    for callsign, entry in entries.items():
+        remaining = max(entry["locked_until"] - now, 0.0)
+        logger.info(
+            msg=f"Callsign '{callsign}': failed attempts={entry['failures']}, last failure={time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_failure']))}, locked for {remaining:.0f} more secs"
+        )
+    return True
+
+
+def clear_lockouts(lockout_file: str, callsign: str):
+    """
+    Removes a callsign (or all callsigns) from the bot's lockout table.
+    A running bot will pick up the change with its next incoming message.
+
+    Parameters
+    ==========
+    lockout_file: str
+        Name of the bot's lockout table file
+    callsign: str
+        Callsign that is to be removed; empty string = remove all callsigns
+
+    Returns
+    =======
+    success: bool
+        True / False, depending on whether entries were removed
+    """
+    if not does_file_exist(lockout_file):
+        logger.info(f"Lockout file '{lockout_file}' does not exist; nothing to do")
+        return False
+
+    # Load the whole table; rewriting the file must not evict any entries
+    lockout_table = LockoutTable(filename=lockout_file, max_entries=None)
+    __success = lockout_table.clear(callsign=callsign if callsign else None)
+    if __success:
+        if callsign:
+            logger.info(f"Removed callsign '{callsign}' from the lockout table")
+        else:
+            logger.info("Removed all callsigns from the lockout table")
+    else:
+        logger.info("Unable to remove the lockout entry - e.g. entry does not exist")
+    return __success
+
+
 def wait_or_keypress(timeout_seconds: float) -> bool:
     """
     Waits a defined number of seconds until key press is pressed or until timeout is reached.
@@ -1178,14 +1441,29 @@ def main():
         sabb_execute_command_code,
         sabb_aprs_test_arguments,
         sabb_watchdog_timespan,
+        sabb_list_lockouts,
+        sabb_clear_lockouts,
+        sabb_lockout_file,
+        sabb_hotp_counter_file,
+        sabb_scheme,
+        sabb_second_factor,
     ) = get_command_line_params_config()
 
+    if sabb_list_lockouts:
+        list_lockouts(lockout_file=sabb_lockout_file)
+        sys.exit(0)
+
+    if sabb_clear_lockouts:
+        clear_lockouts(lockout_file=sabb_lockout_file, callsign=sabb_callsign)
+        sys.exit(0)
+
     if sabb_add_user:
         add_user(
             configfile=sabb_configfile,
             callsign=sabb_callsign,
             ttl_interval=sabb_ttl,
             show_secret=sabb_show_secret,
+            scheme=sabb_scheme,
         )
         sys.exit(0)
 
@@ -1201,6 +1479,9 @@ def main():
             command_string=sabb_command_string,
             detached_launch=sabb_detached_launch,
             watchdog_timespan=sabb_watchdog_timespan,
+            second_factor=sabb_second_factor,
+            ttl_interval=sabb_ttl,
+            show_secret=sabb_show_secret,
         )
         sys.exit(0)
 
@@ -1222,6 +1503,10 @@ def main():
             # Read the file from disk
             success, cfg_data = read_config_file_from_disk(filename=sabb_configfile)
 
+            # HOTP codes need to be newer than the bot's most recently
+            # accepted ones; use the bot's persisted counter values
+            read_hotp_counters_from_disk(filename=sabb_hotp_counter_file)
+
             if success:
                 (
                     success,
@@ -1230,6 +1515,9 @@ def main():
                     detached_launch,
                     secret,
                     watchdog_timespan,
+                    totp_step,
+                    totp_offset,
+                    scheme,
                 ) = identify_target_callsign_and_command_string(
                     data=cfg_data,
                     callsign=sabb_callsign,
@@ -1260,6 +1548,10 @@ def main():
             # Read the file from disk
             success, cfg_data = read_config_file_from_disk(filename=sabb_configfile)
 
+            # HOTP codes need to be newer than the bot's most recently
+            # accepted ones; use the bot's persisted counter values
+            read_hotp_counters_from_disk(filename=sabb_hotp_counter_file)
+
             if success:
 
                 (
@@ -1269,6 +1561,9 @@ def main():
                     detached_launch,
                     secret,
                     watchdog_timespan,
+                    totp_step,
+                    totp_offset,
+                    scheme,
                 ) = identify_target_callsign_and_command_string(
                     data=cfg_data,
                     callsign=sabb_callsign,
@@ -1289,6 +1584,30 @@ def main():
                         msg=f"Command '{sabb_command_code}' translates to target callsign '{target_callsign}' and command_string '{command_string}' with detached_launch='{detached_launch}' and {__wdstr}"
                     )
 
+                # Commands with a second factor expect its TOTP code as
+                # the first APRS argument; validate and remove it
+                second_factor_entry = get_command_second_factor(
+                    data=cfg_data,
+                    callsign=target_callsign,
+                    command_code=sabb_command_code,
+                )
+                if second_factor_entry:
+                    second_factor_code = (
+                        sabb_aprs_test_arguments.pop(0)
+                        if sabb_aprs_test_arguments
+                        else ""
+                    )
+                    if not verify_totp_code(
+                        totp_secret=second_factor_entry["secret"],
+                        totp_code=second_factor_code,
+                        ttl_interval=second_factor_entry["ttl"],
+                    ):
+                        logger.info(
+                            msg=f"Command '{sabb_command_code}' requires a second factor; the first APRS test argument must contain its valid TOTP code. Exiting"
+                        )
+                        sys.exit(0)
+                    logger.info(msg="Second factor TOTP code is valid")
+
                 # Check if there is something that we need to replace
                 regex_string = r"\@[0-9]"
                 matches = re.search(pattern=regex_string, string=command_string)
@@ -0,0 +1,361 @@
+#
+# Secure APRS Bastion Bot
+# Append-only audit journal for all authorized command executions
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Each authorized execution (including simulated ones) results in one
+# journal record. Records are tab-separated text lines, thus keeping the
+# file compact and allowing the query tool to filter the records without
+# parsing each line completely. The message processing only hands the
+# records over to a background writer which writes all pending records
+# with a single write/fsync call (group commit). Journal files are rotated
+# once they exceed their max size (<file>.1 ... <file>.n).
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import atexit
+import os
+import threading
+import time
+import sabb_shared
+from sabb_logger import logger
+
+# Record fields, in the order of their columns
+AUDIT_FIELDS = (
+    "timestamp",
+    "mode",
+    "from_callsign",
+    "target_callsign",
+    "command_code",
+    "command_string",
+    "pid",
+    "exit_code",
+    "duration_ms",
+    "watchdog",
+    "correlation_id",
+)
+
+# First line of each journal file. v1 records lack the correlation ID
+AUDIT_HEADER = "#sabb-audit v2\t" + "\t".join(AUDIT_FIELDS) + "\n"
+
+# Execution modes
+AUDIT_MODES = ("sync", "detached", "dry_run")
+
+# Characters that need to be escaped in a journal field
+_ESCAPE_TABLE = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def escape_field(value) -> str:
+    """
+    Converts a field value to its journal representation
+
+    Parameters
+    ==========
+    value: any
+        The field value; 'None' is stored as empty string
+
+    Returns
+    =======
+    field: str
+        The escaped field value
+    """
+    if value is None:
+        return ""
+    return str(value).translate(_ESCAPE_TABLE)
+
+
+def unescape_field(field: str) -> str:
+    """
+    Reverts escape_field()
+
+    Parameters
+    ==========
+    field: str
+        The escaped field value
+
+    Returns
+    =======
+    value: str
+        The original field value
+    """
+    if "\\" not in field:
+        return field
+    output = []
+    chars = iter(field)
+    for char in chars:
+        if char == "\\":
+            char = {"t": "\t", "n": "\n", "r": "\r"}.get(next(chars, ""), "\\")
+        output.append(char)
+    return "".join(output)
+
+
+def get_journal_files(filename: str):
+    """
+    Returns the names of all existing journal files, oldest file first
+
+    Parameters
+    ==========
+    filename: str
+        Name of the current journal file
+
+    Returns
+    =======
+    filenames: list
+        Rotated files (<file>.n ... <file>.1) plus the current file
+    """
+    rotated = []
+    index = 1
+    while os.path.isfile(f"{filename}.{index}"):
+        rotated.append(f"{filename}.{index}")
+        index += 1
+    filenames = list(reversed(rotated))
+    if os.path.isfile(filename):
+        filenames.append(filename)
+    return filenames
+
+
+class AuditJournal:
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+        commit_interval: float = 1.0,
+    ):
+        """
+        Class initialization. Starts the background writer thread
+
+        Parameters
+        ==========
+        filename: str
+            Name of the journal file
+        max_bytes: int
+            Rotate the journal file once it exceeds this size;
+            0 = no rotation
+        backup_count: int
+            Number of rotated journal files that we keep
+        commit_interval: float
+            Max time span in seconds between a record's submission
+            and its write/fsync
+
+        Returns
+        =======
+        """
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = max(backup_count, 1)
+        self.commit_interval = commit_interval
+        self.commits = 0
+        self.records = 0
+        self._pending = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._file = None
+        self._thread = threading.Thread(
+            target=self._writer, name="sabb-audit", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, record: dict):
+        """
+        Submits a record. Does not wait for the record to be written
+
+        Parameters
+        ==========
+        record: dict
+            The record, see AUDIT_FIELDS; missing fields are stored
+            as empty values
+
+        Returns
+        =======
+        """
+        line = "\t".join(escape_field(record.get(field)) for field in AUDIT_FIELDS)
+        with self._condition:
+            self._pending.append(line + "\n")
+            # The writer only waits for the first record of a batch
+            if len(self._pending) == 1:
+                self._condition.notify()
+
+    def flush(self):
+        """
+        Waits until all records that have been submitted so far are on disk
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        """
+        with self._condition:
+            target = self.records + len(self._pending)
+            self._condition.notify()
+            while self.records < target and not self._closed:
+                self._condition.wait(timeout=0.1)
+
+    def close(self):
+        """
+        Writes all pending records and stops the writer thread
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _writer(self):
+        while True:
+            with self._condition:
+                # Wait for the first record, then give concurrent
+                # records the chance to join the same commit
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._closed and self.commit_interval > 0:
+                    self._condition.wait(timeout=self.commit_interval)
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            if batch:
+                self._commit(batch=batch)
+                with self._condition:
+                    self.records += len(batch)
+                    self.commits += 1
+                    self._condition.notify_all()
+            if closed:
+                with self._condition:
+                    if not self._pending:
+                        break
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _commit(self, batch: list):
+        data = "".join(batch).encode("utf-8")
+        try:
+            if (
+                self._file
+                and self.max_bytes
+                and self._file.tell() + len(data) > self.max_bytes
+            ):
+                self._rotate()
+            if not self._file:
+                self._file = open(self.filename, "ab")
+                if self._file.tell() == 0:
+                    self._file.write(AUDIT_HEADER.encode("utf-8"))
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError as ex:
+            logger.error(
+                msg=f"Unable to write {len(batch)} audit record(s) to '{self.filename}': {ex}"
+            )
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        oldest = f"{self.filename}.{self.backup_count}"
+        if os.path.isfile(oldest):
+            os.remove(oldest)
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.isfile(f"{self.filename}.{index}"):
+                os.replace(f"{self.filename}.{index}", f"{self.filename}.{index + 1}")
+        os.replace(self.filename, f"{self.filename}.1")
+        logger.info(msg=f"Rotated audit journal '{self.filename}'")
+
+
+def create_audit_journal(
+    filename: str,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    commit_interval: float = 1.0,
+):
+    """
+    Creates the audit journal
+
+    Parameters
+    ==========
+    filename: str
+        Name of the journal file; empty string = no journal
+    max_bytes: int
+        Rotate the journal file once it exceeds this size; 0 = no rotation
+    backup_count: int
+        Number of rotated journal files that we keep
+    commit_interval: float
+        Max time span in seconds between a record's submission
+        and its write/fsync
+
+    Returns
+    =======
+    audit_journal: AuditJournal | None
+        The journal object or 'None' if the journal is disabled
+    """
+    if not filename:
+        logger.debug(msg="Audit journal is disabled")
+        return None
+    logger.debug(
+        msg=f"Audit journal '{filename}': rotation at {max_bytes} bytes, {backup_count} backups, commit interval {commit_interval} secs"
+    )
+    return AuditJournal(
+        filename=filename,
+        max_bytes=max_bytes,
+        backup_count=backup_count,
+        commit_interval=commit_interval,
+    )
+
+
+def record_execution(response_object: dict, mode: str, execution_details: dict):
+    """
+    Adds an execution record to the audit journal (if enabled)
+
+    Parameters
+    ==========
+    response_object: dict
+        The input parser's response object
+    mode: str
+        Execution mode, see AUDIT_MODES
+    execution_details: dict
+        execute_program's execution details (empty for dry runs)
+
+    Returns
+    =======
+    """
+    if sabb_shared.audit_journal is None:
+        return
+    duration = execution_details.get("duration")
+    sabb_shared.audit_journal.append(
+        {
+            "timestamp": f"{time.time():.3f}",
+            "mode": mode,
+            "from_callsign": response_object["from_callsign"],
+            "target_callsign": response_object["target_callsign"],
+            "command_code": response_object["command_code"],
+            "command_string": response_object["command_string"],
+            "pid": execution_details.get("pid"),
+            "exit_code": execution_details.get("exit_code"),
+            "duration_ms": f"{duration * 1000:.1f}" if duration is not None else None,
+            "watchdog": 1 if execution_details.get("watchdog_triggered") else 0,
+            "correlation_id": response_object.get("correlation_id"),
+        }
+    )
+
+
+if __name__ == "__main__":
+    pass
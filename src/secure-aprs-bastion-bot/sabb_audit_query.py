@@ -0,0 +1,431 @@
+#!/opt/local/bin/python
+#
+# Secure APRS Bastion Bot
+# Query tool for the execution audit journal
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Filters the records of the bot's audit journal (including its rotated
+# files) by callsign, command code, time span and exit code. The journal
+# files are read in binary mode; exact-match filters are applied as plain
+# substring checks on the raw lines before a line gets split into its
+# fields, thus keeping the tool fast even for millions of records.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import sys
+from collections import deque
+from sabb_audit import AUDIT_FIELDS, get_journal_files, unescape_field
+from sabb_replay import parse_timestamp
+
+# Column positions
+FIELD_INDEX = {field: index for index, field in enumerate(AUDIT_FIELDS)}
+
+
+def get_last_timestamp(filename: str):
+    """
+    Returns the timestamp of a journal file's most recent record
+
+    Parameters
+    ==========
+    filename: str
+        Name of the journal file
+
+    Returns
+    =======
+    timestamp: float | None
+        Epoch seconds; None if the file does not contain any records
+    """
+    with open(filename, "rb") as journal_file:
+        journal_file.seek(0, os.SEEK_END)
+        size = journal_file.tell()
+        journal_file.seek(max(size - 65536, 0))
+        lines = journal_file.read().splitlines()
+    for line in reversed(lines):
+        if line and not line.startswith(b"#"):
+            try:
+                return float(line.split(b"\t", 1)[0])
+            except ValueError:
+                return None
+    return None
+
+
+class RecordFilter:
+    def __init__(
+        self,
+        callsign: str = "",
+        command_code: str = "",
+        since: float | None = None,
+        until: float | None = None,
+        exit_code: int | None = None,
+        failed: bool = False,
+        correlation_id: str = "",
+    ):
+        """
+        Record filter. All criteria are optional and get combined by AND
+
+        Parameters
+        ==========
+        callsign: str
+            Sender or target callsign; '*' and '?' wildcards are supported
+        command_code: str
+            Command code
+        since: float | None
+            Oldest record timestamp (epoch seconds)
+        until: float | None
+            Newest record timestamp (epoch seconds)
+        exit_code: int | None
+            Exit code of the executed command
+        failed: bool
+            Only return records with a non-zero exit code or whose
+            command had to be terminated by the watchdog
+        correlation_id: str
+            Correlation ID of the request
+
+        Returns
+        =======
+        """
+        self.since = since
+        self.until = until
+        self.failed = failed
+        self.callsign = callsign.upper()
+        self.callsign_wildcard = any(char in self.callsign for char in "*?[")
+        self.command_code = command_code.lower()
+        self.exit_code = None if exit_code is None else str(exit_code)
+        self.correlation_id = correlation_id.lower()
+
+        # Literal byte sequences that each matching line has to contain
+        self.prefilter = []
+        if self.callsign:
+            if self.callsign_wildcard:
+                literal = max(
+                    self.callsign.replace("?", "*").replace("[", "*").split("*"),
+                    key=len,
+                )
+                if literal:
+                    self.prefilter.append(literal.encode("utf-8"))
+            else:
+                self.prefilter.append(f"\t{self.callsign}\t".encode("utf-8"))
+        if self.command_code:
+            self.prefilter.append(f"\t{self.command_code}\t".encode("utf-8"))
+        if self.correlation_id:
+            self.prefilter.append(f"\t{self.correlation_id}".encode("utf-8"))
+
+    def skip_file(self, filename: str):
+        """
+        Checks if a journal file can be skipped entirely because
+        all of its records are older than the 'since' timestamp
+
+        Parameters
+        ==========
+        filename: str
+            Name of the journal file
+
+        Returns
+        =======
+        skip: bool
+            True if the file does not contain any matching records
+        """
+        if self.since is None:
+            return False
+        last_timestamp = get_last_timestamp(filename=filename)
+        return last_timestamp is None or last_timestamp < self.since
+
+    def match(self, line: bytes):
+        """
+        Checks a raw journal line
+
+        Parameters
+        ==========
+        line: bytes
+            The raw journal line (without line break)
+
+        Returns
+        =======
+        fields: list | None
+            The line's (still escaped) fields if the line matches,
+            None otherwise
+        """
+        for literal in self.prefilter:
+            if literal not in line:
+                return None
+        if self.since is not None or self.until is not None:
+            timestamp = float(line[: line.index(b"\t")])
+            if self.since is not None and timestamp < self.since:
+                return None
+            if self.until is not None and timestamp > self.until:
+                return None
+        fields = line.decode("utf-8", errors="replace").split("\t")
+        if len(fields) > len(AUDIT_FIELDS):
+            return None
+        if len(fields) < len(AUDIT_FIELDS):
+            # Records of previous journal versions lack the trailing fields
+            fields.extend([""] * (len(AUDIT_FIELDS) - len(fields)))
+        if (
+            self.correlation_id
+            and fields[FIELD_INDEX["correlation_id"]] != self.correlation_id
+        ):
+            return None
+        if self.callsign:
+            callsigns = (
+                fields[FIELD_INDEX["from_callsign"]],
+                fields[FIELD_INDEX["target_callsign"]],
+            )
+            if self.callsign_wildcard:
+                if not any(
+                    fnmatch.fnmatchcase(callsign, self.callsign)
+                    for callsign in callsigns
+                ):
+                    return None
+            elif self.callsign not in callsigns:
+                return None
+        if (
+            self.command_code
+            and fields[FIELD_INDEX["command_code"]].lower() != self.command_code
+        ):
+            return None
+        exit_code = fields[FIELD_INDEX["exit_code"]]
+        if self.exit_code is not None and exit_code != self.exit_code:
+            return None
+        if (
+            self.failed
+            and exit_code in ("", "0")
+            and fields[FIELD_INDEX["watchdog"]] != "1"
+        ):
+            return None
+        return fields
+
+
+def query_journal(filenames: list, record_filter: RecordFilter, limit: int = 0):
+    """
+    Runs a query against the journal files
+
+    Parameters
+    ==========
+    filenames: list
+        Journal files, oldest file first
+    record_filter: RecordFilter
+        Our filter criteria
+    limit: int
+        Only return the most recent n matching records; 0 = all records
+
+    Returns
+    =======
+    records: collections.deque
+        The matching records (lists of escaped fields), oldest record first
+    count: int
+        Total number of matching records
+    """
+    records = deque(maxlen=limit) if limit > 0 else deque()
+    count = 0
+    for filename in filenames:
+        if record_filter.skip_file(filename=filename):
+            continue
+        with open(filename, "rb") as journal_file:
+            for line in journal_file:
+                if line.startswith(b"#"):
+                    continue
+                fields = record_filter.match(line.rstrip(b"\r\n"))
+                if fields is not None:
+                    records.append(fields)
+                    count += 1
+    return records, count
+
+
+def format_record(fields: list, output_format: str):
+    """
+    Formats a matching record
+
+    Parameters
+    ==========
+    fields: list
+        The record's (still escaped) fields
+    output_format: str
+        text, json or tsv
+
+    Returns
+    =======
+    output: str
+        The formatted record
+    """
+    if output_format == "tsv":
+        return "\t".join(fields)
+    record = dict(zip(AUDIT_FIELDS, (unescape_field(field) for field in fields)))
+    if output_format == "json":
+        for field in ("timestamp", "duration_ms"):
+            record[field] = float(record[field]) if record[field] else None
+        for field in ("pid", "exit_code", "watchdog"):
+            record[field] = int(record[field]) if record[field] else None
+        return json.dumps(record)
+    timestamp = datetime.datetime.fromtimestamp(float(record["timestamp"]))
+    exit_code = record["exit_code"] or "-"
+    if record["watchdog"] == "1":
+        exit_code += " (watchdog)"
+    return (
+        f"{timestamp.isoformat(sep=' ', timespec='seconds')} {record['mode']:<8} "
+        f"{record['from_callsign']:<9} -> {record['target_callsign']:<9} "
+        f"{record['command_code']:<12} pid={record['pid'] or '-'} "
+        f"rc={exit_code} {record['duration_ms'] or '-'}ms "
+        f"[{record['correlation_id'] or '-'}] '{record['command_string']}'"
+    )
+
+
+def get_command_line_params():
+    """
+    Gets and returns the command line arguments
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    args: argparse.Namespace
+        The command line arguments
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--journal",
+        dest="journal",
+        default="sabb_audit_journal.tsv",
+        type=str,
+        help="Audit journal file name; rotated files get included (default is 'sabb_audit_journal.tsv')",
+    )
+
+    parser.add_argument(
+        "--callsign",
+        dest="callsign",
+        default="",
+        type=str,
+        help="Sender or target callsign; wildcards are supported, e.g. 'DF1JSL-*'",
+    )
+
+    parser.add_argument(
+        "--command-code",
+        dest="command_code",
+        default="",
+        type=str,
+        help="Command code",
+    )
+
+    parser.add_argument(
+        "--since",
+        dest="since",
+        default="",
+        type=str,
+        help="Oldest record timestamp (epoch seconds or ISO 8601)",
+    )
+
+    parser.add_argument(
+        "--until",
+        dest="until",
+        default="",
+        type=str,
+        help="Newest record timestamp (epoch seconds or ISO 8601)",
+    )
+
+    parser.add_argument(
+        "--correlation-id",
+        dest="correlation_id",
+        default="",
+        type=str,
+        help="Correlation ID of the request (see the bot's log records)",
+    )
+
+    parser.add_argument(
+        "--exit-code",
+        dest="exit_code",
+        default=None,
+        type=int,
+        help="Exit code of the executed command",
+    )
+
+    parser.add_argument(
+        "--failed",
+        dest="failed",
+        action="store_true",
+        default=False,
+        help="Only show commands with a non-zero exit code or a watchdog termination",
+    )
+
+    parser.add_argument(
+        "--limit",
+        dest="limit",
+        default=0,
+        type=int,
+        help="Only show the most recent n matching records (default: all records)",
+    )
+
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=["text", "json", "tsv"],
+        default="text",
+        help="Output format (default: text)",
+    )
+
+    parser.add_argument(
+        "--count",
+        dest="count",
+        action="store_true",
+        default=False,
+        help="Only print the number of matching records",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_command_line_params()
+
+    timestamps = {}
+    for name in ("since", "until"):
+        value = getattr(args, name)
+        timestamps[name] = parse_timestamp(value) if value else None
+        if value and timestamps[name] is None:
+            print(f"Invalid timestamp for --{name}: '{value}'", file=sys.stderr)
+            sys.exit(1)
+
+    filenames = get_journal_files(filename=args.journal)
+    if not filenames:
+        print(f"Audit journal '{args.journal}' does not exist", file=sys.stderr)
+        sys.exit(1)
+
+    record_filter = RecordFilter(
+        callsign=args.callsign,
+        command_code=args.command_code,
+        since=timestamps["since"],
+        until=timestamps["until"],
+        exit_code=args.exit_code,
+        failed=args.failed,
+        correlation_id=args.correlation_id,
+    )
+    records, count = query_journal(
+        filenames=filenames,
+        record_filter=record_filter,
+        limit=1 if args.count else args.limit,
+    )
+    if args.count:
+        print(count)
+        sys.exit(0)
+    try:
+        for fields in records:
+            print(format_record(fields=fields, output_format=args.output_format))
+    except BrokenPipeError:
+        pass
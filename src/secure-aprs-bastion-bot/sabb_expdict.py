@@ -21,10 +21,113 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
+from collections import OrderedDict
+import math
+import time
 from expiringdict import ExpiringDict
 from sabb_logger import logger
 
 
+class TotpExpiringDict(ExpiringDict):
+    """
+    ExpiringDict which keeps track of its capacity usage. Whenever the
+    dictionary is full, expired entries are removed first. If there are
+    no expired entries left, the oldest live entry gets evicted before its
+    expiry - which is something that we want to know about.
+    """
+
+    def __init__(self, max_len: int, max_age_seconds: int):
+        super().__init__(max_len=max_len, max_age_seconds=max_age_seconds)
+        self.insertions = 0
+        self.expired_evictions = 0
+        self.evictions_before_expiry = 0
+        self.high_water_mark = 0
+
+    def __setitem__(self, key, value, set_time=None):
+        with self.lock:
+            if not OrderedDict.__contains__(self, key):
+                self._make_room(max_len=self.max_len - 1)
+            ExpiringDict.__setitem__(self, key, value, set_time)
+            self.insertions += 1
+            self.high_water_mark = max(self.high_water_mark, len(self))
+
+    def _make_room(self, max_len: int):
+        """
+        Removes entries from the dictionary until its size does not
+        exceed max_len. Oldest entries get removed first.
+
+        Parameters
+        ==========
+        max_len: int
+            Maximum number of entries that may remain in the dictionary
+
+        Returns
+        =======
+        """
+        now = time.time()
+        while len(self) > max(max_len, 0):
+            key = next(iter(OrderedDict.keys(self)))
+            item = OrderedDict.__getitem__(self, key)
+            OrderedDict.__delitem__(self, key)
+            if now - item[1] >= self.max_age:
+                self.expired_evictions += 1
+            else:
+                self.evictions_before_expiry += 1
+                # Do not flood the log file; report the first and then every 100th occurrence
+                if self.evictions_before_expiry % 100 == 1:
+                    logger.warning(
+                        msg=f"TOTP message dupe cache is full; evicted a live entry before its expiry ({self.evictions_before_expiry} times so far). Consider increasing 'sabb_totp_cache_max_len'"
+                    )
+
+    def resize(self, max_len: int):
+        """
+        Changes the maximum number of entries of the dictionary
+
+        Parameters
+        ==========
+        max_len: int
+            New maximum number of entries
+
+        Returns
+        =======
+        """
+        with self.lock:
+            self.max_len = max_len
+            self._make_room(max_len=max_len)
+
+    def get_statistics(self):
+        """
+        Returns the dictionary's capacity statistics
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        statistics: dict
+            occupancy (live entries), size (including expired entries
+            which were not yet purged), max_len, insertions, expired
+            evictions, evictions before expiry and high water mark
+        """
+        with self.lock:
+            now = time.time()
+            occupancy = sum(
+                1
+                for key in list(OrderedDict.keys(self))
+                if now - OrderedDict.__getitem__(self, key)[1] < self.max_age
+            )
+            return {
+                "occupancy": occupancy,
+                "size": len(self),
+                "max_len": self.max_len,
+                "max_age_seconds": self.max_age,
+                "insertions": self.insertions,
+                "expired_evictions": self.expired_evictions,
+                "evictions_before_expiry": self.evictions_before_expiry,
+                "high_water_mark": self.high_water_mark,
+            }
+
+
 # Helper method for creating our APRS message cache
 def create_totp_expiringdict(max_len: int, max_age_seconds: int):
     """
@@ -46,12 +149,130 @@ def create_totp_expiringdict(max_len: int, max_age_seconds: int):
     logger.debug(
         msg=f"TOTP message dupe cache set to {str(max_len)} max possible entries and a TTL of {str(max_age_seconds / 60)} mins"
     )
-    totp_message_cache = ExpiringDict(
+    totp_message_cache = TotpExpiringDict(
         max_len=max_len,
         max_age_seconds=max_age_seconds,
     )
     return totp_message_cache
 
 
+def calculate_totp_expiringdict_size(
+    data: dict, max_age_seconds: int, valid_window: int = 0
+):
+    """
+    Calculates the number of TOTP cache entries that the configured users
+    can occupy at most. Every accepted TOTP code needs to be newer than the
+    previously accepted code for the same key; therefore, every key can
+    occupy one entry per time step that can be accepted within the cache's
+    life span. Keys are the callsigns of all TOTP user entries (base and
+    SSID-specific entries alike) plus the 'callsign/command' keys of all
+    commands which require a second factor.
+
+    Parameters
+    ==========
+    data: dict
+        Content from the external YAML file
+    max_age_seconds: int
+        life span per cache entry in seconds
+    valid_window: int
+        Number of TOTP time steps before and after the current time step
+        that are also accepted
+
+    Returns
+    =======
+    max_len: int
+        Number of max dictionary entries
+    """
+    max_len = 0
+    for ttl in get_totp_key_ttls(data=data).values():
+        max_len += math.ceil(max_age_seconds / ttl) + 2 * valid_window + 1
+    return max(max_len, 1)
+
+
+def get_totp_key_ttls(data: dict):
+    """
+    Returns the TOTP cache keys that the configured users can occupy,
+    along with their TOTP time step lengths
+
+    Parameters
+    ==========
+    data: dict
+        Content from the external YAML file
+
+    Returns
+    =======
+    ttls: dict
+        Dictionary, using the callsign (or 'callsign/command') as key and
+        the TOTP time step length in seconds as value
+    """
+    ttls = {}
+    seen = set()
+    for __item in data.get("users") or []:
+        __callsign = __item.get("callsign")
+        # a callsign's first entry wins, see sabb_utils.build_user_index
+        if not __callsign or __callsign in seen:
+            continue
+        seen.add(__callsign)
+        # HOTP users keep track of their counters outside of the cache
+        if str(__item.get("scheme") or "totp").lower() == "totp":
+            ttls[__callsign] = __item.get("ttl", 30)
+        # Second factors are always TOTP based
+        for __code, __command in (__item.get("commands") or {}).items():
+            if __command and __command.get("second_factor_secret"):
+                ttls[f"{__callsign}/{__code}"] = __command.get(
+                    "second_factor_ttl", 30
+                )
+    return ttls
+
+
+def check_totp_expiringdict_config(
+    totp_message_cache: TotpExpiringDict,
+    data: dict,
+    auto_size: bool = False,
+    valid_window: int = 0,
+):
+    """
+    Checks the TOTP cache settings against the users from the external
+    YAML file. Warns if the cache's life span is shorter than a TOTP
+    code's acceptance time span and - if requested - adjusts the cache's
+    number of max entries to the configured users
+
+    Parameters
+    ==========
+    totp_message_cache: TotpExpiringDict
+        Our TOTP cache
+    data: dict
+        Content from the external YAML file
+    auto_size: bool
+        True = derive the cache's number of max entries from the configured users
+    valid_window: int
+        Number of TOTP time steps before and after the current time step
+        that are also accepted
+
+    Returns
+    =======
+    """
+    max_age_seconds = totp_message_cache.max_age
+
+    # A TOTP code can be accepted for (2 * valid_window + 1) time steps
+    ttl_list = list(get_totp_key_ttls(data=data).values())
+    if ttl_list:
+        acceptance_span = max(ttl_list) * (2 * valid_window + 1)
+        if max_age_seconds < acceptance_span:
+            logger.warning(
+                msg=f"'sabb_totp_cache_max_age_seconds' ({max_age_seconds} secs) is shorter than the longest TOTP code acceptance time span ({acceptance_span} secs); consider increasing its value"
+            )
+
+    if auto_size:
+        max_len = calculate_totp_expiringdict_size(
+            data=data, max_age_seconds=max_age_seconds, valid_window=valid_window
+        )
+        if max_len != totp_message_cache.max_len:
+            logger.info(
+                msg=f"Auto-sizing TOTP message dupe cache to {max_len} max possible entries"
+            )
+            totp_message_cache.resize(max_len=max_len)
+
+
 if __name__ == "__main__":
     pass
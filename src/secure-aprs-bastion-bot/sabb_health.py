@@ -0,0 +1,312 @@
+#
+# Secure APRS Bastion Bot
+# Health and readiness endpoints
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Exposes the bot's state (APRS-IS connectivity, time since the last
+# processed packet, pending and running jobs, TOTP replay cache size, the
+# loaded user/command configuration and the load shedding state) as JSON
+# document on the metrics server (paths: /health and /ready). The message
+# processing only updates a few plain attributes of the HealthState object;
+# the endpoints read these attributes without taking any of the message
+# processing's locks.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import json
+import os
+import time
+from collections import OrderedDict
+import sabb_shared
+from sabb_metrics import MetricsRequestHandler
+
+try:
+    from CoreAprsClient import client_shared
+except ImportError:
+    client_shared = None
+
+
+class HealthState:
+    def __init__(self):
+        """
+        Class initialization
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        """
+        self.start_time = time.time()
+        self.packets = 0
+        self.last_packet_time = None
+        self.pending_jobs = 0
+        self.running_job = None
+        self.running_job_start = None
+        self.executed_jobs = 0
+        self.config_generation = 0
+        self.config_timestamp = None
+        self.config_load_time = None
+
+    def config_loaded(self, timestamp: float):
+        """
+        Registers a (re-)load of the user/command configuration file
+
+        Parameters
+        ==========
+        timestamp: float
+            The loaded file's modification time
+
+        Returns
+        =======
+        """
+        self.config_timestamp = timestamp
+        self.config_load_time = time.time()
+        self.config_generation += 1
+
+
+class _NullJob:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class TrackedJob:
+    def __init__(self, command_code: str):
+        self.command_code = command_code
+
+    def __enter__(self):
+        health = sabb_shared.health
+        health.running_job_start = time.monotonic()
+        health.running_job = self.command_code
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        health = sabb_shared.health
+        health.running_job = None
+        health.running_job_start = None
+        health.executed_jobs += 1
+        return False
+
+
+_null_job = _NullJob()
+
+
+def note_packet():
+    """
+    Registers an incoming packet. Does nothing if the health
+    endpoints have not been enabled
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    """
+    health = sabb_shared.health
+    if health is not None:
+        health.packets += 1
+        health.last_packet_time = time.time()
+
+
+def note_job_queued():
+    """
+    Registers a detached launch that waits for the post processor
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    """
+    if sabb_shared.health is not None:
+        sabb_shared.health.pending_jobs += 1
+
+
+def note_job_dequeued():
+    """
+    Registers the post processor's takeover of a detached launch
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    """
+    health = sabb_shared.health
+    if health is not None:
+        health.pending_jobs = max(health.pending_jobs - 1, 0)
+
+
+def note_config_loaded(timestamp: float):
+    """
+    Registers a (re-)load of the user/command configuration file
+
+    Parameters
+    ==========
+    timestamp: float
+        The loaded file's modification time
+
+    Returns
+    =======
+    """
+    if sabb_shared.health is not None:
+        sabb_shared.health.config_loaded(timestamp=timestamp)
+
+
+def tracked_job(command_code: str):
+    """
+    Returns a context manager which marks a command execution as running.
+    Does nothing if the health endpoints have not been enabled
+
+    Parameters
+    ==========
+    command_code: str
+        The command code whose command string gets executed
+
+    Returns
+    =======
+    job: TrackedJob | _NullJob
+        The context manager
+    """
+    if sabb_shared.health is None:
+        return _null_job
+    return TrackedJob(command_code=command_code)
+
+
+def is_aprsis_connected():
+    """
+    Returns the framework's APRS-IS connection state
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    connected: bool
+        True if the bot is connected to APRS-IS
+    """
+    ais = getattr(client_shared, "AIS", None)
+    try:
+        return bool(ais and ais.ais_is_connected())
+    except AttributeError:
+        return False
+
+
+def get_health_status():
+    """
+    Collects the bot's health status
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    ready: bool
+        True if the bot is connected to APRS-IS and has loaded its
+        user/command configuration
+    status: dict
+        The health status
+    """
+    health = sabb_shared.health
+    now = time.time()
+
+    running_seconds = None
+    running_job_start = health.running_job_start
+    if running_job_start is not None:
+        running_seconds = round(time.monotonic() - running_job_start, 3)
+
+    # Plain dictionary length; ExpiringDict's own methods would take its lock
+    cache = sabb_shared.totp_message_cache
+    cache_entries = OrderedDict.__len__(cache) if cache is not None else 0
+
+    # The configuration file gets re-read with the next incoming packet
+    reload_pending = False
+    if sabb_shared.command_config_filename and health.config_timestamp is not None:
+        try:
+            reload_pending = (
+                os.path.getmtime(sabb_shared.command_config_filename)
+                != health.config_timestamp
+            )
+        except OSError:
+            reload_pending = True
+
+    last_packet_time = health.last_packet_time
+    config_data = sabb_shared.config_data
+    status = {
+        "aprsis_connected": is_aprsis_connected(),
+        "uptime_seconds": round(now - health.start_time, 1),
+        "packets": health.packets,
+        "seconds_since_last_packet": (
+            round(now - last_packet_time, 1) if last_packet_time else None
+        ),
+        "jobs": {
+            "pending": health.pending_jobs,
+            "running": 0 if running_seconds is None else 1,
+            "running_command_code": health.running_job,
+            "running_seconds": running_seconds,
+            "executed": health.executed_jobs,
+        },
+        "replay_cache": {
+            "entries": cache_entries,
+            "max_entries": cache.max_len if cache is not None else 0,
+        },
+        "config": {
+            "generation": health.config_generation,
+            "file_timestamp": health.config_timestamp,
+            "loaded_seconds_ago": (
+                round(now - health.config_load_time, 1)
+                if health.config_load_time
+                else None
+            ),
+            "users": len(config_data.get("users", [])) if config_data else 0,
+            "reload_pending": reload_pending,
+        },
+    }
+    if sabb_shared.load_shedder is not None:
+        status["load_shedding"] = sabb_shared.load_shedder.get_status()
+    ready = status["aprsis_connected"] and config_data is not None
+    status["status"] = "ready" if ready else "not_ready"
+    return ready, status
+
+
+def register_health_routes():
+    """
+    Adds the /health (always HTTP 200) and /ready (HTTP 200 or 503)
+    paths to the metrics server
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    """
+
+    def health_route(headers):
+        _, status = get_health_status()
+        return 200, "application/json", json.dumps(status)
+
+    def ready_route(headers):
+        ready, status = get_health_status()
+        return 200 if ready else 503, "application/json", json.dumps(status)
+
+    MetricsRequestHandler.routes["/health"] = health_route
+    MetricsRequestHandler.routes["/ready"] = ready_route
+
+
+if __name__ == "__main__":
+    pass
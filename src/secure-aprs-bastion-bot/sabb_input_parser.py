@@ -22,12 +22,21 @@ from CoreAprsClient import CoreAprsClientInputParserStatus, CoreAprsClient
 import sabb_http_codes
 import sabb_shared
 import re
+import time
+from sabb_logger import logger, log_request_outcome, new_correlation_id
 from sabb_utils import (
     get_modification_time,
     read_config_file_from_disk,
     identify_target_callsign_and_command_string,
-    get_totp_expiringdict_key,
+    build_user_index,
+    get_authenticator,
+    get_command_second_factor,
+    clear_otp_key_cache,
+    TotpAuthenticator,
 )
+from sabb_expdict import check_totp_expiringdict_config
+from sabb_metrics import timed_stage, timed_component, count_outcome
+from sabb_health import note_packet, note_config_loaded
 import copy
 
 
@@ -65,6 +74,7 @@ def dismantle_aprs_message(aprs_message: str):
     return _success, totp, command_code, params
 
 
+@timed_component(component="input_parser")
 def parse_input_message(
     instance: CoreAprsClient, aprs_message: str, from_callsign: str, **kwargs
 ):
@@ -114,25 +124,99 @@ def parse_input_message(
     # does not work for you
     input_parser_error_message = ""
 
-    # Check if the command config file has been changed and re-import it, if necessary
-    config_updated_timestamp = get_modification_time(
-        filename=sabb_shared.command_config_filename
-    )
+    # Used for the request's end-to-end latency (see log_request_outcome)
+    request_start = time.perf_counter()
+    note_packet()
+
+    # Tie together all log records, metrics exemplars, audit records and
+    # child processes which belong to this packet
+    correlation_id = new_correlation_id()
+
+    # Reject messages from locked callsigns before we do any crypto or config work.
+    # Do not disclose the reason to the user
+    lockout_remaining = 0.0
+    if sabb_shared.lockout_table:
+        with timed_stage(component="input_parser", stage="lockout_check"):
+            lockout_remaining = sabb_shared.lockout_table.get_lockout_remaining(
+                callsign=from_callsign, now=sabb_shared.clock()
+            )
+
+    # While the bot falls behind, ignore the messages which are unlikely
+    # to be legitimate requests. Ignored messages do not get a response
+    if sabb_shared.load_shedder:
+        with timed_stage(component="input_parser", stage="load_shedding"):
+            shed_reason = sabb_shared.load_shedder.check(
+                callsign=from_callsign,
+                message=aprs_message,
+                lockout_remaining=lockout_remaining,
+            )
+        if shed_reason:
+            count_outcome(outcome="shed")
+            input_parser_response_object = {}
+            return_code = CoreAprsClientInputParserStatus.PARSE_IGNORE
+            return return_code, input_parser_error_message, input_parser_response_object
+
+    if lockout_remaining > 0:
+        logger.debug(
+            "Rejecting message from locked callsign '%s' (%.0f secs remaining)",
+            from_callsign,
+            lockout_remaining,
+        )
+        count_outcome(outcome="rate_limited")
+        log_request_outcome(
+            outcome="rate_limited",
+            callsign=from_callsign,
+            request_start=request_start,
+        )
+        input_parser_error_message = sabb_http_codes.http_msg_403
+        input_parser_response_object = {}
+        return_code = CoreAprsClientInputParserStatus.PARSE_ERROR
+        return return_code, input_parser_error_message, input_parser_response_object
 
-    # Re-read the config file from disk, if necessary
-    if config_updated_timestamp != sabb_shared.config_initial_timestamp:
-        __success, __data = read_config_file_from_disk(
+    # Check if the command config file has been changed and re-import it, if necessary
+    with timed_stage(component="input_parser", stage="config_reload_check"):
+        config_updated_timestamp = get_modification_time(
             filename=sabb_shared.command_config_filename
         )
-        if __success:
-            sabb_shared.config_data = copy.deepcopy(__data)
-            sabb_shared.config_initial_timestamp = config_updated_timestamp
+
+        # Re-read the config file from disk, if necessary
+        if config_updated_timestamp != sabb_shared.config_initial_timestamp:
+            __success, __data = read_config_file_from_disk(
+                filename=sabb_shared.command_config_filename
+            )
+            if __success:
+                sabb_shared.config_data = copy.deepcopy(__data)
+                sabb_shared.config_user_index = build_user_index(
+                    data=sabb_shared.config_data
+                )
+                sabb_shared.config_initial_timestamp = config_updated_timestamp
+                note_config_loaded(timestamp=config_updated_timestamp)
+
+                # Secrets might have changed; drop all precomputed OTP keys
+                clear_otp_key_cache()
+
+                # The user list might have changed; re-check the TOTP cache settings
+                check_totp_expiringdict_config(
+                    totp_message_cache=sabb_shared.totp_message_cache,
+                    data=sabb_shared.config_data,
+                    auto_size=instance.config_data["secure_aprs_bastion_bot"].get(
+                        "sabb_totp_cache_auto_size", False
+                    ),
+                    valid_window=instance.config_data["secure_aprs_bastion_bot"].get(
+                        "sabb_totp_valid_window", 0
+                    ),
+                )
 
     # Dismantle the incoming APRS message
-    success, totp_code, command_code, command_params = dismantle_aprs_message(
-        aprs_message=aprs_message
-    )
+    with timed_stage(component="input_parser", stage="message_parsing"):
+        success, totp_code, command_code, command_params = dismantle_aprs_message(
+            aprs_message=aprs_message
+        )
     if not success:
+        count_outcome(outcome="403")
+        log_request_outcome(
+            outcome="403", callsign=from_callsign, request_start=request_start
+        )
         # use the default return code 403 as response
         input_parser_error_message = sabb_http_codes.http_msg_403
         input_parser_response_object = {}
@@ -147,24 +231,45 @@ def parse_input_message(
     # Attempt to locate the execution parameters
     # 'target_callsign' might differ from 'from_callsign' for those cases where
     # we went for the SSID-less callsign instead of the original 'from_callsign'
-    (
-        success,
-        target_callsign,
-        command_string,
-        detached_launch,
-        secret,
-        watchdog_timespan,
-    ) = identify_target_callsign_and_command_string(
-        data=sabb_shared.config_data,
-        callsign=from_callsign,
-        totp_code=totp_code,
-        command_code=command_code,
-    )
+    with timed_stage(component="input_parser", stage="user_verification"):
+        (
+            success,
+            target_callsign,
+            command_string,
+            detached_launch,
+            secret,
+            watchdog_timespan,
+            totp_step,
+            totp_offset,
+            scheme,
+        ) = identify_target_callsign_and_command_string(
+            data=sabb_shared.config_data,
+            callsign=from_callsign,
+            totp_code=totp_code,
+            command_code=command_code,
+            valid_window=instance.config_data["secure_aprs_bastion_bot"].get(
+                "sabb_totp_valid_window", 0
+            ),
+            user_index=sabb_shared.config_user_index,
+        )
 
     # Abort the process if we were unable to find the command OR there was a mismatch with
     # the given TOTP code. Do not disclose the origin of the error to the user
     if not success:
-        instance.log_debug(msg="Unable to locate callsign/totp code combo in our config file")
+        logger.debug("Unable to locate callsign/totp code combo in our config file")
+        # A missing target callsign indicates that the TOTP code did not match
+        # any of the secrets; remember that failure for the lockout table
+        if not target_callsign and sabb_shared.lockout_table:
+            sabb_shared.lockout_table.register_failure(
+                callsign=from_callsign, now=sabb_shared.clock()
+            )
+        count_outcome(outcome="403")
+        log_request_outcome(
+            outcome="403",
+            callsign=from_callsign,
+            command_code=command_code,
+            request_start=request_start,
+        )
         # provide generic APRS response to the user
         input_parser_error_message = sabb_http_codes.http_msg_403
         input_parser_response_object = {}
@@ -172,42 +277,141 @@ def parse_input_message(
         return_code = CoreAprsClientInputParserStatus.PARSE_ERROR
         return return_code, input_parser_error_message, input_parser_response_object
 
-    # Check if the callsign/TOTP combination is already present in our expiringdict object
-    key = get_totp_expiringdict_key(callsign=target_callsign, totp_code=totp_code)
-
-    # If we were able to retrieve the item, this means that we already used the
-    # callsign / TOTP combination before
-    if key:
-        instance.log_debug(msg=f"Ignoring valid command sequence as given combo callsign '{target_callsign}'/TOTP key '{totp_code}' is still in our expiring cache")
+    # Check if the code has already been used. Each authentication scheme
+    # keeps its own replay state (TOTP: expiringdict plus most recently
+    # accepted time step; HOTP: most recently accepted counter)
+    with timed_stage(component="input_parser", stage="replay_check"):
+        authenticator = get_authenticator(scheme=scheme)
+        is_replay = authenticator.is_replay(
+            callsign=target_callsign, code=totp_code, step=totp_step
+        )
+    if is_replay:
+        logger.debug(
+            "Ignoring valid command sequence as given combo callsign '%s'/TOTP key '%s' is still in our expiring cache",
+            target_callsign,
+            totp_code,
+        )
+        count_outcome(outcome="403")
+        log_request_outcome(
+            outcome="403",
+            callsign=from_callsign,
+            command_code=command_code,
+            request_start=request_start,
+        )
         # generate a common 403 error message. Alternate approach: PARSE_IGNORE return code
         return_code = CoreAprsClientInputParserStatus.PARSE_ERROR
         input_parser_error_message = sabb_http_codes.http_msg_403
         input_parser_response_object = {}
         return return_code, input_parser_error_message, input_parser_response_object
 
+    # Some commands require a second factor: a TOTP code which is based on
+    # the command's very own secret and which needs to be specified as the
+    # first parameter after the command code. That code is not part of the
+    # @1..@9 placeholders
+    second_factor = None
+    second_factor_entry = get_command_second_factor(
+        data=sabb_shared.config_data,
+        callsign=target_callsign,
+        command_code=command_code,
+        user_index=sabb_shared.config_user_index,
+    )
+    if second_factor_entry:
+        with timed_stage(component="input_parser", stage="second_factor"):
+            second_factor_code = (
+                command_params.pop(1) if len(command_params) > 1 else ""
+            )
+            second_factor_authenticator = get_authenticator(
+                scheme=TotpAuthenticator.scheme
+            )
+            second_factor_step, second_factor_offset = (
+                second_factor_authenticator.verify(
+                    user_entry=second_factor_entry,
+                    code=second_factor_code,
+                    valid_window=instance.config_data[
+                        "secure_aprs_bastion_bot"
+                    ].get("sabb_totp_valid_window", 0),
+                    for_time=sabb_shared.clock(),
+                )
+            )
+            second_factor_valid = (
+                second_factor_step is not None
+                and not second_factor_authenticator.is_replay(
+                    callsign=second_factor_entry["callsign"],
+                    code=second_factor_code,
+                    step=second_factor_step,
+                )
+            )
+        if not second_factor_valid:
+            logger.debug(
+                "Second factor for command code '%s' is invalid or has already been used",
+                command_code,
+            )
+            if sabb_shared.lockout_table:
+                sabb_shared.lockout_table.register_failure(
+                    callsign=from_callsign, now=sabb_shared.clock()
+                )
+            count_outcome(outcome="403")
+            log_request_outcome(
+                outcome="403",
+                callsign=from_callsign,
+                command_code=command_code,
+                request_start=request_start,
+            )
+            input_parser_error_message = sabb_http_codes.http_msg_403
+            input_parser_response_object = {}
+            return_code = CoreAprsClientInputParserStatus.PARSE_ERROR
+            return return_code, input_parser_error_message, input_parser_response_object
+        second_factor = {
+            "callsign": second_factor_entry["callsign"],
+            "code": second_factor_code,
+            "step": second_factor_step,
+            "offset": second_factor_offset,
+        }
+
+    # The TOTP code is valid and has not been used before; reset the callsign's
+    # failure history. Replayed codes must not reset the history as APRS traffic
+    # is public and anyone can resend a previously used code
+    if sabb_shared.lockout_table:
+        sabb_shared.lockout_table.register_success(
+            callsign=from_callsign, now=sabb_shared.clock()
+        )
+
     # Debug information
-    instance.log_debug(
-        msg=f"Command Code: '{command_code}', Command String: '{command_string}', detached_launch: '{detached_launch}', watchdog_timespan: '{watchdog_timespan}'"
+    logger.debug(
+        "Command Code: '%s', Command String: '%s', detached_launch: '%s', watchdog_timespan: '%s'",
+        command_code,
+        command_string,
+        detached_launch,
+        watchdog_timespan,
     )
 
     # and now start iterating through the list and replace our content
     # This will replace all @0..@9 placeholders in the command_string with the
     # additional parameters conveyed through the user's original APRS message
-    for count, item in enumerate(command_params, start=0):
-        command_string = command_string.replace(f"@{count}", item)
-    instance.log_debug(f"final command_string: '{command_string}'")
-
-    # Check if we have received fewer user-specified parameters than expected
-    # if that is the case, our string still contains placeholders such as e.g. @0
-    # This is an end user error, indicating that we did not receive all the required
-    # parameters through the user's APRS message.
-    regex_string = r"\@[0-9]"
-    matches = re.search(pattern=regex_string, string=command_string)
+    with timed_stage(component="input_parser", stage="template_substitution"):
+        for count, item in enumerate(command_params, start=0):
+            command_string = command_string.replace(f"@{count}", item)
+
+        # Check if we have received fewer user-specified parameters than expected
+        # if that is the case, our string still contains placeholders such as e.g. @0
+        # This is an end user error, indicating that we did not receive all the required
+        # parameters through the user's APRS message.
+        regex_string = r"\@[0-9]"
+        matches = re.search(pattern=regex_string, string=command_string)
+    logger.debug("final command_string: '%s'", command_string)
+
     if matches:
-        instance.log_debug(msg="We still have placeholders in our command string. This is very likely a user error, read: the")
-        instance.log_debug(msg="user has provided less parameters via his APRS message than required.")
-        instance.log_debug(msg=f"Command String: '{command_string}'")
+        logger.debug("We still have placeholders in our command string. This is very likely a user error, read: the")
+        logger.debug("user has provided less parameters via his APRS message than required.")
+        logger.debug("Command String: '%s'", command_string)
         # Indicate the error to the user and abort further processing of the message
+        count_outcome(outcome="510")
+        log_request_outcome(
+            outcome="510",
+            callsign=from_callsign,
+            command_code=command_code,
+            request_start=request_start,
+        )
         input_parser_error_message = sabb_http_codes.http_msg_510
         input_parser_response_object = {}
         return_code = CoreAprsClientInputParserStatus.PARSE_ERROR
@@ -220,10 +424,16 @@ def parse_input_message(
         "from_callsign": from_callsign,
         "target_callsign": target_callsign,
         "totp_code": totp_code,
+        "totp_step": totp_step,
+        "totp_offset": totp_offset,
+        "scheme": scheme,
+        "second_factor": second_factor,
         "command_code": command_code,
         "command_string": command_string,
         "detached_launch": detached_launch,
         "watchdog_timespan": watchdog_timespan,
+        "request_start": request_start,
+        "correlation_id": correlation_id,
     }
 
     # set the return code to OK. This will tell the framework to continue
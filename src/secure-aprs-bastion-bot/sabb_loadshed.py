@@ -0,0 +1,363 @@
+#
+# Secure APRS Bastion Bot
+# Load shedding for traffic bursts
+# Author: Joerg Schultze-Lutter, 2025
+#
+# The framework processes the incoming APRS-IS packets one after the other.
+# During a burst (e.g. a misconfigured digipeater which loops packets), the
+# time span between a packet's arrival and its processing grows without
+# limit. The load shedder watches the backlog of packets which are waiting
+# in the APRS-IS socket and estimates the resulting processing lag. Once
+# the configured thresholds have been exceeded, messages get ignored
+# (PARSE_IGNORE, meaning that the bot does not respond) in two tiers:
+#
+# - tier 1: duplicate messages and messages from unknown callsigns
+# - tier 2: additionally, messages from locked callsigns and from
+#           callsigns which exceed their message rate
+#
+# Messages from configured callsigns are always processed. The shedding
+# mode is kept for a minimum time span, thus preventing the bot from
+# toggling its mode with every packet.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import struct
+import time
+from collections import OrderedDict, deque
+import sabb_shared
+from sabb_logger import logger
+from sabb_utils import get_candidate_user_entries
+
+try:
+    from CoreAprsClient import client_shared
+except ImportError:
+    client_shared = None
+
+# The socket backlog can only be determined on POSIX systems
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = termios = None
+
+# Shedding levels; the index is the tier
+SHED_LEVELS = ("normal", "shed_unverified", "shed_rate_limited")
+
+# Reasons for ignoring a message
+SHED_REASONS = ("duplicate", "unknown_callsign", "locked_callsign", "rate_limited")
+
+# Assumed average size of a raw APRS-IS packet (bytes, incl. line break)
+AVERAGE_PACKET_BYTES = 100
+
+# Max. number of callsigns / messages that we keep track of
+MAX_TRACKED_ENTRIES = 1000
+
+
+def get_aprsis_backlog():
+    """
+    Returns the number of APRS-IS packets which have been received
+    but not yet processed: complete lines in aprslib's read buffer plus
+    the bytes in the socket's receive buffer
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    backlog: int
+        Estimated number of pending packets; 0 if not connected
+    """
+    ais = getattr(getattr(client_shared, "AIS", None), "AIS", None)
+    sock = getattr(ais, "sock", None)
+    if sock is None or fcntl is None:
+        return 0
+    try:
+        pending_bytes = struct.unpack(
+            "i", fcntl.ioctl(sock.fileno(), termios.FIONREAD, b"\0\0\0\0")
+        )[0]
+    except (OSError, ValueError):
+        return 0
+    buffered_packets = getattr(ais, "buf", b"").count(b"\n")
+    return buffered_packets + pending_bytes // AVERAGE_PACKET_BYTES
+
+
+class LoadShedder:
+    def __init__(
+        self,
+        lag_seconds: float = 5.0,
+        queue_depth: int = 20,
+        max_messages_per_minute: int = 6,
+        duplicate_seconds: float = 300.0,
+        hold_seconds: float = 30.0,
+        backlog_function=get_aprsis_backlog,
+    ):
+        """
+        Class initialization
+
+        Parameters
+        ==========
+        lag_seconds: float
+            Estimated processing lag which activates tier 1;
+            twice this value activates tier 2
+        queue_depth: int
+            Number of pending packets which activates tier 1;
+            twice this value activates tier 2
+        max_messages_per_minute: int
+            Per-callsign message rate above which a callsign's
+            messages get ignored in tier 2
+        duplicate_seconds: float
+            Time span in which a repeated message from the same callsign
+            counts as duplicate
+        hold_seconds: float
+            Min. time span for which a shedding tier stays active
+        backlog_function: callable
+            Function without parameters which returns the number of
+            pending packets
+
+        Returns
+        =======
+        """
+        self.lag_seconds = lag_seconds
+        self.queue_depth = queue_depth
+        self.max_messages_per_minute = max_messages_per_minute
+        self.duplicate_seconds = duplicate_seconds
+        self.hold_seconds = hold_seconds
+        self.backlog_function = backlog_function
+
+        self.level = 0
+        self.backlog = 0
+        self.lag = 0.0
+        self.service_time = 0.0
+        self.shed_counts = {reason: 0 for reason in SHED_REASONS}
+        self.level_changes = 0
+        self._last_check = None
+        self._last_backlog = 0
+        self._level_since = 0.0
+        self._shed_since_change = 0
+        self._recent_messages = OrderedDict()
+        self._callsign_history = OrderedDict()
+
+    def _update_level(self, now: float):
+        self.backlog = self.backlog_function()
+
+        # While there is a backlog, the time span between two packets equals
+        # the time that the bot (incl. the framework) needs per packet
+        if self._last_check is not None and self._last_backlog > 0:
+            interval = now - self._last_check
+            self.service_time = (
+                interval
+                if self.service_time == 0.0
+                else 0.8 * self.service_time + 0.2 * interval
+            )
+        self._last_check = now
+        self._last_backlog = self.backlog
+        self.lag = self.backlog * self.service_time
+
+        level = 0
+        if self.lag >= 2 * self.lag_seconds or self.backlog >= 2 * self.queue_depth:
+            level = 2
+        elif self.lag >= self.lag_seconds or self.backlog >= self.queue_depth:
+            level = 1
+
+        if level >= self.level:
+            if level > 0:
+                self._level_since = now
+        elif now - self._level_since < self.hold_seconds:
+            # Keep the current tier for a while
+            return
+
+        if level != self.level:
+            logger.warning(
+                "Load shedding: %s -> %s (backlog %d packets, estimated lag %.1f secs, %d messages ignored)",
+                SHED_LEVELS[self.level],
+                SHED_LEVELS[level],
+                self.backlog,
+                self.lag,
+                self._shed_since_change,
+            )
+            self.level = level
+            self._level_since = now
+            self.level_changes += 1
+            self._shed_since_change = 0
+
+    def _is_duplicate(self, callsign: str, message: str, now: float):
+        key = (callsign, message)
+        last_seen = self._recent_messages.pop(key, None)
+        self._recent_messages[key] = now
+        if len(self._recent_messages) > MAX_TRACKED_ENTRIES:
+            self._recent_messages.popitem(last=False)
+        return last_seen is not None and now - last_seen < self.duplicate_seconds
+
+    def _exceeds_rate(self, callsign: str, now: float):
+        history = self._callsign_history.pop(callsign, None)
+        if history is None:
+            history = deque()
+        self._callsign_history[callsign] = history
+        if len(self._callsign_history) > MAX_TRACKED_ENTRIES:
+            self._callsign_history.popitem(last=False)
+        while history and now - history[0] >= 60.0:
+            history.popleft()
+        history.append(now)
+        return len(history) > self.max_messages_per_minute
+
+    def check(self, callsign: str, message: str, lockout_remaining: float = 0.0):
+        """
+        Decides whether a message gets processed or ignored
+
+        Parameters
+        ==========
+        callsign: str
+            The sender's callsign
+        message: str
+            The APRS message text
+        lockout_remaining: float
+            Remaining lockout time span of the callsign (see sabb_lockout.py)
+
+        Returns
+        =======
+        reason: str | None
+            Reason for ignoring the message (see SHED_REASONS);
+            None if the message has to be processed
+        """
+        now = time.monotonic()
+        self._update_level(now=now)
+
+        # Keep the histories up to date, thus providing the data that we
+        # need as soon as a burst begins
+        duplicate = self._is_duplicate(callsign=callsign, message=message, now=now)
+        exceeds_rate = self._exceeds_rate(callsign=callsign, now=now)
+        if self.level == 0:
+            return None
+
+        reason = None
+        if duplicate:
+            reason = "duplicate"
+        elif not get_candidate_user_entries(
+            data=sabb_shared.config_data,
+            callsign=callsign,
+            user_index=sabb_shared.config_user_index,
+        ):
+            reason = "unknown_callsign"
+        elif self.level >= 2 and lockout_remaining > 0:
+            reason = "locked_callsign"
+        elif self.level >= 2 and exceeds_rate:
+            reason = "rate_limited"
+
+        if reason:
+            self.shed_counts[reason] += 1
+            self._shed_since_change += 1
+            logger.debug(
+                "Load shedding: ignoring message from '%s' (%s)", callsign, reason
+            )
+        return reason
+
+    def get_status(self):
+        """
+        Returns the load shedder's current state
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        status: dict
+            Shedding level, backlog, estimated lag and shed messages
+        """
+        return {
+            "level": SHED_LEVELS[self.level],
+            "backlog_packets": self.backlog,
+            "estimated_lag_seconds": round(self.lag, 3),
+            "service_time_seconds": round(self.service_time, 6),
+            "shed_messages": dict(self.shed_counts),
+        }
+
+
+def collect_load_shedding_metrics(openmetrics: bool = False):
+    """
+    Provides the load shedder's state in Prometheus text format
+
+    Parameters
+    ==========
+    openmetrics: bool
+        True = OpenMetrics format; counter families are named without
+        their samples' '_total' suffix
+
+    Returns
+    =======
+    lines: list
+        Metrics in Prometheus text format
+    """
+    shedder = sabb_shared.load_shedder
+    if shedder is None:
+        return []
+    # OpenMetrics counter families are named without the '_total' suffix
+    family = "sabb_shed_messages" if openmetrics else "sabb_shed_messages_total"
+    lines = [
+        "# TYPE sabb_load_shedding_level gauge",
+        f"sabb_load_shedding_level {shedder.level}",
+        "# TYPE sabb_backlog_packets gauge",
+        f"sabb_backlog_packets {shedder.backlog}",
+        "# TYPE sabb_estimated_lag_seconds gauge",
+        f"sabb_estimated_lag_seconds {shedder.lag}",
+        f"# TYPE {family} counter",
+    ]
+    for reason, count in shedder.shed_counts.items():
+        lines.append(f'sabb_shed_messages_total{{reason="{reason}"}} {count}')
+    return lines
+
+
+def create_load_shedder(
+    lag_seconds: float,
+    queue_depth: int,
+    max_messages_per_minute: int,
+    hold_seconds: float,
+):
+    """
+    Creates the load shedder
+
+    Parameters
+    ==========
+    lag_seconds: float
+        Estimated processing lag which activates tier 1; 0 = no lag threshold
+    queue_depth: int
+        Number of pending packets which activates tier 1; 0 = no backlog
+        threshold
+    max_messages_per_minute: int
+        Per-callsign message rate above which a callsign's messages
+        get ignored in tier 2
+    hold_seconds: float
+        Min. time span for which a shedding tier stays active
+
+    Returns
+    =======
+    load_shedder: LoadShedder | None
+        The load shedder or 'None' if both thresholds are disabled
+    """
+    if lag_seconds <= 0 and queue_depth <= 0:
+        logger.debug(msg="Load shedding is disabled")
+        return None
+    logger.debug(
+        msg=f"Load shedding at {lag_seconds} secs lag / {queue_depth} pending packets"
+    )
+    return LoadShedder(
+        lag_seconds=lag_seconds if lag_seconds > 0 else float("inf"),
+        queue_depth=queue_depth if queue_depth > 0 else float("inf"),
+        max_messages_per_minute=max_messages_per_minute,
+        hold_seconds=hold_seconds,
+    )
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,487 @@
+#
+# Secure APRS Bastion Bot
+# Progressive lockout table for callsigns with repeated TOTP failures
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Every failed TOTP attempt gets recorded for the SSID-less base callsign of
+# the sender (e.g. DF1JSL for DF1JSL-15), thus an attacker cannot evade the
+# lockout by switching to a different SSID. Optionally, the failures are also
+# recorded per SSID, using a separate threshold. Once the number of failures
+# reaches the threshold, the (base) callsign gets locked for an exponentially
+# growing time span. Messages from locked callsigns are rejected before we
+# perform any crypto or config work.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from sabb_logger import logger
+
+# Min. time span (in seconds) between two writes of the lockout file for
+# failure counts which have not (yet) led to a lockout. New lockouts are
+# written right away
+LOCKOUT_WRITE_INTERVAL = 60
+
+
+class LockoutTable:
+    def __init__(
+        self,
+        threshold: int = 3,
+        base_seconds: int = 60,
+        max_seconds: int = 3600,
+        max_entries: int | None = 1000,
+        filename: str | None = None,
+        ssid_threshold: int = 0,
+    ):
+        """
+        Class initialization
+
+        Parameters
+        ==========
+        threshold: int
+            Number of failed attempts after which a base callsign (and thus
+            all of its SSIDs) gets locked. A value of 0 disables the lockout
+            mechanism
+        base_seconds: int
+            Lockout time span in seconds for the first lockout. Every
+            additional failure doubles the time span
+        max_seconds: int
+            Upper limit for the lockout time span in seconds. Entries whose
+            most recent failure is older than this value will be forgotten
+        max_entries: int | None
+            Max number of callsign entries that we keep in memory;
+            'None' = no limit (e.g. for maintenance tasks, which must not
+            evict any entries when rewriting the file)
+        filename: str | None
+            Optional file name for persisting the lockout table.
+            'None' or empty string = no persistence
+        ssid_threshold: int
+            Number of failed attempts after which a single SSID (e.g.
+            DF1JSL-15) gets locked. A value of 0 disables the per-SSID
+            tracking
+
+        Returns
+        =======
+        """
+        self.threshold = threshold
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.max_entries = max_entries
+        self.filename = filename if filename else None
+        self.ssid_threshold = ssid_threshold
+        self._entries: OrderedDict = OrderedDict()
+        self._file_timestamp = None
+        self._unsaved_changes = False
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+        if self.filename:
+            self.read_from_disk()
+
+    @staticmethod
+    def get_base_callsign(callsign: str):
+        """
+        Returns the SSID-less base callsign for the given callsign
+
+        Parameters
+        ==========
+        callsign: str
+            User's callsign, e.g. DF1JSL-1
+
+        Returns
+        =======
+        base_callsign: str
+            SSID-less callsign, e.g. DF1JSL
+        """
+        return callsign.split("-")[0]
+
+    def _get_keys(self, callsign: str):
+        """
+        Returns the lockout table keys for the given callsign along with
+        their thresholds
+
+        Parameters
+        ==========
+        callsign: str
+            User's callsign, e.g. DF1JSL-1
+
+        Returns
+        =======
+        keys: dict
+            The SSID-less base callsign and (if enabled) the callsign
+            itself as key, the key's threshold as value
+        """
+        base_callsign = self.get_base_callsign(callsign)
+        keys = {base_callsign: self.threshold}
+        if self.ssid_threshold > 0 and callsign != base_callsign:
+            keys[callsign] = self.ssid_threshold
+        return keys
+
+    def get_lockout_remaining(self, callsign: str, now: float | None = None):
+        """
+        Checks whether the given callsign or its SSID-less base callsign
+        is currently locked.
+
+        Parameters
+        ==========
+        callsign: str
+            User's callsign, e.g. DF1JSL-1
+        now: float | None
+            Current timestamp (time.time() format); 'None' = use current time
+
+        Returns
+        =======
+        remaining: float
+            Remaining lockout time span in seconds; 0.0 if not locked
+        """
+        if self.threshold < 1:
+            return 0.0
+
+        now = now if now is not None else time.time()
+
+        # Pick up changes that were applied by configure.py's --clear-lockouts
+        self._check_for_external_changes()
+
+        remaining = 0.0
+        with self._lock:
+            for key in {callsign, self.get_base_callsign(callsign)}:
+                entry = self._entries.get(key)
+                if entry:
+                    remaining = max(remaining, entry["locked_until"] - now)
+
+        # Write pending failure counts once the write interval has passed
+        if self._unsaved_changes:
+            self._save(now=now)
+        return max(remaining, 0.0)
+
+    def register_failure(self, callsign: str, now: float | None = None):
+        """
+        Records a failed TOTP attempt for the SSID-less base callsign and
+        (if enabled) the callsign itself and (re-)calculates the lockout
+        time span
+
+        Parameters
+        ==========
+        callsign: str
+            User's callsign, e.g. DF1JSL-1
+        now: float | None
+            Current timestamp (time.time() format); 'None' = use current time
+
+        Returns
+        =======
+        """
+        if self.threshold < 1:
+            return
+
+        now = now if now is not None else time.time()
+
+        locked = False
+        with self._lock:
+            for key, threshold in self._get_keys(callsign=callsign).items():
+                entry = self._entries.pop(key, None)
+
+                # A new entry requires room in the table; locked entries
+                # never get evicted in its favor
+                if not entry and not self._make_room(now=now):
+                    logger.warning(
+                        msg=f"Lockout table is full of locked callsigns; not tracking '{key}'"
+                    )
+                    continue
+
+                # Forget about failures which happened a long time ago
+                if not entry or now - entry["last_failure"] > self.max_seconds:
+                    entry = {"failures": 0, "last_failure": now, "locked_until": 0.0}
+
+                entry["failures"] += 1
+                entry["last_failure"] = now
+
+                # Apply the exponential backoff once we have reached the threshold
+                if entry["failures"] >= threshold:
+                    exponent = min(entry["failures"] - threshold, 32)
+                    lockout_span = min(
+                        self.base_seconds * (2**exponent), self.max_seconds
+                    )
+                    entry["locked_until"] = now + lockout_span
+                    locked = True
+                    logger.info(
+                        msg=f"Locking callsign '{key}' for {lockout_span} secs after {entry['failures']} failed attempts"
+                    )
+
+                self._entries[key] = entry
+
+        self._unsaved_changes = True
+        self._save(now=now, force=locked)
+
+    def register_success(self, callsign: str, now: float | None = None):
+        """
+        Removes the failure history for the callsign and its SSID-less
+        base callsign after a successful TOTP validation
+
+        Parameters
+        ==========
+        callsign: str
+            User's callsign, e.g. DF1JSL-1
+        now: float | None
+            Current timestamp (time.time() format); 'None' = use current time
+
+        Returns
+        =======
+        """
+        if self.threshold < 1:
+            return
+
+        now = now if now is not None else time.time()
+
+        with self._lock:
+            for key in {callsign, self.get_base_callsign(callsign)}:
+                if self._entries.pop(key, None):
+                    self._unsaved_changes = True
+        if self._unsaved_changes:
+            self._save(now=now)
+
+    def get_entries(self):
+        """
+        Returns a copy of the lockout table
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        entries: dict
+            Dictionary, using the callsign as key
+        """
+        with self._lock:
+            return {key: dict(value) for key, value in self._entries.items()}
+
+    def clear(self, callsign: str | None = None):
+        """
+        Removes a single callsign or all callsigns from the lockout table
+
+        Parameters
+        ==========
+        callsign: str | None
+            Callsign whose entry is to be removed; 'None' = remove all entries
+
+        Returns
+        =======
+        success: bool
+            True if at least one entry was removed
+        """
+        with self._lock:
+            if callsign:
+                __success = self._entries.pop(callsign, None) is not None
+            else:
+                __success = len(self._entries) > 0
+                self._entries.clear()
+        if __success:
+            self.write_to_disk()
+        return __success
+
+    def _make_room(self, now: float, room: int = 1):
+        """
+        Keeps the in-memory table within its boundaries. Only unlocked
+        entries get evicted, the ones with the oldest failure first; locked
+        entries are never evicted. Must be called with the lock held.
+
+        Parameters
+        ==========
+        now: float
+            Current timestamp (time.time() format)
+        room: int
+            Number of entries that are about to be added
+
+        Returns
+        =======
+        success: bool
+            True if the table has room for the new entries
+        """
+        if not self.max_entries:
+            return True
+
+        # The entries are ordered by their most recent failure
+        excess = len(self._entries) + room - self.max_entries
+        if excess > 0:
+            for key in [
+                key
+                for key, entry in self._entries.items()
+                if entry["locked_until"] <= now
+            ][:excess]:
+                del self._entries[key]
+
+        return len(self._entries) + room <= self.max_entries
+
+    def _save(self, now: float, force: bool = False):
+        """
+        Writes the pending changes to disk unless the most recent write
+        has happened less than LOCKOUT_WRITE_INTERVAL seconds ago
+
+        Parameters
+        ==========
+        now: float
+            Current timestamp (time.time() format)
+        force: bool
+            Write the changes regardless of the interval (e.g. new lockouts)
+
+        Returns
+        =======
+        """
+        if force or now - self._last_write >= LOCKOUT_WRITE_INTERVAL:
+            self._last_write = now
+            self.write_to_disk()
+
+    def _check_for_external_changes(self):
+        """
+        Re-reads the lockout table from disk in case the file has been
+        changed by a different process (e.g. configure.py)
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        """
+        if not self.filename:
+            return
+        try:
+            timestamp = os.path.getmtime(self.filename)
+        except OSError:
+            timestamp = None
+        if timestamp != self._file_timestamp:
+            self.read_from_disk()
+
+    def read_from_disk(self):
+        """
+        Reads the lockout table from disk
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        success: bool
+            True / False, depending on whether the file was read
+        """
+        __success = False
+        if not self.filename:
+            return __success
+
+        entries = OrderedDict()
+        try:
+            if os.path.isfile(self.filename):
+                with open(file=self.filename, mode="r") as json_file:
+                    data = json.load(json_file)
+                for key, entry in sorted(
+                    data.items(), key=lambda item: item[1]["last_failure"]
+                ):
+                    entries[key] = {
+                        "failures": int(entry["failures"]),
+                        "last_failure": float(entry["last_failure"]),
+                        "locked_until": float(entry["locked_until"]),
+                    }
+            __success = True
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            logger.warning(msg=f"Cannot read lockout file '{self.filename}'")
+
+        if __success:
+            with self._lock:
+                self._entries = entries
+                self._make_room(now=time.time(), room=0)
+            self._unsaved_changes = False
+        try:
+            self._file_timestamp = os.path.getmtime(self.filename)
+        except OSError:
+            self._file_timestamp = None
+        return __success
+
+    def write_to_disk(self):
+        """
+        Writes the lockout table to disk (if persistence has been enabled)
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        success: bool
+            True / False, depending on whether the file was written
+        """
+        __success = False
+        if not self.filename:
+            return __success
+
+        temp_filename = f"{self.filename}.tmp"
+        try:
+            with open(file=temp_filename, mode="w") as json_file:
+                json.dump(self.get_entries(), json_file)
+            os.replace(temp_filename, self.filename)
+            self._file_timestamp = os.path.getmtime(self.filename)
+            self._unsaved_changes = False
+            __success = True
+        except OSError:
+            logger.warning(msg=f"Cannot write lockout file '{self.filename}'")
+        return __success
+
+
+def create_lockout_table(
+    threshold: int,
+    base_seconds: int,
+    max_seconds: int,
+    max_entries: int,
+    filename: str | None = None,
+    ssid_threshold: int = 0,
+):
+    """
+    Helper method for creating the callsign lockout table
+
+    Parameters
+    ==========
+    threshold: int
+        Number of failed attempts after which a base callsign gets locked (0 = disable)
+    base_seconds: int
+        Lockout time span in seconds for the first lockout
+    max_seconds: int
+        Upper limit for the lockout time span in seconds
+    max_entries: int
+        Max number of callsign entries that we keep in memory
+    filename: str | None
+        Optional file name for persisting the lockout table
+    ssid_threshold: int
+        Number of failed attempts after which a single SSID gets locked
+        (0 = no per-SSID tracking)
+
+    Returns
+    =======
+    lockout_table: LockoutTable
+        Our lockout table object
+    """
+    logger.debug(
+        msg=f"Lockout table set to a threshold of {threshold} failed attempts, {base_seconds}-{max_seconds} secs lockout span and {max_entries} max possible entries (per-SSID threshold: {ssid_threshold})"
+    )
+    return LockoutTable(
+        threshold=threshold,
+        base_seconds=base_seconds,
+        max_seconds=max_seconds,
+        max_entries=max_entries,
+        filename=filename,
+        ssid_threshold=ssid_threshold,
+    )
+
+
+if __name__ == "__main__":
+    pass
@@ -7,6 +7,11 @@
 # callback function. Therefore, this module acts as a pseudo object in
 # order to provide global access to its worker variables
 #
+# Once start_async_logging() has been called, all log records get handed
+# over to a queue; formatting and writing the records happens in a
+# background thread. Log calls on the message path therefore use lazy
+# %-style arguments (logger.debug("... %s", value)) instead of f-strings.
+#
 # This program is free software; you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
 # the Free Software Foundation; either version 3 of the License, or
@@ -21,7 +26,15 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
+import atexit
+import contextvars
+import datetime
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import time
 
 # Change the logging level to logging.DEBUG if you want to see more
 # content in the program's log file.
@@ -38,5 +51,249 @@ def update_logging_level(logging_level: int):
         handler.setLevel(logging_level)
 
 
+# Optional structured fields of a log record (logger.info(..., extra={...}))
+STRUCTURED_FIELDS = (
+    "correlation_id",
+    "callsign",
+    "command_code",
+    "outcome",
+    "latency_ms",
+)
+
+# Text log format for asynchronous logging; includes the correlation ID
+TEXT_LOG_FORMAT = (
+    "%(asctime)s - %(module)s -%(levelname)s - [%(correlation_id)s] %(message)s"
+)
+
+# Supported log formats
+LOG_FORMATS = ("text", "json")
+
+# Our queue listener; 'None' = synchronous logging
+_listener = None
+
+# Correlation ID of the packet that is currently being processed. Gets set
+# by the input parser and attached to each log record as 'correlation_id'
+_correlation_id = contextvars.ContextVar("sabb_correlation_id", default=None)
+
+
+def new_correlation_id():
+    """
+    Creates a new correlation ID and makes it the current one
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    correlation_id: str
+        The new correlation ID (12 hex digits)
+    """
+    correlation_id = os.urandom(6).hex()
+    _correlation_id.set(correlation_id)
+    return correlation_id
+
+
+def set_correlation_id(correlation_id: str | None):
+    """
+    Sets the current correlation ID, e.g. the one that has been
+    conveyed through the input parser's response object
+
+    Parameters
+    ==========
+    correlation_id: str | None
+        The correlation ID; None = no correlation ID
+
+    Returns
+    =======
+    """
+    _correlation_id.set(correlation_id)
+
+
+def get_correlation_id():
+    """
+    Returns the current correlation ID
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    correlation_id: str | None
+        The current correlation ID; None if there is none
+    """
+    return _correlation_id.get()
+
+
+_default_record_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs):
+    # Runs in the thread that creates the record, thus providing the
+    # correlation ID to all loggers (including the framework's loggers)
+    record = _default_record_factory(*args, **kwargs)
+    record.correlation_id = _correlation_id.get() or "-"
+    return record
+
+
+logging.setLogRecordFactory(_record_factory)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord):
+        """
+        Formats a log record as a single JSON line
+
+        Parameters
+        ==========
+        record: logging.LogRecord
+            The log record
+
+        Returns
+        =======
+        output: str
+            The JSON line
+        """
+        entry = {
+            "timestamp": datetime.datetime.fromtimestamp(
+                record.created, tz=datetime.timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None and value != "-":
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord):
+        # Unlike the default QueueHandler, we keep the record's message and
+        # arguments as they are; the record gets formatted by the listener's
+        # handlers in the background thread. Log arguments must therefore not
+        # be modified after the log call
+        return record
+
+
+def start_async_logging(log_format: str = "text"):
+    """
+    Moves the root logger's handlers (and thus the output of both the bot's
+    and the framework's loggers) to a background thread. The root logger
+    only keeps a handler which puts the log records into a queue
+
+    Parameters
+    ==========
+    log_format: str
+        'text' (default format plus correlation ID) or 'json'
+        (one JSON object per line)
+
+    Returns
+    =======
+    success: bool
+        False if asynchronous logging has already been started
+    """
+    global _listener
+
+    if _listener:
+        return False
+
+    root_logger = logging.getLogger()
+    handlers = list(root_logger.handlers)
+    for handler in handlers:
+        handler.setFormatter(
+            JsonLinesFormatter()
+            if log_format == "json"
+            else logging.Formatter(TEXT_LOG_FORMAT)
+        )
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    for handler in handlers:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(DeferredQueueHandler(log_queue))
+    _listener.start()
+
+    # Write all pending log records prior to exiting
+    atexit.register(stop_async_logging)
+    return True
+
+
+def stop_async_logging():
+    """
+    Writes all pending log records and restores synchronous logging
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    """
+    global _listener
+
+    if not _listener:
+        return
+    _listener.stop()
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        if isinstance(handler, DeferredQueueHandler):
+            root_logger.removeHandler(handler)
+    for handler in _listener.handlers:
+        root_logger.addHandler(handler)
+    _listener = None
+
+
+def log_request_outcome(
+    outcome: str,
+    callsign: str,
+    command_code: str | None = None,
+    request_start: float | None = None,
+):
+    """
+    Logs the outcome of a request along with its structured fields
+
+    Parameters
+    ==========
+    outcome: str
+        Request outcome, e.g. '200' or '403'
+    callsign: str
+        Sender's callsign
+    command_code: str | None
+        The requested command code (if known)
+    request_start: float | None
+        time.perf_counter() value at the start of the request processing
+
+    Returns
+    =======
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    latency_ms = (
+        round((time.perf_counter() - request_start) * 1000, 3)
+        if request_start
+        else None
+    )
+    logger.info(
+        "Request from '%s' for command code '%s': outcome %s after %s msecs",
+        callsign,
+        command_code,
+        outcome,
+        latency_ms,
+        extra={
+            "callsign": callsign,
+            "command_code": command_code,
+            "outcome": outcome,
+            "latency_ms": latency_ms,
+        },
+        # report the caller's module instead of ours
+        stacklevel=2,
+    )
+
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,482 @@
+#
+# Secure APRS Bastion Bot
+# Per-stage latency histograms and outcome counters
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Input parser, output generator and post processor record the processing
+# time of each of their stages plus the outcome of each request. The data
+# is exposed in Prometheus text format, either on a local HTTP port or on
+# a Unix domain socket (e.g. curl --unix-socket <socket> http://localhost/metrics).
+# If neither of these has been configured, no data will be recorded at all.
+# Scrapers which accept the OpenMetrics format additionally receive the
+# correlation ID of each histogram bucket's most recent observation as
+# exemplar, thus linking slow buckets to the corresponding log records.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import bisect
+import functools
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import sabb_shared
+from sabb_logger import logger, get_correlation_id
+
+# Histogram bucket boundaries in seconds
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# Request outcomes; 'rate_limited' = rejected by the callsign lockout table,
+# 'shed' = ignored by the load shedder (see sabb_loadshed.py)
+OUTCOMES = ("200", "202", "403", "510", "rate_limited", "shed")
+
+# TOTP cache statistics which only ever increase; exported as counters
+TOTP_CACHE_COUNTERS = ("insertions", "expired_evictions", "evictions_before_expiry")
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        """
+        Class initialization
+
+        Parameters
+        ==========
+        buckets: tuple
+            Sorted upper bucket boundaries (in seconds); the +Inf
+            bucket gets added automatically
+
+        Returns
+        =======
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        # Most recent (correlation ID, value, timestamp) per bucket
+        self.exemplars = [None] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, exemplar: str | None = None):
+        """
+        Records a single value
+
+        Parameters
+        ==========
+        value: float
+            The value (e.g. a duration in seconds)
+        exemplar: str | None
+            Correlation ID of the observed request (if any)
+
+        Returns
+        =======
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        self.counts[index] += 1
+        if exemplar:
+            self.exemplars[index] = (exemplar, value, time.time())
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        """
+        Class initialization
+
+        Parameters
+        ==========
+        buckets: tuple
+            Histogram bucket boundaries in seconds
+
+        Returns
+        =======
+        """
+        self.buckets = buckets
+        self._histograms = {}
+        self._outcomes = {outcome: 0 for outcome in OUTCOMES}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def observe(
+        self, component: str, stage: str, seconds: float, exemplar: str | None = None
+    ):
+        """
+        Records the processing time of a stage
+
+        Parameters
+        ==========
+        component: str
+            Component name, e.g. 'input_parser'
+        stage: str
+            Stage name, e.g. 'user_verification'
+        seconds: float
+            Processing time in seconds
+        exemplar: str | None
+            Correlation ID of the observed request (if any)
+
+        Returns
+        =======
+        """
+        with self._lock:
+            histogram = self._histograms.get((component, stage))
+            if not histogram:
+                histogram = Histogram(buckets=self.buckets)
+                self._histograms[(component, stage)] = histogram
+            histogram.observe(seconds, exemplar=exemplar)
+
+    def count_outcome(self, outcome: str):
+        """
+        Increments the counter for a request outcome
+
+        Parameters
+        ==========
+        outcome: str
+            Request outcome, see OUTCOMES
+
+        Returns
+        =======
+        """
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def add_collector(self, collector):
+        """
+        Adds a function which provides additional metrics whenever the
+        metrics get rendered (e.g. the TOTP cache statistics)
+
+        Parameters
+        ==========
+        collector: callable
+            Function which returns a list of lines in Prometheus text
+            format; gets called with the 'openmetrics' keyword argument
+            (see render)
+
+        Returns
+        =======
+        """
+        self._collectors.append(collector)
+
+    def render(self, openmetrics: bool = False):
+        """
+        Renders all metrics in Prometheus text format
+
+        Parameters
+        ==========
+        openmetrics: bool
+            True = render in OpenMetrics format, including the
+            histogram buckets' exemplars
+
+        Returns
+        =======
+        output: str
+            Metrics in Prometheus text or OpenMetrics format
+        """
+        lines = [
+            "# HELP sabb_stage_duration_seconds Processing time per component and stage",
+            "# TYPE sabb_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (component, stage), histogram in sorted(self._histograms.items()):
+                labels = f'component="{component}",stage="{stage}"'
+                cumulative = 0
+                for boundary, count, exemplar in zip(
+                    histogram.buckets + ("+Inf",),
+                    histogram.counts,
+                    histogram.exemplars,
+                ):
+                    cumulative += count
+                    line = f'sabb_stage_duration_seconds_bucket{{{labels},le="{boundary}"}} {cumulative}'
+                    if openmetrics and exemplar:
+                        line += f' # {{correlation_id="{exemplar[0]}"}} {exemplar[1]} {exemplar[2]:.3f}'
+                    lines.append(line)
+                lines.append(
+                    f"sabb_stage_duration_seconds_sum{{{labels}}} {histogram.sum}"
+                )
+                lines.append(
+                    f"sabb_stage_duration_seconds_count{{{labels}}} {histogram.count}"
+                )
+            # OpenMetrics counter families are named without the '_total' suffix
+            family = "sabb_requests" if openmetrics else "sabb_requests_total"
+            lines.append(f"# HELP {family} Processed requests per outcome")
+            lines.append(f"# TYPE {family} counter")
+            for outcome, count in self._outcomes.items():
+                lines.append(f'sabb_requests_total{{outcome="{outcome}"}} {count}')
+
+        for collector in self._collectors:
+            try:
+                lines.extend(collector(openmetrics=openmetrics))
+            except Exception as ex:
+                logger.debug(msg=f"Metrics collector failed: {ex}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    __slots__ = ("component", "stage", "start")
+
+    def __init__(self, component: str, stage: str):
+        """
+        Context manager which records the processing time of a stage
+
+        Parameters
+        ==========
+        component: str
+            Component name, e.g. 'input_parser'
+        stage: str
+            Stage name, e.g. 'user_verification'
+
+        Returns
+        =======
+        """
+        self.component = component
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        sabb_shared.metrics.observe(
+            component=self.component,
+            stage=self.stage,
+            seconds=time.perf_counter() - self.start,
+            exemplar=get_correlation_id(),
+        )
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+def timed_stage(component: str, stage: str):
+    """
+    Returns a context manager which records the processing time of a
+    stage. Does nothing if metrics have not been enabled
+
+    Parameters
+    ==========
+    component: str
+        Component name, e.g. 'input_parser'
+    stage: str
+        Stage name, e.g. 'user_verification'
+
+    Returns
+    =======
+    timer: StageTimer | _NullTimer
+        The context manager
+    """
+    if sabb_shared.metrics is None:
+        return _null_timer
+    return StageTimer(component=component, stage=stage)
+
+
+def timed_component(component: str):
+    """
+    Decorator which records a function's total processing time as
+    stage 'total' of the given component
+
+    Parameters
+    ==========
+    component: str
+        Component name, e.g. 'input_parser'
+
+    Returns
+    =======
+    decorator: callable
+        The decorator
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed_stage(component=component, stage="total"):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count_outcome(outcome: str):
+    """
+    Increments the counter for a request outcome. Does nothing if
+    metrics have not been enabled
+
+    Parameters
+    ==========
+    outcome: str
+        Request outcome, see OUTCOMES
+
+    Returns
+    =======
+    """
+    if sabb_shared.metrics is not None:
+        sabb_shared.metrics.count_outcome(outcome=outcome)
+
+
+def collect_totp_cache_metrics(openmetrics: bool = False):
+    """
+    Provides the TOTP cache statistics in Prometheus text format
+
+    Parameters
+    ==========
+    openmetrics: bool
+        True = OpenMetrics format; counter families are named without
+        their samples' '_total' suffix
+
+    Returns
+    =======
+    lines: list
+        Metrics in Prometheus text format
+    """
+    lines = []
+    if sabb_shared.totp_message_cache is None:
+        return lines
+    for key, value in sabb_shared.totp_message_cache.get_statistics().items():
+        if key in TOTP_CACHE_COUNTERS:
+            sample = f"sabb_totp_cache_{key}_total"
+            family = f"sabb_totp_cache_{key}" if openmetrics else sample
+            lines.append(f"# TYPE {family} counter")
+        else:
+            sample = f"sabb_totp_cache_{key}"
+            lines.append(f"# TYPE {sample} gauge")
+        lines.append(f"{sample} {value}")
+    return lines
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    # Paths and their content providers; functions which get the request's
+    # headers and return a (status code, content type, body) tuple
+    routes = {}
+
+    def do_GET(self):
+        route = self.routes.get(self.path.split("?")[0])
+        if not route:
+            self.send_error(404)
+            return
+        status, content_type, body = route(self.headers)
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix domain socket clients do not have an address
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(msg=f"Metrics server: {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def start_metrics_server(
+    registry: MetricsRegistry,
+    port: int = 0,
+    address: str = "127.0.0.1",
+    socket_path: str | None = None,
+):
+    """
+    Exposes the metrics in Prometheus text format (path: /metrics) on a local
+    HTTP port and/or a Unix domain socket. Each server runs in its own
+    daemon thread
+
+    Parameters
+    ==========
+    registry: MetricsRegistry
+        Our metrics registry
+    port: int
+        TCP port for the HTTP server; 0 = disabled
+    address: str
+        Address that the HTTP server binds to
+    socket_path: str | None
+        File name of the Unix domain socket; 'None' or empty = disabled
+
+    Returns
+    =======
+    servers: list
+        The started server objects
+    """
+    def metrics_route(headers):
+        if "application/openmetrics-text" in headers.get("Accept", ""):
+            return (
+                200,
+                "application/openmetrics-text; version=1.0.0; charset=utf-8",
+                registry.render(openmetrics=True),
+            )
+        return 200, "text/plain; version=0.0.4; charset=utf-8", registry.render()
+
+    MetricsRequestHandler.routes["/metrics"] = metrics_route
+
+    servers = []
+    try:
+        if port:
+            servers.append(ThreadingHTTPServer((address, port), MetricsRequestHandler))
+            logger.info(msg=f"Metrics available at http://{address}:{port}/metrics")
+        if socket_path:
+            # Remove the socket file from a previous run
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            servers.append(UnixHTTPServer(socket_path, MetricsRequestHandler))
+            # Only the bot's user may read the metrics
+            os.chmod(socket_path, 0o600)
+            logger.info(msg=f"Metrics available on Unix socket '{socket_path}'")
+    except OSError as ex:
+        logger.error(msg=f"Unable to start metrics server: {ex}")
+
+    for server in servers:
+        threading.Thread(
+            target=server.serve_forever, name="sabb-metrics", daemon=True
+        ).start()
+    return servers
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,263 @@
+#
+# Secure APRS Bastion Bot
+# Offline stand-in for the CoreAprsClient object
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Input parser, output generator and post processor only need the client's
+# configuration data and its logging methods. This module provides a
+# stand-in object with exactly these properties plus a helper which sets up
+# the bot's shared state from a user/command configuration file, thus
+# allowing benchmarks and offline tools to drive the message handling code
+# without an APRS-IS connection.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import configparser
+from types import MappingProxyType
+from CoreAprsClient import CoreAprsClientInputParserStatus
+import sabb_shared
+from sabb_logger import logger
+from sabb_input_parser import parse_input_message
+from sabb_output_generator import generate_output_message
+from sabb_post_processor import post_processing
+from sabb_expdict import create_totp_expiringdict, check_totp_expiringdict_config
+from sabb_lockout import create_lockout_table
+from sabb_utils import (
+    get_modification_time,
+    read_config_file_from_disk,
+    build_user_index,
+    clear_otp_key_cache,
+)
+
+# Default settings for the bot's configuration file section. Unlike
+# the bot, the offline client always simulates the command execution
+DEFAULT_SABB_CONFIG = {
+    "sabb_command_config": "sabb_command_config.yml",
+    "sabb_totp_cache_max_len": 250,
+    "sabb_totp_cache_max_age_seconds": 300,
+    "sabb_totp_cache_auto_size": False,
+    "sabb_dry_run": True,
+    "sabb_totp_valid_window": 0,
+    "sabb_lockout_threshold": 3,
+    "sabb_lockout_base_seconds": 60,
+    "sabb_lockout_max_seconds": 3600,
+    "sabb_lockout_max_entries": 1000,
+    "sabb_lockout_file": "",
+    "sabb_lockout_ssid_threshold": 0,
+    "sabb_hotp_look_ahead": 10,
+}
+
+
+class OfflineAprsClient:
+    def __init__(self, sabb_config: dict | None = None, log_messages: bool = False):
+        """
+        Class initialization
+
+        Parameters
+        ==========
+        sabb_config: dict | None
+            Settings for the configuration file's [secure_aprs_bastion_bot]
+            section; missing settings fall back to DEFAULT_SABB_CONFIG.
+            'sabb_dry_run' is always enforced
+        log_messages: bool
+            Forward the client's log messages to our logger (default: discard)
+
+        Returns
+        =======
+        """
+        config = dict(DEFAULT_SABB_CONFIG)
+        config.update(sabb_config or {})
+        config["sabb_dry_run"] = True
+        self.config_data = MappingProxyType(
+            {"secure_aprs_bastion_bot": MappingProxyType(config)}
+        )
+        self.log_messages = log_messages
+
+    def log_debug(self, msg: str):
+        if self.log_messages:
+            logger.debug(msg=msg)
+
+    def log_info(self, msg: str):
+        if self.log_messages:
+            logger.info(msg=msg)
+
+    def log_warning(self, msg: str):
+        if self.log_messages:
+            logger.warning(msg=msg)
+
+    def log_error(self, msg: str):
+        if self.log_messages:
+            logger.error(msg=msg)
+
+
+def initialize_offline_bot(
+    client: OfflineAprsClient,
+    command_config_filename: str,
+    data: dict | None = None,
+):
+    """
+    Sets up the bot's shared state (TOTP cache, lockout table, user
+    configuration) the same way secure_aprs_bastion_bot.py does. All
+    previous replay and skew state gets discarded
+
+    Parameters
+    ==========
+    client: OfflineAprsClient
+        Our offline client object
+    command_config_filename: str
+        Name of the user/command configuration file
+    data: dict | None
+        Content of the configuration file, if already known (e.g. when
+        re-initializing the bot); 'None' = read the file from disk
+
+    Returns
+    =======
+    success: bool
+        True / False, depending on whether the configuration file was read
+    """
+    sabb_config = client.config_data["secure_aprs_bastion_bot"]
+
+    sabb_shared.totp_message_cache = create_totp_expiringdict(
+        max_len=sabb_config["sabb_totp_cache_max_len"],
+        max_age_seconds=sabb_config["sabb_totp_cache_max_age_seconds"],
+    )
+    sabb_shared.lockout_table = create_lockout_table(
+        threshold=sabb_config["sabb_lockout_threshold"],
+        base_seconds=sabb_config["sabb_lockout_base_seconds"],
+        max_seconds=sabb_config["sabb_lockout_max_seconds"],
+        max_entries=sabb_config["sabb_lockout_max_entries"],
+        filename=sabb_config["sabb_lockout_file"],
+        ssid_threshold=sabb_config["sabb_lockout_ssid_threshold"],
+    )
+    sabb_shared.totp_skew_data = {}
+    sabb_shared.hotp_counter_data = {}
+    sabb_shared.hotp_counter_filename = None
+    sabb_shared.hotp_look_ahead = max(sabb_config["sabb_hotp_look_ahead"], 1)
+    clear_otp_key_cache()
+
+    sabb_shared.command_config_filename = command_config_filename
+    if data is None:
+        success, data = read_config_file_from_disk(filename=command_config_filename)
+        if not success:
+            return success
+    sabb_shared.config_data = data
+    sabb_shared.config_user_index = build_user_index(data=sabb_shared.config_data)
+    sabb_shared.config_initial_timestamp = get_modification_time(
+        filename=command_config_filename
+    )
+    check_totp_expiringdict_config(
+        totp_message_cache=sabb_shared.totp_message_cache,
+        data=sabb_shared.config_data,
+        auto_size=sabb_config["sabb_totp_cache_auto_size"],
+        valid_window=sabb_config["sabb_totp_valid_window"],
+    )
+    return True
+
+
+def _parse_config_value(value: str):
+    """
+    Converts a configuration file value to its native data type,
+    using the same rules as the core-aprs-client framework
+
+    Parameters
+    ==========
+    value: str
+        Our input value
+
+    Returns
+    =======
+    Converted data type
+    """
+    if value.lower() in {"true", "yes", "on"}:
+        return True
+    elif value.lower() in {"false", "no", "off"}:
+        return False
+    try:
+        if "." in value:
+            return float(value)
+        return int(value)
+    except ValueError:
+        return value
+
+
+def read_bot_config_file(filename: str):
+    """
+    Reads the bot's configuration file (secure_aprs_bastion_bot.cfg)
+    without validating the framework's configuration sections
+
+    Parameters
+    ==========
+    filename: str
+        Name of the configuration file
+
+    Returns
+    =======
+    success: bool
+        True / False, depending on whether the file could be read
+    config: dict
+        Configuration sections and their settings
+    """
+    config = configparser.ConfigParser()
+    try:
+        if not config.read(filename):
+            logger.error(msg=f"Unable to read configuration file '{filename}'")
+            return False, {}
+    except configparser.Error as ex:
+        logger.error(msg=f"Unable to parse configuration file '{filename}': {ex}")
+        return False, {}
+    return True, {
+        section: {key: _parse_config_value(value) for key, value in config.items(section)}
+        for section in config.sections()
+    }
+
+
+def process_offline_message(
+    client: OfflineAprsClient, from_callsign: str, message: str
+):
+    """
+    Processes a single message the way the framework does: input parser
+    plus (for accepted messages) output generator and post processor
+
+    Parameters
+    ==========
+    client: OfflineAprsClient
+        Our offline client
+    from_callsign: str
+        Sender's callsign
+    message: str
+        APRS message text
+
+    Returns
+    =======
+    accepted: bool
+        True if the input parser has accepted the message
+    response: str
+        The bot's response message
+    """
+    return_code, error_message, response_object = parse_input_message(
+        client, message, from_callsign
+    )
+    if return_code != CoreAprsClientInputParserStatus.PARSE_OK:
+        return False, error_message
+    _, output_message, postprocessor_object = generate_output_message(
+        client, response_object
+    )
+    if postprocessor_object:
+        post_processing(client, postprocessor_object)
+    return True, output_message
+
+
+if __name__ == "__main__":
+    pass
@@ -28,10 +28,16 @@
 #
 
 from CoreAprsClient import CoreAprsClient
-from sabb_utils import set_totp_expiringdict_key, execute_program
+from sabb_utils import commit_authentication, execute_program
+from sabb_metrics import timed_stage, timed_component, count_outcome
+from sabb_audit import record_execution
+from sabb_health import note_job_queued, tracked_job
+from sabb_reply_server import get_reply_environment
+from sabb_logger import logger, log_request_outcome, set_correlation_id
 import sabb_http_codes
 
 
+@timed_component(component="output_generator")
 def generate_output_message(
     instance: CoreAprsClient, input_parser_response_object: dict | object, **kwargs
 ):
@@ -67,12 +73,23 @@ def generate_output_message(
         must not be 'None'
     """
 
+    # Continue the input parser's correlation ID (see sabb_logger.py)
+    set_correlation_id(input_parser_response_object.get("correlation_id"))
+
     # If the user has requested a detached launch, simply return http 202 response
     # message and pass the input parser response object along to the framework
     # The post-processing function will then take care of the rest.
     if input_parser_response_object["detached_launch"]:
         success = True
         output_message = sabb_http_codes.http_msg_202
+        count_outcome(outcome="202")
+        note_job_queued()
+        log_request_outcome(
+            outcome="202",
+            callsign=input_parser_response_object["from_callsign"],
+            command_code=input_parser_response_object["command_code"],
+            request_start=input_parser_response_object.get("request_start"),
+        )
         # By using a value different to 'None' as 3rd parameter, we signal to the framework
         # that we want to invoke the post processor AFTER the APRS response message has
         # been sent back to the user
@@ -82,31 +99,63 @@ def generate_output_message(
         # Everything else from here is NOT a detached launch, meaning that we have to
         # execute the user's command string and ultimately, add callsign/token to our
         # expiring dict, thus preventing the framework from re-using it again.
-        instance.log_info(
-            msg=f"Executing command: '{input_parser_response_object["command_string"]}'"
+        logger.info(
+            "Executing command: '%s'", input_parser_response_object["command_string"]
+        )
+
+        # Permit the command to reply via the bot's reply socket
+        reply_environment = get_reply_environment(
+            correlation_id=input_parser_response_object.get("correlation_id"),
+            callsign=input_parser_response_object["from_callsign"],
         )
 
         # run the user's requested command sequence
-        execute_program(
-            command=input_parser_response_object["command_string"],
-            detached_launch=input_parser_response_object["detached_launch"],
-            watchdog_timespan=input_parser_response_object["watchdog_timespan"],
+        execution_details = {}
+        with timed_stage(
+            component="output_generator", stage="execute_program"
+        ), tracked_job(command_code=input_parser_response_object["command_code"]):
+            execute_program(
+                command=input_parser_response_object["command_string"],
+                detached_launch=input_parser_response_object["detached_launch"],
+                watchdog_timespan=input_parser_response_object["watchdog_timespan"],
+                execution_details=execution_details,
+                correlation_id=input_parser_response_object.get("correlation_id"),
+                extra_environment=reply_environment,
+            )
+        record_execution(
+            response_object=input_parser_response_object,
+            mode="sync",
+            execution_details=execution_details,
         )
     else:
-        instance.log_info(
-            msg=f"Simulating command execution: '{input_parser_response_object["command_string"]}' with detached_launch: '{input_parser_response_object["detached_launch"]}' and watchdog_timespan: '{input_parser_response_object["watchdog_timespan"]}'"
+        logger.info(
+            "Simulating command execution: '%s' with detached_launch: '%s' and watchdog_timespan: '%s'",
+            input_parser_response_object["command_string"],
+            input_parser_response_object["detached_launch"],
+            input_parser_response_object["watchdog_timespan"],
+        )
+        record_execution(
+            response_object=input_parser_response_object,
+            mode="dry_run",
+            execution_details={},
         )
 
     # Set the return value content
     success = True
     output_message = sabb_http_codes.http_msg_200
-
-    # Finally, add the target callsign and the TOTP token to our expiring cache
-    set_totp_expiringdict_key(
-        callsign=input_parser_response_object["target_callsign"],
-        totp_code=input_parser_response_object["totp_code"],
+    count_outcome(outcome="200")
+    log_request_outcome(
+        outcome="200",
+        callsign=input_parser_response_object["from_callsign"],
+        command_code=input_parser_response_object["command_code"],
+        request_start=input_parser_response_object.get("request_start"),
     )
 
+    # Finally, mark the code(s) as used (e.g. add the target callsign
+    # and the TOTP token to our expiring cache)
+    with timed_stage(component="output_generator", stage="commit_authentication"):
+        commit_authentication(response_object=input_parser_response_object)
+
     # and return the status to the framework
     # By using 'None' as 3rd parameter, we signal to the framework that we do not
     # want to invoke the post processor
@@ -28,9 +28,15 @@
 #
 
 from CoreAprsClient import CoreAprsClient
-from sabb_utils import set_totp_expiringdict_key, execute_program
+from sabb_utils import commit_authentication, execute_program
+from sabb_metrics import timed_stage, timed_component
+from sabb_audit import record_execution
+from sabb_health import note_job_dequeued, tracked_job
+from sabb_reply_server import get_reply_environment
+from sabb_logger import logger, set_correlation_id
 
 
+@timed_component(component="post_processor")
 def post_processing(
     instance: CoreAprsClient, postprocessor_input_object: dict | object, **kwargs
 ):
@@ -57,32 +63,64 @@ def post_processing(
     """
 
     if postprocessor_input_object:
-        instance.log_debug(msg="Executing post-processor")
+        # Continue the input parser's correlation ID (see sabb_logger.py)
+        set_correlation_id(postprocessor_input_object.get("correlation_id"))
+        logger.debug("Executing post-processor")
+        note_job_dequeued()
 
         if not instance.config_data["secure_aprs_bastion_bot"]["sabb_dry_run"]:
             # Everything else from here is NOT a detached launch, meaning that we have to
             # execute the user's command string and ultimately, add callsign/token to our
             # expiring dict, thus preventing the framework from re-using it again.
-            instance.log_info(
-                msg=f"Executing command: '{postprocessor_input_object["command_string"]}'"
+            logger.info(
+                "Executing command: '%s'", postprocessor_input_object["command_string"]
+            )
+
+            # Permit the command to reply via the bot's reply socket
+            reply_environment = get_reply_environment(
+                correlation_id=postprocessor_input_object.get("correlation_id"),
+                callsign=postprocessor_input_object["from_callsign"],
             )
 
             # run the user's requested command sequence
-            execute_program(
-                command=postprocessor_input_object["command_string"],
-                detached_launch=postprocessor_input_object["detached_launch"],
-                watchdog_timespan=postprocessor_input_object["watchdog_timespan"],
+            execution_details = {}
+            with timed_stage(
+                component="post_processor", stage="execute_program"
+            ), tracked_job(command_code=postprocessor_input_object["command_code"]):
+                execute_program(
+                    command=postprocessor_input_object["command_string"],
+                    detached_launch=postprocessor_input_object["detached_launch"],
+                    watchdog_timespan=postprocessor_input_object["watchdog_timespan"],
+                    execution_details=execution_details,
+                    correlation_id=postprocessor_input_object.get("correlation_id"),
+                    extra_environment=reply_environment,
+                )
+            record_execution(
+                response_object=postprocessor_input_object,
+                mode=(
+                    "detached"
+                    if postprocessor_input_object["detached_launch"]
+                    else "sync"
+                ),
+                execution_details=execution_details,
             )
         else:
-            instance.log_info(
-                msg=f"Simulating command execution: '{postprocessor_input_object["command_string"]}' with detached launch '{postprocessor_input_object['detached_launch']}' and watchdog_timespan '{postprocessor_input_object['watchdog_timespan']}'"
+            logger.info(
+                "Simulating command execution: '%s' with detached launch '%s' and watchdog_timespan '%s'",
+                postprocessor_input_object["command_string"],
+                postprocessor_input_object["detached_launch"],
+                postprocessor_input_object["watchdog_timespan"],
+            )
+            record_execution(
+                response_object=postprocessor_input_object,
+                mode="dry_run",
+                execution_details={},
             )
 
-        # Finally, add the target callsign and the TOTP token to our expiring cache
-        set_totp_expiringdict_key(
-            callsign=postprocessor_input_object["target_callsign"],
-            totp_code=postprocessor_input_object["totp_code"],
-        )
+        # Finally, mark the code(s) as used (e.g. add the target callsign
+        # and the TOTP token to our expiring cache)
+        with timed_stage(component="post_processor", stage="commit_authentication"):
+            commit_authentication(response_object=postprocessor_input_object)
 
     return True
 
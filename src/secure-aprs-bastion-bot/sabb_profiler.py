@@ -0,0 +1,330 @@
+#
+# Secure APRS Bastion Bot
+# On-demand profiling of the running bot
+# Author: Joerg Schultze-Lutter, 2025
+#
+# A time-limited profile capture of the live process can be triggered by
+# sending SIGUSR1 to the bot or by sending a command to the (optional)
+# profiler control socket. Two capture modes are supported:
+#
+# - sample:   a background thread samples the stacks of all threads at a
+#             fixed interval and writes them in "folded stacks" format
+#             (compatible with flamegraph.pl and speedscope)
+# - cprofile: deterministic cProfile capture of the main thread (which is
+#             the thread that processes the incoming APRS messages). The
+#             capture gets started and stopped from within the main thread's
+#             signal handlers (SIGUSR1 / SIGALRM)
+#
+# The results are written to the framework's data directory. Unless a
+# capture has been triggered, the profiler does not run any code at all.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import cProfile
+import io
+import os
+import pstats
+import signal
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter
+from sabb_logger import logger
+
+PROFILER_MODES = ("sample", "cprofile")
+
+# Upper limit for the duration of a single capture (in seconds)
+MAX_PROFILE_DURATION = 600
+
+
+class Profiler:
+    def __init__(
+        self,
+        data_directory: str,
+        mode: str = "sample",
+        duration: float = 30.0,
+        sample_interval: float = 0.01,
+    ):
+        """
+        Class initialization
+
+        Parameters
+        ==========
+        data_directory: str
+            Directory for the capture results
+        mode: str
+            Default capture mode, see PROFILER_MODES
+        duration: float
+            Default capture duration in seconds
+        sample_interval: float
+            Stack sampling interval in seconds ('sample' mode only)
+
+        Returns
+        =======
+        """
+        self.data_directory = data_directory
+        self.mode = mode if mode in PROFILER_MODES else "sample"
+        self.duration = duration
+        self.sample_interval = max(sample_interval, 0.001)
+        self._lock = threading.Lock()
+        self._active = None
+        self._pending = None
+        self._cprofile = None
+        self._cprofile_filename = None
+
+    def _get_filename(self, mode: str, extension: str):
+        os.makedirs(self.data_directory, exist_ok=True)
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(
+            self.data_directory, f"sabb_profile_{timestamp}_{mode}.{extension}"
+        )
+
+    def request(self, mode: str | None = None, duration: float | None = None):
+        """
+        Requests a new capture. Can be called from any thread; cProfile
+        captures get handed over to the main thread via SIGUSR1
+
+        Parameters
+        ==========
+        mode: str | None
+            Capture mode, see PROFILER_MODES; None = default mode
+        duration: float | None
+            Capture duration in seconds; None = default duration
+
+        Returns
+        =======
+        success: bool
+            True if the capture has been started (or handed over
+            to the main thread)
+        message: str
+            Status message
+        """
+        mode = mode or self.mode
+        if mode not in PROFILER_MODES:
+            return False, f"unknown mode '{mode}'"
+        duration = min(max(duration or self.duration, 1.0), MAX_PROFILE_DURATION)
+
+        # cProfile captures can only be started from within the main thread
+        hand_over = (
+            mode == "cprofile"
+            and threading.current_thread() is not threading.main_thread()
+        )
+        with self._lock:
+            if self._active or self._pending:
+                return False, f"'{self._active or self._pending[0]}' capture in progress"
+            if hand_over:
+                self._pending = (mode, duration)
+            else:
+                self._active = mode
+
+        if hand_over:
+            signal.pthread_kill(threading.main_thread().ident, signal.SIGUSR1)
+            return True, f"cprofile capture for {duration:.0f} secs requested"
+        return True, self._start(mode=mode, duration=duration)
+
+    def _start(self, mode: str, duration: float):
+        if mode == "cprofile":
+            self._cprofile_filename = self._get_filename(mode=mode, extension="prof")
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+            signal.setitimer(signal.ITIMER_REAL, duration)
+            filename = self._cprofile_filename
+        else:
+            filename = self._get_filename(mode=mode, extension="folded")
+            threading.Thread(
+                target=self._sample,
+                args=(duration, filename),
+                name="sabb-profiler",
+                daemon=True,
+            ).start()
+        logger.info(
+            msg=f"Started {mode} profile capture for {duration:.0f} secs; output: '{filename}'"
+        )
+        return f"{mode} capture for {duration:.0f} secs started; output: '{filename}'"
+
+    def handle_sigusr1(self, signal_number, frame):
+        """
+        SIGUSR1 handler; runs in the main thread. Starts either a
+        capture that has been requested by another thread or a
+        capture with the default settings
+
+        Parameters
+        ==========
+        signal_number:
+            The signal number
+        frame:
+            The current stack frame
+
+        Returns
+        =======
+        """
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if pending:
+                self._active = pending[0]
+        if pending:
+            self._start(mode=pending[0], duration=pending[1])
+        else:
+            success, message = self.request()
+            if not success:
+                logger.info(msg=f"Ignoring profiling request: {message}")
+
+    def handle_sigalrm(self, signal_number, frame):
+        """
+        SIGALRM handler; runs in the main thread. Finishes the cProfile capture
+
+        Parameters
+        ==========
+        signal_number:
+            The signal number
+        frame:
+            The current stack frame
+
+        Returns
+        =======
+        """
+        if not self._cprofile:
+            return
+        self._cprofile.disable()
+        try:
+            self._cprofile.dump_stats(self._cprofile_filename)
+            # Add a human-readable summary next to the binary pstats file
+            output = io.StringIO()
+            stats = pstats.Stats(self._cprofile, stream=output)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(50)
+            with open(f"{self._cprofile_filename}.txt", "w") as summary_file:
+                summary_file.write(output.getvalue())
+            logger.info(msg=f"Wrote cprofile capture to '{self._cprofile_filename}'")
+        except OSError as ex:
+            logger.error(msg=f"Unable to write cprofile capture: {ex}")
+        self._cprofile = None
+        with self._lock:
+            self._active = None
+
+    def _sample(self, duration: float, filename: str):
+        own_ident = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(thread_names.get(ident, str(ident)))
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(self.sample_interval)
+
+        try:
+            with open(filename, "w") as folded_file:
+                for stack, count in stacks.most_common():
+                    folded_file.write(f"{stack} {count}\n")
+            logger.info(msg=f"Wrote {samples} stack samples to '{filename}'")
+        except OSError as ex:
+            logger.error(msg=f"Unable to write stack samples: {ex}")
+        with self._lock:
+            self._active = None
+
+    def status(self):
+        with self._lock:
+            if self._active or self._pending:
+                return f"'{self._active or self._pending[0]}' capture in progress"
+        return "idle"
+
+
+class ProfilerControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        """
+        Handles a single control command:
+
+        profile [sample|cprofile] [duration]
+        status
+        """
+        fields = self.rfile.readline().decode("utf-8", errors="replace").split()
+        profiler = self.server.profiler
+        if fields and fields[0].lower() == "profile":
+            mode = fields[1].lower() if len(fields) > 1 else None
+            try:
+                duration = float(fields[2]) if len(fields) > 2 else None
+            except ValueError:
+                duration = None
+            success, message = profiler.request(mode=mode, duration=duration)
+            response = f"{'OK' if success else 'ERROR'} {message}"
+        elif fields and fields[0].lower() == "status":
+            response = f"OK {profiler.status()}"
+        else:
+            response = "ERROR usage: profile [sample|cprofile] [duration] | status"
+        self.wfile.write(f"{response}\n".encode("utf-8"))
+
+
+class ProfilerControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def install_profiler(profiler: Profiler, socket_path: str | None = None):
+    """
+    Installs the SIGUSR1 / SIGALRM handlers and (optionally) starts the
+    profiler control socket. Must be called from the main thread
+
+    Parameters
+    ==========
+    profiler: Profiler
+        Our profiler object
+    socket_path: str | None
+        File name of the control socket; 'None' or empty = disabled
+
+    Returns
+    =======
+    success: bool
+        False if profiling is not supported on this platform
+    """
+    if not hasattr(signal, "SIGUSR1") or not hasattr(signal, "pthread_kill"):
+        logger.warning(msg="On-demand profiling is not supported on this platform")
+        return False
+
+    signal.signal(signal.SIGUSR1, profiler.handle_sigusr1)
+    signal.signal(signal.SIGALRM, profiler.handle_sigalrm)
+    logger.debug(msg=f"Send SIGUSR1 to process {os.getpid()} for a profile capture")
+
+    if socket_path:
+        try:
+            # Remove the socket file from a previous run
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = ProfilerControlServer(socket_path, ProfilerControlHandler)
+            # Only the bot's user may start a profile capture
+            os.chmod(socket_path, 0o600)
+        except OSError as ex:
+            logger.error(msg=f"Unable to start profiler control socket: {ex}")
+            return True
+        server.profiler = profiler
+        threading.Thread(
+            target=server.serve_forever, name="sabb-profiler-control", daemon=True
+        ).start()
+        logger.info(msg=f"Profiler control socket available at '{socket_path}'")
+    return True
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,449 @@
+#!/opt/local/bin/python
+#
+# Secure APRS Bastion Bot
+# Offline replay of recorded APRS-IS traffic
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Reads raw APRS-IS packet logs, extracts the APRS messages which are
+# addressed to the bot and pushes them through the bot's input parser,
+# output generator and post processor - without any network connection.
+# The bot's clock gets replaced with a simulated clock which follows the
+# packets' capture timestamps, thus allowing the TOTP codes in the capture
+# to verify. Command execution is always simulated (dry run).
+#
+# Each log line may start with a capture timestamp (epoch seconds or ISO
+# 8601) followed by the raw packet (SOURCE>DEST,PATH::ADDRESSEE:text{msgno).
+# Lines without timestamp get consecutive timestamps starting at
+# --start-time. The program prints one decision line per message and
+# the aggregate throughput at the end.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import datetime
+import json
+import logging
+import os
+import re
+import sys
+import time
+import sabb_shared
+from sabb_logger import logger
+from sabb_offline_client import (
+    OfflineAprsClient,
+    initialize_offline_bot,
+    process_offline_message,
+    read_bot_config_file,
+)
+
+# Leading capture timestamp: epoch seconds or ISO 8601
+regex_timestamp = re.compile(
+    r"^\s*(?:(\d{9,10}(?:\.\d+)?)|(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?))"
+)
+
+# APRS message packet: SOURCE>DEST[,PATH]::ADDRESSEE:text[{msgno]
+regex_aprs_message = re.compile(
+    r"([A-Z0-9-]{1,9})>[^:\s]*::([A-Z0-9- ]{9}):(.*?)(?:\{[A-Z0-9]{1,5}(?:\}[A-Z0-9]{0,2})?)?\s*$",
+    re.IGNORECASE,
+)
+
+
+class ReplayClock:
+    def __init__(self, speed: float = 0.0):
+        """
+        Simulated clock for the bot. The clock's time is set to each
+        packet's capture timestamp prior to processing the packet. With
+        a speed factor > 0, the replay additionally waits for the time
+        span between two packets (divided by the speed factor), thus
+        replaying the capture in accelerated real time
+
+        Parameters
+        ==========
+        speed: float
+            Replay speed factor; 0 = as fast as possible
+
+        Returns
+        =======
+        """
+        self.speed = speed
+        self.now = 0.0
+        self._capture_start = None
+        self._replay_start = None
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, timestamp: float):
+        if self.speed > 0:
+            if self._capture_start is None:
+                self._capture_start = timestamp
+                self._replay_start = time.monotonic()
+            delay = (
+                self._replay_start
+                + (timestamp - self._capture_start) / self.speed
+                - time.monotonic()
+            )
+            if delay > 0:
+                time.sleep(delay)
+        self.now = timestamp
+
+
+def parse_timestamp(value: str):
+    """
+    Converts a command line or log file timestamp to epoch seconds.
+    ISO 8601 timestamps without time zone are treated as local time
+
+    Parameters
+    ==========
+    value: str
+        Epoch seconds or ISO 8601 timestamp
+
+    Returns
+    =======
+    timestamp: float | None
+        Epoch seconds; None if the value could not be parsed
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(
+            value.replace(",", ".").replace("Z", "+00:00")
+        ).timestamp()
+    except ValueError:
+        return None
+
+
+def read_packet_log(
+    logfile, bot_callsign: str | None, start_time: float, interval: float
+):
+    """
+    Extracts the APRS messages from a raw packet log. Acks, rejects
+    and messages to other addressees are skipped
+
+    Parameters
+    ==========
+    logfile: file
+        The packet log
+    bot_callsign: str | None
+        The bot's callsign; None = accept messages to all addressees
+    start_time: float
+        Capture timestamp for the first line without timestamp
+    interval: float
+        Time span between consecutive lines without timestamp
+
+    Returns
+    =======
+    generator of (line_number, timestamp, from_callsign, message) tuples;
+    message = None for skipped lines
+    """
+    next_timestamp = start_time
+    for line_number, line in enumerate(logfile, start=1):
+        line = line.rstrip("\r\n")
+        timestamp = None
+        matches = regex_timestamp.match(line)
+        if matches:
+            timestamp = parse_timestamp(matches[1] or matches[2])
+        if timestamp is None:
+            timestamp = next_timestamp
+            next_timestamp += interval
+
+        matches = regex_aprs_message.search(line)
+        if not matches:
+            yield line_number, timestamp, None, None
+            continue
+        from_callsign = matches[1].upper()
+        addressee = matches[2].strip().upper()
+        message = matches[3]
+        if (bot_callsign and addressee != bot_callsign) or re.match(
+            r"^(ack|rej)[A-Za-z0-9]{1,5}", message
+        ):
+            yield line_number, timestamp, from_callsign, None
+            continue
+        yield line_number, timestamp, from_callsign, message
+
+
+def percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_replay(
+    client: OfflineAprsClient,
+    logfiles: list,
+    bot_callsign: str | None,
+    clock: ReplayClock,
+    start_time: float,
+    interval: float,
+    output_format: str = "text",
+    quiet: bool = False,
+    output=sys.stdout,
+):
+    """
+    Replays the packet logs through the bot's message handling code
+
+    Parameters
+    ==========
+    client: OfflineAprsClient
+        Our offline client
+    logfiles: list
+        Names of the packet logs; '-' = stdin
+    bot_callsign: str | None
+        The bot's callsign; None = accept messages to all addressees
+    clock: ReplayClock
+        The simulated clock
+    start_time: float
+        Capture timestamp for the first line without timestamp
+    interval: float
+        Time span between consecutive lines without timestamp
+    output_format: str
+        'text' or 'json' (one JSON object per line)
+    quiet: bool
+        Do not print the per-message decisions
+    output: file
+        Target for the per-message decisions
+
+    Returns
+    =======
+    summary: dict
+        Aggregate results
+    """
+    latencies = []
+    outcomes = {}
+    lines = skipped = 0
+    total_start = time.perf_counter()
+
+    for logfile_name in logfiles:
+        logfile = sys.stdin if logfile_name == "-" else open(logfile_name, "r")
+        try:
+            for line_number, timestamp, from_callsign, message in read_packet_log(
+                logfile=logfile,
+                bot_callsign=bot_callsign,
+                start_time=start_time,
+                interval=interval,
+            ):
+                lines += 1
+                if message is None:
+                    skipped += 1
+                    continue
+                clock.advance(timestamp=timestamp)
+
+                start = time.perf_counter()
+                accepted, response = process_offline_message(
+                    client=client, from_callsign=from_callsign, message=message
+                )
+                elapsed = time.perf_counter() - start
+                latencies.append(elapsed)
+
+                outcome = response.split(" ", 1)[0] if response else ""
+                if not outcome.isdigit():
+                    outcome = "other"
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+                if quiet:
+                    continue
+                if output_format == "json":
+                    output.write(
+                        json.dumps(
+                            {
+                                "file": logfile_name,
+                                "line": line_number,
+                                "timestamp": timestamp,
+                                "from_callsign": from_callsign,
+                                "message": message,
+                                "accepted": accepted,
+                                "response": response,
+                                "usec": round(elapsed * 1e6, 1),
+                            }
+                        )
+                        + "\n"
+                    )
+                else:
+                    capture_time = datetime.datetime.fromtimestamp(timestamp).isoformat(
+                        timespec="seconds"
+                    )
+                    output.write(
+                        f"{capture_time} {from_callsign:<9} {'ACCEPT' if accepted else 'REJECT'} "
+                        f"{response!r} ({elapsed * 1e6:.0f} usec) <- {message!r}\n"
+                    )
+        finally:
+            if logfile is not sys.stdin:
+                logfile.close()
+
+    total_elapsed = time.perf_counter() - total_start
+    processing_time = sum(latencies)
+    latencies.sort()
+    return {
+        "lines": lines,
+        "skipped": skipped,
+        "messages": len(latencies),
+        "outcomes": outcomes,
+        "elapsed_seconds": round(total_elapsed, 3),
+        "throughput_msgs_per_sec": (
+            round(len(latencies) / processing_time, 1) if processing_time else 0.0
+        ),
+        "latency_usec": {
+            "p50": round(percentile(latencies, 0.50) * 1e6, 1),
+            "p99": round(percentile(latencies, 0.99) * 1e6, 1),
+            "mean": round(processing_time / len(latencies) * 1e6, 1) if latencies else 0.0,
+            "max": round(latencies[-1] * 1e6, 1) if latencies else 0.0,
+        },
+    }
+
+
+def get_command_line_params():
+    """
+    Gets and returns the command line arguments
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    args: argparse.Namespace
+        The command line arguments
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "logfiles",
+        nargs="+",
+        help="Raw APRS-IS packet log(s); '-' = stdin",
+    )
+
+    parser.add_argument(
+        "--configfile",
+        default="secure_aprs_bastion_bot.cfg",
+        type=str,
+        help="APRS framework config file name (default is 'secure_aprs_bastion_bot.cfg')",
+    )
+
+    parser.add_argument(
+        "--command-config",
+        dest="command_config",
+        default="",
+        type=str,
+        help="User/command configuration file (default: 'sabb_command_config' setting)",
+    )
+
+    parser.add_argument(
+        "--callsign",
+        dest="callsign",
+        default="",
+        type=str,
+        help="The bot's callsign (default: 'aprsis_callsign' setting); '*' = all addressees",
+    )
+
+    parser.add_argument(
+        "--speed",
+        dest="speed",
+        default=0.0,
+        type=float,
+        help="Replay speed factor, e.g. 60 = one hour per minute; 0 = as fast as possible (default)",
+    )
+
+    parser.add_argument(
+        "--start-time",
+        dest="start_time",
+        default="",
+        type=str,
+        help="Capture timestamp (epoch seconds or ISO 8601) for lines without timestamp (default: now)",
+    )
+
+    parser.add_argument(
+        "--interval",
+        dest="interval",
+        default=1.0,
+        type=float,
+        help="Time span in seconds between lines without timestamp (default: 1)",
+    )
+
+    parser.add_argument(
+        "--output-format",
+        dest="output_format",
+        choices=["text", "json"],
+        default="text",
+        help="Format of the per-message decisions (default: text)",
+    )
+
+    parser.add_argument(
+        "--quiet",
+        dest="quiet",
+        action="store_true",
+        default=False,
+        help="Print the aggregate results only",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_command_line_params()
+
+    # Keep the console free for the decisions and the summary
+    logger.setLevel(logging.WARNING)
+
+    sabb_config = {}
+    bot_callsign = None
+    if os.path.isfile(args.configfile):
+        success, bot_config = read_bot_config_file(filename=args.configfile)
+        if not success:
+            sys.exit(1)
+        sabb_config = bot_config.get("secure_aprs_bastion_bot", {})
+        bot_callsign = bot_config.get("coac_client_config", {}).get("aprsis_callsign")
+    if args.callsign:
+        bot_callsign = args.callsign
+    bot_callsign = (
+        None if not bot_callsign or bot_callsign == "*" else str(bot_callsign).upper()
+    )
+
+    # Never touch the production state files
+    sabb_config["sabb_lockout_file"] = ""
+    sabb_config["sabb_dry_run"] = True
+    client = OfflineAprsClient(sabb_config=sabb_config)
+    command_config = (
+        args.command_config
+        or client.config_data["secure_aprs_bastion_bot"]["sabb_command_config"]
+    )
+
+    start_time = time.time()
+    if args.start_time:
+        start_time = parse_timestamp(args.start_time)
+        if start_time is None:
+            logger.error(msg=f"Invalid start time '{args.start_time}'")
+            sys.exit(1)
+
+    clock = ReplayClock(speed=args.speed)
+    sabb_shared.clock = clock
+    if not initialize_offline_bot(client=client, command_config_filename=command_config):
+        sys.exit(1)
+
+    summary = run_replay(
+        client=client,
+        logfiles=args.logfiles,
+        bot_callsign=bot_callsign,
+        clock=clock,
+        start_time=start_time,
+        interval=args.interval,
+        output_format=args.output_format,
+        quiet=args.quiet,
+    )
+    if args.output_format == "json" and not args.quiet:
+        print(json.dumps({"summary": summary}))
+    else:
+        print(json.dumps(summary, indent=2))
@@ -0,0 +1,142 @@
+#
+# Secure APRS Bastion Bot
+# Reply client for programs which have been launched by the bot
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Programs that the bot executes on behalf of a user can hand a reply to
+# the running bot, which then sends the reply to the requesting callsign
+# via its existing APRS-IS session. The bot passes the request's
+# correlation ID, the callsign of the requesting user and the file name of
+# its reply socket to the program's environment (SABB_CORRELATION_ID,
+# SABB_REPLY_CALLSIGN, SABB_REPLY_SOCKET). Unlike send-aprs-message.py,
+# no additional Python interpreter and no APRS-IS login are required:
+#
+#   from sabb_reply import send_reply
+#   send_reply(message="Backup completed, 12 files")
+#
+# This module only uses the Python standard library; you can copy it to
+# your scripts' directory or add the bot's directory to your PYTHONPATH.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import json
+import os
+import socket
+import sys
+
+# Environment variables which get set by the bot
+ENV_CORRELATION_ID = "SABB_CORRELATION_ID"
+ENV_REPLY_CALLSIGN = "SABB_REPLY_CALLSIGN"
+ENV_REPLY_SOCKET = "SABB_REPLY_SOCKET"
+
+
+class ReplyError(Exception):
+    """
+    The reply could not be handed over to the bot (no reply socket,
+    bot not running or reply rejected by the bot)
+    """
+
+
+def reply_available():
+    """
+    Checks whether the bot has provided reply information to us
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    available: bool
+        True if correlation ID and reply socket are present
+    """
+    return bool(os.environ.get(ENV_CORRELATION_ID) and os.environ.get(ENV_REPLY_SOCKET))
+
+
+def send_reply(
+    message: str,
+    correlation_id: str | None = None,
+    callsign: str | None = None,
+    socket_path: str | None = None,
+    timeout: float = 5.0,
+):
+    """
+    Hands a reply over to the bot. Returns as soon as the bot has queued
+    the reply for sending
+
+    Parameters
+    ==========
+    message: str
+        The reply's text. Texts longer than a single APRS message get
+        split up by the bot
+    correlation_id: str | None
+        The request's correlation ID; None = SABB_CORRELATION_ID
+    callsign: str | None
+        The requesting callsign; None = SABB_REPLY_CALLSIGN. The bot
+        only accepts the callsign that has sent the request
+    socket_path: str | None
+        The bot's reply socket; None = SABB_REPLY_SOCKET
+    timeout: float
+        Max. time span in seconds to wait for the bot
+
+    Returns
+    =======
+    response: dict
+        The bot's response, e.g. {"status": "queued", "fragments": 2}
+    """
+    correlation_id = correlation_id or os.environ.get(ENV_CORRELATION_ID, "")
+    callsign = callsign or os.environ.get(ENV_REPLY_CALLSIGN, "")
+    socket_path = socket_path or os.environ.get(ENV_REPLY_SOCKET, "")
+    if not correlation_id or not socket_path:
+        raise ReplyError(
+            f"No reply information available "
+            f"({ENV_CORRELATION_ID} / {ENV_REPLY_SOCKET})"
+        )
+
+    request = {
+        "correlation_id": correlation_id,
+        "callsign": callsign,
+        "message": message,
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall(f"{json.dumps(request)}\n".encode("utf-8"))
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = client.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+        response = json.loads(data)
+    except (OSError, ValueError) as ex:
+        raise ReplyError(f"Unable to submit reply to '{socket_path}': {ex}") from ex
+
+    if response.get("status") != "queued":
+        raise ReplyError(response.get("message", "reply has been rejected"))
+    return response
+
+
+if __name__ == "__main__":
+    # Shell scripts: python sabb_reply.py "Backup completed"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("message", type=str, help="Reply text")
+    args = parser.parse_args()
+    try:
+        print(json.dumps(send_reply(message=args.message)))
+    except ReplyError as ex:
+        print(f"Unable to send reply: {ex}")
+        sys.exit(1)
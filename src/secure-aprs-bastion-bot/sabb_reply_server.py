@@ -0,0 +1,410 @@
+#
+# Secure APRS Bastion Bot
+# Reply socket for programs which have been launched by the bot
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Programs that have been started by execute_program can hand replies to
+# the running bot via a local Unix domain socket (see sabb_reply.py for
+# the client side). The bot sends these replies to the requesting
+# callsign on its existing APRS-IS session. Each request's correlation ID
+# acts as its reply token: a reply is only accepted for a correlation ID
+# whose command has been launched within the last sabb_reply_max_age_seconds
+# and only for the callsign that has sent the request. The number of
+# APRS messages per request is limited, thus a runaway script cannot
+# flood APRS-IS.
+#
+# Replies get queued and are sent by a background thread, using the
+# framework's packet delays between the fragments of a reply.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+import sabb_shared
+from sabb_logger import logger, set_correlation_id
+from sabb_reply import ENV_REPLY_CALLSIGN, ENV_REPLY_SOCKET
+from CoreAprsClient.client_utils import (
+    APRS_MSG_LEN_NOTRAILING,
+    APRS_MSG_LEN_TRAILING,
+    make_pretty_aprs_messages,
+    format_list_with_enumeration,
+)
+
+try:
+    from CoreAprsClient import client_shared
+except ImportError:
+    client_shared = None
+
+# Max. number of correlation IDs which are kept for replies
+MAX_REPLY_ROUTES = 1000
+
+# Max. length of a request line on the reply socket
+MAX_REQUEST_BYTES = 16384
+
+
+class ReplyRelay:
+    def __init__(
+        self,
+        source_callsign: str,
+        tocall: str,
+        packet_delay: float = 6.0,
+        packet_delay_grace_period: float = 1.0,
+        max_age_seconds: float = 3600,
+        max_fragments: int = 10,
+        message_enumeration: bool = False,
+        simulate_send: bool = False,
+    ):
+        """
+        Class initialization
+
+        Parameters
+        ==========
+        source_callsign: str
+            Our own APRS callsign
+        tocall: str
+            TOCALL for the outgoing messages
+        packet_delay: float
+            Delay in seconds between two fragments of a reply
+        packet_delay_grace_period: float
+            Delay in seconds after the last fragment of a reply
+        max_age_seconds: float
+            Time span in seconds (counting from the command's launch)
+            during which replies are accepted
+        max_fragments: int
+            Max. number of APRS messages per request
+        message_enumeration: bool
+            Add the framework's trailing enumeration to multi-part replies
+        simulate_send: bool
+            Only log the outgoing messages
+
+        Returns
+        =======
+        """
+        self.source_callsign = source_callsign
+        self.tocall = tocall
+        self.packet_delay = packet_delay
+        self.packet_delay_grace_period = packet_delay_grace_period
+        self.max_age_seconds = max_age_seconds
+        self.max_fragments = max_fragments
+        self.message_enumeration = message_enumeration
+        self.simulate_send = simulate_send
+        self.socket_path = None
+        self._lock = threading.Lock()
+        # correlation ID -> [callsign, expiry, remaining fragments]
+        self._routes = OrderedDict()
+        self._queue = queue.Queue()
+        self.counters = {
+            "queued_replies": 0,
+            "rejected_replies": 0,
+            "sent_messages": 0,
+        }
+
+    def register(self, correlation_id: str, callsign: str):
+        """
+        Permits replies to the given callsign for the given correlation ID
+
+        Parameters
+        ==========
+        correlation_id: str
+            The request's correlation ID
+        callsign: str
+            The callsign that has sent the request
+
+        Returns
+        =======
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now=now)
+            self._routes[correlation_id] = [
+                callsign.upper(),
+                now + self.max_age_seconds,
+                self.max_fragments,
+            ]
+            self._routes.move_to_end(correlation_id)
+            while len(self._routes) > MAX_REPLY_ROUTES:
+                self._routes.popitem(last=False)
+
+    def _purge(self, now: float):
+        # Routes are ordered by their registration, thus by their expiry
+        while self._routes:
+            correlation_id, route = next(iter(self._routes.items()))
+            if route[1] > now:
+                break
+            del self._routes[correlation_id]
+
+    def build_messages(self, message: str):
+        """
+        Splits a reply up into APRS messages
+
+        Parameters
+        ==========
+        message: str
+            The reply's text
+
+        Returns
+        =======
+        messages: list
+            The APRS messages' texts
+        """
+        # Script output may contain line breaks and tabs
+        message = " ".join(message.split())
+        if not message:
+            return []
+        messages = make_pretty_aprs_messages(
+            message_to_add=message,
+            max_len=(
+                APRS_MSG_LEN_TRAILING
+                if self.message_enumeration
+                else APRS_MSG_LEN_NOTRAILING
+            ),
+        )
+        if self.message_enumeration:
+            messages = format_list_with_enumeration(mylistarray=messages)
+        return messages
+
+    def submit(self, request: dict):
+        """
+        Validates a reply and queues it for sending
+
+        Parameters
+        ==========
+        request: dict
+            The client's request (correlation_id, callsign, message)
+
+        Returns
+        =======
+        response: dict
+            The response for the client
+        """
+        if request.get("command") == "status":
+            return {"status": "ok", **self.get_status()}
+
+        correlation_id = str(request.get("correlation_id") or "")
+        callsign = str(request.get("callsign") or "").upper()
+        messages = self.build_messages(message=str(request.get("message") or ""))
+
+        with self._lock:
+            self._purge(now=time.monotonic())
+            route = self._routes.get(correlation_id)
+            if not route:
+                error = "unknown or expired correlation ID"
+            elif callsign and callsign != route[0]:
+                error = f"replies are only permitted to '{route[0]}'"
+            elif not messages:
+                error = "empty message"
+            elif len(messages) > route[2]:
+                error = f"reply limit exceeded ({route[2]} APRS messages left)"
+            else:
+                error = None
+                route[2] -= len(messages)
+                callsign = route[0]
+                self.counters["queued_replies"] += 1
+            if error:
+                self.counters["rejected_replies"] += 1
+
+        if error:
+            logger.info(msg=f"Rejected reply for '{correlation_id}': {error}")
+            return {"status": "error", "message": error}
+        self._queue.put((correlation_id, callsign, messages))
+        return {"status": "queued", "fragments": len(messages)}
+
+    def run(self):
+        """
+        Sends the queued replies via the framework's APRS-IS connection
+        (runs in its own thread)
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        """
+        while True:
+            correlation_id, callsign, messages = self._queue.get()
+            set_correlation_id(correlation_id)
+            for index, message in enumerate(messages, start=1):
+                self._send(callsign=callsign, message=message)
+                time.sleep(
+                    self.packet_delay
+                    if index < len(messages)
+                    else self.packet_delay_grace_period
+                )
+            set_correlation_id(None)
+
+    def _send(self, callsign: str, message: str):
+        packet = f"{self.source_callsign}>{self.tocall}::{callsign:9}:{message}"
+        if self.simulate_send:
+            logger.debug(msg=f"Simulating reply message '{packet}'")
+            return
+        # Wait for the framework's (re)connect
+        while True:
+            ais = getattr(client_shared, "AIS", None)
+            try:
+                if ais and ais.ais_is_connected():
+                    logger.debug(msg=f"Sending reply message '{packet}'")
+                    ais.ais_send(aprsis_data=packet)
+                    self.counters["sent_messages"] += 1
+                    return
+            except (AttributeError, OSError) as ex:
+                logger.warning(msg=f"Unable to send reply message: {ex}")
+            time.sleep(1.0)
+
+    def get_status(self):
+        """
+        Returns the relay's counters
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        status: dict
+            Counters, number of reply routes and queued replies
+        """
+        with self._lock:
+            routes = len(self._routes)
+        return {
+            **self.counters,
+            "reply_routes": routes,
+            "pending_replies": self._queue.qsize(),
+        }
+
+
+class ReplyRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        """
+        Handles a single request: one line with a JSON object, either
+        {"correlation_id": "...", "callsign": "...", "message": "..."}
+        or {"command": "status"}
+        """
+        line = self.rfile.readline(MAX_REQUEST_BYTES)
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request is not a JSON object")
+            response = self.server.relay.submit(request=request)
+        except ValueError as ex:
+            response = {"status": "error", "message": f"invalid request: {ex}"}
+        self.wfile.write(f"{json.dumps(response)}\n".encode("utf-8"))
+
+
+class ReplyServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def get_reply_environment(correlation_id: str | None, callsign: str):
+    """
+    Registers a request for replies and returns the environment variables
+    for its command
+
+    Parameters
+    ==========
+    correlation_id: str | None
+        The request's correlation ID
+    callsign: str
+        The callsign that has sent the request
+
+    Returns
+    =======
+    environment: dict
+        SABB_REPLY_SOCKET and SABB_REPLY_CALLSIGN; empty if the reply
+        socket is disabled
+    """
+    relay = sabb_shared.reply_relay
+    if relay is None or not relay.socket_path or not correlation_id:
+        return {}
+    relay.register(correlation_id=correlation_id, callsign=callsign)
+    return {ENV_REPLY_SOCKET: relay.socket_path, ENV_REPLY_CALLSIGN: callsign}
+
+
+def collect_reply_metrics(openmetrics: bool = False):
+    """
+    Provides the reply relay's counters in Prometheus text format
+
+    Parameters
+    ==========
+    openmetrics: bool
+        True = OpenMetrics format; counter families are named without
+        their samples' '_total' suffix
+
+    Returns
+    =======
+    lines: list
+        Metrics in Prometheus text format
+    """
+    relay = sabb_shared.reply_relay
+    if relay is None:
+        return []
+    status = relay.get_status()
+    # OpenMetrics counter families are named without the '_total' suffix
+    suffix = "" if openmetrics else "_total"
+    return [
+        f"# TYPE sabb_reply_messages{suffix} counter",
+        f'sabb_reply_messages_total{{result="queued"}} {status["queued_replies"]}',
+        f'sabb_reply_messages_total{{result="rejected"}} {status["rejected_replies"]}',
+        f"# TYPE sabb_reply_sent_aprs_messages{suffix} counter",
+        f"sabb_reply_sent_aprs_messages_total {status['sent_messages']}",
+        "# TYPE sabb_reply_pending gauge",
+        f"sabb_reply_pending {status['pending_replies']}",
+    ]
+
+
+def start_reply_relay(relay: ReplyRelay, socket_path: str | None):
+    """
+    Starts the reply socket and the relay's sender thread
+
+    Parameters
+    ==========
+    relay: ReplyRelay
+        Our reply relay object
+    socket_path: str | None
+        File name of the reply socket; 'None' or empty = disabled
+
+    Returns
+    =======
+    success: bool
+        True if the reply socket is available
+    """
+    if not socket_path:
+        logger.debug(msg="Reply socket is disabled")
+        return False
+    try:
+        # Remove the socket file from a previous run
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ReplyServer(socket_path, ReplyRequestHandler)
+        # Only the bot's user (and thus the programs it launches) may reply
+        os.chmod(socket_path, 0o600)
+    except OSError as ex:
+        logger.error(msg=f"Unable to start reply socket: {ex}")
+        return False
+    server.relay = relay
+    relay.socket_path = os.path.abspath(socket_path)
+    threading.Thread(
+        target=server.serve_forever, name="sabb-reply-socket", daemon=True
+    ).start()
+    threading.Thread(target=relay.run, name="sabb-reply-sender", daemon=True).start()
+    logger.info(msg=f"Reply socket available at '{relay.socket_path}'")
+    return True
+
+
+if __name__ == "__main__":
+    pass
@@ -21,12 +21,45 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
+import time
 
 # shared variables
 totp_message_cache = None
 config_initial_timestamp = None
 config_data = None
 command_config_filename = None
+# callsign index for config_data's user entries
+config_user_index = None
+lockout_table = None
+# per-stage latency histograms and outcome counters
+# (None = metrics have not been enabled)
+metrics = None
+# on-demand profiler (see sabb_profiler.py)
+profiler = None
+# execution audit journal (see sabb_audit.py; None = disabled)
+audit_journal = None
+# health state for the /health and /ready endpoints
+# (see sabb_health.py; None = disabled)
+health = None
+# load shedder (see sabb_loadshed.py; None = disabled)
+load_shedder = None
+# reply relay for launched programs (see sabb_reply_server.py;
+# None = disabled)
+reply_relay = None
+
+# Most recently accepted TOTP time step and observed
+# clock offset per callsign
+totp_skew_data = {}
+
+# Most recently accepted HOTP counter per callsign, its (optional)
+# persistence file and the number of accepted look-ahead counter values
+hotp_counter_data = {}
+hotp_counter_filename = None
+hotp_look_ahead = 10
+
+# Time source for TOTP verification and lockout handling. Benchmarks and
+# offline replays of packet logs can replace it with a simulated clock
+clock = time.time
 
 
 if __name__ == "__main__":
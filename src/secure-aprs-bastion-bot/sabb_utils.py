@@ -27,6 +27,10 @@ import sabb_shared
 import yaml
 from datetime import datetime, timezone
 
+import base64
+import hashlib
+import hmac
+import json
 import os
 import shlex
 import signal
@@ -87,7 +91,11 @@ def read_config_file_from_disk(filename: str):
     else:
         try:
             with open(file=filename, mode="r") as yaml_file:
-                data = yaml.safe_load(yaml_file)
+                # Use libyaml's loader whenever available; reading large
+                # user configurations with the pure Python loader is slow
+                data = yaml.load(
+                    yaml_file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+                )
                 logger.info(f"Configuration file '{filename}' was successfully read")
 
                 # perform a very basic check of the file structure
@@ -102,18 +110,28 @@ def read_config_file_from_disk(filename: str):
     return __success, data
 
 
-def get_totp_expiringdict_key(callsign: str, totp_code: str):
+def get_totp_expiringdict_key(
+    callsign: str, totp_code: str, totp_step: int | None = None
+):
     """
     Checks for an entry in our TOTP expiring dictionary cache.
     If we find that entry in our list before that entry has expired,
     we consider the request as a duplicate and will not process it again
 
+    If the TOTP time step is provided, the request is also considered a
+    duplicate if that time step is not newer than the most recent time step
+    that we have accepted for this callsign. This covers every time step
+    that can be accepted through a verification window, even after the
+    entry has expired from the cache.
+
     Parameters
     ==========
     callsign: str
         User's callsign, e.g. DF1JSL-1
     totp_code: str
         six-digit numeric TOTP code
+    totp_step: int | None
+        TOTP time step that the code was generated for (optional)
 
     Returns
     =======
@@ -122,24 +140,43 @@ def get_totp_expiringdict_key(callsign: str, totp_code: str):
         value 'None' if we were unable to locate the entry
     """
 
-    logger.debug(msg=f"Getting TOTP expiring key for {callsign} and {totp_code}")
+    logger.debug("Getting TOTP expiring key for %s and %s", callsign, totp_code)
     key = (callsign, totp_code)
     key = tuple(key)
-    key = key if key in sabb_shared.totp_message_cache else None
-    logger.debug(msg=f"TOTP expiring key retrieval resulted in {key}")
+    if key not in sabb_shared.totp_message_cache:
+        skew_data = sabb_shared.totp_skew_data.get(callsign)
+        if (
+            totp_step is None
+            or not skew_data
+            or totp_step > skew_data["last_step"]
+        ):
+            key = None
+    logger.debug("TOTP expiring key retrieval resulted in %s", key)
     return key
 
 
-def set_totp_expiringdict_key(callsign: str, totp_code: str):
+def set_totp_expiringdict_key(
+    callsign: str,
+    totp_code: str,
+    totp_step: int | None = None,
+    totp_offset: int | None = None,
+):
     """
     Adds an entry to our TOTP expiring dictionary cache.
 
+    If the TOTP time step and offset are provided, the callsign's most
+    recently accepted time step and its observed clock offset get updated, too.
+
     Parameters
     ==========
     callsign: str
         User's callsign, e.g. DF1JSL-1
     totp_code: str
         six-digit numeric TOTP code
+    totp_step: int | None
+        TOTP time step that the code was generated for (optional)
+    totp_offset: int | None
+        Offset between the code's time step and our own time step (optional)
 
     Returns
     =======
@@ -147,14 +184,78 @@ def set_totp_expiringdict_key(callsign: str, totp_code: str):
         The updated version of our ExpiringDict object
     """
 
-    logger.debug(msg=f"Setting TOTP expiring key for {callsign} and {totp_code}")
+    logger.debug("Setting TOTP expiring key for %s and %s", callsign, totp_code)
     key = (callsign, totp_code)
     key = tuple(key)
     sabb_shared.totp_message_cache[key] = datetime.now(timezone.utc)
 
+    if totp_step is not None:
+        update_totp_skew_data(
+            callsign=callsign, totp_step=totp_step, totp_offset=totp_offset or 0
+        )
+
+
+def update_totp_skew_data(callsign: str, totp_step: int, totp_offset: int):
+    """
+    Remembers the most recently accepted TOTP time step for a callsign and
+    learns the callsign's clock offset (exponentially smoothed), thus allowing
+    us to check the most likely time step first for future requests
+
+    Parameters
+    ==========
+    callsign: str
+        User's callsign, e.g. DF1JSL-1
+    totp_step: int
+        TOTP time step that was accepted
+    totp_offset: int
+        Offset between the accepted time step and our own time step
+
+    Returns
+    =======
+    """
+    skew_data = sabb_shared.totp_skew_data.get(callsign)
+    if not skew_data:
+        skew_data = {"last_step": totp_step, "skew": float(totp_offset)}
+    else:
+        skew_data = {
+            "last_step": max(skew_data["last_step"], totp_step),
+            "skew": (skew_data["skew"] + totp_offset) / 2,
+        }
+    sabb_shared.totp_skew_data[callsign] = skew_data
+    logger.debug(
+        "TOTP skew data for %s: last step=%s, observed offset=%.2f steps",
+        callsign,
+        skew_data["last_step"],
+        skew_data["skew"],
+    )
+
+
+def get_preferred_totp_offset(callsign: str):
+    """
+    Returns the most likely TOTP time step offset for a callsign, based
+    on the callsign's previously observed clock offsets
+
+    Parameters
+    ==========
+    callsign: str
+        User's callsign, e.g. DF1JSL-1
+
+    Returns
+    =======
+    offset: int
+        Most likely time step offset (0 if unknown)
+    """
+    skew_data = sabb_shared.totp_skew_data.get(callsign)
+    return round(skew_data["skew"]) if skew_data else 0
+
 
 def execute_program(
-    command: str, detached_launch: bool = False, watchdog_timespan: float = 0.0
+    command: str,
+    detached_launch: bool = False,
+    watchdog_timespan: float = 0.0,
+    execution_details: dict | None = None,
+    correlation_id: str | None = None,
+    extra_environment: dict | None = None,
 ) -> Optional[int]:
     """
     Runs an external program / Script
@@ -172,22 +273,45 @@ def execute_program(
         'detached_launch=False' cases.
         0.0 = Disable watchdog and wait until the program has finished running.
         Any other positive value: (try to) terminate the program after x seconds
+    execution_details: dict | None
+        Optional dictionary which gets populated with the execution's
+        details: 'pid', 'exit_code' (None for detached launches and
+        errors), 'duration' (seconds) and 'watchdog_triggered'
+    correlation_id: str | None
+        The request's correlation ID. Gets passed to the program
+        as environment variable SABB_CORRELATION_ID
+    extra_environment: dict | None
+        Optional additional environment variables for the program,
+        e.g. the reply socket (see sabb_reply_server.py)
 
     Returns
     =======
     - Optional[int]:
         process PID or 'None' in case of an error
     """
+    if execution_details is None:
+        execution_details = {}
+    execution_details.update(
+        {"pid": None, "exit_code": None, "duration": 0.0, "watchdog_triggered": False}
+    )
+    __start = time.monotonic()
+
+    # None = inherit our environment as it is
+    __environment = None
+    if correlation_id or extra_environment:
+        __environment = dict(os.environ, **(extra_environment or {}))
+        if correlation_id:
+            __environment["SABB_CORRELATION_ID"] = correlation_id
 
-    def out_debug(message: str) -> None:
+    def out_debug(message: str, *args) -> None:
         try:
-            logger.debug(msg=message)
+            logger.debug(message, *args)
         except Exception:
             pass
 
-    def out_info(message: str) -> None:
+    def out_info(message: str, *args) -> None:
         try:
-            logger.info(msg=message)
+            logger.info(message, *args)
         except Exception:
             pass
 
@@ -225,7 +349,7 @@ def execute_program(
         out_info(f"execute_program: ERROR: failed to parse command: '{e}'")
         return None
 
-    out_debug(f"execute_program: starting command: {command}")
+    out_debug("execute_program: starting command: %s", command)
 
     def terminate_process_tree(pid: int) -> None:
         """
@@ -298,6 +422,7 @@ def execute_program(
                         stdout=subprocess.DEVNULL,
                         stderr=subprocess.DEVNULL,
                         close_fds=True,
+                        env=__environment,
                         creationflags=creationflags,
                     )
                 else:
@@ -307,10 +432,13 @@ def execute_program(
                         stdout=subprocess.DEVNULL,
                         stderr=subprocess.DEVNULL,
                         close_fds=True,
+                        env=__environment,
                         start_new_session=True,
                     )
                 pid = proc.pid
-                out_info(f"Detached process started with PID={pid}")
+                out_info("Detached process started with PID=%s", pid)
+                execution_details["pid"] = pid
+                execution_details["duration"] = time.monotonic() - __start
                 return pid
             except FileNotFoundError:
                 out_info(f"Command not found: '{command}'")
@@ -330,6 +458,7 @@ def execute_program(
                 stderr=subprocess.PIPE,
                 text=True,
                 bufsize=1,
+                env=__environment,
             )
         except FileNotFoundError:
             out_info(f"Command not found: '{command}'")
@@ -342,7 +471,8 @@ def execute_program(
             return None
 
         pid = proc.pid
-        out_info(f"Process started with PID={pid}")
+        out_info("Process started with PID=%s", pid)
+        execution_details["pid"] = pid
 
         # Watchdog
         try:
@@ -359,10 +489,12 @@ def execute_program(
                     rc = None
 
                 if stdout_data:
-                    out_debug(f"stdout (PID={pid}):\n{stdout_data.rstrip()}")
+                    out_debug("stdout (PID=%s):\n%s", pid, stdout_data.rstrip())
                 if stderr_data:
-                    out_debug(f"stderr (PID={pid}):\n{stderr_data.rstrip()}")
-                out_debug(f"Process finished (PID={pid}, rc={rc})")
+                    out_debug("stderr (PID=%s):\n%s", pid, stderr_data.rstrip())
+                out_debug("Process finished (PID=%s, rc=%s)", pid, rc)
+                execution_details["exit_code"] = rc
+                execution_details["duration"] = time.monotonic() - __start
                 return pid
 
             deadline = time.time() + watchdog
@@ -379,6 +511,7 @@ def execute_program(
                         f"Watchdog timeout reached (PID={pid}, {watchdog:.3f}s). Terminating."
                     )
                     terminate_process_tree(pid)
+                    execution_details["watchdog_triggered"] = True
                     break
 
                 time.sleep(0.1)
@@ -396,20 +529,19 @@ def execute_program(
                 rc = None
 
             if stdout_data:
-                out_debug(
-                    f"execute_program: INFO: stdout (PID={pid}):\n{stdout_data.rstrip()}"
-                )
+                out_debug("execute_program: INFO: stdout (PID=%s):\n%s", pid, stdout_data.rstrip())
             if stderr_data:
-                out_debug(
-                    f"execute_program: WARN: stderr (PID={pid}):\n{stderr_data.rstrip()}"
-                )
-            out_debug(f"execute_program: INFO: process ended (PID={pid}, rc={rc})")
+                out_debug("execute_program: WARN: stderr (PID=%s):\n%s", pid, stderr_data.rstrip())
+            out_debug("execute_program: INFO: process ended (PID=%s, rc=%s)", pid, rc)
+            execution_details["exit_code"] = rc
+            execution_details["duration"] = time.monotonic() - __start
             return pid
 
         except Exception as e:
             out_debug(
                 f"execute_program: ERROR: runtime error while waiting/terminating (PID={pid}): {e}"
             )
+            execution_details["duration"] = time.monotonic() - __start
             return pid
 
     except Exception as e:
@@ -417,8 +549,125 @@ def execute_program(
         return None
 
 
+def build_user_index(data: dict | None):
+    """
+    Builds a callsign index for the user entries from the external YAML
+    config file. If a callsign is listed more than once, its first
+    entry wins.
+
+    Parameters
+    ==========
+    data: dict | None
+        Content from the external YAML file
+
+    Returns
+    =======
+    user_index: dict
+        Dictionary, using the callsign as key and the user entry as value
+    """
+    user_index = {}
+    if data and data.get("users"):
+        for __item in data["users"]:
+            if "callsign" in __item:
+                user_index.setdefault(__item["callsign"], __item)
+    return user_index
+
+
+def get_candidate_user_entries(
+    data: dict, callsign: str, user_index: dict | None = None
+):
+    """
+    Returns all user entries which may grant access to the given callsign,
+    ordered by priority: the entry for the callsign itself comes first,
+    followed by the entry for its SSID-less base callsign
+
+    Parameters
+    ==========
+    data: dict
+        Content from the external YAML file
+    callsign: str
+        Callsign code of the user, e.g. DF1JSL-1
+    user_index: dict | None
+        Callsign index for 'data' (see build_user_index). 'None' = scan 'data'
+
+    Returns
+    =======
+    candidates: list
+        List of user entries (0..2 entries) that come with a secret
+    """
+    if user_index is None:
+        user_index = build_user_index(data=data)
+
+    # build the SSID-less call sign
+    callsign_truncated = callsign.split("-")[0]
+
+    candidates = []
+    for __callsign in dict.fromkeys((callsign, callsign_truncated)):
+        __item = user_index.get(__callsign)
+        if __item and "secret" in __item:
+            candidates.append(__item)
+    return candidates
+
+
+def verify_candidate_user_entries(
+    candidates: list,
+    code: str,
+    valid_window: int = 0,
+    for_time: float | None = None,
+):
+    """
+    Verifies the code against all candidate user entries as a single
+    batch. Every entry gets checked, regardless of whether a previous
+    entry has already matched; resolving the match is up to the caller.
+
+    Parameters
+    ==========
+    candidates: list
+        List of user entries, see get_candidate_user_entries
+    code: str
+        user's TOTP (or HOTP) code
+    valid_window: int
+        Number of TOTP time steps before and after the current time step
+        that are also accepted (default: 0)
+    for_time: float | None
+        Timestamp (time.time() format) to check TOTP codes at; 'None' = now
+
+    Returns
+    =======
+    results: list
+        One (authenticator, step, offset) tuple per candidate entry.
+        'step' and 'offset' are 'None' if the code does not match
+    """
+    for_time = for_time if for_time is not None else time.time()
+    results = []
+    for __item in candidates:
+        __scheme = __item.get("scheme", DEFAULT_AUTHENTICATION_SCHEME)
+        authenticator = get_authenticator(scheme=__scheme)
+        if not authenticator:
+            logger.debug(
+                "Unsupported authentication scheme '%s' for callsign '%s'",
+                __scheme,
+                __item["callsign"],
+            )
+            results.append((None, None, None))
+            continue
+        step, offset = authenticator.verify(
+            user_entry=__item,
+            code=code,
+            valid_window=valid_window,
+            for_time=for_time,
+        )
+        results.append((authenticator, step, offset))
+    return results
+
+
 def identify_target_callsign_and_command_string(
-    data: dict, callsign: str, totp_code: str, command_code: str | None
+    data: dict,
+    callsign: str,
+    totp_code: str,
+    command_code: str | None,
+    valid_window: int = 0,
+    user_index: dict | None = None,
 ):
     """
     Retrieves the callsign/totp_code match and identifies the command_string for the given command_code.
@@ -454,6 +703,9 @@ def identify_target_callsign_and_command_string(
     > [!WARNING]
     > With great power comes great responsibility. If you want to limit access to specific callsigns, do not use the SSID-less callsign option but rather use a single dedicated callsign instead.
 
+    The code gets verified against all candidate entries (callsign with and without SSID) before
+    the match is resolved; the entry WITH SSID takes precedence over the SSID-less entry.
+
     Once the matching call sign has been identified, this function then tries to identify the command_code/command_string combination
 
     Parameters
@@ -463,10 +715,15 @@ def identify_target_callsign_and_command_string(
     callsign: str
         Callsign code of the user
     totp_code: str
-        user's TOTP code
+        user's TOTP (or HOTP) code
     command_code: str
         Command code for which we intend to retrieve the command string
         If missing (None or empty string), only the TOTP validation will be performed
+    valid_window: int
+        Number of TOTP time steps before and after the current time step
+        that are also accepted (default: 0)
+    user_index: dict | None
+        Callsign index for 'data' (see build_user_index). 'None' = scan 'data'
 
     Returns
     =======
@@ -484,6 +741,12 @@ def identify_target_callsign_and_command_string(
         Secret associated with this callsign
     watchdog_timespan: float
         Watchdog timespan in seconds (0.0 = disable). Only applicable to 'detached_launch'='False' settings
+    totp_step: int
+        TOTP time step that the code was generated for (or None if no matching callsign was found)
+    totp_offset: int
+        Offset between the code's time step and our current time step (or None if no matching callsign was found)
+    scheme: str
+        Authentication scheme of the matching user entry, e.g. 'totp' or 'hotp' (or None if no matching callsign was found)
     """
 
     __success = False
@@ -492,62 +755,71 @@ def identify_target_callsign_and_command_string(
     __secret = None
     __detached_launch = False
     __watchdog_timespan = 0.0
+    __totp_step = None
+    __totp_offset = None
+    __scheme = None
+    __now = sabb_shared.clock()
 
     # Determine if we are only supposed to check the TOTP code and skip the command_code validation
     perform_full_check = (
         True if type(command_code) is str and len(command_code) > 0 else False
     )
 
-    # build the SSID-less call sign
-    callsign_truncated = callsign.split("-")[0]
+    # Get all candidate entries for the callsign (in order of priority: entry
+    # with SSID first, SSID-less base entry second) and verify the code
+    # against all of them before resolving the match. This way, our response
+    # time does not depend on which one of the entries (if any) matches
+    __candidates = get_candidate_user_entries(
+        data=data, callsign=callsign, user_index=user_index
+    )
+    __results = verify_candidate_user_entries(
+        candidates=__candidates,
+        code=totp_code,
+        valid_window=valid_window,
+        for_time=__now,
+    )
 
-    # and now iterate through the config file
-    for __item in data["users"]:
-        if "callsign" in __item and __item["callsign"] in (
-            callsign,
-            callsign_truncated,
-        ):
-            # We have found a match, let's retrieve the secret
-            if "secret" in __item:
-                __secret = __item["secret"]
-                _ttl = __item["ttl"]
-                # Validate the given TOTP code against that secret
-                if verify_totp_code(
-                    totp_secret=__item["secret"], totp_code=totp_code, ttl_interval=_ttl
-                ):
-                    # We found a match for the callsign (note that the input callsign
-                    # and our new one may differ for those cases our target callsign
-                    # is ssid-less!)
-                    __target_callsign = __item["callsign"]
-                    # We might be required to skip the next step for those cases
-                    # where
-                    if perform_full_check:
-                        # now let's iterate through the target callsign's list of command
-                        # codes and try to determine what command string we are supposed
-                        # to execute
-                        for command in __item["commands"]:
-                            if command == command_code:
-                                # We found a match!
-                                try:
-                                    __command_string = __item["commands"][command][
-                                        "command_string"
-                                    ]
-                                    __detached_launch = __item["commands"][command][
-                                        "detached_launch"
-                                    ]
-                                    __watchdog_timespan = __item["commands"][command][
-                                        "watchdog_timespan"
-                                    ]
-                                    __success = True
-                                except KeyError:
-                                    __command_string = __detached_launch = None
-                                break
-                    # no full check requested; return ok but set command_string and
-                    # detached_launch to None as we don't retrieve this data
-                    else:
+    # Now resolve the match with the highest priority
+    for __item, (__authenticator, __step, __offset) in zip(__candidates, __results):
+        if __step is None:
+            continue
+        __secret = __item["secret"]
+        __scheme = __authenticator.scheme
+        __totp_step = __step
+        __totp_offset = __offset
+        # We found a match for the callsign (note that the input callsign
+        # and our new one may differ for those cases our target callsign
+        # is ssid-less!)
+        __target_callsign = __item["callsign"]
+        # We might be required to skip the next step for those cases
+        # where
+        if perform_full_check:
+            # now let's iterate through the target callsign's list of command
+            # codes and try to determine what command string we are supposed
+            # to execute
+            for command in __item["commands"]:
+                if command == command_code:
+                    # We found a match!
+                    try:
+                        __command_string = __item["commands"][command][
+                            "command_string"
+                        ]
+                        __detached_launch = __item["commands"][command][
+                            "detached_launch"
+                        ]
+                        __watchdog_timespan = __item["commands"][command][
+                            "watchdog_timespan"
+                        ]
                         __success = True
+                    except KeyError:
                         __command_string = __detached_launch = None
                     break
+        # no full check requested; return ok but set command_string and
+        # detached_launch to None as we don't retrieve this data
+        else:
+            __success = True
+            __command_string = __detached_launch = None
+        break
     return (
         __success,
         __target_callsign,
@@ -555,10 +827,15 @@ def identify_target_callsign_and_command_string(
         __detached_launch,
         __secret,
         __watchdog_timespan,
+        __totp_step,
+        __totp_offset,
+        __scheme,
     )
 
 
-def verify_totp_code(totp_secret: str, totp_code: str, ttl_interval: int):
+def verify_totp_code(
+    totp_secret: str, totp_code: str, ttl_interval: int, valid_window: int = 0
+):
     """
     Verifies a given TOTP code against the given secret.
 
@@ -570,14 +847,611 @@ def verify_totp_code(totp_secret: str, totp_code: str, ttl_interval: int):
         user's TOTP code
     ttl_interval: int
         TOTP's TTL interval
+    valid_window: int
+        Number of time steps before and after the current time
+        step that are also accepted (default: 0)
 
     Returns
     =======
     status: bool
         True / False, depending on whether the code matches
     """
-    totp = pyotp.TOTP(totp_secret, interval=ttl_interval)
-    return totp.verify(otp=totp_code)
+    return (
+        match_totp_code(
+            totp_secret=totp_secret,
+            totp_code=totp_code,
+            ttl_interval=ttl_interval,
+            valid_window=valid_window,
+        )
+        is not None
+    )
+
+
+def match_totp_code(
+    totp_secret: str,
+    totp_code: str,
+    ttl_interval: int,
+    valid_window: int = 0,
+    preferred_offset: int = 0,
+    for_time: float | None = None,
+):
+    """
+    Verifies a given TOTP code against the given secret and returns
+    the time step that the code was generated for.
+
+    All time steps within the verification window get checked. If more
+    than one time step matches, the most likely time step (based on the
+    user's previously observed clock offset) wins.
+
+    Parameters
+    ==========
+    totp_secret: str
+        user's TOTP secret
+    totp_code: str
+        user's TOTP code
+    ttl_interval: int
+        TOTP's TTL interval
+    valid_window: int
+        Number of time steps before and after the current time
+        step that are also accepted (default: 0)
+    preferred_offset: int
+        Most likely time step offset; preferred in case of multiple matches
+    for_time: float | None
+        Timestamp (time.time() format) to check the code at; 'None' = now
+
+    Returns
+    =======
+    totp_step: int | None
+        The time step that the code was generated for or
+        'None' if the code does not match
+    """
+    for_time = for_time if for_time is not None else time.time()
+    current_step = int(for_time // ttl_interval)
+    valid_window = max(int(valid_window), 0)
+
+    # Order the offsets by likelihood: most likely offset first, then outwards
+    preferred_offset = min(max(preferred_offset, -valid_window), valid_window)
+    offsets = sorted(
+        range(-valid_window, valid_window + 1),
+        key=lambda offset: (abs(offset - preferred_offset), abs(offset)),
+    )
+
+    # Check all time steps, even after we have found a match. This way,
+    # the verification time does not depend on the matching time step
+    otp_key = get_otp_key(secret=totp_secret)
+    totp_step = None
+    for offset in offsets:
+        step = max(current_step + offset, 0)
+        if (
+            hmac.compare_digest(str(totp_code), otp_key.generate(step))
+            and totp_step is None
+        ):
+            totp_step = step
+    return totp_step
+
+
+class OtpKey:
+    """
+    Precomputed OTP key. The base32 secret gets decoded once and the HMAC
+    object's inner and outer key pads are prepared once; every OTP code
+    generation only needs to copy that HMAC state. Generates the same codes
+    as pyotp's default settings (SHA1, 6 digits).
+    """
+
+    def __init__(self, secret: str, digits: int = 6):
+        missing_padding = len(secret) % 8
+        if missing_padding != 0:
+            secret += "=" * (8 - missing_padding)
+        self.digits = digits
+        self._hmac = hmac.new(
+            base64.b32decode(secret, casefold=True), digestmod=hashlib.sha1
+        )
+
+    def generate(self, counter: int):
+        """
+        Generates the OTP code for the given counter / time step
+
+        Parameters
+        ==========
+        counter: int
+            HOTP counter or TOTP time step
+
+        Returns
+        =======
+        otp_code: str
+            The OTP code
+        """
+        mac = self._hmac.copy()
+        mac.update(counter.to_bytes(8, "big"))
+        digest = mac.digest()
+        offset = digest[-1] & 0x0F
+        code = int.from_bytes(digest[offset : offset + 4], "big") & 0x7FFFFFFF
+        return str(code % 10**self.digits).zfill(self.digits)
+
+
+# Precomputed OTP keys, using the secret as key
+_otp_key_cache = {}
+
+
+def get_otp_key(secret: str):
+    """
+    Returns the precomputed OTP key for the given secret
+
+    Parameters
+    ==========
+    secret: str
+        base32-encoded OTP secret
+
+    Returns
+    =======
+    otp_key: OtpKey
+        Precomputed OTP key
+    """
+    otp_key = _otp_key_cache.get(secret)
+    if not otp_key:
+        otp_key = OtpKey(secret=secret)
+        _otp_key_cache[secret] = otp_key
+    return otp_key
+
+
+def clear_otp_key_cache():
+    """
+    Removes all precomputed OTP keys, e.g. after the user configuration
+    file has been re-read
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    """
+    _otp_key_cache.clear()
+
+
+def match_hotp_code(
+    hotp_secret: str, hotp_code: str, next_counter: int, look_ahead: int = 10
+):
+    """
+    Verifies a given HOTP code against the given secret and returns
+    the counter that the code was generated for.
+
+    Parameters
+    ==========
+    hotp_secret: str
+        user's HOTP secret
+    hotp_code: str
+        user's HOTP code
+    next_counter: int
+        The next counter value that we expect from the user
+    look_ahead: int
+        Number of counter values (starting with next_counter) that are accepted
+
+    Returns
+    =======
+    hotp_counter: int | None
+        The counter that the code was generated for or
+        'None' if the code does not match
+    """
+    # Check all counter values, even after we have found a match. This way,
+    # the verification time does not depend on the matching counter value
+    otp_key = get_otp_key(secret=hotp_secret)
+    hotp_counter = None
+    for counter in range(max(next_counter, 0), max(next_counter, 0) + look_ahead):
+        if (
+            hmac.compare_digest(str(hotp_code), otp_key.generate(counter))
+            and hotp_counter is None
+        ):
+            hotp_counter = counter
+    return hotp_counter
+
+
+def get_hotp_next_counter(callsign: str, initial_counter: int = 0):
+    """
+    Returns the next HOTP counter value that we expect from the user
+
+    Parameters
+    ==========
+    callsign: str
+        User's callsign, e.g. DF1JSL-1
+    initial_counter: int
+        Initial counter value from the user configuration file
+
+    Returns
+    =======
+    next_counter: int
+        The next counter value
+    """
+    last_counter = sabb_shared.hotp_counter_data.get(callsign)
+    if last_counter is None:
+        return initial_counter
+    return max(initial_counter, last_counter + 1)
+
+
+def set_hotp_counter(callsign: str, hotp_counter: int):
+    """
+    Remembers the most recently accepted HOTP counter value for a
+    callsign and persists the counter values to disk (if configured)
+
+    Parameters
+    ==========
+    callsign: str
+        User's callsign, e.g. DF1JSL-1
+    hotp_counter: int
+        The accepted counter value
+
+    Returns
+    =======
+    """
+    last_counter = sabb_shared.hotp_counter_data.get(callsign, -1)
+    sabb_shared.hotp_counter_data[callsign] = max(last_counter, hotp_counter)
+    write_hotp_counters_to_disk(filename=sabb_shared.hotp_counter_filename)
+
+
+def resolve_hotp_counter_filename(filename: str | None, config_filename: str):
+    """
+    Resolves a relative HOTP counter file name against the directory of
+    the command config file, thus allowing the bot and configure.py to
+    share the same counter file regardless of their working directories
+
+    Parameters
+    ==========
+    filename: str | None
+        Name of the HOTP counter file; 'None' or empty = no persistence
+    config_filename: str
+        Name of the external YAML command config file
+
+    Returns
+    =======
+    filename: str | None
+        Resolved name of the HOTP counter file
+    """
+    if not filename or os.path.isabs(filename):
+        return filename
+    return os.path.join(os.path.dirname(os.path.abspath(config_filename)), filename)
+
+
+def read_hotp_counters_from_disk(filename: str | None):
+    """
+    Reads the HOTP counter values from disk
+
+    Parameters
+    ==========
+    filename: str | None
+        Name of the HOTP counter file; 'None' or empty = no persistence
+
+    Returns
+    =======
+    success: bool
+        True / False, depending on whether the file was read
+    """
+    __success = False
+    if not filename or not does_file_exist(file_name=filename):
+        return __success
+    try:
+        with open(file=filename, mode="r") as json_file:
+            data = json.load(json_file)
+        sabb_shared.hotp_counter_data = {
+            callsign: int(counter) for callsign, counter in data.items()
+        }
+        __success = True
+    except (OSError, ValueError, TypeError, AttributeError):
+        logger.warning(msg=f"Cannot read HOTP counter file '{filename}'")
+    return __success
+
+
+def write_hotp_counters_to_disk(filename: str | None):
+    """
+    Writes the HOTP counter values to disk
+
+    Parameters
+    ==========
+    filename: str | None
+        Name of the HOTP counter file; 'None' or empty = no persistence
+
+    Returns
+    =======
+    success: bool
+        True / False, depending on whether the file was written
+    """
+    __success = False
+    if not filename:
+        return __success
+    temp_filename = f"{filename}.tmp"
+    try:
+        with open(file=temp_filename, mode="w") as json_file:
+            json.dump(sabb_shared.hotp_counter_data, json_file)
+        os.replace(temp_filename, filename)
+        __success = True
+    except OSError:
+        logger.warning(msg=f"Cannot write HOTP counter file '{filename}'")
+    return __success
+
+
+class TotpAuthenticator:
+    """
+    Time-based one-time passwords (RFC 6238). Replay state: the TOTP
+    expiring dictionary plus the most recently accepted time step per callsign
+    """
+
+    scheme = "totp"
+
+    def verify(
+        self,
+        user_entry: dict,
+        code: str,
+        valid_window: int = 0,
+        for_time: float | None = None,
+    ):
+        """
+        Verifies the code against the user entry's secret
+
+        Parameters
+        ==========
+        user_entry: dict
+            User entry from the external YAML config file
+        code: str
+            The user's code
+        valid_window: int
+            Number of time steps before and after the current time
+            step that are also accepted
+        for_time: float | None
+            Timestamp (time.time() format) to check the code at; 'None' = now
+
+        Returns
+        =======
+        step: int | None
+            Matching time step or 'None' if the code does not match
+        offset: int | None
+            Offset between the matching and the current time step
+        """
+        for_time = for_time if for_time is not None else time.time()
+        ttl = user_entry.get("ttl", 30)
+        step = match_totp_code(
+            totp_secret=user_entry["secret"],
+            totp_code=code,
+            ttl_interval=ttl,
+            valid_window=valid_window,
+            preferred_offset=get_preferred_totp_offset(
+                callsign=user_entry["callsign"]
+            ),
+            for_time=for_time,
+        )
+        if step is None:
+            return None, None
+        return step, step - int(for_time // ttl)
+
+    def is_replay(self, callsign: str, code: str, step: int | None):
+        """
+        Checks whether the code has already been used
+
+        Parameters
+        ==========
+        callsign: str
+            Target callsign, e.g. DF1JSL
+        code: str
+            The user's code
+        step: int | None
+            Matching time step
+
+        Returns
+        =======
+        replay: bool
+            True if the code has already been used
+        """
+        return (
+            get_totp_expiringdict_key(callsign=callsign, totp_code=code, totp_step=step)
+            is not None
+        )
+
+    def commit(self, callsign: str, code: str, step: int | None, offset: int | None):
+        """
+        Marks the code as used
+
+        Parameters
+        ==========
+        callsign: str
+            Target callsign, e.g. DF1JSL
+        code: str
+            The user's code
+        step: int | None
+            Matching time step
+        offset: int | None
+            Offset between the matching and the current time step
+
+        Returns
+        =======
+        """
+        set_totp_expiringdict_key(
+            callsign=callsign, totp_code=code, totp_step=step, totp_offset=offset
+        )
+
+
+class HotpAuthenticator:
+    """
+    Counter-based one-time passwords (RFC 4226) for users with unreliable
+    clocks. Replay state: the most recently accepted counter per callsign,
+    optionally persisted to disk
+    """
+
+    scheme = "hotp"
+
+    def verify(
+        self,
+        user_entry: dict,
+        code: str,
+        valid_window: int = 0,
+        for_time: float | None = None,
+    ):
+        """
+        Verifies the code against the user entry's secret. The next
+        'sabb_shared.hotp_look_ahead' counter values are accepted.
+
+        Parameters
+        ==========
+        user_entry: dict
+            User entry from the external YAML config file
+        code: str
+            The user's code
+        valid_window: int
+            Not used for HOTP
+        for_time: float | None
+            Not used for HOTP
+
+        Returns
+        =======
+        counter: int | None
+            Matching counter or 'None' if the code does not match
+        offset: int | None
+            Distance between the matching and the expected counter
+        """
+        next_counter = get_hotp_next_counter(
+            callsign=user_entry["callsign"],
+            initial_counter=user_entry.get("counter", 0),
+        )
+        counter = match_hotp_code(
+            hotp_secret=user_entry["secret"],
+            hotp_code=code,
+            next_counter=next_counter,
+            look_ahead=sabb_shared.hotp_look_ahead,
+        )
+        if counter is None:
+            return None, None
+        return counter, counter - next_counter
+
+    def is_replay(self, callsign: str, code: str, step: int | None):
+        """
+        Checks whether the code has already been used
+
+        Parameters
+        ==========
+        callsign: str
+            Target callsign, e.g. DF1JSL
+        code: str
+            The user's code
+        step: int | None
+            Matching counter
+
+        Returns
+        =======
+        replay: bool
+            True if the code has already been used
+        """
+        last_counter = sabb_shared.hotp_counter_data.get(callsign)
+        return step is None or (last_counter is not None and step <= last_counter)
+
+    def commit(self, callsign: str, code: str, step: int | None, offset: int | None):
+        """
+        Marks the code (and all codes with lower counter values) as used
+
+        Parameters
+        ==========
+        callsign: str
+            Target callsign, e.g. DF1JSL
+        code: str
+            The user's code
+        step: int | None
+            Matching counter
+        offset: int | None
+            Not used for HOTP
+
+        Returns
+        =======
+        """
+        if step is not None:
+            set_hotp_counter(callsign=callsign, hotp_counter=step)
+
+
+# Supported authentication schemes; a user entry selects its
+# scheme via its 'scheme' key (default: totp)
+AUTHENTICATORS = {
+    TotpAuthenticator.scheme: TotpAuthenticator(),
+    HotpAuthenticator.scheme: HotpAuthenticator(),
+}
+DEFAULT_AUTHENTICATION_SCHEME = TotpAuthenticator.scheme
+
+
+def get_authenticator(scheme: str | None):
+    """
+    Returns the authenticator for the given scheme
+
+    Parameters
+    ==========
+    scheme: str | None
+        Authentication scheme, e.g. 'totp' or 'hotp'. 'None' = default scheme
+
+    Returns
+    =======
+    authenticator: TotpAuthenticator | HotpAuthenticator | None
+        The authenticator or 'None' if the scheme is not supported
+    """
+    scheme = str(scheme).lower() if scheme else DEFAULT_AUTHENTICATION_SCHEME
+    return AUTHENTICATORS.get(scheme)
+
+
+def get_command_second_factor(
+    data: dict, callsign: str, command_code: str, user_index: dict | None = None
+):
+    """
+    Returns the optional second factor configuration for a
+    callsign/command_code combination
+
+    Parameters
+    ==========
+    data: dict
+        Content from the external YAML file
+    callsign: str
+        Target callsign, e.g. DF1JSL
+    command_code: str
+        The command code
+    user_index: dict | None
+        Callsign index for 'data' (see build_user_index). 'None' = scan 'data'
+
+    Returns
+    =======
+    second_factor: dict | None
+        User-entry-like dictionary with 'callsign', 'secret' and 'ttl' keys
+        or 'None' if the command does not require a second factor
+    """
+    if user_index is None:
+        user_index = build_user_index(data=data)
+    __item = user_index.get(callsign)
+    if __item:
+        command = (__item.get("commands") or {}).get(command_code)
+        if command and command.get("second_factor_secret"):
+            return {
+                "callsign": f"{callsign}/{command_code}",
+                "secret": command["second_factor_secret"],
+                "ttl": command.get("second_factor_ttl", 30),
+            }
+    return None
+
+
+def commit_authentication(response_object: dict):
+    """
+    Marks the code(s) from an input parser response object as used
+
+    Parameters
+    ==========
+    response_object: dict
+        The input parser's response object
+
+    Returns
+    =======
+    """
+    get_authenticator(scheme=response_object.get("scheme")).commit(
+        callsign=response_object["target_callsign"],
+        code=response_object["totp_code"],
+        step=response_object.get("totp_step"),
+        offset=response_object.get("totp_offset"),
+    )
+    second_factor = response_object.get("second_factor")
+    if second_factor:
+        get_authenticator(scheme=TotpAuthenticator.scheme).commit(
+            callsign=second_factor["callsign"],
+            code=second_factor["code"],
+            step=second_factor["step"],
+            offset=second_factor["offset"],
+        )
 
 
 if __name__ == "__main__":
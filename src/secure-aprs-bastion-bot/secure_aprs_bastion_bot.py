@@ -32,9 +32,26 @@ import sys
 import logging
 import sabb_shared
 
-from sabb_logger import logger
-from sabb_expdict import create_totp_expiringdict
-from sabb_utils import get_modification_time, read_config_file_from_disk
+from sabb_logger import logger, start_async_logging
+from sabb_expdict import create_totp_expiringdict, check_totp_expiringdict_config
+from sabb_lockout import create_lockout_table
+from sabb_metrics import (
+    MetricsRegistry,
+    collect_totp_cache_metrics,
+    start_metrics_server,
+)
+from sabb_profiler import Profiler, install_profiler
+from sabb_audit import create_audit_journal
+from sabb_health import HealthState, register_health_routes
+from sabb_loadshed import create_load_shedder, collect_load_shedding_metrics
+from sabb_reply_server import ReplyRelay, start_reply_relay, collect_reply_metrics
+from sabb_utils import (
+    get_modification_time,
+    read_config_file_from_disk,
+    read_hotp_counters_from_disk,
+    resolve_hotp_counter_filename,
+    build_user_index,
+)
 
 
 def get_command_line_params():
@@ -91,6 +108,14 @@ if __name__ == "__main__":
         post_processor=post_processing,
     )
 
+    # Hand over all log output to a background thread, thus preventing
+    # log I/O from stalling the message processing
+    start_async_logging(
+        log_format=client.config_data["secure_aprs_bastion_bot"].get(
+            "sabb_log_format", "text"
+        )
+    )
+
     # Create the expiring dictionary object for the TOTP records
     logger.debug(msg="Initializing TOTP Expiration Dictionary")
     sabb_shared.totp_message_cache = create_totp_expiringdict(
@@ -102,12 +127,47 @@ if __name__ == "__main__":
         ],
     )
 
+    # Create the lockout table for callsigns with repeated TOTP failures
+    # All settings are optional; older configuration files will fall back
+    # to the default values
+    logger.debug(msg="Initializing callsign lockout table")
+    sabb_config = client.config_data["secure_aprs_bastion_bot"]
+    sabb_shared.lockout_table = create_lockout_table(
+        threshold=sabb_config.get("sabb_lockout_threshold", 3),
+        base_seconds=sabb_config.get("sabb_lockout_base_seconds", 60),
+        max_seconds=sabb_config.get("sabb_lockout_max_seconds", 3600),
+        max_entries=sabb_config.get("sabb_lockout_max_entries", 1000),
+        filename=sabb_config.get("sabb_lockout_file", ""),
+        ssid_threshold=sabb_config.get("sabb_lockout_ssid_threshold", 0),
+    )
+
+    # Ignore unverifiable and rate-limited traffic while the bot falls behind
+    sabb_shared.load_shedder = create_load_shedder(
+        lag_seconds=sabb_config.get("sabb_shed_lag_seconds", 10),
+        queue_depth=sabb_config.get("sabb_shed_queue_depth", 50),
+        max_messages_per_minute=sabb_config.get(
+            "sabb_shed_max_messages_per_minute", 6
+        ),
+        hold_seconds=sabb_config.get("sabb_shed_hold_seconds", 30),
+    )
+
     # Save the command config filename - we may need to re-read the file
     # in case its content has changed during runtime
     sabb_shared.command_config_filename = client.config_data["secure_aprs_bastion_bot"][
         "sabb_command_config"
     ]
 
+    # Restore the most recently accepted counter values for HOTP users.
+    # Without these values, previously used HOTP codes could be replayed
+    # after a restart of the bot. Relative file names are resolved against
+    # the command config file's directory (see configure.py)
+    sabb_shared.hotp_look_ahead = max(sabb_config.get("sabb_hotp_look_ahead", 10), 1)
+    sabb_shared.hotp_counter_filename = resolve_hotp_counter_filename(
+        filename=sabb_config.get("sabb_hotp_counter_file", "sabb_hotp_counters.json"),
+        config_filename=sabb_shared.command_config_filename,
+    )
+    read_hotp_counters_from_disk(filename=sabb_shared.hotp_counter_filename)
+
     # Verify if the Command Config file exists
     if not os.path.isfile(sabb_shared.command_config_filename):
         logger.error(
@@ -125,6 +185,18 @@ if __name__ == "__main__":
         )
         sys.exit(0)
 
+    # Build the callsign index for the user entries
+    sabb_shared.config_user_index = build_user_index(data=sabb_shared.config_data)
+
+    # Check the TOTP cache settings against the configured users and
+    # (optionally) derive the cache's number of max entries from them
+    check_totp_expiringdict_config(
+        totp_message_cache=sabb_shared.totp_message_cache,
+        data=sabb_shared.config_data,
+        auto_size=sabb_config.get("sabb_totp_cache_auto_size", False),
+        valid_window=sabb_config.get("sabb_totp_valid_window", 0),
+    )
+
     # remember the file's initial config file timestamp, thus allowing us to
     # detect any changes to the file during runtime (and re-read the file
     # into memory, if necessary)
@@ -132,5 +204,67 @@ if __name__ == "__main__":
         filename=sabb_shared.command_config_filename
     )
 
+    # Expose per-stage latency histograms and outcome counters (optional)
+    metrics_port = sabb_config.get("sabb_metrics_port", 0)
+    metrics_socket = sabb_config.get("sabb_metrics_socket", "")
+    if metrics_port or metrics_socket:
+        sabb_shared.metrics = MetricsRegistry()
+        sabb_shared.metrics.add_collector(collect_totp_cache_metrics)
+        sabb_shared.metrics.add_collector(collect_load_shedding_metrics)
+        sabb_shared.metrics.add_collector(collect_reply_metrics)
+
+        # Health and readiness endpoints (/health, /ready) on the same server
+        sabb_shared.health = HealthState()
+        sabb_shared.health.config_loaded(
+            timestamp=sabb_shared.config_initial_timestamp
+        )
+        register_health_routes()
+        start_metrics_server(
+            registry=sabb_shared.metrics,
+            port=metrics_port,
+            address=sabb_config.get("sabb_metrics_address", "127.0.0.1"),
+            socket_path=metrics_socket,
+        )
+
+    # Durable record of every authorized command execution (optional)
+    sabb_shared.audit_journal = create_audit_journal(
+        filename=sabb_config.get("sabb_audit_file", ""),
+        max_bytes=sabb_config.get("sabb_audit_max_bytes", 10485760),
+        backup_count=sabb_config.get("sabb_audit_backup_count", 5),
+        commit_interval=sabb_config.get("sabb_audit_commit_interval_ms", 1000) / 1000,
+    )
+
+    # On-demand profiling via SIGUSR1 and the (optional) control socket
+    sabb_shared.profiler = Profiler(
+        data_directory=client.config_data["coac_data_storage"]["aprs_data_directory"],
+        mode=sabb_config.get("sabb_profiler_mode", "sample"),
+        duration=sabb_config.get("sabb_profiler_duration", 30),
+        sample_interval=sabb_config.get("sabb_profiler_sample_interval_ms", 10) / 1000,
+    )
+    install_profiler(
+        profiler=sabb_shared.profiler,
+        socket_path=sabb_config.get("sabb_profiler_socket", ""),
+    )
+
+    # Replies from launched programs via the bot's APRS-IS session (optional)
+    reply_relay = ReplyRelay(
+        source_callsign=client.config_data["coac_client_config"]["aprsis_callsign"],
+        tocall=client.config_data["coac_client_config"]["aprsis_tocall"],
+        packet_delay=client.config_data["coac_message_delay"]["packet_delay_message"],
+        packet_delay_grace_period=client.config_data["coac_message_delay"][
+            "packet_delay_grace_period"
+        ],
+        max_age_seconds=sabb_config.get("sabb_reply_max_age_seconds", 3600),
+        max_fragments=sabb_config.get("sabb_reply_max_messages", 10),
+        message_enumeration=client.config_data["coac_client_config"][
+            "aprs_message_enumeration"
+        ],
+        simulate_send=client.config_data["coac_testing"]["aprsis_simulate_send"],
+    )
+    if start_reply_relay(
+        relay=reply_relay, socket_path=sabb_config.get("sabb_reply_socket", "")
+    ):
+        sabb_shared.reply_relay = reply_relay
+
     # Finally, activate the APRS client and connect to APRS-IS
     client.activate_client()
@@ -0,0 +1,150 @@
+#!/opt/local/bin/python
+#
+# send-aprs-message: ack tracking against the local APRS-IS emulator
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Starts the APRS-IS emulator (../../aprsis-emulator) in-process with
+# auto-ack, a configurable ack loss and one station which rejects all
+# messages. A batch of multi-fragment messages is then sent with ack
+# tracking. The run fails if a message to a regular station has not been
+# delivered, if the rejected message has not failed right away (or its
+# remaining fragments have been sent anyway) or if a fragment has been
+# retried after its ack had arrived (each retry must correspond to one
+# ack that the emulator has dropped on purpose).
+#
+# Usage: python benchmarks/bench_ack_tracking.py [--destinations N] [--ack-loss F]
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import aprslib
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# send-aprs-message's modules and the APRS-IS emulator (../../aprsis-emulator)
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "aprsis-emulator"))
+
+import aprsis_emulator
+from sam_batch import run_batch
+from sam_server_pool import AprsIsServerPool
+
+FROM_CALLSIGN = "DF0BOT"
+REJECT_CALLSIGN = "DF9REJ"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--destinations",
+        dest="destinations",
+        type=int,
+        default=10,
+        help="Number of destination call signs (default: 10)",
+    )
+    parser.add_argument(
+        "--fragments",
+        dest="fragments",
+        type=int,
+        default=3,
+        help="Fragments per message (default: 3)",
+    )
+    parser.add_argument(
+        "--ack-loss",
+        dest="ack_loss",
+        type=float,
+        default=0.3,
+        help="Fraction of the acks which get lost (default: 0.3)",
+    )
+    parser.add_argument(
+        "--ack-retries",
+        dest="ack_retries",
+        type=int,
+        default=8,
+        help="Max. number of retries per fragment (default: 8)",
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    received_log = io.StringIO()
+    emulator = aprsis_emulator.AprsIsEmulator(
+        port=0,
+        received_log=received_log,
+        auto_ack=True,
+        ack_loss=args.ack_loss,
+        reject_patterns=[REJECT_CALLSIGN],
+    )
+    emulator.start()
+
+    # Each word fills a fragment of its own
+    message = " ".join(["x" * 60] * args.fragments)
+    destinations = [f"DF{index}TST" for index in range(args.destinations)]
+    batch_file = io.StringIO(
+        "".join(
+            json.dumps({"to_callsign": destination, "message": message}) + "\n"
+            for destination in destinations + [REJECT_CALLSIGN]
+        )
+    )
+    summary = run_batch(
+        from_callsign=FROM_CALLSIGN,
+        passcode=str(aprslib.passcode(FROM_CALLSIGN)),
+        batch_file=batch_file,
+        packet_delay=0.2,
+        packet_delay_last_message=0.05,
+        channel_delay=0.01,
+        ack_tracking=True,
+        ack_timeout=0.5,
+        ack_retries=args.ack_retries,
+        server_pool=AprsIsServerPool(servers=[(emulator.address, emulator.port)]),
+    )
+    emulator.stop()
+    tracker = summary["ack_tracking"]
+    answers = emulator.statistics.report()["auto_answers"]
+    packets = received_log.getvalue().splitlines()
+    # Message numbers that were sent to the rejecting station (the rej may get
+    # lost, too; retries of the first fragment are fine)
+    rejected_msgnos = {
+        line.rpartition("{")[2] for line in packets if f"::{REJECT_CALLSIGN}" in line
+    }
+
+    violations = []
+    if tracker["delivered_messages"] != args.destinations:
+        violations.append("not all messages to regular stations have been delivered")
+    if tracker["failed_messages"] != 1 or tracker["rejected_fragments"] != 1:
+        violations.append("the rejected message has not failed")
+    if len(rejected_msgnos) != 1:
+        violations.append("fragments have been sent after a rej")
+    if answers["ack"] != tracker["acked_fragments"]:
+        violations.append("fragments have been retried after their ack")
+    if tracker["retransmissions"] != answers["dropped"]:
+        violations.append("retries do not match the lost acks")
+
+    results = {
+        "messages": args.destinations + 1,
+        "fragments_per_message": args.fragments,
+        "ack_loss": args.ack_loss,
+        "packets": len(packets),
+        "elapsed_seconds": summary["elapsed_seconds"],
+        "ack_tracking": tracker,
+        "auto_answers": answers,
+        "violations": violations,
+    }
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if violations else 0)
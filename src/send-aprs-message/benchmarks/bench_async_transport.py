@@ -0,0 +1,264 @@
+#!/opt/local/bin/python
+#
+# send-aprs-message: messages per second of the asyncio APRS-IS transport
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Measures how many messages AsyncAprsIsTransport schedules per second:
+# (1) in simulation mode without any delays (the transport's own overhead),
+# (2) against the local APRS-IS emulator (../../aprsis-emulator), once for
+# many concurrent conversations in one event loop and once for the same
+# kind of conversations one after another (as with send_aprs_message_list)
+# and (3) with ack tracking and lost acks. The run fails if a packet is
+# missing, if the fragments of a message arrive out of order, if a message
+# has not been delivered or if the concurrent conversations are not faster
+# than the sequential ones.
+#
+# Usage: python benchmarks/bench_async_transport.py [--destinations N]
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import time
+import aprslib
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# send-aprs-message's modules and the APRS-IS emulator (../../aprsis-emulator)
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "aprsis-emulator"))
+
+import aprsis_emulator
+from sam_server_pool import AprsIsServerPool
+from sam_transport import AsyncAprsIsTransport
+
+FROM_CALLSIGN = "DF0BOT"
+
+
+def make_fragments(destination: str, fragments: int):
+    return [f"{destination} part {index}" for index in range(1, fragments + 1)]
+
+
+async def run_transport(
+    destinations: list,
+    fragments: int,
+    concurrent: bool = True,
+    **kwargs,
+):
+    """
+    Sends one message to each destination
+
+    Parameters
+    ==========
+    destinations: list
+        Destination call signs
+    fragments: int
+        Fragments per message
+    concurrent: bool
+        True: all conversations at once; False: one after another
+    kwargs: dict
+        Parameters for AsyncAprsIsTransport
+
+    Returns
+    =======
+    result: dict
+        Elapsed time, messages per second and the transport's status
+    """
+    async with AsyncAprsIsTransport(
+        callsign=FROM_CALLSIGN,
+        passcode=str(aprslib.passcode(FROM_CALLSIGN)),
+        **kwargs,
+    ) as transport:
+        start = time.monotonic()
+        if concurrent:
+            results = await asyncio.gather(
+                *(
+                    transport.submit(
+                        to_callsign=destination,
+                        fragments=make_fragments(destination, fragments),
+                    )
+                    for destination in destinations
+                )
+            )
+        else:
+            results = [
+                await transport.submit(
+                    to_callsign=destination,
+                    fragments=make_fragments(destination, fragments),
+                )
+                for destination in destinations
+            ]
+        elapsed = time.monotonic() - start
+        status = transport.get_status()
+    return {
+        "messages": len(destinations),
+        "successful_messages": sum(results),
+        "elapsed_seconds": round(elapsed, 3),
+        "messages_per_second": round(len(destinations) / elapsed, 1),
+        "status": status,
+    }
+
+
+def check_received(received_log: io.StringIO, destinations: list, fragments: int):
+    """
+    Checks that the emulator has received all fragments in order
+
+    Parameters
+    ==========
+    received_log: io.StringIO
+        The emulator's log of the received packets
+    destinations: list
+        Destination call signs
+    fragments: int
+        Fragments per message
+
+    Returns
+    =======
+    violations: list
+        Missing or out-of-order fragments
+    """
+    received = {}
+    for line in received_log.getvalue().splitlines():
+        _, _, addressee_text = line.partition("::")
+        addressee, _, text = addressee_text.partition(":")
+        received.setdefault(addressee.strip(), []).append(text.partition("{")[0])
+    violations = []
+    for destination in destinations:
+        if received.get(destination) != make_fragments(destination, fragments):
+            violations.append(f"fragments to '{destination}' are missing or out of order")
+    return violations[:5]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--destinations",
+        dest="destinations",
+        type=int,
+        default=500,
+        help="Number of concurrent conversations (default: 500)",
+    )
+    parser.add_argument(
+        "--fragments",
+        dest="fragments",
+        type=int,
+        default=3,
+        help="Fragments per message (default: 3)",
+    )
+    parser.add_argument(
+        "--packet-delay",
+        dest="packet_delay",
+        type=float,
+        default=0.05,
+        help="Spacing between the fragments of a message (default: 0.05)",
+    )
+    parser.add_argument(
+        "--sequential",
+        dest="sequential",
+        type=int,
+        default=20,
+        help="Number of sequential conversations (default: 20)",
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    destinations = [f"DF{index}TST" for index in range(args.destinations)]
+    results = {}
+    violations = []
+
+    # (1) scheduling overhead of the transport itself (50 messages per
+    # destination, no delays)
+    results["simulated"] = asyncio.run(
+        run_transport(
+            destinations=destinations * 50,
+            fragments=args.fragments,
+            simulate_send=True,
+            packet_delay=0.0,
+            packet_delay_last_message=0.0,
+            channel_delay=0.0,
+        )
+    )
+
+    # (2) concurrent vs. sequential conversations against the emulator
+    timing = {
+        "packet_delay": args.packet_delay,
+        "packet_delay_last_message": 0.0,
+        "channel_delay": 0.0,
+    }
+    for name, conversations, concurrent in (
+        ("concurrent", destinations, True),
+        ("sequential", destinations[: args.sequential], False),
+    ):
+        received_log = io.StringIO()
+        emulator = aprsis_emulator.AprsIsEmulator(port=0, received_log=received_log)
+        emulator.start()
+        server_pool = AprsIsServerPool(
+            servers=[(emulator.address, emulator.port)]
+        )
+        results[name] = asyncio.run(
+            run_transport(
+                destinations=conversations,
+                fragments=args.fragments,
+                concurrent=concurrent,
+                server_pool=server_pool,
+                **timing,
+            )
+        )
+        # The emulator logs the packets in its own threads
+        time.sleep(0.5)
+        emulator.stop()
+        violations += check_received(
+            received_log=received_log,
+            destinations=conversations,
+            fragments=args.fragments,
+        )
+
+    # (3) ack tracking with lost acks
+    emulator = aprsis_emulator.AprsIsEmulator(port=0, auto_ack=True, ack_loss=0.2)
+    emulator.start()
+    results["ack_tracking"] = asyncio.run(
+        run_transport(
+            destinations=destinations[:100],
+            fragments=args.fragments,
+            server_pool=AprsIsServerPool(
+                servers=[(emulator.address, emulator.port)]
+            ),
+            ack_tracking=True,
+            ack_timeout=0.5,
+            ack_retries=8,
+            **timing,
+        )
+    )
+    emulator.stop()
+
+    for name in ("simulated", "concurrent", "sequential", "ack_tracking"):
+        if results[name]["successful_messages"] != results[name]["messages"]:
+            violations.append(f"{name}: not all messages have been sent")
+    speedup = (
+        results["concurrent"]["messages_per_second"]
+        / results["sequential"]["messages_per_second"]
+    )
+    if speedup <= 1.0:
+        violations.append("concurrent conversations are not faster than sequential ones")
+
+    results["concurrent_speedup"] = round(speedup, 1)
+    results["violations"] = violations
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if violations else 0)
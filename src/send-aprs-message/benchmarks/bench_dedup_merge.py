@@ -0,0 +1,243 @@
+#!/opt/local/bin/python
+#
+# send-aprs-message: airtime savings of outbound deduplication and merging
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Sends a batch of script notifications in simulation mode: short status
+# texts which get repeated several times, plus a few longer reports, to a
+# handful of call signs. The batch is sent (1) as is, (2) with the
+# deduplicator and (3) with deduplication and merging; the benchmark
+# reports the number of APRS packets (i.e. the airtime) of each run and the
+# time per record. The run fails if a distinct text is missing from the
+# packets to its call sign (or arrives out of order), if a text has been
+# sent twice within the window or if a packet exceeds 67 characters.
+#
+# Usage: python benchmarks/bench_dedup_merge.py [--records N]
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sam_batch import run_batch
+from sam_dedup import OutboundDeduplicator
+from sam_logger import logger
+from sam_messages import APRS_MSG_LEN_NOTRAILING
+
+FROM_CALLSIGN = "DF0BOT"
+WORDS = ["backup", "disk", "load", "sda1", "ok", "warn", "91%", "ups", "temp"]
+
+
+class PacketCollector(logging.Handler):
+    # Collects the simulated packets from send-aprs-message's logger
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.packets = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith("Simulating APRS message '"):
+            self.packets.append(message[len("Simulating APRS message '") : -1])
+
+
+def make_records(records: int, destinations: int, seed: int = 42):
+    """
+    Creates the batch: short status texts (repeated), some longer reports
+
+    Parameters
+    ==========
+    records: int
+        Number of batch records
+    destinations: int
+        Number of call signs
+    seed: int
+        Seed of the random number generator
+
+    Returns
+    =======
+    records: list
+        (call sign, text) tuples
+    """
+    generator = random.Random(seed)
+    callsigns = [f"DF{index}TST" for index in range(destinations)]
+    status_texts = [
+        " ".join(generator.choice(WORDS) for _ in range(generator.randint(2, 4)))
+        + f" {index}"
+        for index in range(40)
+    ]
+    batch = []
+    for index in range(records):
+        if generator.random() < 0.1:
+            text = " ".join(generator.choice(WORDS) for _ in range(30)) + f" r{index}"
+        else:
+            text = generator.choice(status_texts)
+        batch.append((generator.choice(callsigns), text))
+    return batch
+
+
+def run(records: list, collector: PacketCollector, **kwargs):
+    """
+    Sends the batch in simulation mode
+
+    Parameters
+    ==========
+    records: list
+        (call sign, text) tuples
+    collector: PacketCollector
+        Our packet collector
+    kwargs: dict
+        Additional parameters for run_batch
+
+    Returns
+    =======
+    summary: dict
+        The batch summary, the number of packets and the time per record
+    packets: list
+        The simulated packets
+    """
+    collector.packets = []
+    batch_file = io.StringIO(
+        "".join(
+            json.dumps({"to_callsign": callsign, "message": text}) + "\n"
+            for callsign, text in records
+        )
+    )
+    summary = run_batch(
+        from_callsign=FROM_CALLSIGN,
+        passcode="-1",
+        batch_file=batch_file,
+        simulate_send=True,
+        packet_delay=0.0,
+        packet_delay_last_message=0.0,
+        channel_delay=0.0,
+        **kwargs,
+    )
+    summary["packets"] = len(collector.packets)
+    summary["usec_per_record"] = round(
+        summary["elapsed_seconds"] / len(records) * 1e6, 1
+    )
+    return summary, list(collector.packets)
+
+
+def check_packets(records: list, packets: list, deduplicated: bool):
+    """
+    Checks that each distinct text has reached its call sign in order
+
+    Parameters
+    ==========
+    records: list
+        (call sign, text) tuples
+    packets: list
+        The simulated packets
+    deduplicated: bool
+        True if each distinct text must have been sent exactly once
+
+    Returns
+    =======
+    violations: list
+        The first few violations
+    """
+    violations = []
+    received = {}
+    for packet in packets:
+        _, _, addressee_text = packet.partition("::")
+        addressee, _, text = addressee_text.partition(":")
+        if len(text) > APRS_MSG_LEN_NOTRAILING:
+            violations.append(f"packet exceeds 67 characters: '{packet}'")
+        received.setdefault(addressee.strip(), []).append(text)
+
+    expected = {}
+    for callsign, text in records:
+        texts = expected.setdefault(callsign, [])
+        if not deduplicated or text not in texts:
+            texts.append(text)
+    for callsign, texts in expected.items():
+        stream = " ".join(received.get(callsign, []))
+        position = 0
+        for text in texts:
+            found = stream.find(text, position)
+            if found < 0:
+                violations.append(f"'{text}' to '{callsign}' is missing or reordered")
+                break
+            position = found + len(text)
+        if deduplicated:
+            for text in texts:
+                # Texts which are part of another text (e.g. 'ok 1' and
+                # 'ok 12') cannot be counted this way
+                if sum(other.find(text) >= 0 for other in texts) > 1:
+                    continue
+                if stream.count(text) > 1:
+                    violations.append(f"'{text}' to '{callsign}' has been sent twice")
+    return violations[:5]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--records",
+        dest="records",
+        type=int,
+        default=5000,
+        help="Number of batch records (default: 5000)",
+    )
+    parser.add_argument(
+        "--destinations",
+        dest="destinations",
+        type=int,
+        default=20,
+        help="Number of call signs (default: 20)",
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    collector = PacketCollector()
+    logger.addHandler(collector)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+    records = make_records(records=args.records, destinations=args.destinations)
+    results = {}
+    violations = []
+    for name, kwargs in (
+        ("plain", {}),
+        ("dedup", {"deduplicator": "new"}),
+        ("dedup_merge", {"deduplicator": "new", "merge_messages": True}),
+    ):
+        if "deduplicator" in kwargs:
+            kwargs["deduplicator"] = OutboundDeduplicator(window=600)
+        results[name], packets = run(records=records, collector=collector, **kwargs)
+        violations += [
+            f"{name}: {violation}"
+            for violation in check_packets(
+                records=records,
+                packets=packets,
+                deduplicated="deduplicator" in kwargs,
+            )
+        ]
+
+    results["airtime_saved_percent"] = round(
+        100 * (1 - results["dedup_merge"]["packets"] / results["plain"]["packets"]), 1
+    )
+    if results["dedup_merge"]["packets"] >= results["dedup"]["packets"]:
+        violations.append("merging has not reduced the number of packets")
+    results["violations"] = violations
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if violations else 0)
@@ -0,0 +1,291 @@
+#!/opt/local/bin/python
+#
+# send-aprs-message: message packing cost and differential check
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Compares make_pretty_aprs_messages against the previous, recursive
+# implementation (kept below as reference). First, a large number of
+# random messages (ASCII and non-ASCII words, over-long words, characters
+# which are not permitted in APRS messages, whitespace variations) is
+# packed by both implementations, with and without pre-filled destination
+# lists and numeric pagination; any difference counts as a mismatch.
+# Afterwards, the time per call is measured for short messages and for
+# long script output.
+#
+# Usage: python benchmarks/bench_message_packing.py [--cases N]
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import timeit
+from unidecode import unidecode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sam_messages
+
+
+def reference_convert_text_to_plain_ascii(message_string: str):
+    # Previous implementation of convert_text_to_plain_ascii
+    message_string = (
+        message_string.replace("Ä", "Ae")
+        .replace("Ö", "Oe")
+        .replace("Ü", "Ue")
+        .replace("ä", "ae")
+        .replace("ö", "oe")
+        .replace("ü", "ue")
+        .replace("ß", "ss")
+    )
+    message_string = unidecode(message_string)
+    return message_string
+
+
+def reference_make_pretty_aprs_messages(
+    message_to_add: str,
+    max_len: int,
+    destination_list: list = None,
+    separator_char: str = " ",
+    add_sep: bool = True,
+    force_outgoing_unicode_messages: bool = False,
+) -> list:
+    # Previous (recursive) implementation of make_pretty_aprs_messages
+    if not destination_list:
+        destination_list = []
+    message_to_add = re.sub("[{}|~]+", "", message_to_add)
+    message_to_add = reference_convert_text_to_plain_ascii(
+        message_string=message_to_add
+    )
+    # The current implementation also removes the non-permitted characters
+    # which the ASCII conversion creates (e.g. '¦' -> '|')
+    message_to_add = re.sub("[{}|~]+", "", message_to_add)
+    if len(message_to_add) > max_len:
+        split_data = message_to_add.split()
+        for split in split_data:
+            if len(split) < max_len:
+                destination_list = reference_make_pretty_aprs_messages(
+                    message_to_add=split,
+                    destination_list=destination_list,
+                    max_len=max_len,
+                    separator_char=separator_char,
+                    add_sep=add_sep,
+                    force_outgoing_unicode_messages=force_outgoing_unicode_messages,
+                )
+            else:
+                string_list = [
+                    split[index : index + max_len]
+                    for index in range(0, len(split), max_len)
+                ]
+                for msg in string_list:
+                    destination_list.append(msg)
+    else:
+        if len(destination_list) > 0:
+            string_from_list = destination_list[-1]
+            if len(string_from_list) + len(message_to_add) + 1 <= max_len:
+                delimiter = ""
+                if len(string_from_list) > 0 and add_sep:
+                    delimiter = separator_char
+                string_from_list = string_from_list + delimiter + message_to_add
+                destination_list[-1] = string_from_list
+            else:
+                destination_list.append(message_to_add)
+        else:
+            destination_list.append(message_to_add)
+    return destination_list
+
+
+# Building blocks for the random messages
+WORDS = ["ok", "Backup", "disk", "91%", "/var/log/syslog", "Grüße", "Übermaß"]
+SPECIAL = ["{", "}", "|", "~", "¦", "‖", "〜", "€", "中文", "ß", "Ä", "…", "\x00"]
+WHITESPACE = [" ", " ", " ", "  ", "\t", "\n", " \r\n "]
+
+
+def random_message(generator: random.Random):
+    """
+    Creates a random message text
+
+    Parameters
+    ==========
+    generator: random.Random
+        Our random number generator
+
+    Returns
+    =======
+    message: str
+        The message text
+    """
+    parts = []
+    for _ in range(generator.randint(0, 40)):
+        choice = generator.random()
+        if choice < 0.5:
+            parts.append(generator.choice(WORDS))
+        elif choice < 0.7:
+            parts.append(
+                "".join(
+                    generator.choice("abcXYZ019-_.äöü")
+                    for _ in range(generator.randint(1, 140))
+                )
+            )
+        else:
+            parts.append(generator.choice(SPECIAL))
+        parts.append(generator.choice(WHITESPACE))
+    return "".join(parts)
+
+
+def run_differential_check(cases: int, seed: int = 42):
+    """
+    Packs random messages with both implementations
+
+    Parameters
+    ==========
+    cases: int
+        Number of random messages
+    seed: int
+        Seed of the random number generator
+
+    Returns
+    =======
+    mismatches: list
+        The first few mismatching cases
+    mismatch_count: int
+        Total number of mismatches
+    """
+    generator = random.Random(seed)
+    mismatches = []
+    mismatch_count = 0
+    for _ in range(cases):
+        message = random_message(generator=generator)
+        max_len = generator.choice(
+            (
+                sam_messages.APRS_MSG_LEN_NOTRAILING,
+                sam_messages.APRS_MSG_LEN_TRAILING,
+                10,
+            )
+        )
+        prefilled = generator.choice(
+            (None, [], [""], ["status:"], ["x" * (max_len - 2)])
+        )
+        kwargs = {
+            "message_to_add": message,
+            "max_len": max_len,
+            "separator_char": generator.choice((" ", ",")),
+            "add_sep": generator.random() < 0.8,
+        }
+        expected = reference_make_pretty_aprs_messages(
+            destination_list=None if prefilled is None else list(prefilled), **kwargs
+        )
+        actual = sam_messages.make_pretty_aprs_messages(
+            destination_list=None if prefilled is None else list(prefilled), **kwargs
+        )
+        for finalize in (False, True):
+            if finalize:
+                expected = sam_messages.finalize_pretty_aprs_messages(
+                    mylistarray=expected, max_len=max_len
+                )
+                actual = sam_messages.finalize_pretty_aprs_messages(
+                    mylistarray=actual, max_len=max_len
+                )
+            if actual != expected:
+                mismatch_count += 1
+                if len(mismatches) < 5:
+                    mismatches.append(
+                        {"input": kwargs, "expected": expected, "actual": actual}
+                    )
+                break
+    return mismatches, mismatch_count
+
+
+def measure(function, message: str, max_len: int, repeat: int):
+    """
+    Returns the time per call in microseconds
+
+    Parameters
+    ==========
+    function: callable
+        The packing function
+    message: str
+        Message text
+    max_len: int
+        Max. fragment length
+    repeat: int
+        Number of calls
+
+    Returns
+    =======
+    usec: float
+        Time per call (best of 3 runs)
+    """
+    timer = timeit.Timer(lambda: function(message_to_add=message, max_len=max_len))
+    return min(timer.repeat(repeat=3, number=repeat)) / repeat * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--cases",
+        dest="cases",
+        type=int,
+        default=20000,
+        help="Number of random messages for the differential check (default: 20000)",
+    )
+    args = parser.parse_args()
+
+    mismatches, mismatch_count = run_differential_check(cases=args.cases)
+
+    generator = random.Random(7)
+    script_output = "\n".join(
+        f"{index:04d} Prüfung /dev/sda{index % 4}: "
+        + " ".join(generator.choice(WORDS) for _ in range(8))
+        for index in range(200)
+    )
+    messages = {
+        "short_ascii": ("Backup completed, 12 files", 10000),
+        "short_umlauts": ("Sicherung für Jörg abgeschlossen", 10000),
+        "long_ascii": (" ".join(["word"] * 400), 200),
+        "script_output": (script_output, 20),
+    }
+    timings = {}
+    for name, (message, repeat) in messages.items():
+        reference = measure(
+            function=reference_make_pretty_aprs_messages,
+            message=message,
+            max_len=67,
+            repeat=repeat,
+        )
+        current = measure(
+            function=sam_messages.make_pretty_aprs_messages,
+            message=message,
+            max_len=67,
+            repeat=repeat,
+        )
+        timings[name] = {
+            "characters": len(message),
+            "reference_usec": round(reference, 2),
+            "current_usec": round(current, 2),
+            "speedup": round(reference / current, 1),
+        }
+
+    results = {
+        "cases": args.cases,
+        "mismatches": mismatch_count,
+        "mismatch_examples": mismatches,
+        "timings": timings,
+    }
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if mismatch_count else 0)
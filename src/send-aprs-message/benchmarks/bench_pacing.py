@@ -0,0 +1,229 @@
+#!/opt/local/bin/python
+#
+# send-aprs-message: pacing scheduler wall time
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Computes the time span that is required for sending multi-fragment
+# messages to a number of destinations, (1) one message after the other
+# with send_aprs_message_list's fixed delays and (2) interleaved by the
+# PacingScheduler. The scheduler runs on a virtual clock, thus the
+# benchmark finishes within seconds. Each packet of the resulting schedule
+# is checked against the per-destination and the channel spacing; the
+# fragments of each destination have to be sent in their original order.
+#
+# Usage: python benchmarks/bench_pacing.py [--destinations N] [--fragments N]
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sam_pacing import PacingScheduler
+
+
+def run_schedule(
+    destinations: int,
+    fragments: int,
+    messages: int,
+    packet_delay: float,
+    packet_delay_last_message: float,
+    channel_delay: float,
+):
+    """
+    Runs the pacing scheduler on a virtual clock
+
+    Parameters
+    ==========
+    destinations: int
+        Number of destination call signs
+    fragments: int
+        Number of fragments per message
+    messages: int
+        Number of messages per destination
+    packet_delay: float
+        Min. spacing between two fragments of the same message
+    packet_delay_last_message: float
+        Min. spacing after the last fragment of a message
+    channel_delay: float
+        Min. spacing between any two packets
+
+    Returns
+    =======
+    schedule: list
+        Tuples of (send time, destination, fragment, last fragment)
+    cpu_seconds: float
+        CPU time for computing the schedule
+    """
+    scheduler = PacingScheduler(
+        packet_delay=packet_delay,
+        packet_delay_last_message=packet_delay_last_message,
+        channel_delay=channel_delay,
+    )
+    for message in range(messages):
+        for destination in range(destinations):
+            scheduler.add(
+                destination=f"N{destination}TST",
+                fragments=[f"{message}/{index}" for index in range(fragments)],
+            )
+
+    now = 0.0
+    schedule = []
+    begin = time.process_time()
+    while True:
+        wait = scheduler.time_until_next(now=now)
+        if wait is None:
+            break
+        now += wait
+        destination, fragment, _, last_fragment = scheduler.pop(now=now)
+        schedule.append((now, destination, fragment, last_fragment))
+    return schedule, time.process_time() - begin
+
+
+def check_schedule(
+    schedule: list,
+    fragments: int,
+    messages: int,
+    packet_delay: float,
+    packet_delay_last_message: float,
+    channel_delay: float,
+):
+    """
+    Checks a schedule against the spacing rules
+
+    Parameters
+    ==========
+    schedule: list
+        Output of run_schedule
+    fragments: int
+        Number of fragments per message
+    messages: int
+        Number of messages per destination
+    packet_delay: float
+        Min. spacing between two fragments of the same message
+    packet_delay_last_message: float
+        Min. spacing after the last fragment of a message
+    channel_delay: float
+        Min. spacing between any two packets
+
+    Returns
+    =======
+    violations: int
+        Number of packets which violate a spacing rule or the order
+    """
+    violations = 0
+    epsilon = 1e-9
+    last_send = None
+    per_destination = {}
+    for send_time, destination, fragment, last_fragment in schedule:
+        if last_send is not None and send_time - last_send < channel_delay - epsilon:
+            violations += 1
+        last_send = send_time
+        history = per_destination.setdefault(destination, [])
+        if history:
+            previous_time, previous_last = history[-1][0], history[-1][2]
+            spacing = packet_delay_last_message if previous_last else packet_delay
+            if send_time - previous_time < spacing - epsilon:
+                violations += 1
+        history.append((send_time, fragment, last_fragment))
+
+    expected = [
+        f"{message}/{index}"
+        for message in range(messages)
+        for index in range(fragments)
+    ]
+    for history in per_destination.values():
+        if [fragment for _, fragment, _ in history] != expected:
+            violations += 1
+    return violations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--destinations",
+        dest="destinations",
+        type=int,
+        default=20,
+        help="Number of destination call signs (default: 20)",
+    )
+    parser.add_argument(
+        "--fragments",
+        dest="fragments",
+        type=int,
+        default=5,
+        help="Fragments per message (default: 5)",
+    )
+    parser.add_argument(
+        "--messages",
+        dest="messages",
+        type=int,
+        default=1,
+        help="Messages per destination (default: 1)",
+    )
+    parser.add_argument(
+        "--packet-delay",
+        dest="packet_delay",
+        type=float,
+        default=10.0,
+        help="Per-destination fragment spacing in seconds (default: 10)",
+    )
+    parser.add_argument(
+        "--channel-delay",
+        dest="channel_delay",
+        type=float,
+        default=1.0,
+        help="Channel spacing in seconds (default: 1)",
+    )
+    args = parser.parse_args()
+    packet_delay_last_message = 1.0
+
+    # send_aprs_message_list: fixed delays, one message after the other
+    sequential_seconds = (
+        args.destinations
+        * args.messages
+        * ((args.fragments - 1) * args.packet_delay + packet_delay_last_message)
+    )
+    schedule, cpu_seconds = run_schedule(
+        destinations=args.destinations,
+        fragments=args.fragments,
+        messages=args.messages,
+        packet_delay=args.packet_delay,
+        packet_delay_last_message=packet_delay_last_message,
+        channel_delay=args.channel_delay,
+    )
+    violations = check_schedule(
+        schedule=schedule,
+        fragments=args.fragments,
+        messages=args.messages,
+        packet_delay=args.packet_delay,
+        packet_delay_last_message=packet_delay_last_message,
+        channel_delay=args.channel_delay,
+    )
+    scheduled_seconds = schedule[-1][0] if schedule else 0.0
+    results = {
+        "packets": len(schedule),
+        "sequential_seconds": round(sequential_seconds, 1),
+        "scheduled_seconds": round(scheduled_seconds, 1),
+        "speedup": round(sequential_seconds / max(scheduled_seconds, 1e-9), 1),
+        "scheduler_usec_per_packet": round(cpu_seconds / len(schedule) * 1e6, 2),
+        "violations": violations,
+    }
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if violations else 0)
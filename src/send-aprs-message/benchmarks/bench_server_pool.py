@@ -0,0 +1,186 @@
+#!/opt/local/bin/python
+#
+# send-aprs-message: APRS-IS server pool failover and connection timing
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Runs a server pool against local stand-ins: a server which accepts the
+# TCP connection but never sends its banner, a closed port, a slow APRS-IS
+# emulator (delayed login response) and a fast one. The benchmark checks
+# that (1) the first connection fails over within the connect timeout,
+# (2) after a probe of all servers, the next run starts with the fastest
+# server (read from the state file), (3) the pool fails over to the next
+# healthy server once the fastest one is gone and (4) the subsequent run
+# starts with that server right away.
+#
+# Usage: python benchmarks/bench_server_pool.py [--connect-timeout N]
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+import aprslib
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# send-aprs-message's modules and the APRS-IS emulator (../../aprsis-emulator)
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "aprsis-emulator"))
+
+import aprsis_emulator
+from sam_server_pool import AprsIsServerPool
+from sam_transport import AsyncAprsIsTransport, probe_servers
+
+FROM_CALLSIGN = "DF0BOT"
+SLOW_LOGIN_DELAY = 0.3
+
+
+async def connect(server_pool: AprsIsServerPool):
+    # Logs in to the first available server and returns it
+    transport = AsyncAprsIsTransport(
+        callsign=FROM_CALLSIGN,
+        passcode=str(aprslib.passcode(FROM_CALLSIGN)),
+        server_pool=server_pool,
+        reconnect=False,
+    )
+    await transport.start()
+    server = transport.server
+    await transport.close()
+    return server
+
+
+def timed_connect(servers: list, connect_timeout: float, state_file: str):
+    """
+    Connects to the first available server of a new pool
+
+    Parameters
+    ==========
+    servers: list
+        (host, port) tuples
+    connect_timeout: float
+        Connect timeout in seconds
+    state_file: str
+        The pool's state file
+
+    Returns
+    =======
+    result: dict
+        Server, elapsed time and the pool's order
+    """
+    server_pool = AprsIsServerPool(
+        servers=servers, connect_timeout=connect_timeout, state_file=state_file
+    )
+    order = [server_pool.server_key(server) for server in server_pool.ordered_servers()]
+    start = time.monotonic()
+    server = asyncio.run(connect(server_pool=server_pool))
+    elapsed = time.monotonic() - start
+    return {
+        "server": server_pool.server_key(server),
+        "elapsed_seconds": round(elapsed, 3),
+        "order": order,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--connect-timeout",
+        dest="connect_timeout",
+        type=float,
+        default=0.5,
+        help="Connect timeout in seconds (default: 0.5)",
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    # Accepts TCP connections (backlog) but never sends a banner
+    hanging_server = socket.create_server(("127.0.0.1", 0))
+    # Closed port
+    closed_socket = socket.create_server(("127.0.0.1", 0))
+    closed_port = closed_socket.getsockname()[1]
+    closed_socket.close()
+    slow_emulator = aprsis_emulator.AprsIsEmulator(
+        port=0, login_delay=SLOW_LOGIN_DELAY
+    )
+    fast_emulator = aprsis_emulator.AprsIsEmulator(port=0)
+    slow_emulator.start()
+    fast_emulator.start()
+
+    servers = [
+        hanging_server.getsockname()[:2],
+        ("127.0.0.1", closed_port),
+        (slow_emulator.address, slow_emulator.port),
+        (fast_emulator.address, fast_emulator.port),
+    ]
+    hanging, closed, slow, fast = (f"{host}:{port}" for host, port in servers)
+
+    results = {}
+    violations = []
+    with tempfile.TemporaryDirectory() as directory:
+        state_file = os.path.join(directory, "servers.json")
+
+        # (1) no state yet: configured order
+        results["first_run"] = timed_connect(
+            servers=servers, connect_timeout=args.connect_timeout, state_file=state_file
+        )
+        if results["first_run"]["server"] != slow:
+            violations.append("first run has not failed over to the slow server")
+        if results["first_run"]["elapsed_seconds"] > args.connect_timeout + 1.0:
+            violations.append("first run has exceeded the connect timeout")
+
+        # (2) measure all servers, then start with the fastest one
+        server_pool = AprsIsServerPool(
+            servers=servers, connect_timeout=args.connect_timeout, state_file=state_file
+        )
+        results["probe"] = probe_servers(
+            from_callsign=FROM_CALLSIGN,
+            passcode=str(aprslib.passcode(FROM_CALLSIGN)),
+            server_pool=server_pool,
+        )
+        results["second_run"] = timed_connect(
+            servers=servers, connect_timeout=args.connect_timeout, state_file=state_file
+        )
+        if results["second_run"]["server"] != fast:
+            violations.append("second run has not started with the fastest server")
+
+        # (3) the fastest server is gone
+        fast_emulator.stop()
+        results["third_run"] = timed_connect(
+            servers=servers, connect_timeout=args.connect_timeout, state_file=state_file
+        )
+        if results["third_run"]["server"] != slow:
+            violations.append("third run has not failed over to the slow server")
+
+        # (4) start with the remaining healthy server
+        results["fourth_run"] = timed_connect(
+            servers=servers, connect_timeout=args.connect_timeout, state_file=state_file
+        )
+        if results["fourth_run"]["order"][0] != slow:
+            violations.append("fourth run has not started with the healthy server")
+
+        with open(state_file, "r", encoding="utf-8") as file:
+            results["state_file"] = json.load(file)
+
+    slow_emulator.stop()
+    hanging_server.close()
+    results["violations"] = violations
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if violations else 0)
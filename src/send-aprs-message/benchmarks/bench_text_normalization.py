@@ -0,0 +1,232 @@
+#!/opt/local/bin/python
+#
+# send-aprs-message: outgoing text normalization cost and differential check
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Compares normalize_aprs_text against the previous normalization (removal
+# of the non-permitted characters, seven str.replace calls and unidecode
+# for each text, kept below as reference). First, a large number of random
+# texts (ASCII, German umlauts, other scripts, characters which are not
+# permitted in APRS messages) is normalized by both implementations; any
+# difference counts as a mismatch. With force_outgoing_unicode_messages,
+# the non-ASCII characters have to be kept. Afterwards, the time per call
+# is measured for short and long texts.
+#
+# Usage: python benchmarks/bench_text_normalization.py [--cases N]
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import timeit
+from unidecode import unidecode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sam_messages
+
+
+def reference_normalize(message_string: str):
+    # Previous normalization of make_pretty_aprs_messages
+    message_string = re.sub("[{}|~]+", "", message_string)
+    message_string = (
+        message_string.replace("Ä", "Ae")
+        .replace("Ö", "Oe")
+        .replace("Ü", "Ue")
+        .replace("ä", "ae")
+        .replace("ö", "oe")
+        .replace("ü", "ue")
+        .replace("ß", "ss")
+    )
+    message_string = unidecode(message_string)
+    # The current implementation also removes the non-permitted characters
+    # which the ASCII conversion creates (e.g. '¦' -> '|'); the previous
+    # implementation kept them
+    message_string = re.sub("[{}|~]+", "", message_string)
+    return message_string
+
+
+# Building blocks for the random texts
+WORDS = ["ok", "Backup", "disk", "91%", "/var/log/syslog", "Grüße", "Übermaß"]
+SPECIAL = ["{", "}", "|", "~", "¦", "‖", "〜", "€", "中文", "ß", "Ä", "…", "\x00"]
+
+
+def random_text(generator: random.Random):
+    """
+    Creates a random text
+
+    Parameters
+    ==========
+    generator: random.Random
+        Our random number generator
+
+    Returns
+    =======
+    text: str
+        The text
+    """
+    parts = []
+    for _ in range(generator.randint(0, 30)):
+        choice = generator.random()
+        if choice < 0.6:
+            parts.append(generator.choice(WORDS))
+        elif choice < 0.8:
+            parts.append(
+                "".join(
+                    generator.choice("abcXYZ019-_.äöü")
+                    for _ in range(generator.randint(1, 20))
+                )
+            )
+        else:
+            parts.append(generator.choice(SPECIAL))
+    return " ".join(parts)
+
+
+def run_differential_check(cases: int, seed: int = 42):
+    """
+    Normalizes random texts with both implementations
+
+    Parameters
+    ==========
+    cases: int
+        Number of random texts
+    seed: int
+        Seed of the random number generator
+
+    Returns
+    =======
+    mismatches: list
+        The first few mismatching cases
+    mismatch_count: int
+        Total number of mismatches
+    unidecode_calls: int
+        Number of unidecode calls of the current implementation
+    """
+    unidecode_calls = 0
+
+    def counting_unidecode(message_string: str):
+        nonlocal unidecode_calls
+        unidecode_calls += 1
+        return unidecode(message_string)
+
+    sam_messages.unidecode = counting_unidecode
+    generator = random.Random(seed)
+    mismatches = []
+    mismatch_count = 0
+    for _ in range(cases):
+        text = random_text(generator=generator)
+        force_unicode = generator.random() < 0.2
+        if force_unicode:
+            expected = re.sub("[{}|~]+", "", text)
+        else:
+            expected = reference_normalize(message_string=text)
+        actual = sam_messages.normalize_aprs_text(
+            message_string=text, force_outgoing_unicode_messages=force_unicode
+        )
+        if actual != expected:
+            mismatch_count += 1
+            if len(mismatches) < 5:
+                mismatches.append(
+                    {
+                        "input": text,
+                        "force_outgoing_unicode_messages": force_unicode,
+                        "expected": expected,
+                        "actual": actual,
+                    }
+                )
+    sam_messages.unidecode = unidecode
+    return mismatches, mismatch_count, unidecode_calls
+
+
+def measure(function, message: str, repeat: int):
+    """
+    Returns the time per call in microseconds
+
+    Parameters
+    ==========
+    function: callable
+        The normalization function
+    message: str
+        Text
+    repeat: int
+        Number of calls
+
+    Returns
+    =======
+    usec: float
+        Time per call (best of 3 runs)
+    """
+    timer = timeit.Timer(lambda: function(message_string=message))
+    return min(timer.repeat(repeat=3, number=repeat)) / repeat * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--cases",
+        dest="cases",
+        type=int,
+        default=50000,
+        help="Number of random texts for the differential check (default: 50000)",
+    )
+    args = parser.parse_args()
+
+    mismatches, mismatch_count, unidecode_calls = run_differential_check(
+        cases=args.cases
+    )
+
+    generator = random.Random(7)
+    script_output = "\n".join(
+        f"{index:04d} Prüfung /dev/sda{index % 4}: "
+        + " ".join(generator.choice(WORDS) for _ in range(8))
+        for index in range(200)
+    )
+    messages = {
+        "short_ascii": ("Backup completed, 12 files", 20000),
+        "short_umlauts": ("Sicherung für Jörg abgeschlossen", 20000),
+        "short_other_scripts": ("Temperatur 21 °C – Zähler 中文", 20000),
+        "long_ascii": (" ".join(["word"] * 400), 2000),
+        "script_output": (script_output, 200),
+    }
+    timings = {}
+    for name, (message, repeat) in messages.items():
+        reference = measure(
+            function=reference_normalize, message=message, repeat=repeat
+        )
+        current = measure(
+            function=sam_messages.normalize_aprs_text,
+            message=message,
+            repeat=repeat,
+        )
+        timings[name] = {
+            "characters": len(message),
+            "reference_usec": round(reference, 2),
+            "current_usec": round(current, 2),
+            "speedup": round(reference / current, 1),
+        }
+
+    results = {
+        "cases": args.cases,
+        "mismatches": mismatch_count,
+        "mismatch_examples": mismatches,
+        "unidecode_calls": unidecode_calls,
+        "timings": timings,
+    }
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if mismatch_count else 0)
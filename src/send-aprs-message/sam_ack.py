@@ -0,0 +1,363 @@
+#
+# send-aprs-message
+# Acknowledgement tracking for outgoing APRS messages
+# Author: Joerg Schultze-Lutter, 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import random
+import re
+import threading
+import time
+from collections import deque
+from sam_logger import logger
+
+
+# Acknowledgement tracking: initial retry timeout, lower and upper bound of
+# the adaptive retry timeout (all in seconds) and max. number of retries
+ACK_TIMEOUT = 30.0
+ACK_MIN_TIMEOUT = 5.0
+ACK_MAX_TIMEOUT = 300.0
+ACK_MAX_RETRIES = 3
+
+# Incoming ack / rej for one of our messages: SOURCE>DEST[,PATH]::ADDRESSEE:ackNN
+# (optionally in the reply-ack format ackNN}AA)
+regex_aprs_ack = re.compile(
+    r"^([A-Z0-9-]{1,9})>[^:]*::([A-Z0-9- ]{9}):(ack|rej)([A-Za-z0-9]{1,5})(?:\}[A-Za-z0-9]{0,5})?$",
+    re.IGNORECASE,
+)
+
+
+class TrackedFragment:
+    __slots__ = (
+        "msgno",
+        "destination",
+        "packet",
+        "message_id",
+        "last_fragment",
+        "attempts",
+        "first_sent",
+        "deadline",
+    )
+
+    def __init__(
+        self,
+        msgno: str,
+        destination: str,
+        packet: str,
+        message_id,
+        last_fragment: bool,
+        sent: float,
+        deadline: float,
+    ):
+        self.msgno = msgno
+        self.destination = destination
+        self.packet = packet
+        self.message_id = message_id
+        self.last_fragment = last_fragment
+        self.attempts = 1
+        self.first_sent = sent
+        self.deadline = deadline
+
+
+class AckTracker:
+    def __init__(
+        self, ack_timeout: float = ACK_TIMEOUT, max_retries: int = ACK_MAX_RETRIES
+    ):
+        """
+        Keeps track of the fragments which have been sent with an APRS
+        message number and are waiting for the recipient's ack. The
+        receiver passes all incoming packets to handle_packet(); acks and
+        rejects end the tracking of the respective fragment. Unacknowledged
+        fragments are retried with exponential backoff. The retry timeout
+        adapts to the measured ack round trip times (smoothed round trip
+        time plus four times its variation); only fragments which have been
+        sent once provide round trip samples.
+
+        This class is thread-safe.
+
+        Parameters
+        ==========
+        ack_timeout: float
+            Retry timeout (in seconds) until the first ack has arrived
+        max_retries: int
+            Max. number of retries per fragment
+
+        Returns
+        =======
+        """
+        self.max_retries = max_retries
+        self.min_timeout = min(ACK_MIN_TIMEOUT, ack_timeout)
+        self.timeout = ack_timeout
+        self.acked_fragments = 0
+        self.rejected_fragments = 0
+        self.timed_out_fragments = 0
+        self.retransmissions = 0
+        self.delivered_messages = 0
+        self.failed_messages = 0
+        self._srtt = None
+        self._rttvar = None
+        # Random start value; a restarted sender does not reuse the message
+        # numbers that the recipient has just seen
+        self._msgno = random.randrange(99999)
+        # message number -> TrackedFragment
+        self._outstanding = {}
+        # (TrackedFragment, 'ack' | 'rej' | 'timeout')
+        self._completed = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def outstanding(self):
+        return len(self._outstanding)
+
+    def next_msgno(self):
+        """
+        Returns the next free APRS message number
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        msgno: str
+            Numeric message number (1..99999)
+        """
+        with self._lock:
+            while True:
+                self._msgno = self._msgno % 99999 + 1
+                msgno = str(self._msgno)
+                if msgno not in self._outstanding:
+                    return msgno
+
+    def track(
+        self,
+        msgno: str,
+        destination: str,
+        packet: str,
+        message_id,
+        last_fragment: bool,
+        now: float,
+    ):
+        """
+        Starts tracking a fragment which is about to be sent
+
+        Parameters
+        ==========
+        msgno: str
+            The fragment's message number, see next_msgno()
+        destination: str
+            Target user call sign
+        packet: str
+            The raw APRS-IS packet (required for retries)
+        message_id: any
+            ID of the message that the fragment belongs to
+        last_fragment: bool
+            True if this is the last fragment of its message
+        now: float
+            Current time (time.monotonic)
+
+        Returns
+        =======
+        """
+        with self._lock:
+            self._outstanding[msgno] = TrackedFragment(
+                msgno=msgno,
+                destination=destination,
+                packet=packet,
+                message_id=message_id,
+                last_fragment=last_fragment,
+                sent=now,
+                deadline=now + self.timeout,
+            )
+
+    def handle_packet(self, packet):
+        """
+        Checks an incoming APRS-IS packet for an ack or reject
+        of one of our outstanding fragments
+
+        Parameters
+        ==========
+        packet: str | bytes
+            The raw APRS-IS packet
+
+        Returns
+        =======
+        matched: bool
+            True if the packet has ended the tracking of a fragment
+        """
+        if isinstance(packet, bytes):
+            packet = packet.decode("latin-1")
+        matches = regex_aprs_ack.match(packet.strip())
+        if not matches:
+            return False
+        source = matches[1].upper()
+        kind = matches[3].lower()
+        msgno = matches[4]
+        now = time.monotonic()
+        with self._lock:
+            fragment = self._outstanding.get(msgno)
+            # Duplicate acks and acks from other stations are ignored
+            if not fragment or fragment.destination != source:
+                return False
+            del self._outstanding[msgno]
+            if kind == "ack":
+                self.acked_fragments += 1
+                if fragment.attempts == 1:
+                    self._update_timeout(rtt=now - fragment.first_sent)
+                if fragment.last_fragment:
+                    self.delivered_messages += 1
+            else:
+                self.rejected_fragments += 1
+                self.failed_messages += 1
+            self._completed.append((fragment, kind))
+        logger.debug(
+            msg=f"Received {kind} for message number {msgno} from '{source}' "
+            f"after {now - fragment.first_sent:.1f}s ({fragment.attempts} attempt(s))"
+        )
+        return True
+
+    def _update_timeout(self, rtt: float):
+        if self._srtt is None:
+            self._srtt = rtt
+            self._rttvar = rtt / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+            self._srtt = 0.875 * self._srtt + 0.125 * rtt
+        self.timeout = min(
+            max(self._srtt + 4 * self._rttvar, self.min_timeout), ACK_MAX_TIMEOUT
+        )
+
+    def next_retransmission(self, now: float):
+        """
+        Returns the outstanding fragment whose retry is due. Fragments
+        which have used up all of their retries are given up
+
+        Parameters
+        ==========
+        now: float
+            Current time (time.monotonic)
+
+        Returns
+        =======
+        fragment: TrackedFragment | None
+            The fragment that is to be sent again; call retransmitted()
+            after sending it
+        """
+        due = None
+        with self._lock:
+            for msgno, fragment in list(self._outstanding.items()):
+                if fragment.deadline > now:
+                    continue
+                if fragment.attempts > self.max_retries:
+                    del self._outstanding[msgno]
+                    self.timed_out_fragments += 1
+                    self.failed_messages += 1
+                    self._completed.append((fragment, "timeout"))
+                elif due is None or fragment.deadline < due.deadline:
+                    due = fragment
+        return due
+
+    def retransmitted(self, fragment: TrackedFragment, now: float):
+        """
+        Registers the retry of a fragment; the timeout doubles with each retry
+
+        Parameters
+        ==========
+        fragment: TrackedFragment
+            The fragment, see next_retransmission()
+        now: float
+            Current time (time.monotonic)
+
+        Returns
+        =======
+        """
+        with self._lock:
+            fragment.attempts += 1
+            fragment.deadline = now + min(
+                self.timeout * 2 ** (fragment.attempts - 1), ACK_MAX_TIMEOUT
+            )
+            self.retransmissions += 1
+        logger.debug(
+            msg=f"No ack for message number {fragment.msgno} from "
+            f"'{fragment.destination}'; "
+            f"retry {fragment.attempts - 1}/{self.max_retries}"
+        )
+
+    def pop_completed(self):
+        """
+        Returns (and forgets) all fragments whose tracking has ended
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        completed: list
+            Tuples of (TrackedFragment, outcome); outcome is 'ack',
+            'rej' or 'timeout'
+        """
+        with self._lock:
+            completed = list(self._completed)
+            self._completed.clear()
+        return completed
+
+    def time_until_deadline(self, now: float):
+        """
+        Returns the time span until the next retry is due
+
+        Parameters
+        ==========
+        now: float
+            Current time (time.monotonic)
+
+        Returns
+        =======
+        wait: float | None
+            Seconds until the next retry is due (0 = due now);
+            None if no fragments are outstanding
+        """
+        with self._lock:
+            if not self._outstanding:
+                return None
+            deadline = min(fragment.deadline for fragment in self._outstanding.values())
+        return max(deadline - now, 0.0)
+
+    def get_status(self):
+        """
+        Returns the tracker's counters
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        status: dict
+            Delivered and failed messages, fragment outcomes, number
+            of retries and the current retry timeout
+        """
+        return {
+            "delivered_messages": self.delivered_messages,
+            "failed_messages": self.failed_messages,
+            "outstanding_fragments": self.outstanding,
+            "acked_fragments": self.acked_fragments,
+            "rejected_fragments": self.rejected_fragments,
+            "timed_out_fragments": self.timed_out_fragments,
+            "retransmissions": self.retransmissions,
+            "timeout_seconds": round(self.timeout, 3),
+        }
+
+
+if __name__ == "__main__":
+    pass
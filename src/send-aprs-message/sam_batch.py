@@ -0,0 +1,258 @@
+#
+# send-aprs-message
+# Batch send mode (NDJSON or CSV records)
+# Author: Joerg Schultze-Lutter, 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import aprslib
+import asyncio
+import csv
+import json
+import time
+from sam_messages import is_valid_callsign
+from sam_ack import ACK_MAX_RETRIES, ACK_TIMEOUT
+from sam_dedup import OutboundDeduplicator
+from sam_server_pool import AprsIsServerPool
+from sam_transport import AsyncAprsIsTransport
+from sam_logger import logger
+
+
+def read_batch_records(batch_file, batch_format: str = "auto"):
+    """
+    Reads the records of a batch file. NDJSON files contain one JSON object
+    per line ("to_callsign", "message" and the optional
+    "numeric_message_pagination"); CSV files contain the TO call sign and
+    the message in the first two columns and may start with a header line
+
+    Parameters
+    ==========
+    batch_file: file object
+        The opened batch file
+    batch_format: str
+        auto, ndjson or csv. 'auto' checks the first non-empty line
+        for a JSON object
+
+    Returns
+    =======
+    records: list
+        Tuples of (line number, to_callsign, message, pagination | None)
+    errors: list
+        Error messages for all lines which could not be read
+    """
+    lines = batch_file.read().splitlines()
+    if batch_format == "auto":
+        first_line = next((line for line in lines if line.strip()), "")
+        batch_format = "ndjson" if first_line.lstrip().startswith("{") else "csv"
+
+    records = []
+    errors = []
+    if batch_format == "ndjson":
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("not a JSON object")
+            except ValueError as ex:
+                errors.append(f"line {line_number}: invalid JSON record ({ex})")
+                continue
+            pagination = record.get("numeric_message_pagination")
+            records.append(
+                (
+                    line_number,
+                    str(record.get("to_callsign", "")),
+                    str(record.get("message", "")),
+                    None if pagination is None else bool(pagination),
+                )
+            )
+    else:
+        for line_number, row in enumerate(csv.reader(lines), start=1):
+            if not row or not "".join(row).strip():
+                continue
+            # Optional header line
+            if line_number == 1 and row[0].strip().lower() in (
+                "to_callsign",
+                "callsign",
+            ):
+                continue
+            if len(row) < 2:
+                errors.append(f"line {line_number}: expected 'to_callsign,message'")
+                continue
+            records.append((line_number, row[0].strip(), row[1], None))
+    return records, errors
+
+
+def run_batch(
+    from_callsign: str,
+    passcode: str,
+    batch_file,
+    batch_format: str = "auto",
+    numeric_message_pagination: bool = False,
+    simulate_send: bool = False,
+    packet_delay: float = 10.0,
+    packet_delay_last_message: float = 1.0,
+    channel_delay: float = 1.0,
+    ack_tracking: bool = False,
+    ack_timeout: float = ACK_TIMEOUT,
+    ack_retries: int = ACK_MAX_RETRIES,
+    server_pool: AprsIsServerPool | None = None,
+    deduplicator: OutboundDeduplicator | None = None,
+    merge_messages: bool = False,
+):
+    """
+    Validates all records of a batch file and sends their messages
+    over a single APRS-IS connection (see AsyncAprsIsTransport). Nothing
+    gets sent if any of the records is invalid. The messages are paced
+    by a PacingScheduler; the batch is aborted if the connection drops
+
+    Parameters
+    ==========
+    from_callsign: str
+        Our very own call sign
+    passcode: str
+        APRS-IS passcode for our call sign
+    batch_file: file object
+        The opened batch file
+    batch_format: str
+        auto, ndjson or csv
+    numeric_message_pagination: bool
+        Default setting for records without their own pagination setting
+    simulate_send: bool
+        If True: only send the messages to our logger
+    packet_delay: float
+        Min. spacing between two fragments of the same message
+    packet_delay_last_message: float
+        Min. spacing after the last fragment of a message (same destination)
+    channel_delay: float
+        Min. spacing between any two packets
+    ack_tracking: bool
+        Send the fragments with message numbers and retry
+        unacknowledged fragments (ignored in simulation mode)
+    ack_timeout: float
+        Initial retry timeout in seconds
+    ack_retries: int
+        Max. number of retries per fragment
+    server_pool: AprsIsServerPool | None
+        APRS-IS servers; None = aprsis_server_name / aprsis_server_port
+    deduplicator: OutboundDeduplicator | None
+        Optional deduplicator; duplicate records are not sent
+    merge_messages: bool
+        Merge the messages to the same destination into fewer fragments,
+        see PendingMessageMerger
+
+    Returns
+    =======
+    summary: dict
+        Number of records, invalid records, sent messages/fragments,
+        unsent messages and the elapsed time; with ack tracking, the
+        tracker's counters (see AckTracker.get_status); with
+        deduplication / merging, the number of duplicate / merged records
+    """
+    start = time.monotonic()
+    records, errors = read_batch_records(
+        batch_file=batch_file, batch_format=batch_format
+    )
+    read_errors = len(errors)
+
+    # Validate everything before we connect to APRS-IS
+    batch = []
+    for line_number, to_callsign, message, pagination in records:
+        to_callsign = to_callsign.upper()
+        if pagination is None:
+            pagination = numeric_message_pagination
+        if not is_valid_callsign(to_callsign):
+            errors.append(f"line {line_number}: invalid TO call sign '{to_callsign}'")
+        elif len(message) < 1:
+            errors.append(f"line {line_number}: APRS message is empty")
+        else:
+            batch.append((to_callsign, message, pagination))
+    summary = {
+        "records": len(records) + read_errors,
+        "invalid_records": len(errors),
+        "sent_messages": 0,
+        "sent_fragments": 0,
+        "unsent_messages": 0,
+        "elapsed_seconds": 0.0,
+    }
+    for error in errors:
+        logger.error(msg=error)
+    if errors:
+        logger.error(msg="Batch contains invalid records; nothing has been sent")
+        summary["unsent_messages"] = len(batch)
+        summary["elapsed_seconds"] = round(time.monotonic() - start, 3)
+        return summary
+
+    async def send_batch():
+        transport = AsyncAprsIsTransport(
+            callsign=from_callsign,
+            passcode=passcode,
+            server_pool=server_pool,
+            simulate_send=simulate_send,
+            packet_delay=packet_delay,
+            packet_delay_last_message=packet_delay_last_message,
+            channel_delay=channel_delay,
+            ack_tracking=ack_tracking,
+            ack_timeout=ack_timeout,
+            ack_retries=ack_retries,
+            deduplicator=deduplicator,
+            merge_window=0.0 if merge_messages else None,
+            reconnect=False,
+        )
+        # Queue everything before we connect to APRS-IS
+        futures = []
+        duplicate_messages = 0
+        for to_callsign, message, pagination in batch:
+            _, _, merged, future = transport.queue_message(
+                to_callsign=to_callsign,
+                message=message,
+                numeric_message_pagination=pagination,
+            )
+            if future is None:
+                duplicate_messages += 1
+            elif not merged:
+                futures.append(future)
+        if deduplicator is not None:
+            summary["duplicate_messages"] = duplicate_messages
+        if transport.merger is not None:
+            summary["merged_messages"] = transport.merger.merged_messages
+        if not futures:
+            return
+
+        try:
+            await transport.start()
+        except aprslib.exceptions.ConnectionError as ex:
+            logger.error(msg=f"Unable to connect to APRS-IS: {ex}")
+            summary["unsent_messages"] = len(futures)
+            await transport.close()
+            return
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        summary["sent_messages"] = transport.sent_messages
+        summary["sent_fragments"] = transport.sent_fragments
+        # Failed messages (e.g. rejected or not acknowledged) resolve to
+        # False, messages which are lost with the connection to an exception
+        summary["unsent_messages"] = sum(result is not True for result in results)
+        if transport.ack_tracker is not None:
+            summary["ack_tracking"] = transport.ack_tracker.get_status()
+        await transport.close()
+
+    asyncio.run(send_batch())
+    summary["elapsed_seconds"] = round(time.monotonic() - start, 3)
+    return summary
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,297 @@
+#
+# send-aprs-message
+# Daemon mode: sends the messages of local clients (Unix domain
+# socket) over a single APRS-IS connection
+# Author: Joerg Schultze-Lutter, 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import aprslib
+import asyncio
+import json
+import os
+import signal
+from sam_ack import ACK_MAX_RETRIES, ACK_TIMEOUT
+from sam_dedup import OutboundDeduplicator
+from sam_server_pool import AprsIsServerPool
+from sam_transport import AsyncAprsIsTransport
+from sam_logger import logger
+
+
+# Default Unix domain socket of the daemon mode
+DEFAULT_DAEMON_SOCKET = "send-aprs-message.sock"
+
+# Max. number of messages which the daemon keeps in its queue
+DAEMON_MAX_QUEUED_MESSAGES = 1000
+
+
+class MessageDaemon:
+    def __init__(
+        self,
+        from_callsign: str,
+        passcode: str,
+        socket_path: str,
+        simulate_send: bool = False,
+        packet_delay: float = 10.0,
+        packet_delay_last_message: float = 1.0,
+        channel_delay: float = 1.0,
+        ack_tracking: bool = False,
+        ack_timeout: float = ACK_TIMEOUT,
+        ack_retries: int = ACK_MAX_RETRIES,
+        server_pool: AprsIsServerPool | None = None,
+        deduplicator: OutboundDeduplicator | None = None,
+        merge_window: float | None = None,
+    ):
+        """
+        Keeps a single APRS-IS session open and sends the messages which
+        local clients submit via a Unix domain socket. The session, its
+        reconnects and the pacing of the queued messages are handled by
+        an AsyncAprsIsTransport
+
+        Parameters
+        ==========
+        from_callsign: str
+            Our very own call sign
+        passcode: str
+            APRS-IS passcode for our call sign
+        socket_path: str
+            File name of the Unix domain socket
+        simulate_send: bool
+            If True: do not connect to APRS-IS, only send the messages to our logger
+        packet_delay: float
+            Min. spacing between two fragments of the same message
+        packet_delay_last_message: float
+            Min. spacing after the last fragment of a message (same destination)
+        channel_delay: float
+            Min. spacing between any two packets
+        ack_tracking: bool
+            Send the fragments with message numbers and retry
+            unacknowledged fragments (ignored in simulation mode)
+        ack_timeout: float
+            Initial retry timeout in seconds
+        ack_retries: int
+            Max. number of retries per fragment
+        server_pool: AprsIsServerPool | None
+            APRS-IS servers; reconnects fail over to the next server.
+            None = aprsis_server_name / aprsis_server_port
+        deduplicator: OutboundDeduplicator | None
+            Optional deduplicator; duplicate messages are not queued
+        merge_window: float | None
+            Merge queued messages to the same destination, see
+            PendingMessageMerger; None = do not merge
+
+        Returns
+        =======
+        """
+        self.socket_path = socket_path
+        # Filter for messages which are addressed to us (e.g. acks)
+        self.transport = AsyncAprsIsTransport(
+            callsign=from_callsign,
+            passcode=passcode,
+            server_pool=server_pool,
+            aprs_filter=f"g/{from_callsign}",
+            simulate_send=simulate_send,
+            packet_delay=packet_delay,
+            packet_delay_last_message=packet_delay_last_message,
+            channel_delay=channel_delay,
+            ack_tracking=ack_tracking,
+            ack_timeout=ack_timeout,
+            ack_retries=ack_retries,
+            deduplicator=deduplicator,
+            merge_window=merge_window,
+        )
+        self._stop = None
+
+    def submit(
+        self, to_callsign: str, message: str, numeric_message_pagination: bool = False
+    ):
+        """
+        Validates a message and adds it to the send queue
+
+        Parameters
+        ==========
+        to_callsign: str
+            APRS TO callsign (recipient)
+        message: str
+            The APRS message text
+        numeric_message_pagination: bool
+            Add message enumeration to each outgoing APRS message
+
+        Returns
+        =======
+        response: dict
+            Response for the client: status 'queued' (plus message ID and
+            number of fragments; for a merged message, the ID of the
+            message that it has been merged into), 'duplicate' or 'error'
+            (plus error message)
+        """
+        if self.transport.scheduler.pending_messages >= DAEMON_MAX_QUEUED_MESSAGES:
+            return {"status": "error", "error": "send queue is full"}
+        try:
+            message_id, fragments, merged, future = self.transport.queue_message(
+                to_callsign=to_callsign,
+                message=message,
+                numeric_message_pagination=numeric_message_pagination,
+            )
+        except ValueError as ex:
+            return {"status": "error", "error": str(ex)}
+        except aprslib.exceptions.ConnectionError as ex:
+            # The transport's send loop has terminated
+            return {"status": "error", "error": f"unable to send messages: {ex}"}
+        if future is None:
+            return {"status": "duplicate"}
+        if not merged:
+            future.add_done_callback(self._message_done)
+        logger.debug(
+            msg=f"Queued message {message_id} for '{to_callsign.upper()}' "
+            f"({len(fragments)} fragment(s){', merged' if merged else ''})"
+        )
+        response = {
+            "status": "queued",
+            "message_id": message_id,
+            "fragments": len(fragments),
+            "queued_messages": self.transport.scheduler.pending_messages,
+        }
+        if merged:
+            response["merged"] = True
+        return response
+
+    def get_status(self):
+        """
+        Returns the daemon's current state
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        status: dict
+            Connection state, queue length and number of sent messages;
+            with ack tracking, the tracker's counters (see
+            AsyncAprsIsTransport.get_status)
+        """
+        return self.transport.get_status()
+
+    @staticmethod
+    def _message_done(future):
+        # Nobody waits for the daemon's messages; failures only get logged
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(msg=f"Unable to send message: {future.exception()}")
+
+    async def _handle_client(self, reader, writer):
+        """
+        Handles the requests of a local client. Each request and each
+        response is a single line with a JSON object:
+
+        {"to_callsign": "DF1JSL-1", "message": "...", "numeric_message_pagination": false}
+        {"command": "status"}
+        """
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request is not a JSON object")
+                except ValueError as ex:
+                    response = {"status": "error", "error": f"invalid request: {ex}"}
+                else:
+                    if request.get("command") == "status":
+                        response = self.get_status()
+                    else:
+                        response = self.submit(
+                            to_callsign=str(request.get("to_callsign", "")),
+                            message=str(request.get("message", "")),
+                            numeric_message_pagination=bool(
+                                request.get("numeric_message_pagination", False)
+                            ),
+                        )
+                writer.write(f"{json.dumps(response)}\n".encode("utf-8"))
+                await writer.drain()
+        except (OSError, ValueError) as ex:
+            logger.debug(msg=f"Daemon client has disconnected: {ex}")
+        finally:
+            writer.close()
+
+    def stop(self):
+        """
+        Stops the daemon (handler for SIGTERM and SIGINT)
+        """
+        if self._stop is not None:
+            self._stop.set()
+
+    async def _run(self):
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stop)
+
+        try:
+            # Remove the socket file from a previous run
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            server = await asyncio.start_unix_server(
+                self._handle_client, path=self.socket_path
+            )
+            # Only the daemon's user may submit messages
+            os.chmod(self.socket_path, 0o600)
+        except OSError as ex:
+            logger.error(msg=f"Unable to create daemon socket: {ex}")
+            return False
+        logger.info(msg=f"Accepting messages on Unix socket '{self.socket_path}'")
+
+        # Messages get queued while we are (re-)connecting to APRS-IS
+        starter = asyncio.create_task(self.transport.start(blocking=True))
+        await self._stop.wait()
+        starter.cancel()
+        server.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        scheduler = self.transport.scheduler
+        if scheduler.pending_messages:
+            logger.warning(
+                msg=f"Discarding {scheduler.pending_messages} unsent message(s)"
+            )
+        ack_tracker = self.transport.ack_tracker
+        if ack_tracker is not None and ack_tracker.outstanding:
+            logger.warning(
+                msg=f"Giving up on {ack_tracker.outstanding} unacknowledged "
+                f"fragment(s)"
+            )
+        await self.transport.close()
+        logger.info(
+            msg=f"Daemon stopped after sending {self.transport.sent_messages} "
+            f"message(s)"
+        )
+        return True
+
+    def run(self):
+        """
+        Starts the daemon socket, connects to APRS-IS and sends the queued
+        messages until the daemon gets terminated
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        success: bool
+            False if the daemon socket could not be created
+        """
+        return asyncio.run(self._run())
+
+
+if __name__ == "__main__":
+    pass
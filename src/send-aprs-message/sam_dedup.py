@@ -0,0 +1,362 @@
+#
+# send-aprs-message
+# Outbound deduplication and merging of queued messages
+# Author: Joerg Schultze-Lutter, 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import hashlib
+import json
+import os
+import threading
+import time
+from sam_messages import normalize_aprs_text, prepare_aprs_messages
+from sam_pacing import PacingScheduler
+from sam_logger import logger
+
+
+# Outbound deduplication: file for the recently sent messages (hashes of
+# call sign and normalized text); separator between merged messages
+DEFAULT_DEDUP_STATE_FILE = "send-aprs-message-dedup.json"
+MESSAGE_MERGE_SEPARATOR = "; "
+
+
+class OutboundDeduplicator:
+    def __init__(self, window: float, state_file: str = ""):
+        """
+        Suppresses outgoing messages whose text has already been sent to the
+        same destination within the last 'window' seconds. Messages are
+        compared by their destination and their normalized text (APRS
+        character normalization, collapsed whitespace). The window starts
+        with the first copy of a message; a status text which a script
+        repeats every minute is thus sent once per window. A message only
+        counts as sent once it has been delivered (see release); while
+        it is still queued, further copies are suppressed as well. The
+        keys are kept as hashes in an optional JSON file, thus subsequent
+        program runs share the window.
+
+        This class is thread-safe.
+
+        Parameters
+        ==========
+        window: float
+            Time span in seconds during which a message is not sent again
+        state_file: str
+            JSON file for the sent messages; empty string = do not keep
+            the state between runs
+
+        Returns
+        =======
+        """
+        self.window = window
+        self.state_file = state_file
+        self.suppressed_messages = 0
+        # message key -> time (time.time) of the last sent copy
+        self._sent = {}
+        # keys of the messages which are queued but not sent yet
+        self._in_flight = set()
+        # True if _sent has changed since the last save_state
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load_state()
+
+    @staticmethod
+    def message_key(destination: str, message: str):
+        text = " ".join(normalize_aprs_text(message_string=message).split())
+        return hashlib.sha256(
+            f"{destination.upper()}\n{text}".encode("utf-8")
+        ).hexdigest()[:32]
+
+    def _load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as state_file:
+                sent = json.load(state_file)["sent"]
+            now = time.time()
+            self._sent = {
+                key: float(value)
+                for key, value in sent.items()
+                if now - float(value) < self.window
+            }
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as ex:
+            logger.warning(
+                msg=f"Ignoring deduplication state file '{self.state_file}': {ex}"
+            )
+
+    def save_state(self):
+        """
+        Writes the sent messages (within the window) to the state file
+        if they have changed since the last call
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        """
+        if not self.state_file:
+            return
+        now = time.time()
+        with self._lock:
+            if not self._dirty:
+                return
+            self._sent = {
+                key: value
+                for key, value in self._sent.items()
+                if now - value < self.window
+            }
+            temp_file = f"{self.state_file}.tmp"
+            try:
+                with open(temp_file, "w", encoding="utf-8") as state_file:
+                    json.dump({"sent": self._sent}, state_file)
+                os.replace(temp_file, self.state_file)
+                self._dirty = False
+            except OSError as ex:
+                logger.warning(
+                    msg=f"Unable to write deduplication state file "
+                    f"'{self.state_file}': {ex}"
+                )
+
+    def is_duplicate(self, destination: str, message: str, now: float | None = None):
+        """
+        Checks whether a message has been sent within the window
+
+        Parameters
+        ==========
+        destination: str
+            Target user call sign
+        message: str
+            The message text
+        now: float | None
+            Current time (time.time); None = now
+
+        Returns
+        =======
+        duplicate: bool
+            True if the message must not be sent again
+        """
+        now = time.time() if now is None else now
+        key = self.message_key(destination=destination, message=message)
+        with self._lock:
+            sent = self._sent.get(key)
+        return sent is not None and now - sent < self.window
+
+    def record(self, destination: str, message: str, now: float | None = None):
+        """
+        Registers a message which has been sent
+
+        Parameters
+        ==========
+        destination: str
+            Target user call sign
+        message: str
+            The message text
+        now: float | None
+            Current time (time.time); None = now
+
+        Returns
+        =======
+        """
+        now = time.time() if now is None else now
+        key = self.message_key(destination=destination, message=message)
+        with self._lock:
+            self._sent[key] = now
+            self._dirty = True
+
+    def reserve(self, destination: str, message: str, now: float | None = None):
+        """
+        Marks a message as queued unless it is a duplicate, i.e. unless it
+        has been sent within the window or is still queued. Each reserved
+        message must be passed to release once it has been sent (or has
+        failed)
+
+        Parameters
+        ==========
+        destination: str
+            Target user call sign
+        message: str
+            The message text
+        now: float | None
+            Current time (time.time); None = now
+
+        Returns
+        =======
+        key: str | None
+            The message's key for release; None if the message has been
+            suppressed as a duplicate
+        """
+        now = time.time() if now is None else now
+        key = self.message_key(destination=destination, message=message)
+        with self._lock:
+            sent = self._sent.get(key)
+            if key in self._in_flight or (
+                sent is not None and now - sent < self.window
+            ):
+                self.suppressed_messages += 1
+                duplicate = True
+            else:
+                self._in_flight.add(key)
+                duplicate = False
+        if duplicate:
+            logger.info(
+                msg=f"Suppressed duplicate message to '{destination}' "
+                f"(already sent within the last {self.window:g} seconds)"
+            )
+            return None
+        return key
+
+    def release(self, key: str, sent: bool, now: float | None = None):
+        """
+        Releases a reserved message. Only a sent message starts the window;
+        a failed one may be sent again right away
+
+        Parameters
+        ==========
+        key: str
+            The message's key, see reserve
+        sent: bool
+            True if the message has been sent (with ack tracking:
+            acknowledged)
+        now: float | None
+            Current time (time.time); None = now
+
+        Returns
+        =======
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._in_flight.discard(key)
+            if sent:
+                self._sent[key] = now
+                self._dirty = True
+
+
+class PendingMessageMerger:
+    def __init__(self, scheduler: PacingScheduler, merge_window: float = 0.0):
+        """
+        Merges messages to the same destination which are waiting in a
+        PacingScheduler. A new message gets appended to the destination's
+        last queued message (separated by MESSAGE_MERGE_SEPARATOR) if none
+        of that message's fragments has been sent yet and if the merged
+        text needs fewer fragments than both messages on their own. With
+        a merge window, the first message to an idle destination is held
+        back for that many seconds, thus subsequent short messages can
+        still be merged.
+
+        Parameters
+        ==========
+        scheduler: PacingScheduler
+            The scheduler which sends the messages
+        merge_window: float
+            Time span in seconds for which a message to an idle
+            destination is held back (0 = not held back)
+
+        Returns
+        =======
+        """
+        self.scheduler = scheduler
+        self.merge_window = merge_window
+        self.merged_messages = 0
+        # destination -> [message ID, text, pagination, number of fragments]
+        self._candidates = {}
+
+    def add(
+        self,
+        destination: str,
+        message: str,
+        message_id,
+        numeric_message_pagination: bool = False,
+        now: float | None = None,
+    ):
+        """
+        Splits up a message and adds it to the scheduler, either as a new
+        message or merged into the destination's last queued message
+
+        Parameters
+        ==========
+        destination: str
+            Target user call sign
+        message: str
+            The message text
+        message_id: any
+            ID for the message if it does not get merged
+        numeric_message_pagination: bool
+            Add message enumeration to each outgoing APRS message
+        now: float | None
+            Current time (time.monotonic); None = now
+
+        Returns
+        =======
+        message_id: any
+            The message's ID; for a merged message, the ID of the message
+            that it has been merged into
+        fragments: list
+            The APRS message texts which are queued under this ID
+        merged: bool
+            True if the message has been merged
+        """
+        fragments = prepare_aprs_messages(
+            message=message, numeric_message_pagination=numeric_message_pagination
+        )
+        candidate = self._candidates.get(destination)
+        if candidate and candidate[2] == numeric_message_pagination:
+            merged_text = f"{candidate[1]}{MESSAGE_MERGE_SEPARATOR}{message}"
+            merged_fragments = prepare_aprs_messages(
+                message=merged_text,
+                numeric_message_pagination=numeric_message_pagination,
+            )
+            if len(merged_fragments) < candidate[3] + len(
+                fragments
+            ) and self.scheduler.replace_message(
+                destination=destination,
+                message_id=candidate[0],
+                fragments=merged_fragments,
+                pending_fragments=candidate[3],
+            ):
+                candidate[1] = merged_text
+                candidate[3] = len(merged_fragments)
+                self.merged_messages += 1
+                logger.debug(
+                    msg=f"Merged message into message {candidate[0]} "
+                    f"for '{destination}'"
+                )
+                return candidate[0], merged_fragments, True
+
+        now = time.monotonic() if now is None else now
+        self.scheduler.add(
+            destination=destination,
+            fragments=fragments,
+            message_id=message_id,
+            not_before=now + self.merge_window if self.merge_window > 0 else None,
+        )
+        self._candidates[destination] = [
+            message_id,
+            message,
+            numeric_message_pagination,
+            len(fragments),
+        ]
+        # Forget the destinations which no longer have queued messages
+        if len(self._candidates) > self.scheduler.pending_messages + 1000:
+            self._candidates = {
+                key: value
+                for key, value in self._candidates.items()
+                if self.scheduler.has_pending(destination=key)
+            }
+        return message_id, fragments, False
+
+
+if __name__ == "__main__":
+    pass
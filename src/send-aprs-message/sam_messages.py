@@ -0,0 +1,434 @@
+#
+# send-aprs-message
+# APRS message text: call sign check, normalization and splitting
+# of the message text into APRS message fragments
+# Author: Joerg Schultze-Lutter, 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import re
+from unidecode import unidecode
+from sam_logger import logger
+
+
+# Default APRS message lengths
+# 67 = standard APRS message
+# 59 = APRS message with numeric message ID
+APRS_MSG_LEN_NOTRAILING = 67
+APRS_MSG_LEN_TRAILING = 59
+
+# Characters which are not permitted in APRS messages
+# Details: see APRS specification chapter 15 taken from
+# https://github.com/wb2osz/aprsspec
+# "Messages, Bulletins and Announcements"
+regex_forbidden_aprs_characters = re.compile("[{}|~]+")
+
+# ASCII conversion of outgoing messages. unidecode does not take care of
+# German special characters, therefore we 'translate' them first
+APRS_ASCII_REPLACEMENTS = {
+    "Ä": "Ae",
+    "Ö": "Oe",
+    "Ü": "Ue",
+    "ä": "ae",
+    "ö": "oe",
+    "ü": "ue",
+    "ß": "ss",
+}
+
+# Call sign with or without SSID
+regex_callsign = re.compile(r"\b^([A-Z0-9]{1,3}[0-9][A-Z0-9]{0,3})(-[A-Z0-9]{1,2})?$\b")
+
+
+def is_valid_callsign(callsign: str):
+    """
+    Checks whether a call sign (with or without SSID) is valid
+
+    Parameters
+    ==========
+    callsign: str
+        The call sign in upper case
+
+    Returns
+    =======
+    valid: bool
+        True if the call sign matches a valid call sign format
+    """
+    return regex_callsign.search(callsign) is not None
+
+
+def make_pretty_aprs_messages(
+    message_to_add: str,
+    max_len: int,
+    destination_list: list = None,
+    separator_char: str = " ",
+    add_sep: bool = True,
+    force_outgoing_unicode_messages: bool = False,
+) -> list:
+    """
+    Pretty Printer for APRS messages. As APRS messages are likely to be split
+    up (due to the 67 chars message len limitation), this function prevents
+    'hard cuts'. Any information that is to be injected into message
+    destination list is going to be checked wrt its length. If
+    len(current content) + len(message_to_add) exceeds the max_len value,
+    the content will not be added to the current list string but to a new
+    string in the list.
+
+    Example:
+
+    current APRS message = 1111111111222222222233333333333444444444455555555556666666666
+
+    Add String "Hello World !!!!" (16 chars)
+
+    Add the string the 'conventional' way:
+
+    Message changes to
+    Line 1 = 1111111111222222222233333333333444444444455555555556666666666Hello W
+    Line 2 = orld !!!!
+
+    This function however returns:
+    Line 1 = 1111111111222222222233333333333444444444455555555556666666666
+    Line 2 = Hello World !!!!
+
+    In case the to-be-added text exceeds 67 characters due to whatever reason,
+    this function first tries to split up the content based on space characters
+    in the text and insert the resulting elements word by word, thus preventing
+    the program from ripping the content apart. However, if the content consists
+    of one or multiple strings which _do_ exceed the maximum text len, then there
+    is nothing that we can do. In this case, we will split up the text into 1..n
+    chunks of text and add it to the list element.
+
+    Known issues: if the separator_char is different from its default setting
+    (space), the second element that is inserted into the list may have an
+    additional separator char in the text
+
+    Parameters
+    ==========
+    message_to_add: str
+        message string that is to be added to the list in a pretty way
+        If string is longer than 67 chars, we will truncate the information
+    destination_list: list
+        List with string elements which will be enriched with the
+        'mesage_to_add' string. Default: empty list aka user wants new list
+    max_len: int:
+        Max length of the list's string len.
+        The length is dependent on whether the user has activated trailing
+        message number information in the outgoing message or not.
+        When activated, the message length is 59 - otherwise, it is 67.
+    separator_char: str
+        Separator that is going to be used for dividing the single
+        elements that the user is going to add
+    add_sep: bool
+        True = we will add the separator when more than one item
+               is in our string. This is the default
+        False = do not add the separator (e.g. if we add the
+                very first line of text, then we don't want a
+                comma straight after the location
+    force_outgoing_unicode_messages: bool
+        False = all outgoing UTF-8 content will be down-converted
+                to ASCII content
+        True = all outgoing UTF-8 content will sent out 'as is'
+
+    Returns
+    =======
+    destination_list: list
+        List array, containing 1..n human readable strings with
+        the "message_to_add' input data
+    """
+    # Dummy handler in case the list is completely empty
+    # or a reference to a list item has not been specified at all
+    # In this case, create an empty list
+    if not destination_list:
+        destination_list = []
+
+    # remove non-permitted APRS characters as APRS-IS might choke on this
+    # content and convert the message to plain ascii (unless requested
+    # otherwise)
+    message_to_add = normalize_aprs_text(
+        message_string=message_to_add,
+        force_outgoing_unicode_messages=force_outgoing_unicode_messages,
+    )
+
+    # If new message is longer than max len then split it up into words
+    # and pack the words into the list in a single pass. Words which exceed
+    # max_len are split up into chunks of max_len bytes and added as is.
+    # This should never happen but better safe than sorry.
+    # Keep in mind that we only transport plain text anyway.
+    if len(message_to_add) > max_len:
+        split_data = message_to_add.split()
+    else:
+        split_data = [message_to_add]
+
+    for split in split_data:
+        if len(split) >= max_len:
+            # string exceeds max len; split it up and add it as is
+            destination_list.extend(
+                split_string_to_string_list(message_string=split, max_len=max_len)
+            )
+            continue
+
+        # element + new string > max len? no: add to existing string, else create new element in list
+        if destination_list:
+            string_from_list = destination_list[-1]
+            if len(string_from_list) + len(split) + 1 <= max_len:
+                delimiter = ""
+                if len(string_from_list) > 0 and add_sep:
+                    delimiter = separator_char
+                destination_list[-1] = string_from_list + delimiter + split
+                continue
+        destination_list.append(split)
+
+    return destination_list
+
+
+def split_string_to_string_list(message_string: str, max_len: int):
+    """
+    Force-split the string into chunks of max_len size and return a list of
+    strings. This function is going to be called if the string that the user
+    wants to insert exceeds more than e.g. 67 characters. In this unlikely
+    case, we may not be able to add the string in a pretty format - but
+    we will split it up for the user and ensure that none of the data is lost
+
+    Parameters
+    ==========
+    message_string: str
+        message string that is to be divided into 1..n strings of 'max_len"
+        text length
+    max_len: int:
+        Default: 67; set to 59 in case of pagination
+
+    Returns
+    =======
+    split_strings: list
+        List array, containing 1..n strings with a max len of 'max_len'
+    """
+    split_strings = [
+        message_string[index : index + max_len]
+        for index in range(0, len(message_string), max_len)
+    ]
+    return split_strings
+
+
+def convert_text_to_plain_ascii(message_string: str):
+    """
+    Converts a string to plain ASCII
+    Parameters
+    ==========
+    message_string: str
+        Text that needs to be converted
+    Returns
+    =======
+    hex-converted text to the user
+    """
+    for character, replacement in APRS_ASCII_REPLACEMENTS.items():
+        if character in message_string:
+            message_string = message_string.replace(character, replacement)
+    if not message_string.isascii():
+        message_string = unidecode(message_string)
+    return message_string
+
+
+def has_forbidden_aprs_characters(message_string: str):
+    """
+    Checks whether a text contains characters which are not permitted in
+    APRS messages. These characters are rare; four substring searches are
+    much cheaper than a regular expression substitution
+
+    Parameters
+    ==========
+    message_string: str
+        Text that needs to be checked
+
+    Returns
+    =======
+    found: bool
+        True if the text contains at least one non-permitted character
+    """
+    return (
+        "{" in message_string
+        or "}" in message_string
+        or "|" in message_string
+        or "~" in message_string
+    )
+
+
+def normalize_aprs_text(
+    message_string: str, force_outgoing_unicode_messages: bool = False
+):
+    """
+    Prepares a text for an outgoing APRS message: removes the characters
+    which are not permitted in APRS messages and converts the text to
+    plain ASCII. Pure ASCII text without non-permitted characters is
+    returned as is; unidecode only gets called if non-ASCII characters
+    remain after the replacement of the German special characters
+
+    Parameters
+    ==========
+    message_string: str
+        Text that needs to be converted
+    force_outgoing_unicode_messages: bool
+        False = convert the text to ASCII
+        True = keep the text's non-ASCII characters
+
+    Returns
+    =======
+    message_string: str
+        The normalized text
+    """
+    if has_forbidden_aprs_characters(message_string=message_string):
+        message_string = regex_forbidden_aprs_characters.sub("", message_string)
+    if force_outgoing_unicode_messages or message_string.isascii():
+        return message_string
+    message_string = convert_text_to_plain_ascii(message_string=message_string)
+    # unidecode may create non-permitted characters (e.g. '¦' -> '|')
+    if has_forbidden_aprs_characters(message_string=message_string):
+        message_string = regex_forbidden_aprs_characters.sub("", message_string)
+    return message_string
+
+
+def prepare_aprs_messages(message: str, numeric_message_pagination: bool = False):
+    """
+    Splits up a message text into 1..n APRS messages, including the
+    (optional) trailing message enumeration
+
+    Parameters
+    ==========
+    message: str
+        The message text
+    numeric_message_pagination: bool
+        Add message enumeration to each outgoing APRS message
+
+    Returns
+    =======
+    message_text_array: list
+        1..n APRS message texts
+    """
+    max_len = (
+        APRS_MSG_LEN_TRAILING if numeric_message_pagination else APRS_MSG_LEN_NOTRAILING
+    )
+    output_message = make_pretty_aprs_messages(message_to_add=message, max_len=max_len)
+    return finalize_pretty_aprs_messages(mylistarray=output_message, max_len=max_len)
+
+
+def format_aprs_message(
+    source_call_sign: str,
+    destination_call_sign: str,
+    message_text: str,
+    tocall: str = "APMPAD",
+    msgno: str | None = None,
+):
+    """
+    Builds the raw APRS-IS packet for a single APRS message
+
+    Parameters
+    ==========
+    source_call_sign: str
+        Our very own call sign
+    destination_call_sign: str
+        Target user call sign
+    message_text: str
+        The APRS message text (max. 67 characters)
+    tocall: str
+        This bot uses the default TOCALL ("APMPAD")
+    msgno: str | None
+        Optional APRS message number (1..5 characters); requests an ack
+        from the recipient
+
+    Returns
+    =======
+    packet: str
+        The raw APRS-IS packet
+    """
+    packet = f"{source_call_sign}>{tocall}::{destination_call_sign:9}:{message_text}"
+    if msgno:
+        packet += f"{{{msgno}"
+    return packet
+
+
+def finalize_pretty_aprs_messages(mylistarray: list, max_len: int) -> list:
+    """
+    Helper method which finalizes the prettified APRS messages
+    and triggers the addition of the trailing message numbers (if
+    activated by the user).
+
+    Parameters
+    ==========
+    mylistarray: list
+        List of APRS messages
+    max_len: int
+        maximum length of the message
+
+    Returns
+    =======
+    listitem: list
+        Either formatted list (if more than one list entry was present) or
+        the original list item
+    """
+    if max_len == APRS_MSG_LEN_TRAILING:
+        return format_list_with_enumeration(mylistarray=mylistarray)
+    else:
+        return mylistarray
+
+
+def format_list_with_enumeration(mylistarray: list) -> list:
+    """
+    Adds a trailing enumeration to the list if the user has activated this configuration in
+    the client's config file
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    listitem: list
+        Either formatted list (if more than one list entry was present) or
+        the original list item
+    """
+
+    max_total_length = APRS_MSG_LEN_NOTRAILING
+    annotation_length = APRS_MSG_LEN_NOTRAILING - APRS_MSG_LEN_TRAILING
+    max_content_length = max_total_length - annotation_length
+
+    # check if we have more than 99 entries. We always truncate the list (just to be
+    # on the safe side) but whenever more than 99 entries were detected, we also supply
+    # the user with a warning message and notify him about the truncation
+    if len(mylistarray) > 99:
+        logger.warning(
+            msg="User has supplied list with more than 99 elements; truncating"
+        )
+        trimmed_listarray = mylistarray[:98]
+        trimmed_listarray.append("[message truncated]")
+    else:
+        trimmed_listarray = mylistarray
+    total = len(trimmed_listarray)
+
+    # now let's add the enumeration to the list - but only if we have
+    # more than one list item in our outgoing list
+    if len(trimmed_listarray) > 1:
+        formatted_list = []
+        for i, s in enumerate(trimmed_listarray, start=1):
+            annotation = f" ({i:02d}/{total:02d})"
+            truncated = s[:max_content_length]
+            padded = truncated.ljust(max_content_length)
+            final = padded + annotation
+            formatted_list.append(final)
+
+        return formatted_list
+    else:
+        # return the original list to the user
+        return trimmed_listarray
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,377 @@
+#
+# send-aprs-message
+# Pacing scheduler for the outgoing APRS message fragments
+# Author: Joerg Schultze-Lutter, 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import heapq
+from collections import deque
+
+
+class PacingScheduler:
+    def __init__(
+        self,
+        packet_delay: float = 10.0,
+        packet_delay_last_message: float = 1.0,
+        channel_delay: float = 1.0,
+    ):
+        """
+        Pacing scheduler for the outgoing APRS messages. The spacing between
+        two packets to the same destination and the spacing between any two
+        packets on the channel are enforced separately; fragments for
+        different destinations get interleaved. Destinations which are
+        ready at the same time are served in round-robin order. With ack
+        tracking, a destination can be put on hold until the ack for its
+        last packet has arrived. The destinations which are due next are
+        kept in a heap, thus the cost per packet does not grow with the
+        number of destinations
+
+        Parameters
+        ==========
+        packet_delay: float
+            Min. spacing between two fragments of the same message
+        packet_delay_last_message: float
+            Min. spacing between the last fragment of a message and the
+            next packet to the same destination
+        channel_delay: float
+            Min. spacing between any two packets
+
+        Returns
+        =======
+        """
+        self.packet_delay = packet_delay
+        self.packet_delay_last_message = packet_delay_last_message
+        self.channel_delay = channel_delay
+        self.pending_messages = 0
+        self.pending_fragments = 0
+        # destination -> deque of (fragment, message ID, last fragment)
+        self._queues = {}
+        # destination -> earliest time for its next packet
+        self._ready = {}
+        # destinations which are waiting for an ack
+        self._held = set()
+        self._channel_ready = 0.0
+        # destination -> round-robin position; a destination gets a new
+        # position whenever it (re)enters the queues
+        self._positions = {}
+        self._next_position = 0
+        # (earliest time, round-robin position, destination) for the
+        # destinations with pending packets; entries of held destinations
+        # and entries with an outdated position get discarded lazily
+        self._heap = []
+
+    def add(
+        self,
+        destination: str,
+        fragments: list,
+        message_id=None,
+        not_before: float | None = None,
+    ):
+        """
+        Adds the fragments of a message to the destination's queue
+
+        Parameters
+        ==========
+        destination: str
+            Target user call sign
+        fragments: list
+            1..n APRS message texts
+        message_id: any
+            Optional ID which gets returned along with the fragments
+        not_before: float | None
+            Optional earliest time (time.monotonic) for the first fragment;
+            only applies if the destination has no other pending packets
+
+        Returns
+        =======
+        """
+        if not fragments:
+            return
+        destination_queue = self._queues.get(destination)
+        if destination_queue is None:
+            destination_queue = self._queues[destination] = deque()
+            if not_before is not None:
+                self._ready[destination] = max(
+                    self._ready.get(destination, 0.0), not_before
+                )
+            self._schedule(destination=destination, new_position=True)
+        for index, fragment in enumerate(fragments, start=1):
+            destination_queue.append((fragment, message_id, index == len(fragments)))
+        self.pending_messages += 1
+        self.pending_fragments += len(fragments)
+
+    def time_until_next(self, now: float):
+        """
+        Returns the time span until the next packet is due
+
+        Parameters
+        ==========
+        now: float
+            Current time (time.monotonic)
+
+        Returns
+        =======
+        wait: float | None
+            Seconds until the next packet is due (0 = due now);
+            None if no packets are pending (or if all destinations
+            with pending packets are on hold)
+        """
+        entry = self._next_entry()
+        if entry is None:
+            return None
+        return max(entry[0], self._channel_ready, now) - now
+
+    def _schedule(self, destination: str, new_position: bool = False):
+        if new_position:
+            self._positions[destination] = self._next_position
+            self._next_position += 1
+        if destination in self._held:
+            return
+        heapq.heappush(
+            self._heap,
+            (
+                self._ready.get(destination, 0.0),
+                self._positions[destination],
+                destination,
+            ),
+        )
+
+    def _next_entry(self):
+        # Discard the outdated entries at the top of the heap
+        while self._heap:
+            entry = self._heap[0]
+            destination = entry[2]
+            if (
+                destination not in self._held
+                and self._positions.get(destination) == entry[1]
+            ):
+                return entry
+            heapq.heappop(self._heap)
+        return None
+
+    def pop(self, now: float):
+        """
+        Removes the next due packet from the queues. Must only be called
+        if time_until_next() has returned 0
+
+        Parameters
+        ==========
+        now: float
+            Current time (time.monotonic)
+
+        Returns
+        =======
+        destination: str
+            Target user call sign
+        fragment: str
+            APRS message text
+        message_id: any
+            The message ID which has been passed to add()
+        last_fragment: bool
+            True if this is the last fragment of its message
+        """
+        self._next_entry()
+        _, _, destination = heapq.heappop(self._heap)
+        destination_queue = self._queues[destination]
+        fragment, message_id, last_fragment = destination_queue.popleft()
+
+        self._ready[destination] = now + (
+            self.packet_delay_last_message if last_fragment else self.packet_delay
+        )
+        # Re-insert the destination at the end (round-robin order)
+        if destination_queue:
+            self._schedule(destination=destination, new_position=True)
+        else:
+            del self._queues[destination]
+            del self._positions[destination]
+        self._channel_ready = now + self.channel_delay
+        self.pending_fragments -= 1
+        if last_fragment:
+            self.pending_messages -= 1
+
+        # Forget the spacing of destinations which have been idle for a while
+        if len(self._ready) > len(self._queues) + 1000:
+            self._ready = {
+                key: value
+                for key, value in self._ready.items()
+                if value > now or key in self._queues
+            }
+        return destination, fragment, message_id, last_fragment
+
+    def hold(self, destination: str):
+        """
+        Puts a destination on hold; its pending packets will not be sent
+        until release() gets called
+
+        Parameters
+        ==========
+        destination: str
+            Target user call sign
+
+        Returns
+        =======
+        """
+        self._held.add(destination)
+
+    def release(self, destination: str):
+        """
+        Releases a destination which has been put on hold. The regular
+        per-destination spacing still applies
+
+        Parameters
+        ==========
+        destination: str
+            Target user call sign
+
+        Returns
+        =======
+        """
+        if destination not in self._held:
+            return
+        self._held.discard(destination)
+        # The destination keeps its round-robin position
+        if destination in self._queues:
+            self._schedule(destination=destination)
+
+    def drop_message(self, destination: str, message_id):
+        """
+        Removes the remaining fragments of a message from the queue
+
+        Parameters
+        ==========
+        destination: str
+            Target user call sign
+        message_id: any
+            The message ID which has been passed to add()
+
+        Returns
+        =======
+        dropped: int
+            Number of removed fragments
+        """
+        destination_queue = self._queues.get(destination)
+        if not destination_queue:
+            return 0
+        remaining = deque(
+            entry for entry in destination_queue if entry[1] != message_id
+        )
+        dropped = len(destination_queue) - len(remaining)
+        if not dropped:
+            return 0
+        # The last fragment is always among the removed ones
+        self.pending_messages -= 1
+        self.pending_fragments -= dropped
+        if remaining:
+            self._queues[destination] = remaining
+        else:
+            del self._queues[destination]
+            del self._positions[destination]
+        return dropped
+
+    def replace_message(
+        self, destination: str, message_id, fragments: list, pending_fragments: int
+    ):
+        """
+        Replaces the fragments of a queued message, provided that none of
+        its fragments has been sent yet. The message keeps its place in
+        the destination's queue
+
+        Parameters
+        ==========
+        destination: str
+            Target user call sign
+        message_id: any
+            The message ID which has been passed to add()
+        fragments: list
+            1..n APRS message texts
+        pending_fragments: int
+            Number of fragments which the message has been queued with
+
+        Returns
+        =======
+        replaced: bool
+            False if the message is no longer (completely) queued
+        """
+        destination_queue = self._queues.get(destination)
+        if not destination_queue or not fragments:
+            return False
+        if sum(1 for entry in destination_queue if entry[1] == message_id) != (
+            pending_fragments
+        ):
+            return False
+        replaced = deque()
+        inserted = False
+        for entry in destination_queue:
+            if entry[1] != message_id:
+                replaced.append(entry)
+            elif not inserted:
+                for index, fragment in enumerate(fragments, start=1):
+                    replaced.append((fragment, message_id, index == len(fragments)))
+                inserted = True
+        self._queues[destination] = replaced
+        self.pending_fragments += len(fragments) - pending_fragments
+        return True
+
+    def has_pending(self, destination: str):
+        """
+        Checks whether a destination has packets in the queue
+
+        Parameters
+        ==========
+        destination: str
+            Target user call sign
+
+        Returns
+        =======
+        pending: bool
+            True if packets to the destination are waiting
+        """
+        return destination in self._queues
+
+    def channel_wait(self, now: float):
+        """
+        Returns the time span until the channel is available again
+
+        Parameters
+        ==========
+        now: float
+            Current time (time.monotonic)
+
+        Returns
+        =======
+        wait: float
+            Seconds until the channel is available (0 = available now)
+        """
+        return max(self._channel_ready - now, 0.0)
+
+    def reserve_channel(self, now: float):
+        """
+        Registers a packet which has been sent outside of the queues
+        (e.g. a retry), thus applying the channel spacing
+
+        Parameters
+        ==========
+        now: float
+            Current time (time.monotonic)
+
+        Returns
+        =======
+        """
+        self._channel_ready = now + self.channel_delay
+
+
+if __name__ == "__main__":
+    pass
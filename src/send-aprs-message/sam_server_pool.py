@@ -0,0 +1,250 @@
+#
+# send-aprs-message
+# APRS-IS server pool with connect timeouts, latency tracking
+# and failover
+# Author: Joerg Schultze-Lutter, 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import json
+import os
+import threading
+import time
+from sam_logger import logger
+
+
+# change these settings if necessary
+aprsis_server_name = "euro.aprs2.net"
+aprsis_server_port = 14580
+
+# Max. time span (in seconds) for the TCP connect to an APRS-IS server
+# and the server's banner
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+# Time span (in seconds) after which a failed APRS-IS server
+# is considered healthy again (with its last measured latencies)
+SERVER_FAILURE_EXPIRY = 3600
+
+
+def parse_server_address(address: str):
+    """
+    Splits an APRS-IS server address into host name and port
+
+    Parameters
+    ==========
+    address: str
+        HOST or HOST:PORT
+
+    Returns
+    =======
+    server: tuple | None
+        (host, port); None if the address is invalid
+    """
+    host, separator, port = address.strip().rpartition(":")
+    if not separator:
+        host, port = port, str(aprsis_server_port)
+    if not host or not port.isdigit() or not 0 < int(port) < 65536:
+        return None
+    return host, int(port)
+
+
+class AprsIsServerPool:
+    def __init__(
+        self,
+        servers: list,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        state_file: str = "",
+    ):
+        """
+        Pool of APRS-IS servers. For each server, the pool keeps the
+        latencies of the last successful connection (TCP connect incl. the
+        server's banner, login) and the number of consecutive failures.
+        Connections are attempted in this order: healthy servers (fastest
+        first), servers without measurements (in their configured order),
+        failing servers. Failures expire after SERVER_FAILURE_EXPIRY seconds.
+        The state is kept in an optional JSON file, thus subsequent runs
+        start with the fastest healthy server
+
+        Parameters
+        ==========
+        servers: list
+            (host, port) tuples in their configured order
+        connect_timeout: float
+            Max. time span in seconds for the TCP connect and the
+            server's banner
+        state_file: str
+            JSON file for the servers' state; empty string = do not keep
+            the state between runs
+
+        Returns
+        =======
+        """
+        self.servers = list(servers)
+        self.connect_timeout = connect_timeout
+        self.state_file = state_file
+        # "host:port" -> state dictionary
+        self.state = {}
+        self._lock = threading.Lock()
+        self._load_state()
+
+    @staticmethod
+    def server_key(server: tuple):
+        return f"{server[0]}:{server[1]}"
+
+    def _load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as state_file:
+                state = json.load(state_file)
+            servers = state["servers"]
+        except (OSError, ValueError, KeyError, TypeError) as ex:
+            logger.warning(
+                msg=f"Ignoring APRS-IS server state file '{self.state_file}': {ex}"
+            )
+            return
+        # Forget the state of servers which are no longer part of the pool
+        keys = {self.server_key(server) for server in self.servers}
+        self.state = {
+            key: value
+            for key, value in servers.items()
+            if key in keys and isinstance(value, dict)
+        }
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        fastest = next(
+            (
+                self.server_key(server)
+                for server in self.ordered_servers()
+                if self._is_healthy(self.server_key(server))
+            ),
+            None,
+        )
+        temp_file = f"{self.state_file}.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as state_file:
+                json.dump({"fastest": fastest, "servers": self.state}, state_file)
+            os.replace(temp_file, self.state_file)
+        except OSError as ex:
+            logger.warning(
+                msg=f"Unable to write APRS-IS server state file "
+                f"'{self.state_file}': {ex}"
+            )
+
+    def _is_healthy(self, key: str):
+        state = self.state.get(key)
+        if not state or "connect_ms" not in state:
+            return False
+        return (
+            not state.get("failures")
+            or time.time() - state.get("last_failure", 0) > SERVER_FAILURE_EXPIRY
+        )
+
+    def ordered_servers(self):
+        """
+        Returns the pool's servers in the order of the connection attempts
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        servers: list
+            (host, port) tuples
+        """
+
+        def order(item):
+            index, server = item
+            key = self.server_key(server)
+            state = self.state.get(key, {})
+            if self._is_healthy(key):
+                return 0, state["connect_ms"] + state.get("login_ms", 0.0), index
+            if state.get("failures"):
+                return 2, state["failures"], index
+            return 1, 0, index
+
+        return [server for _, server in sorted(enumerate(self.servers), key=order)]
+
+    def record_success(
+        self, server: tuple, connect_seconds: float, login_seconds: float
+    ):
+        """
+        Registers a successful connection and login
+
+        Parameters
+        ==========
+        server: tuple
+            (host, port)
+        connect_seconds: float
+            Time span for the TCP connect incl. the server's banner
+        login_seconds: float
+            Time span between sending the login and the server's response
+
+        Returns
+        =======
+        """
+        with self._lock:
+            self.state[self.server_key(server)] = {
+                "connect_ms": round(connect_seconds * 1000, 1),
+                "login_ms": round(login_seconds * 1000, 1),
+                "failures": 0,
+                "last_success": round(time.time()),
+            }
+            self._save_state()
+
+    def record_failure(self, server: tuple, error: str):
+        """
+        Registers a failed connection or login attempt
+
+        Parameters
+        ==========
+        server: tuple
+            (host, port)
+        error: str
+            The error message
+
+        Returns
+        =======
+        """
+        with self._lock:
+            state = self.state.setdefault(self.server_key(server), {})
+            state["failures"] = state.get("failures", 0) + 1
+            state["last_failure"] = round(time.time())
+            state["last_error"] = error
+            self._save_state()
+
+    def get_status(self):
+        """
+        Returns the servers' state in the order of the connection attempts
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        status: list
+            One dictionary per server
+        """
+        status = []
+        for server in self.ordered_servers():
+            key = self.server_key(server)
+            status.append({"server": key, **self.state.get(key, {})})
+        return status
+
+
+if __name__ == "__main__":
+    pass
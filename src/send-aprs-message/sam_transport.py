@@ -0,0 +1,1057 @@
+#
+# send-aprs-message
+# asyncio APRS-IS transport for concurrent conversations
+# Author: Joerg Schultze-Lutter, 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import aprslib
+import asyncio
+import concurrent.futures
+import time
+from sam_messages import format_aprs_message, is_valid_callsign, prepare_aprs_messages
+from sam_pacing import PacingScheduler
+from sam_ack import ACK_MAX_RETRIES, ACK_TIMEOUT, AckTracker
+from sam_dedup import OutboundDeduplicator, PendingMessageMerger
+from sam_server_pool import AprsIsServerPool, aprsis_server_name, aprsis_server_port
+from sam_logger import logger
+
+
+# asyncio transport: software name and version for the APRS-IS login line,
+# max. time span (in seconds) for the server's login response, interval of
+# our keepalive comments, max. time span without any data from the server
+# (APRS-IS servers send a keepalive comment every 20 seconds), delay
+# between two rounds of reconnect attempts and interval for saving the
+# deduplicator's state
+ASYNC_SOFTWARE_VERSION = "send-aprs-message 1.0"
+ASYNC_LOGIN_TIMEOUT = 5.0
+ASYNC_KEEPALIVE_INTERVAL = 60.0
+ASYNC_RECEIVE_TIMEOUT = 90.0
+ASYNC_RECONNECT_DELAY = 30.0
+ASYNC_DEDUP_SAVE_INTERVAL = 60.0
+
+
+def send_aprs_packet(
+    myaprsis: aprslib.inet.IS | None, packet: str, simulate_send: bool = False
+):
+    """
+    Sends a single raw packet to APRS-IS (or to our logger)
+
+    Parameters
+    ==========
+    myaprsis: aprslib.inet.IS
+        Our aprslib object
+    packet: str
+        The raw APRS-IS packet
+    simulate_send: bool
+        If True: only send the packet to our logger
+
+    Returns
+    =======
+    """
+    if simulate_send:
+        logger.debug(msg=f"Simulating APRS message '{packet}'")
+    else:
+        logger.debug(msg=f"Sending APRS message '{packet}'")
+        myaprsis.sendall(packet)
+
+
+def next_outgoing_packet(
+    scheduler: PacingScheduler,
+    ack_tracker: AckTracker | None,
+    source_call_sign: str,
+    now: float,
+    tocall: str = "APMPAD",
+    completed: list | None = None,
+):
+    """
+    Determines the next packet which is due: either the retry of an
+    unacknowledged fragment or the scheduler's next fragment. With ack
+    tracking, each new fragment gets a message number and its destination
+    is put on hold until the fragment has been acknowledged; the remaining
+    fragments of a rejected or unacknowledged message are dropped
+
+    Parameters
+    ==========
+    scheduler: PacingScheduler
+        The scheduler, containing the messages that are to be sent
+    ack_tracker: AckTracker | None
+        Our ack tracker; None = send each fragment once, without message number
+    source_call_sign: str
+        Our very own call sign
+    now: float
+        Current time (time.monotonic)
+    tocall: str
+        This bot uses the default TOCALL ("APMPAD")
+    completed: list | None
+        Optional list which receives the (TrackedFragment, outcome) tuples
+        of the fragments whose tracking has ended
+
+    Returns
+    =======
+    packet: str | None
+        The raw APRS-IS packet which is to be sent now
+    wait: float | None
+        If no packet is due: seconds until the next packet may be due;
+        None if there is nothing left to send
+    fragment: tuple | None
+        (destination, message ID, last fragment) for a new fragment;
+        None for retries
+    """
+    if ack_tracker is not None:
+        retransmission = ack_tracker.next_retransmission(now=now)
+        for tracked, outcome in ack_tracker.pop_completed():
+            if completed is not None:
+                completed.append((tracked, outcome))
+            scheduler.release(destination=tracked.destination)
+            if outcome != "ack":
+                dropped = scheduler.drop_message(
+                    destination=tracked.destination, message_id=tracked.message_id
+                )
+                logger.warning(
+                    msg=f"Message to '{tracked.destination}' has failed ({outcome} "
+                    f"for message number {tracked.msgno}); dropped {dropped} "
+                    f"remaining fragment(s)"
+                )
+        if retransmission is not None and scheduler.channel_wait(now=now) == 0:
+            ack_tracker.retransmitted(fragment=retransmission, now=now)
+            scheduler.reserve_channel(now=now)
+            return retransmission.packet, 0.0, None
+
+    wait = scheduler.time_until_next(now=now)
+    if wait == 0:
+        destination, fragment, message_id, last_fragment = scheduler.pop(now=now)
+        msgno = ack_tracker.next_msgno() if ack_tracker is not None else None
+        packet = format_aprs_message(
+            source_call_sign=source_call_sign,
+            destination_call_sign=destination,
+            message_text=fragment,
+            tocall=tocall,
+            msgno=msgno,
+        )
+        if ack_tracker is not None:
+            scheduler.hold(destination=destination)
+            ack_tracker.track(
+                msgno=msgno,
+                destination=destination,
+                packet=packet,
+                message_id=message_id,
+                last_fragment=last_fragment,
+                now=now,
+            )
+        return packet, 0.0, (destination, message_id, last_fragment)
+
+    if ack_tracker is not None:
+        deadline = ack_tracker.time_until_deadline(now=now)
+        if deadline is not None:
+            # Retries are subject to the channel spacing, too
+            deadline = max(deadline, scheduler.channel_wait(now=now))
+            wait = deadline if wait is None else min(wait, deadline)
+    return None, wait, None
+
+
+class AsyncAprsIsTransport:
+    def __init__(
+        self,
+        callsign: str,
+        passcode: str,
+        server_pool: AprsIsServerPool | None = None,
+        aprs_filter: str = "",
+        simulate_send: bool = False,
+        packet_delay: float = 10.0,
+        packet_delay_last_message: float = 1.0,
+        channel_delay: float = 1.0,
+        ack_tracking: bool = False,
+        ack_timeout: float = ACK_TIMEOUT,
+        ack_retries: int = ACK_MAX_RETRIES,
+        tocall: str = "APMPAD",
+        deduplicator: OutboundDeduplicator | None = None,
+        merge_window: float | None = None,
+        packet_handler=None,
+        keepalive_interval: float = ASYNC_KEEPALIVE_INTERVAL,
+        receive_timeout: float = ASYNC_RECEIVE_TIMEOUT,
+        reconnect_delay: float = ASYNC_RECONNECT_DELAY,
+        reconnect: bool = True,
+    ):
+        """
+        asyncio-based APRS-IS session which serves many concurrent outbound
+        conversations in a single event loop. The transport logs in to the
+        first available server of the pool, sends keepalive comments,
+        passes the received packets (see aprs_filter) to the ack tracker
+        and the optional packet handler and re-establishes the session if
+        the server goes silent or drops the connection. The outgoing
+        messages are paced by a PacingScheduler; unlike
+        send_aprs_message_list, waiting for one destination's packet delay
+        does not block the other destinations. All modes of
+        send-aprs-message.py (single message, batch and daemon) use this
+        transport.
+
+            async with AsyncAprsIsTransport(callsign, passcode) as transport:
+                await asyncio.gather(
+                    transport.send_message(to_callsign="DF1JSL-1", message="Hi"),
+                    transport.send_message(to_callsign="DF2XX", message="Hello"),
+                )
+
+        Parameters
+        ==========
+        callsign: str
+            Our very own call sign
+        passcode: str
+            APRS-IS passcode for our call sign
+        server_pool: AprsIsServerPool | None
+            APRS-IS servers; None = aprsis_server_name / aprsis_server_port
+        aprs_filter: str
+            Optional APRS-IS filter; with ack tracking, messages which are
+            addressed to us (g/CALLSIGN) are always included
+        simulate_send: bool
+            If True: do not connect to APRS-IS, only send the messages to our logger
+        packet_delay: float
+            Min. spacing between two fragments of the same message
+        packet_delay_last_message: float
+            Min. spacing after the last fragment of a message (same destination)
+        channel_delay: float
+            Min. spacing between any two packets
+        ack_tracking: bool
+            Send the fragments with message numbers and retry
+            unacknowledged fragments (ignored in simulation mode)
+        ack_timeout: float
+            Initial retry timeout in seconds
+        ack_retries: int
+            Max. number of retries per fragment
+        tocall: str
+            This bot uses the default TOCALL ("APMPAD")
+        deduplicator: OutboundDeduplicator | None
+            Optional deduplicator for send_message(); a message counts
+            as sent once it has been sent (with ack tracking:
+            acknowledged). Its state is saved every 60 seconds and by
+            close()
+        merge_window: float | None
+            Merge the messages of send_message() to the same destination,
+            see PendingMessageMerger; None = do not merge
+        packet_handler: callable | None
+            Optional function which gets called with each received packet
+            (str) that is neither a server comment nor an ack / rej for
+            one of our messages
+        keepalive_interval: float
+            Time span in seconds without outgoing data after which we send
+            a keepalive comment
+        receive_timeout: float
+            Max. time span in seconds without any data from the server
+            before the session gets re-established
+        reconnect_delay: float
+            Delay in seconds between two rounds of reconnect attempts
+        reconnect: bool
+            Re-establish the session after it has dropped. If False, the
+            pending messages fail with a ConnectionError instead
+
+        Returns
+        =======
+        """
+        if server_pool is None:
+            server_pool = AprsIsServerPool(
+                servers=[(aprsis_server_name, aprsis_server_port)]
+            )
+        self.callsign = callsign
+        self.passcode = passcode
+        self.server_pool = server_pool
+        self.simulate_send = simulate_send
+        self.tocall = tocall
+        self.packet_handler = packet_handler
+        self.keepalive_interval = keepalive_interval
+        self.receive_timeout = receive_timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect = reconnect
+
+        self.scheduler = PacingScheduler(
+            packet_delay=packet_delay,
+            packet_delay_last_message=packet_delay_last_message,
+            channel_delay=channel_delay,
+        )
+        self.ack_tracker = None
+        if ack_tracking and not simulate_send:
+            self.ack_tracker = AckTracker(
+                ack_timeout=ack_timeout, max_retries=ack_retries
+            )
+            own_messages = f"g/{callsign}"
+            if own_messages not in aprs_filter.split():
+                aprs_filter = f"{own_messages} {aprs_filter}".strip()
+        self.aprs_filter = aprs_filter
+        self.deduplicator = deduplicator
+        self.merger = None
+        if merge_window is not None:
+            self.merger = PendingMessageMerger(
+                scheduler=self.scheduler, merge_window=merge_window
+            )
+
+        self.server = None
+        self.message_id = 0
+        self.sent_messages = 0
+        self.sent_fragments = 0
+        self.received_packets = 0
+        self.reconnects = 0
+        self._myaprsis = None
+        self._reader = None
+        self._writer = None
+        self._last_write = 0.0
+        self._connected = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        # message ID -> future (True = sent / delivered, False = failed)
+        self._pending = {}
+        # message ID -> deduplicator keys of the (merged) messages
+        self._dedup_keys = {}
+        # IDs of the messages with at least one lost fragment
+        self._lost_messages = set()
+        self._tasks = []
+        # Exception which has terminated the send loop (if any)
+        self._failure = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.drain()
+        await self.close()
+
+    def attach(self, myaprsis: aprslib.inet.IS):
+        """
+        Sends the packets via an established aprslib connection instead of
+        a session of our own (no receive, keepalive or reconnect; thus, no
+        ack tracking). Must be called before start()
+
+        Parameters
+        ==========
+        myaprsis: aprslib.inet.IS
+            Our aprslib object
+
+        Returns
+        =======
+        """
+        self._myaprsis = myaprsis
+        self.ack_tracker = None
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    async def start(self, blocking: bool = False):
+        """
+        Connects to APRS-IS and starts the transport's tasks
+
+        Parameters
+        ==========
+        blocking: bool
+            If True: keep on trying until a connection has been established;
+            otherwise, raise an exception if none of the servers is available
+
+        Returns
+        =======
+        """
+        if self.simulate_send or self._myaprsis is not None:
+            self._connected.set()
+        else:
+            await self._connect(blocking=blocking)
+            self._tasks.append(asyncio.create_task(self._connection_loop()))
+            self._tasks.append(asyncio.create_task(self._keepalive_loop()))
+        if self.deduplicator is not None and not self.simulate_send:
+            self._tasks.append(asyncio.create_task(self._dedup_save_loop()))
+        self._tasks.append(asyncio.create_task(self._send_loop()))
+
+    async def close(self):
+        """
+        Stops the transport's tasks and closes the APRS-IS session. Messages
+        which have not been sent (or acknowledged) yet count as failed
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._disconnect()
+        for message_id in list(self._pending):
+            self._complete(message_id=message_id, success=False)
+        if self.deduplicator is not None and not self.simulate_send:
+            self.deduplicator.save_state()
+
+    def submit(self, to_callsign: str, fragments: list):
+        """
+        Adds the fragments of a message to the send queue
+
+        Parameters
+        ==========
+        to_callsign: str
+            APRS TO callsign (recipient)
+        fragments: list
+            1..n APRS message texts, see prepare_aprs_messages
+
+        Returns
+        =======
+        future: asyncio.Future
+            Resolves to True once the message has been sent (with ack
+            tracking: acknowledged) or to False if it has failed; raises
+            the exception which has terminated the transport's send loop
+        """
+        future = asyncio.get_running_loop().create_future()
+        if self._failure is not None:
+            future.set_exception(self._failure)
+            return future
+        if not fragments:
+            future.set_result(True)
+            return future
+        self.message_id += 1
+        self.scheduler.add(
+            destination=to_callsign, fragments=fragments, message_id=self.message_id
+        )
+        self._pending[self.message_id] = future
+        self._wakeup.set()
+        return future
+
+    def queue_message(
+        self, to_callsign: str, message: str, numeric_message_pagination: bool = False
+    ):
+        """
+        Validates a message, splits it up and adds it to the send queue.
+        Duplicates (see deduplicator) are not queued; with a merge window,
+        the message may get merged into a queued message to the same
+        destination
+
+        Parameters
+        ==========
+        to_callsign: str
+            APRS TO callsign (recipient)
+        message: str
+            The APRS message text
+        numeric_message_pagination: bool
+            Add message enumeration to each outgoing APRS message
+
+        Returns
+        =======
+        message_id: int | None
+            The message's ID; for a merged message, the ID of the message
+            that it has been merged into; None for a duplicate
+        fragments: list
+            The APRS message texts which are queued under this ID
+        merged: bool
+            True if the message has been merged
+        future: asyncio.Future | None
+            See submit(); a merged message shares the future of the
+            message that it has been merged into. None for a duplicate
+        """
+        to_callsign = to_callsign.upper()
+        if not is_valid_callsign(to_callsign):
+            raise ValueError(f"invalid TO call sign '{to_callsign}'")
+        if len(message) < 1:
+            raise ValueError("APRS message is empty")
+        if self._failure is not None:
+            raise self._failure
+        dedup_key = None
+        if self.deduplicator is not None:
+            dedup_key = self.deduplicator.reserve(
+                destination=to_callsign, message=message
+            )
+            if dedup_key is None:
+                return None, [], False, None
+        if self.merger is None:
+            fragments = prepare_aprs_messages(
+                message=message, numeric_message_pagination=numeric_message_pagination
+            )
+            future = self.submit(to_callsign=to_callsign, fragments=fragments)
+            message_id, merged = self.message_id, False
+        else:
+            self.message_id += 1
+            message_id, fragments, merged = self.merger.add(
+                destination=to_callsign,
+                message=message,
+                message_id=self.message_id,
+                numeric_message_pagination=numeric_message_pagination,
+            )
+            if not merged:
+                self._pending[message_id] = asyncio.get_running_loop().create_future()
+                self._wakeup.set()
+            future = self._pending[message_id]
+        if dedup_key is not None:
+            if future.done():
+                # Nothing to send
+                self.deduplicator.release(key=dedup_key, sent=future.result())
+            else:
+                self._dedup_keys.setdefault(message_id, []).append(dedup_key)
+        return message_id, fragments, merged, future
+
+    async def send_message(
+        self, to_callsign: str, message: str, numeric_message_pagination: bool = False
+    ):
+        """
+        Splits up a message, queues it and waits until it has been sent
+
+        Parameters
+        ==========
+        to_callsign: str
+            APRS TO callsign (recipient)
+        message: str
+            The APRS message text
+        numeric_message_pagination: bool
+            Add message enumeration to each outgoing APRS message
+
+        Returns
+        =======
+        success: bool
+            True if the message has been sent (with ack tracking:
+            acknowledged) or if it is a duplicate; a merged message
+            shares the result of the message that it has been merged into
+        """
+        _, _, _, future = self.queue_message(
+            to_callsign=to_callsign,
+            message=message,
+            numeric_message_pagination=numeric_message_pagination,
+        )
+        if future is None:
+            return True
+        return await future
+
+    async def probe(self):
+        """
+        Connects and logs in to each server of the pool once, thus
+        measuring their latencies (see AprsIsServerPool.record_success)
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        """
+        for server in self.server_pool.servers:
+            if await self._connect_to_server(server=server):
+                await self._disconnect()
+
+    async def drain(self):
+        """
+        Waits until all queued messages have been sent (or have failed)
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        """
+        while self._pending:
+            await asyncio.wait(list(self._pending.values()))
+
+    def get_status(self):
+        """
+        Returns the transport's current state
+
+        Parameters
+        ==========
+
+        Returns
+        =======
+        status: dict
+            Connection state, queue length, number of sent messages and
+            received packets; with ack tracking, the tracker's counters
+        """
+        status = {
+            "status": "ok",
+            "connected": self.connected,
+            "server": (
+                self.server_pool.server_key(self.server)
+                if self.server and self.connected
+                else None
+            ),
+            "queued_messages": self.scheduler.pending_messages,
+            "queued_fragments": self.scheduler.pending_fragments,
+            "sent_messages": self.sent_messages,
+            "sent_fragments": self.sent_fragments,
+            "received_packets": self.received_packets,
+            "reconnects": self.reconnects,
+        }
+        if self.deduplicator is not None:
+            status["duplicate_messages"] = self.deduplicator.suppressed_messages
+        if self.merger is not None:
+            status["merged_messages"] = self.merger.merged_messages
+        if self.ack_tracker is not None:
+            status["ack_tracking"] = self.ack_tracker.get_status()
+        return status
+
+    def _complete(self, message_id, success: bool):
+        self._lost_messages.discard(message_id)
+        # Only messages which have been sent count for the deduplicator
+        for dedup_key in self._dedup_keys.pop(message_id, []):
+            self.deduplicator.release(key=dedup_key, sent=success)
+        future = self._pending.pop(message_id, None)
+        if future is not None and not future.done():
+            future.set_result(success)
+
+    def _fail(self, ex: Exception):
+        # The pending messages (and all messages which get submitted
+        # afterwards) fail with the given exception
+        self._failure = ex
+        for message_id, future in self._pending.items():
+            for dedup_key in self._dedup_keys.pop(message_id, []):
+                self.deduplicator.release(key=dedup_key, sent=False)
+            if not future.done():
+                future.set_exception(ex)
+        self._pending.clear()
+        self._lost_messages.clear()
+
+    async def _connect(self, blocking: bool):
+        while True:
+            for server in self.server_pool.ordered_servers():
+                if await self._connect_to_server(server=server):
+                    return
+            if not blocking:
+                raise aprslib.exceptions.ConnectionError(
+                    "unable to connect to any APRS-IS server"
+                )
+            logger.info(
+                msg=f"Retrying the APRS-IS server pool in "
+                f"{self.reconnect_delay} seconds"
+            )
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _open_connection(self, server: tuple):
+        reader, writer = await asyncio.open_connection(*server)
+        banner = await reader.readline()
+        if not banner.startswith(b"#"):
+            writer.close()
+            raise aprslib.exceptions.ConnectionError("invalid banner")
+        return reader, writer
+
+    async def _connect_to_server(self, server: tuple):
+        # Same login and response check as aprslib; the connect timeout
+        # covers both the TCP connect and the server's banner
+        login = (
+            f"user {self.callsign} pass {self.passcode} "
+            f"vers {ASYNC_SOFTWARE_VERSION}"
+        )
+        if self.aprs_filter:
+            login += f" filter {self.aprs_filter}"
+        start = time.monotonic()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                self._open_connection(server=server),
+                timeout=self.server_pool.connect_timeout,
+            )
+            connected = time.monotonic()
+            writer.write(f"{login}\r\n".encode("utf-8"))
+            await writer.drain()
+            response = await asyncio.wait_for(
+                reader.readline(), timeout=ASYNC_LOGIN_TIMEOUT
+            )
+            try:
+                _, _, callsign, status, _ = (
+                    response.decode("latin-1").strip().split(" ", 4)
+                )
+            except ValueError:
+                raise aprslib.exceptions.LoginError("incorrect login response")
+            if callsign != self.callsign:
+                raise aprslib.exceptions.LoginError(f"Server: {response.strip()}")
+            if status != "verified," and self.passcode != "-1":
+                raise aprslib.exceptions.LoginError("Password is incorrect")
+        except (
+            OSError,
+            asyncio.TimeoutError,
+            aprslib.exceptions.ConnectionError,
+            aprslib.exceptions.LoginError,
+        ) as ex:
+            error = str(ex) or "timed out"
+            logger.warning(
+                msg=f"Unable to connect to APRS-IS server "
+                f"'{self.server_pool.server_key(server)}': {error}"
+            )
+            self.server_pool.record_failure(server=server, error=error)
+            if writer is not None:
+                writer.close()
+            return False
+        self.server_pool.record_success(
+            server=server,
+            connect_seconds=connected - start,
+            login_seconds=time.monotonic() - connected,
+        )
+        self.server = server
+        self._reader = reader
+        self._writer = writer
+        self._last_write = time.monotonic()
+        self._connected.set()
+        logger.info(
+            msg=f"Established connection to APRS_IS: server={server[0]},"
+            f"port={server[1]}, APRS-IS User: {self.callsign}"
+        )
+        return True
+
+    async def _disconnect(self):
+        self._connected.clear()
+        writer, self._writer, self._reader = self._writer, None, None
+        if writer is None:
+            return
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    async def _connection_loop(self):
+        # Receive until the session drops, then fail over / reconnect
+        while True:
+            await self._receive_loop()
+            await self._disconnect()
+            if not self.reconnect:
+                logger.error(msg="Connection to APRS-IS lost")
+                self._fail(
+                    ex=aprslib.exceptions.ConnectionError("connection to APRS-IS lost")
+                )
+                return
+            logger.warning(msg="Re-establishing the APRS-IS session")
+            await self._connect(blocking=True)
+            self.reconnects += 1
+
+    async def _receive_loop(self):
+        # Acks and rejects go to the ack tracker, all other packets go to
+        # the packet handler; the server's comments get discarded
+        while True:
+            try:
+                line = await asyncio.wait_for(
+                    self._reader.readline(), timeout=self.receive_timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    msg=f"No data from APRS-IS for {self.receive_timeout} seconds"
+                )
+                return
+            except (OSError, ValueError) as ex:
+                logger.error(msg=f"APRS-IS receiver has terminated: {ex}")
+                return
+            if not line:
+                logger.error(msg="APRS-IS connection has been closed by the server")
+                return
+            line = line.rstrip(b"\r\n")
+            if not line or line.startswith(b"#"):
+                continue
+            self.received_packets += 1
+            if self.ack_tracker is not None and self.ack_tracker.handle_packet(
+                packet=line
+            ):
+                self._wakeup.set()
+                continue
+            if self.packet_handler is not None:
+                self.packet_handler(line.decode("utf-8", errors="replace"))
+            else:
+                logger.debug(msg=f"Received APRS-IS packet: {line}")
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            if time.monotonic() - self._last_write < self.keepalive_interval:
+                continue
+            if self.connected:
+                await self._write(line=f"#{ASYNC_SOFTWARE_VERSION} keepalive")
+
+    async def _dedup_save_loop(self):
+        # save_state only writes the file if messages have been sent
+        while True:
+            await asyncio.sleep(ASYNC_DEDUP_SAVE_INTERVAL)
+            self.deduplicator.save_state()
+
+    async def _write(self, line: str):
+        # A failed write ends the session; the connection loop reconnects
+        try:
+            self._writer.write(f"{line}\r\n".encode("utf-8"))
+            await self._writer.drain()
+        except (OSError, AttributeError) as ex:
+            logger.warning(msg=f"Unable to send to APRS-IS: {ex}")
+            self._connected.clear()
+            if self._writer is not None:
+                self._writer.close()
+            return False
+        self._last_write = time.monotonic()
+        return True
+
+    async def _send_packet(self, packet: str):
+        if self.simulate_send or self._myaprsis is not None:
+            send_aprs_packet(
+                myaprsis=self._myaprsis, packet=packet, simulate_send=self.simulate_send
+            )
+            return True
+        logger.debug(msg=f"Sending APRS message '{packet}'")
+        return await self._write(line=packet)
+
+    async def _send_loop(self):
+        # Any error (e.g. a lost aprslib connection, see attach, for which
+        # there is no reconnect) terminates the loop; the pending messages
+        # must not wait for a packet which will never be sent
+        try:
+            while True:
+                await self._send_next()
+        except Exception as ex:
+            logger.error(msg=f"APRS-IS send loop has terminated: {ex!r}")
+            self._fail(ex=ex)
+
+    async def _send_next(self):
+        await self._connected.wait()
+        completed = []
+        packet, wait, fragment = next_outgoing_packet(
+            scheduler=self.scheduler,
+            ack_tracker=self.ack_tracker,
+            source_call_sign=self.callsign,
+            now=time.monotonic(),
+            tocall=self.tocall,
+            completed=completed,
+        )
+        for tracked, outcome in completed:
+            if outcome != "ack" or tracked.last_fragment:
+                self._complete(message_id=tracked.message_id, success=outcome == "ack")
+        if packet is None:
+            # Wake up on new messages, acks or the next due packet
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            return
+        sent = await self._send_packet(packet=packet)
+        if not sent:
+            logger.warning(msg=f"APRS message has been lost: '{packet}'")
+        if fragment is not None:
+            to_callsign, message_id, last_fragment = fragment
+            self.sent_fragments += 1
+            if not sent:
+                self._lost_messages.add(message_id)
+            if last_fragment:
+                self.sent_messages += 1
+                logger.debug(msg=f"Sent message {message_id} to '{to_callsign}'")
+                if self.ack_tracker is None:
+                    # The message has failed if any of its fragments is lost
+                    self._complete(
+                        message_id=message_id,
+                        success=message_id not in self._lost_messages,
+                    )
+
+
+def run_blocking(coroutine):
+    """
+    Runs a coroutine to completion and returns its result. asyncio.run
+    cannot be used while the calling thread is running an event loop
+    (e.g. when being called from a coroutine); in that case, the coroutine
+    gets its own event loop in a worker thread. Note that the caller's
+    event loop is blocked until the coroutine has finished
+
+    Parameters
+    ==========
+    coroutine: coroutine
+        The coroutine that is to be run
+
+    Returns
+    =======
+    result:
+        The coroutine's result
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def send_aprs_message_list(
+    myaprsis: aprslib.inet.IS | None,
+    message_text_array: list,
+    destination_call_sign: str,
+    source_call_sign: str,
+    simulate_send: bool = True,
+    packet_delay: float = 10.0,
+    packet_delay_last_message: float = 1.0,
+    tocall: str = "APMPAD",
+):
+    """
+    Sends a pre-prepared message list to APRS-IS via the given aprslib
+    connection. All packets have a max len of 67 characters.
+    If 'simulate_send'= True, we still prepare the message but only send it to our log file
+    This is a blocking wrapper around AsyncAprsIsTransport (see run_blocking);
+    coroutines should rather use AsyncAprsIsTransport.send_message
+
+    Parameters
+    ==========
+    myaprsis: aprslib.inet.IS
+        Our aprslib object that we will use for the communication part
+    message_text_array: list
+        Contains 1..n entries of the content that we want to send to the user
+    destination_call_sign: str
+        Target user call sign that is going to receive the message (usually, this
+        is the user's call sign who has sent us the initial message)
+    simulate_send: bool
+        If True: Prepare string but only send it to logger
+    source_call_sign: str
+        Our very own call sign
+    packet_delay: float
+        Delay after sending out our APRS acknowledgment request
+        Used when there are still remaining messages
+    packet_delay_last_message: float
+        Delay after sending out our APRS acknowledgment request
+        Used when there are no remaining messages
+    tocall: str
+        This bot uses the default TOCALL ("APMPAD")
+
+    Returns
+    =======
+    """
+
+    async def send_message_list():
+        # A single destination: the packet delay applies between the
+        # fragments, no additional channel spacing is required
+        transport = AsyncAprsIsTransport(
+            callsign=source_call_sign,
+            passcode="-1",
+            simulate_send=simulate_send,
+            packet_delay=packet_delay,
+            packet_delay_last_message=packet_delay_last_message,
+            channel_delay=0.0,
+            tocall=tocall,
+        )
+        if not simulate_send:
+            transport.attach(myaprsis=myaprsis)
+        async with transport:
+            await transport.submit(
+                to_callsign=destination_call_sign, fragments=message_text_array
+            )
+        # In case of remaining messages, the user sleep period has been
+        # applied; after the last one, let's wait just one sec
+        await asyncio.sleep(packet_delay_last_message)
+
+    run_blocking(coroutine=send_message_list())
+
+
+def send_fragments(
+    from_callsign: str,
+    passcode: str,
+    to_callsign: str,
+    fragments: list,
+    server_pool: AprsIsServerPool | None = None,
+    simulate_send: bool = False,
+    packet_delay: float = 10.0,
+    ack_tracking: bool = False,
+    ack_timeout: float = ACK_TIMEOUT,
+    ack_retries: int = ACK_MAX_RETRIES,
+    tocall: str = "APMPAD",
+):
+    """
+    Sends the fragments of a single message over an APRS-IS session of
+    our own. Blocking wrapper around AsyncAprsIsTransport (see run_blocking);
+    see send_aprs_message_list for sending via an existing aprslib connection
+
+    Parameters
+    ==========
+    from_callsign: str
+        Our very own call sign
+    passcode: str
+        APRS-IS passcode for our call sign
+    to_callsign: str
+        APRS TO callsign (recipient)
+    fragments: list
+        1..n APRS message texts, see make_pretty_aprs_messages
+    server_pool: AprsIsServerPool | None
+        APRS-IS servers; None = aprsis_server_name / aprsis_server_port
+    simulate_send: bool
+        If True: do not connect to APRS-IS, only send the message to our logger
+    packet_delay: float
+        Min. spacing between two fragments
+    ack_tracking: bool
+        Send the fragments with message numbers and retry
+        unacknowledged fragments (ignored in simulation mode)
+    ack_timeout: float
+        Initial retry timeout in seconds
+    ack_retries: int
+        Max. number of retries per fragment
+    tocall: str
+        This bot uses the default TOCALL ("APMPAD")
+
+    Returns
+    =======
+    success: bool
+        True if the message has been sent (with ack tracking: acknowledged)
+    """
+
+    async def send():
+        transport = AsyncAprsIsTransport(
+            callsign=from_callsign,
+            passcode=passcode,
+            server_pool=server_pool,
+            simulate_send=simulate_send,
+            packet_delay=packet_delay,
+            channel_delay=0.0,
+            ack_tracking=ack_tracking,
+            ack_timeout=ack_timeout,
+            ack_retries=ack_retries,
+            tocall=tocall,
+            reconnect=False,
+        )
+        try:
+            await transport.start()
+            success = await transport.submit(
+                to_callsign=to_callsign, fragments=fragments
+            )
+        except aprslib.exceptions.ConnectionError as ex:
+            logger.error(msg=f"Unable to send the message to '{to_callsign}': {ex}")
+            success = False
+        await transport.close()
+        if transport.ack_tracker is not None:
+            if success:
+                logger.info(
+                    msg=f"Message to '{to_callsign}' has been acknowledged "
+                    f"({transport.ack_tracker.retransmissions} retries)"
+                )
+            else:
+                logger.error(
+                    msg=f"Message to '{to_callsign}' has not been acknowledged"
+                )
+        return success
+
+    return run_blocking(coroutine=send())
+
+
+def probe_servers(from_callsign: str, passcode: str, server_pool: AprsIsServerPool):
+    """
+    Connects and logs in to each server of the pool once, thus
+    measuring their latencies
+
+    Parameters
+    ==========
+    from_callsign: str
+        Our very own call sign
+    passcode: str
+        APRS-IS passcode for our call sign
+    server_pool: AprsIsServerPool
+        The pool
+
+    Returns
+    =======
+    status: list
+        The servers' state, see AprsIsServerPool.get_status
+    """
+    transport = AsyncAprsIsTransport(
+        callsign=from_callsign, passcode=passcode, server_pool=server_pool
+    )
+    run_blocking(coroutine=transport.probe())
+    return server_pool.get_status()
+
+
+if __name__ == "__main__":
+    pass
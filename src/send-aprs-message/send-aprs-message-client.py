@@ -0,0 +1,152 @@
+#!/opt/local/bin/python
+#
+# send-aprs-message-client.py
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Thin client for the daemon mode of send-aprs-message.py. Submits a
+# message to the daemon's Unix domain socket and returns as soon as the
+# daemon has queued the message. Only uses the Python standard library,
+# thus keeping the start-up time to a minimum.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import argparse
+import json
+import socket
+import sys
+
+# Default Unix domain socket of the daemon mode
+DEFAULT_DAEMON_SOCKET = "send-aprs-message.sock"
+
+
+def get_command_line_params():
+    """
+    Gets and returns the command line arguments
+
+    Parameters
+    ==========
+
+    Returns
+    =======
+    args: argparse.Namespace
+        The command line arguments
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--socket",
+        dest="socket_path",
+        type=str,
+        default=DEFAULT_DAEMON_SOCKET,
+        help=f"Unix domain socket of the daemon (default: '{DEFAULT_DAEMON_SOCKET}')",
+    )
+
+    parser.add_argument(
+        "--to-callsign",
+        dest="aprs_to_callsign",
+        type=str,
+        default="",
+        help="APRS TO callsign (receipient)",
+    )
+
+    parser.add_argument(
+        "--aprs-message",
+        dest="aprs_message",
+        type=str,
+        default="",
+        help="APRS message",
+    )
+
+    parser.add_argument(
+        "--numeric-message-pagination",
+        dest="aprs_message_pagination",
+        action="store_true",
+        default=False,
+        help="Add message enumeration to each outgoing APRS message",
+    )
+
+    parser.add_argument(
+        "--status",
+        dest="status",
+        action="store_true",
+        default=False,
+        help="Show the daemon's status instead of submitting a message",
+    )
+
+    parser.add_argument(
+        "--timeout",
+        dest="timeout",
+        type=float,
+        default=5.0,
+        help="Max. time span in seconds to wait for the daemon (default: 5)",
+    )
+
+    return parser.parse_args()
+
+
+def submit_request(socket_path: str, request: dict, timeout: float = 5.0):
+    """
+    Sends a request to the daemon and returns its response
+
+    Parameters
+    ==========
+    socket_path: str
+        Unix domain socket of the daemon
+    request: dict
+        The request
+    timeout: float
+        Max. time span in seconds to wait for the daemon
+
+    Returns
+    =======
+    response: dict
+        The daemon's response
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        client.sendall(f"{json.dumps(request)}\n".encode("utf-8"))
+        response = b""
+        while not response.endswith(b"\n"):
+            data = client.recv(4096)
+            if not data:
+                break
+            response += data
+    return json.loads(response)
+
+
+if __name__ == "__main__":
+    args = get_command_line_params()
+
+    if args.status:
+        request = {"command": "status"}
+    else:
+        request = {
+            "to_callsign": args.aprs_to_callsign,
+            "message": args.aprs_message,
+            "numeric_message_pagination": args.aprs_message_pagination,
+        }
+
+    try:
+        response = submit_request(
+            socket_path=args.socket_path, request=request, timeout=args.timeout
+        )
+    except (OSError, ValueError) as ex:
+        print(f"Unable to submit to daemon socket '{args.socket_path}': {ex}")
+        sys.exit(1)
+
+    print(json.dumps(response))
+    # Duplicates have already been sent within the daemon's dedup window
+    sys.exit(0 if response.get("status") in ("queued", "duplicate", "ok") else 1)
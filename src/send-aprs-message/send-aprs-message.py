@@ -17,29 +17,31 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
-import logging
 import aprslib
 import argparse
-from unidecode import unidecode
-import re
-import time
+import json
 import sys
-
-
-logging.basicConfig(
-    level=logging.DEBUG, format="%(asctime)s - %(module)s -%(levelname)s - %(message)s"
+from sam_messages import (
+    APRS_MSG_LEN_NOTRAILING,
+    APRS_MSG_LEN_TRAILING,
+    finalize_pretty_aprs_messages,
+    is_valid_callsign,
+    make_pretty_aprs_messages,
 )
-logger = logging.getLogger(__name__)
-
-# change these settings if necessary
-aprsis_server_name = "euro.aprs2.net"
-aprsis_server_port = 14580
+from sam_ack import ACK_MAX_RETRIES, ACK_TIMEOUT
+from sam_dedup import DEFAULT_DEDUP_STATE_FILE, OutboundDeduplicator
+from sam_server_pool import (
+    DEFAULT_CONNECT_TIMEOUT,
+    AprsIsServerPool,
+    aprsis_server_name,
+    aprsis_server_port,
+    parse_server_address,
+)
+from sam_transport import probe_servers, send_fragments
+from sam_batch import run_batch
+from sam_daemon import DEFAULT_DAEMON_SOCKET, MessageDaemon
+from sam_logger import logger
 
-# Default APRS message lengths
-# 67 = standard APRS message
-# 59 = APRS message with numeric message ID
-APRS_MSG_LEN_NOTRAILING = 67
-APRS_MSG_LEN_TRAILING = 59
 
 # Our APRS message length
 APRS_MSG_LEN = APRS_MSG_LEN_NOTRAILING
@@ -111,14 +113,157 @@ def get_command_line_params():
         help="Simulate sending of data to APRS-IS (output will be made to the console)",
     )
 
+    parser.add_argument(
+        "--packet-delay",
+        dest="aprs_packet_delay",
+        type=float,
+        default=10.0,
+        help="Min. delay in seconds between two fragments of a message to the same destination (default: 10)",
+    )
+
+    parser.add_argument(
+        "--channel-delay",
+        dest="aprs_channel_delay",
+        type=float,
+        default=1.0,
+        help="Min. delay in seconds between any two outgoing packets in batch and daemon mode (default: 1)",
+    )
+
+    parser.add_argument(
+        "--server",
+        dest="aprs_servers",
+        action="append",
+        default=[],
+        help=f"APRS-IS server (HOST or HOST:PORT); can be repeated, thus defining a server pool (default: '{aprsis_server_name}:{aprsis_server_port}')",
+    )
+
+    parser.add_argument(
+        "--connect-timeout",
+        dest="aprs_connect_timeout",
+        type=float,
+        default=DEFAULT_CONNECT_TIMEOUT,
+        help=f"Max. time span in seconds for connecting to an APRS-IS server (default: {DEFAULT_CONNECT_TIMEOUT:g})",
+    )
+
+    parser.add_argument(
+        "--server-state-file",
+        dest="aprs_server_state_file",
+        type=str,
+        default="",
+        help="File for the APRS-IS servers' latencies and health state (default: disabled)",
+    )
+
+    parser.add_argument(
+        "--probe-servers",
+        dest="aprs_probe_servers",
+        action="store_true",
+        default=False,
+        help="Connect to each APRS-IS server once, show the latencies and exit",
+    )
+
+    parser.add_argument(
+        "--ack-tracking",
+        dest="aprs_ack_tracking",
+        action="store_true",
+        default=False,
+        help="Add a message number to each outgoing APRS message, wait for the recipient's ack and retry unacknowledged messages",
+    )
+
+    parser.add_argument(
+        "--ack-timeout",
+        dest="aprs_ack_timeout",
+        type=float,
+        default=ACK_TIMEOUT,
+        help=f"Initial time span in seconds to wait for an ack before retrying (default: {ACK_TIMEOUT:g})",
+    )
+
+    parser.add_argument(
+        "--ack-retries",
+        dest="aprs_ack_retries",
+        type=int,
+        default=ACK_MAX_RETRIES,
+        help=f"Max. number of retries per unacknowledged message (default: {ACK_MAX_RETRIES})",
+    )
+
+    parser.add_argument(
+        "--dedup-window",
+        dest="aprs_dedup_window",
+        type=float,
+        default=0.0,
+        help="Do not send a message again if the same text has been sent to the same call sign within this many seconds (default: 0 = disabled)",
+    )
+
+    parser.add_argument(
+        "--dedup-state-file",
+        dest="aprs_dedup_state_file",
+        type=str,
+        default=DEFAULT_DEDUP_STATE_FILE,
+        help=f"File for the recently sent messages (--dedup-window); empty string = only within a single run (default: '{DEFAULT_DEDUP_STATE_FILE}')",
+    )
+
+    parser.add_argument(
+        "--merge-window",
+        dest="aprs_merge_window",
+        type=float,
+        default=None,
+        help="Batch and daemon mode: merge queued messages to the same call sign into fewer APRS messages; the daemon holds back a message to an idle call sign for this many seconds (default: disabled)",
+    )
+
+    parser.add_argument(
+        "--batch",
+        dest="aprs_batch_file",
+        type=str,
+        default="",
+        help="Send all messages from this file ('-' = stdin) over a single APRS-IS connection",
+    )
+
+    parser.add_argument(
+        "--batch-format",
+        dest="aprs_batch_format",
+        choices=["auto", "ndjson", "csv"],
+        default="auto",
+        help="Format of the batch file (default: auto)",
+    )
+
+    parser.add_argument(
+        "--daemon",
+        dest="aprs_daemon",
+        action="store_true",
+        default=False,
+        help="Keep the APRS-IS connection open and send the messages which local clients submit via the daemon socket",
+    )
+
+    parser.add_argument(
+        "--socket",
+        dest="aprs_daemon_socket",
+        type=str,
+        default=DEFAULT_DAEMON_SOCKET,
+        help=f"Unix domain socket of the daemon mode (default: '{DEFAULT_DAEMON_SOCKET}')",
+    )
+
     args = parser.parse_args()
 
     aprsis_from_callsign = args.aprs_from_callsign.upper()
     aprsis_to_callsign = args.aprs_to_callsign.upper()
     aprsis_passcode = args.aprs_passcode
     aprsis_message = args.aprs_message
-    aprsis_message_pagination = args.aprs_message_pagination
     aprsis_simulate_send = args.aprs_simulate_send
+    aprsis_daemon = args.aprs_daemon
+    aprsis_daemon_socket = args.aprs_daemon_socket
+    aprsis_batch_file = args.aprs_batch_file
+    aprsis_batch_format = args.aprs_batch_format
+    aprsis_message_pagination = args.aprs_message_pagination
+    aprsis_packet_delay = args.aprs_packet_delay
+    aprsis_channel_delay = args.aprs_channel_delay
+    aprsis_ack_tracking = args.aprs_ack_tracking
+    aprsis_ack_timeout = args.aprs_ack_timeout
+    aprsis_ack_retries = args.aprs_ack_retries
+    aprsis_connect_timeout = args.aprs_connect_timeout
+    aprsis_server_state_file = args.aprs_server_state_file
+    aprsis_probe_servers = args.aprs_probe_servers
+    aprsis_dedup_window = args.aprs_dedup_window
+    aprsis_dedup_state_file = args.aprs_dedup_state_file
+    aprsis_merge_window = args.aprs_merge_window
 
     # change our global variable in case of active numeric pagination
     APRS_MSG_LEN = (
@@ -127,26 +272,40 @@ def get_command_line_params():
 
     if len(aprsis_from_callsign) > 0:
         # Check whether we have a call sign with or without SSID
-        regex_string = r"\b^([A-Z0-9]{1,3}[0-9][A-Z0-9]{0,3})(-[A-Z0-9]{1,2})?$\b"
-        matches = re.search(pattern=regex_string, string=aprsis_from_callsign)
-        if not matches:
+        if not is_valid_callsign(aprsis_from_callsign):
             logger.error(msg="Call sign must match a valid call sign format")
             sys.exit(0)
     else:
         logger.error(msg="No FROM call sign provided")
         sys.exit(0)
 
-    if len(aprsis_to_callsign) > 0:
-        # Check whether we have a call sign with or without SSID
-        regex_string = r"\b^([A-Z0-9]{1,3}[0-9][A-Z0-9]{0,3})(-[A-Z0-9]{1,2})?$\b"
-        matches = re.search(pattern=regex_string, string=aprsis_to_callsign)
-        if not matches:
-            logger.error(msg="Call sign must match a valid call sign format")
+    aprsis_servers = []
+    for address in args.aprs_servers or [f"{aprsis_server_name}:{aprsis_server_port}"]:
+        server = parse_server_address(address=address)
+        if not server:
+            logger.error(msg=f"Invalid APRS-IS server address '{address}'")
             sys.exit(0)
-    else:
-        logger.error(msg="No FROM call sign provided")
+        if server not in aprsis_servers:
+            aprsis_servers.append(server)
+    if aprsis_connect_timeout <= 0:
+        logger.error(msg="Connect timeout must be positive")
+        sys.exit(0)
+    if aprsis_dedup_window < 0 or (aprsis_merge_window or 0) < 0:
+        logger.error(msg="Dedup window and merge window must not be negative")
         sys.exit(0)
 
+    # In daemon and batch mode, the recipients and messages
+    # are submitted via the socket or the batch file
+    if not aprsis_daemon and not aprsis_batch_file and not aprsis_probe_servers:
+        if len(aprsis_to_callsign) > 0:
+            # Check whether we have a call sign with or without SSID
+            if not is_valid_callsign(aprsis_to_callsign):
+                logger.error(msg="Call sign must match a valid call sign format")
+                sys.exit(0)
+        else:
+            logger.error(msg="No FROM call sign provided")
+            sys.exit(0)
+
     if len(aprsis_passcode) != 5:
         logger.error(msg="APRS passcode must be 5 characters long")
         sys.exit(0)
@@ -164,346 +323,52 @@ def get_command_line_params():
                 logger.error(msg="APRS passcode is incorrect")
                 sys.exit(0)
 
-    if len(aprsis_message) < 1:
+    if (
+        len(aprsis_message) < 1
+        and not aprsis_daemon
+        and not aprsis_batch_file
+        and not aprsis_probe_servers
+    ):
         logger.error(msg="APRS message is empty")
         sys.exit(0)
 
+    if aprsis_ack_tracking:
+        if aprsis_ack_timeout <= 0 or aprsis_ack_retries < 0:
+            logger.error(
+                msg="Ack timeout must be positive, ack retries must not be negative"
+            )
+            sys.exit(0)
+        # Without an APRS-IS connection, there will never be any acks
+        if aprsis_simulate_send:
+            logger.warning(msg="Ack tracking is not available in simulation mode")
+            aprsis_ack_tracking = False
+
     return (
         aprsis_from_callsign,
         aprsis_passcode,
         aprsis_message,
         aprsis_to_callsign,
         aprsis_simulate_send,
+        aprsis_daemon,
+        aprsis_daemon_socket,
+        aprsis_batch_file,
+        aprsis_batch_format,
+        aprsis_message_pagination,
+        aprsis_packet_delay,
+        aprsis_channel_delay,
+        aprsis_ack_tracking,
+        aprsis_ack_timeout,
+        aprsis_ack_retries,
+        aprsis_servers,
+        aprsis_connect_timeout,
+        aprsis_server_state_file,
+        aprsis_probe_servers,
+        aprsis_dedup_window,
+        aprsis_dedup_state_file,
+        aprsis_merge_window,
     )
 
 
-def make_pretty_aprs_messages(
-    message_to_add: str,
-    max_len: int,
-    destination_list: list = None,
-    separator_char: str = " ",
-    add_sep: bool = True,
-    force_outgoing_unicode_messages: bool = False,
-) -> list:
-    """
-    Pretty Printer for APRS messages. As APRS messages are likely to be split
-    up (due to the 67 chars message len limitation), this function prevents
-    'hard cuts'. Any information that is to be injected into message
-    destination list is going to be checked wrt its length. If
-    len(current content) + len(message_to_add) exceeds the max_len value,
-    the content will not be added to the current list string but to a new
-    string in the list.
-
-    Example:
-
-    current APRS message = 1111111111222222222233333333333444444444455555555556666666666
-
-    Add String "Hello World !!!!" (16 chars)
-
-    Add the string the 'conventional' way:
-
-    Message changes to
-    Line 1 = 1111111111222222222233333333333444444444455555555556666666666Hello W
-    Line 2 = orld !!!!
-
-    This function however returns:
-    Line 1 = 1111111111222222222233333333333444444444455555555556666666666
-    Line 2 = Hello World !!!!
-
-    In case the to-be-added text exceeds 67 characters due to whatever reason,
-    this function first tries to split up the content based on space characters
-    in the text and insert the resulting elements word by word, thus preventing
-    the program from ripping the content apart. However, if the content consists
-    of one or multiple strings which _do_ exceed the maximum text len, then there
-    is nothing that we can do. In this case, we will split up the text into 1..n
-    chunks of text and add it to the list element.
-
-    Known issues: if the separator_char is different from its default setting
-    (space), the second element that is inserted into the list may have an
-    additional separator char in the text
-
-    Parameters
-    ==========
-    message_to_add: str
-        message string that is to be added to the list in a pretty way
-        If string is longer than 67 chars, we will truncate the information
-    destination_list: list
-        List with string elements which will be enriched with the
-        'mesage_to_add' string. Default: empty list aka user wants new list
-    max_len: int:
-        Max length of the list's string len.
-        The length is dependent on whether the user has activated trailing
-        message number information in the outgoing message or not.
-        When activated, the message length is 59 - otherwise, it is 67.
-    separator_char: str
-        Separator that is going to be used for dividing the single
-        elements that the user is going to add
-    add_sep: bool
-        True = we will add the separator when more than one item
-               is in our string. This is the default
-        False = do not add the separator (e.g. if we add the
-                very first line of text, then we don't want a
-                comma straight after the location
-    force_outgoing_unicode_messages: bool
-        False = all outgoing UTF-8 content will be down-converted
-                to ASCII content
-        True = all outgoing UTF-8 content will sent out 'as is'
-
-    Returns
-    =======
-    destination_list: list
-        List array, containing 1..n human readable strings with
-        the "message_to_add' input data
-    """
-    # Dummy handler in case the list is completely empty
-    # or a reference to a list item has not been specified at all
-    # In this case, create an empty list
-    if not destination_list:
-        destination_list = []
-
-    # replace non-permitted APRS characters from the
-    # message text as APRS-IS might choke on this content
-    # Details: see APRS specification chapter 15 taken from
-    # https://github.com/wb2osz/aprsspec
-    # "Messages, Bulletins and Announcements"
-    message_to_add = re.sub("[{}|~]+", "", message_to_add)
-
-    # Convert the message to plain ascii
-    # Unidecode does not take care of German special characters
-    # Therefore, we need to 'translate' them first
-    message_to_add = convert_text_to_plain_ascii(message_string=message_to_add)
-
-    # If new message is longer than max len then split it up with
-    # max chunks of max_len bytes and add it to the array.
-    # This should never happen but better safe than sorry.
-    # Keep in mind that we only transport plain text anyway.
-    if len(message_to_add) > max_len:
-        split_data = message_to_add.split()
-        for split in split_data:
-            # if string is short enough then add it by calling ourself
-            # with the smaller text chunk
-            if len(split) < max_len:
-                destination_list = make_pretty_aprs_messages(
-                    message_to_add=split,
-                    destination_list=destination_list,
-                    max_len=max_len,
-                    separator_char=separator_char,
-                    add_sep=add_sep,
-                    force_outgoing_unicode_messages=force_outgoing_unicode_messages,
-                )
-            else:
-                # string exceeds max len; split it up and add it as is
-                string_list = split_string_to_string_list(
-                    message_string=split, max_len=max_len
-                )
-                for msg in string_list:
-                    destination_list.append(msg)
-    else:  # try to insert
-        # Get very last element from list
-        if len(destination_list) > 0:
-            string_from_list = destination_list[-1]
-
-            # element + new string > max len? no: add to existing string, else create new element in list
-            if len(string_from_list) + len(message_to_add) + 1 <= max_len:
-                delimiter = ""
-                if len(string_from_list) > 0 and add_sep:
-                    delimiter = separator_char
-                string_from_list = string_from_list + delimiter + message_to_add
-                destination_list[-1] = string_from_list
-            else:
-                destination_list.append(message_to_add)
-        else:
-            destination_list.append(message_to_add)
-
-    return destination_list
-
-
-def split_string_to_string_list(message_string: str, max_len: int):
-    """
-    Force-split the string into chunks of max_len size and return a list of
-    strings. This function is going to be called if the string that the user
-    wants to insert exceeds more than e.g. 67 characters. In this unlikely
-    case, we may not be able to add the string in a pretty format - but
-    we will split it up for the user and ensure that none of the data is lost
-
-    Parameters
-    ==========
-    message_string: str
-        message string that is to be divided into 1..n strings of 'max_len"
-        text length
-    max_len: int:
-        Default: 67; set to 59 in case of pagination
-
-    Returns
-    =======
-    split_strings: list
-        List array, containing 1..n strings with a max len of 'max_len'
-    """
-    split_strings = [
-        message_string[index : index + max_len]
-        for index in range(0, len(message_string), max_len)
-    ]
-    return split_strings
-
-
-def convert_text_to_plain_ascii(message_string: str):
-    """
-    Converts a string to plain ASCII
-    Parameters
-    ==========
-    message_string: str
-        Text that needs to be converted
-    Returns
-    =======
-    hex-converted text to the user
-    """
-    message_string = (
-        message_string.replace("Ä", "Ae")
-        .replace("Ö", "Oe")
-        .replace("Ü", "Ue")
-        .replace("ä", "ae")
-        .replace("ö", "oe")
-        .replace("ü", "ue")
-        .replace("ß", "ss")
-    )
-    message_string = unidecode(message_string)
-    return message_string
-
-
-def send_aprs_message_list(
-    myaprsis: aprslib.inet.IS | None,
-    message_text_array: list,
-    destination_call_sign: str,
-    source_call_sign: str,
-    simulate_send: bool = True,
-    packet_delay: float = 10.0,
-    packet_delay_last_message: float = 1.0,
-    tocall: str = "APMPAD",
-):
-    """
-    Send a pre-prepared message list to to APRS_IS
-    All packages have a max len of 67 characters
-    If 'simulate_send'= True, we still prepare the message but only send it to our log file
-    Parameters
-    ==========
-    myaprsis: aprslib.inet.IS
-        Our aprslib object that we will use for the communication part
-    message_text_array: list
-        Contains 1..n entries of the content that we want to send to the user
-    destination_call_sign: str
-        Target user call sign that is going to receive the message (usually, this
-        is the user's call sign who has sent us the initial message)
-    simulate_send: bool
-        If True: Prepare string but only send it to logger
-    source_call_sign: str
-        Our very own call sign
-    packet_delay: float
-        Delay after sending out our APRS acknowledgment request
-        Used when there are still remaining messages
-    packet_delay_last_message: float
-        Delay after sending out our APRS acknowledgment request
-        Used when there are no remaining messages
-    tocall: str
-        This bot uses the default TOCALL ("APMPAD")
-
-    Returns
-    =======
-    """
-
-    # Send the message list
-    for index, single_message in enumerate(message_text_array, start=1):
-        # Build our output string
-        stringtosend = (
-            f"{source_call_sign}>{tocall}::{destination_call_sign:9}:{single_message}"
-        )
-        # Check if we want to send the data for real or just perform an output to console
-        if not simulate_send:
-            logger.debug(msg=f"Sending APRS message '{stringtosend}'")
-            myaprsis.sendall(stringtosend)
-        else:
-            logger.debug(msg=f"Simulating APRS message '{stringtosend}'")
-        # In case of remaining messages, apply the user sleep period
-        # otherwise, let's wait just one sec
-        if index < len(message_text_array):
-            time.sleep(packet_delay)
-        else:
-            time.sleep(packet_delay_last_message)
-
-
-def finalize_pretty_aprs_messages(mylistarray: list, max_len: int) -> list:
-    """
-    Helper method which finalizes the prettified APRS messages
-    and triggers the addition of the trailing message numbers (if
-    activated by the user).
-
-    Parameters
-    ==========
-    mylistarray: list
-        List of APRS messages
-    max_len: int
-        maximum length of the message
-
-    Returns
-    =======
-    listitem: list
-        Either formatted list (if more than one list entry was present) or
-        the original list item
-    """
-    if max_len == APRS_MSG_LEN_TRAILING:
-        return format_list_with_enumeration(mylistarray=mylistarray)
-    else:
-        return mylistarray
-
-
-def format_list_with_enumeration(mylistarray: list) -> list:
-    """
-    Adds a trailing enumeration to the list if the user has activated this configuration in
-    the client's config file
-
-    Parameters
-    ==========
-
-    Returns
-    =======
-    listitem: list
-        Either formatted list (if more than one list entry was present) or
-        the original list item
-    """
-
-    max_total_length = APRS_MSG_LEN_NOTRAILING
-    annotation_length = APRS_MSG_LEN_NOTRAILING - APRS_MSG_LEN_TRAILING
-    max_content_length = max_total_length - annotation_length
-
-    # check if we have more than 99 entries. We always truncate the list (just to be
-    # on the safe side) but whenever more than 99 entries were detected, we also supply
-    # the user with a warning message and notify him about the truncation
-    if len(mylistarray) > 99:
-        logger.warning(
-            msg="User has supplied list with more than 99 elements; truncating"
-        )
-        trimmed_listarray = mylistarray[:98]
-        trimmed_listarray.append("[message truncated]")
-    else:
-        trimmed_listarray = mylistarray
-    total = len(trimmed_listarray)
-
-    # now let's add the enumeration to the list - but only if we have
-    # more than one list item in our outgoing list
-    if len(trimmed_listarray) > 1:
-        formatted_list = []
-        for i, s in enumerate(trimmed_listarray, start=1):
-            annotation = f" ({i:02d}/{total:02d})"
-            truncated = s[:max_content_length]
-            padded = truncated.ljust(max_content_length)
-            final = padded + annotation
-            formatted_list.append(final)
-
-        return formatted_list
-    else:
-        # return the original list to the user
-        return trimmed_listarray
-
-
 if __name__ == "__main__":
     (
         aprs_from_callsign,
@@ -511,8 +376,129 @@ if __name__ == "__main__":
         aprs_message,
         aprs_to_callsign,
         aprs_simulate_send,
+        aprs_daemon,
+        aprs_daemon_socket,
+        aprs_batch_file,
+        aprs_batch_format,
+        aprs_message_pagination,
+        aprs_packet_delay,
+        aprs_channel_delay,
+        aprs_ack_tracking,
+        aprs_ack_timeout,
+        aprs_ack_retries,
+        aprs_servers,
+        aprs_connect_timeout,
+        aprs_server_state_file,
+        aprs_probe_servers,
+        aprs_dedup_window,
+        aprs_dedup_state_file,
+        aprs_merge_window,
     ) = get_command_line_params()
 
+    aprsis_server_pool = AprsIsServerPool(
+        servers=aprs_servers,
+        connect_timeout=aprs_connect_timeout,
+        state_file=aprs_server_state_file,
+    )
+
+    # Suppress messages which have been sent within the dedup window
+    aprs_deduplicator = None
+    if aprs_dedup_window > 0:
+        aprs_deduplicator = OutboundDeduplicator(
+            window=aprs_dedup_window, state_file=aprs_dedup_state_file
+        )
+
+    # Measure the latencies of all APRS-IS servers
+    if aprs_probe_servers:
+        print(
+            json.dumps(
+                probe_servers(
+                    from_callsign=aprs_from_callsign,
+                    passcode=aprs_passcode,
+                    server_pool=aprsis_server_pool,
+                )
+            )
+        )
+        sys.exit(0)
+
+    # Keep the connection open and send the messages of our local clients
+    if aprs_daemon:
+        daemon = MessageDaemon(
+            from_callsign=aprs_from_callsign,
+            passcode=aprs_passcode,
+            socket_path=aprs_daemon_socket,
+            simulate_send=aprs_simulate_send,
+            packet_delay=aprs_packet_delay,
+            channel_delay=aprs_channel_delay,
+            ack_tracking=aprs_ack_tracking,
+            ack_timeout=aprs_ack_timeout,
+            ack_retries=aprs_ack_retries,
+            server_pool=aprsis_server_pool,
+            deduplicator=aprs_deduplicator,
+            merge_window=aprs_merge_window,
+        )
+        sys.exit(0 if daemon.run() else 1)
+
+    # Send all messages of the batch file over a single connection
+    if aprs_batch_file:
+        try:
+            if aprs_batch_file == "-":
+                batch_summary = run_batch(
+                    from_callsign=aprs_from_callsign,
+                    passcode=aprs_passcode,
+                    batch_file=sys.stdin,
+                    batch_format=aprs_batch_format,
+                    numeric_message_pagination=aprs_message_pagination,
+                    simulate_send=aprs_simulate_send,
+                    packet_delay=aprs_packet_delay,
+                    channel_delay=aprs_channel_delay,
+                    ack_tracking=aprs_ack_tracking,
+                    ack_timeout=aprs_ack_timeout,
+                    ack_retries=aprs_ack_retries,
+                    server_pool=aprsis_server_pool,
+                    deduplicator=aprs_deduplicator,
+                    merge_messages=aprs_merge_window is not None,
+                )
+            else:
+                with open(aprs_batch_file, "r", encoding="utf-8") as batch_file:
+                    batch_summary = run_batch(
+                        from_callsign=aprs_from_callsign,
+                        passcode=aprs_passcode,
+                        batch_file=batch_file,
+                        batch_format=aprs_batch_format,
+                        numeric_message_pagination=aprs_message_pagination,
+                        simulate_send=aprs_simulate_send,
+                        packet_delay=aprs_packet_delay,
+                        channel_delay=aprs_channel_delay,
+                        ack_tracking=aprs_ack_tracking,
+                        ack_timeout=aprs_ack_timeout,
+                        ack_retries=aprs_ack_retries,
+                        server_pool=aprsis_server_pool,
+                        deduplicator=aprs_deduplicator,
+                        merge_messages=aprs_merge_window is not None,
+                    )
+        except OSError as ex:
+            logger.error(msg=f"Unable to read batch file '{aprs_batch_file}': {ex}")
+            sys.exit(1)
+        print(json.dumps(batch_summary))
+        if (
+            batch_summary["invalid_records"]
+            or batch_summary["unsent_messages"]
+            or batch_summary.get("ack_tracking", {}).get("failed_messages")
+        ):
+            sys.exit(1)
+        sys.exit(0)
+
+    # Skip the message if it has been sent within the dedup window
+    if aprs_deduplicator is not None and aprs_deduplicator.is_duplicate(
+        destination=aprs_to_callsign, message=aprs_message
+    ):
+        logger.info(
+            msg=f"Message to '{aprs_to_callsign}' has already been sent within "
+            f"the last {aprs_dedup_window:g} seconds; not sending it again"
+        )
+        sys.exit(0)
+
     # prepare the outgoing APRS message list
     output_message = make_pretty_aprs_messages(
         message_to_add=aprs_message, max_len=APRS_MSG_LEN
@@ -524,37 +510,23 @@ if __name__ == "__main__":
         mylistarray=output_message, max_len=APRS_MSG_LEN
     )
 
-    # simulate server connection; dump our messages to stdout
-    # and exit afterwards
-    if aprs_simulate_send:
-        send_aprs_message_list(
-            myaprsis=None,
-            message_text_array=output_message,
-            destination_call_sign=aprs_to_callsign,
-            simulate_send=True,
-            source_call_sign=aprs_from_callsign,
-        )
-    else:
-        # Establish the connection to APRS-IS
-        AIS = aprslib.IS(aprs_from_callsign, aprs_passcode)
-        AIS.set_server(aprsis_server_name, aprsis_server_port)
-        AIS.connect(blocking=True)
-
-        # are we connected?
-        if AIS._connected:
-            logger.info(
-                msg=f"Established connection to APRS_IS: server={aprsis_server_name},"
-                f"port={aprsis_server_port}, APRS-IS User: {aprs_from_callsign}, APRS-IS passcode: {aprs_passcode}"
-            )
-
-            send_aprs_message_list(
-                myaprsis=AIS,
-                message_text_array=output_message,
-                destination_call_sign=aprs_to_callsign,
-                simulate_send=False,
-                source_call_sign=aprs_from_callsign,
-            )
-
-            AIS.close()
-        else:
-            print("An error has occurred")
+    # Send the message (with ack tracking: number each fragment, wait for
+    # the recipient's acks and retry unacknowledged fragments). In simulation
+    # mode, the messages are only dumped to our logger
+    if not send_fragments(
+        from_callsign=aprs_from_callsign,
+        passcode=aprs_passcode,
+        to_callsign=aprs_to_callsign,
+        fragments=output_message,
+        server_pool=aprsis_server_pool,
+        simulate_send=aprs_simulate_send,
+        packet_delay=aprs_packet_delay,
+        ack_tracking=aprs_ack_tracking,
+        ack_timeout=aprs_ack_timeout,
+        ack_retries=aprs_ack_retries,
+    ):
+        sys.exit(1)
+
+    if aprs_deduplicator is not None and not aprs_simulate_send:
+        aprs_deduplicator.record(destination=aprs_to_callsign, message=aprs_message)
+        aprs_deduplicator.save_state()
@@ -0,0 +1,62 @@
+#
+# send-aprs-message: shared fixtures for the test modules
+# Author: Joerg Schultze-Lutter, 2025
+#
+# The tests run against local stand-ins only: the APRS-IS emulator
+# (../../aprsis-emulator) and sockets which never answer or refuse
+# connections. Run them with 'python -m pytest tests' from the
+# send-aprs-message directory.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import io
+import os
+import sys
+import aprslib
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# send-aprs-message's modules and the APRS-IS emulator (../../aprsis-emulator)
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BASE_DIR), "aprsis-emulator"))
+
+import aprsis_emulator
+
+FROM_CALLSIGN = "DF0BOT"
+PASSCODE = str(aprslib.passcode(FROM_CALLSIGN))
+
+
+@pytest.fixture
+def start_emulator():
+    """
+    Returns a function which starts an APRS-IS emulator on a free port.
+    Its keyword arguments are passed to AprsIsEmulator; the received
+    packets are available via the emulator's 'received_log' attribute.
+    All emulators are stopped after the test
+    """
+    emulators = []
+
+    def start(**kwargs):
+        emulator = aprsis_emulator.AprsIsEmulator(
+            port=0, received_log=io.StringIO(), **kwargs
+        )
+        emulator.start()
+        emulators.append(emulator)
+        return emulator
+
+    yield start
+    for emulator in emulators:
+        emulator.stop()
@@ -0,0 +1,93 @@
+#
+# send-aprs-message: ack timeout and retry tests
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Sends messages with ack tracking to the APRS-IS emulator and checks
+# the packets that the emulator has received: acknowledged fragments
+# are sent once, unacknowledged fragments are retried until their
+# retries are used up and rejected messages are given up right away.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+from conftest import FROM_CALLSIGN, PASSCODE
+from sam_server_pool import AprsIsServerPool
+from sam_transport import send_fragments
+
+TO_CALLSIGN = "DF1TST"
+REJECT_CALLSIGN = "DF9REJ"
+FRAGMENTS = ["first fragment", "second fragment"]
+
+
+def send(emulator, to_callsign: str = TO_CALLSIGN, ack_retries: int = 8):
+    # Sends FRAGMENTS with ack tracking; short timeouts keep the tests fast
+    return send_fragments(
+        from_callsign=FROM_CALLSIGN,
+        passcode=PASSCODE,
+        to_callsign=to_callsign,
+        fragments=FRAGMENTS,
+        server_pool=AprsIsServerPool(servers=[(emulator.address, emulator.port)]),
+        packet_delay=0.05,
+        ack_tracking=True,
+        ack_timeout=0.2,
+        ack_retries=ack_retries,
+    )
+
+
+def sent_packets(emulator, fragment: str):
+    # Returns the received packets which carry the given fragment
+    return [
+        line
+        for line in emulator.received_log.getvalue().splitlines()
+        if f":{fragment}{{" in line
+    ]
+
+
+def test_acknowledged_fragments_are_sent_once(start_emulator):
+    emulator = start_emulator(auto_ack=True)
+    assert send(emulator)
+    for fragment in FRAGMENTS:
+        packets = sent_packets(emulator, fragment)
+        assert len(packets) == 1
+        assert f"::{TO_CALLSIGN:<9}:" in packets[0]
+    assert emulator.statistics.report()["auto_answers"]["ack"] == len(FRAGMENTS)
+
+
+def test_unacknowledged_fragment_is_retried_until_timeout(start_emulator):
+    emulator = start_emulator(auto_ack=False)
+    assert not send(emulator, ack_retries=2)
+    # first attempt plus two retries, all with the same message number
+    packets = sent_packets(emulator, FRAGMENTS[0])
+    assert len(packets) == 3
+    assert len({packet.rpartition("{")[2] for packet in packets}) == 1
+    # the message has failed; its remaining fragments are not sent
+    assert not sent_packets(emulator, FRAGMENTS[1])
+
+
+def test_lost_acks_are_retried(start_emulator):
+    emulator = start_emulator(auto_ack=True, ack_loss=0.5)
+    assert send(emulator, ack_retries=20)
+    answers = emulator.statistics.report()["auto_answers"]
+    # each retry corresponds to exactly one ack that the emulator has dropped
+    packets = sum(len(sent_packets(emulator, fragment)) for fragment in FRAGMENTS)
+    assert answers["ack"] == len(FRAGMENTS)
+    assert packets == len(FRAGMENTS) + answers.get("dropped", 0)
+
+
+def test_rejected_message_fails_without_retries(start_emulator):
+    emulator = start_emulator(auto_ack=True, reject_patterns=[REJECT_CALLSIGN])
+    assert not send(emulator, to_callsign=REJECT_CALLSIGN)
+    assert len(sent_packets(emulator, FRAGMENTS[0])) == 1
+    assert not sent_packets(emulator, FRAGMENTS[1])
+    assert emulator.statistics.report()["auto_answers"]["rej"] == 1
@@ -0,0 +1,140 @@
+#
+# send-aprs-message: APRS-IS server pool tests
+# Author: Joerg Schultze-Lutter, 2025
+#
+# Connects via server pools which contain failing stand-ins (a server
+# which never sends its banner, a closed port) and APRS-IS emulators.
+# Checks the failover within the connect timeout, the connection order
+# and the server state file.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+import json
+import socket
+import time
+import pytest
+from conftest import FROM_CALLSIGN, PASSCODE
+from sam_server_pool import AprsIsServerPool
+from sam_transport import AsyncAprsIsTransport, probe_servers, run_blocking
+
+CONNECT_TIMEOUT = 0.5
+
+
+@pytest.fixture
+def failing_servers():
+    """
+    Returns a server which accepts TCP connections but never sends its
+    banner and a closed port, both as (host, port) tuples
+    """
+    hanging_server = socket.create_server(("127.0.0.1", 0))
+    closed_socket = socket.create_server(("127.0.0.1", 0))
+    closed_server = closed_socket.getsockname()[:2]
+    closed_socket.close()
+    yield [hanging_server.getsockname()[:2], closed_server]
+    hanging_server.close()
+
+
+def connect(server_pool: AprsIsServerPool):
+    # Logs in to the first available server of the pool and returns it
+    async def login():
+        transport = AsyncAprsIsTransport(
+            callsign=FROM_CALLSIGN,
+            passcode=PASSCODE,
+            server_pool=server_pool,
+            reconnect=False,
+        )
+        await transport.start()
+        server = transport.server
+        await transport.close()
+        return server
+
+    return AprsIsServerPool.server_key(run_blocking(coroutine=login()))
+
+
+def keys(servers: list):
+    return [AprsIsServerPool.server_key(server) for server in servers]
+
+
+def test_failover_within_connect_timeout(start_emulator, failing_servers, tmp_path):
+    emulator = start_emulator()
+    servers = failing_servers + [(emulator.address, emulator.port)]
+    state_file = tmp_path / "servers.json"
+    server_pool = AprsIsServerPool(
+        servers=servers, connect_timeout=CONNECT_TIMEOUT, state_file=str(state_file)
+    )
+    # no state yet: the configured order
+    assert server_pool.ordered_servers() == servers
+
+    start = time.monotonic()
+    assert connect(server_pool) == keys(servers)[2]
+    assert time.monotonic() - start < CONNECT_TIMEOUT + 1.0
+
+    # the failures and the working server have been recorded
+    state = json.loads(state_file.read_text())
+    assert state["fastest"] == keys(servers)[2]
+    for key in keys(failing_servers):
+        assert state["servers"][key]["failures"] == 1
+    assert state["servers"][keys(servers)[2]]["failures"] == 0
+
+    # the next run starts with the working server, failing servers come last
+    server_pool = AprsIsServerPool(
+        servers=servers, connect_timeout=CONNECT_TIMEOUT, state_file=str(state_file)
+    )
+    assert keys(server_pool.ordered_servers()) == [keys(servers)[i] for i in (2, 0, 1)]
+
+
+def test_probe_orders_by_latency(start_emulator, failing_servers, tmp_path):
+    slow_emulator = start_emulator(login_delay=0.3)
+    fast_emulator = start_emulator()
+    slow = (slow_emulator.address, slow_emulator.port)
+    fast = (fast_emulator.address, fast_emulator.port)
+    servers = failing_servers + [slow, fast]
+    state_file = str(tmp_path / "servers.json")
+    probe_servers(
+        from_callsign=FROM_CALLSIGN,
+        passcode=PASSCODE,
+        server_pool=AprsIsServerPool(
+            servers=servers, connect_timeout=CONNECT_TIMEOUT, state_file=state_file
+        ),
+    )
+    server_pool = AprsIsServerPool(
+        servers=servers, connect_timeout=CONNECT_TIMEOUT, state_file=state_file
+    )
+    assert server_pool.ordered_servers()[:2] == [fast, slow]
+    assert connect(server_pool) == keys([fast])[0]
+
+    # the fastest server is gone: fail over to the slow one and start
+    # with it next time
+    fast_emulator.stop()
+    assert connect(server_pool) == keys([slow])[0]
+    server_pool = AprsIsServerPool(
+        servers=servers, connect_timeout=CONNECT_TIMEOUT, state_file=state_file
+    )
+    assert server_pool.ordered_servers()[0] == slow
+
+
+def test_state_file_is_disabled_by_default(
+    start_emulator, failing_servers, tmp_path, monkeypatch
+):
+    # a state file with a relative name would end up in the working directory
+    monkeypatch.chdir(tmp_path)
+    emulator = start_emulator()
+    servers = failing_servers + [(emulator.address, emulator.port)]
+    server_pool = AprsIsServerPool(servers=servers, connect_timeout=CONNECT_TIMEOUT)
+    assert connect(server_pool) == keys(servers)[2]
+    assert not any(tmp_path.iterdir())
+    # without a state file, every run starts in the configured order
+    server_pool = AprsIsServerPool(servers=servers, connect_timeout=CONNECT_TIMEOUT)
+    assert server_pool.ordered_servers() == servers